@@ -0,0 +1,148 @@
+"""
+ベンチマーク共通ヘルパー
+
+lambda/syslog_parser と generator を import できるようにし、
+ジェネレーターでのテストデータ作成や計測用の補助関数をまとめる。
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import resource
+import contextlib
+from pathlib import Path
+from unittest.mock import Mock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+LAMBDA_DIR = REPO_ROOT / 'lambda' / 'syslog_parser'
+GENERATOR_DIR = REPO_ROOT / 'generator'
+
+sys.path.insert(0, str(LAMBDA_DIR))
+sys.path.insert(0, str(GENERATOR_DIR))
+
+os.environ.setdefault('DYNAMODB_TABLE', 'syslog-hourly-stats-bench')
+
+# boto3 はローカルに無くてもよい（S3/DynamoDB はフェイクに差し替える）
+try:
+    import boto3  # noqa: F401
+except ImportError:
+    sys.modules['boto3'] = Mock()
+
+
+def quiet():
+    """計測対象の print 出力を捨てる"""
+    return contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+
+def generate_zip(output_dir, rows, hour=0, threat_ratio=0.1, profile='flat', seed=None):
+    """
+    JuniperSyslogGenerator で1時間分のZIPを生成（profile は generator/profiles.py の指定）
+
+    Returns:
+        Path: 生成したZIPのパス（{output_dir}/{hour:02d}.zip）
+    """
+    from datetime import datetime
+    from generate import JuniperSyslogGenerator
+
+    with quiet():
+        generator = JuniperSyslogGenerator(
+            output_dir=output_dir,
+            date=datetime(2025, 4, 28),
+            hostname='srx-fw01',
+            rows_per_hour=rows,
+            threat_ratio=threat_ratio,
+            seed=seed,
+            profile=profile,
+        )
+        generator.create_hourly_log(hour)
+    return Path(output_dir) / f"{hour:02d}.zip"
+
+
+def interleaved_best(cases, repeat):
+    """
+    各ケースを1回ずつ順に実行するのを repeat 回繰り返し、ケースごとの CPU 時間（time.process_time）の最良値を返す
+
+    計測環境のばらつき（同じケースを続けて実行した間だけ遅くなる、など）がケースの差に出にくい。
+
+    Args:
+        cases (dict): ケース名 → 引数なしの関数
+
+    Returns:
+        dict: ケース名 → (秒, 最後の返り値)
+    """
+    results = {}
+    for _ in range(repeat):
+        for name, func in cases.items():
+            with quiet():
+                start = time.process_time()
+                result = func()
+                elapsed = time.process_time() - start
+            best = results[name][0] if name in results else elapsed
+            results[name] = (min(best, elapsed), result)
+    return results
+
+
+def peak_rss_mb():
+    """
+    このプロセスのピーク RSS (MB)
+
+    ru_maxrss は fork 元の値を exec 後も引き継ぐため、
+    Linux では /proc/self/status の VmHWM を優先する。
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LocalDirS3Client:
+    """
+    ローカルファイルを S3 オブジェクトとして返すクライアント
+
+    get_object はファイルを開いたストリームを返すため、
+    大きなZIPでもベンチマーク側のメモリを消費しない。
+    レンジ GET（Range="bytes=start-end"）と head_object にも対応する（s3_range 用）。
+    put_object / upload_fileobj で書き込まれたオブジェクト（日次JSON など）は
+    メモリ上の FakeS3Client に置き、files にないキーの読み込みはそちらから返す。
+    """
+
+    def __init__(self, files):
+        from tests.fakes import FakeS3Client
+
+        # files: {(bucket, key): path}
+        self.files = files
+        self.written = FakeS3Client()
+
+    def etag(self, path):
+        st = os.stat(path)
+        return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        if (Bucket, Key) not in self.files:
+            return self.written.get_object(Bucket=Bucket, Key=Key, Range=Range, **kwargs)
+        path = self.files[(Bucket, Key)]
+        if Range is None:
+            return {'Body': open(path, 'rb')}
+        start, end = (int(n) for n in Range[len('bytes='):].split('-'))
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return {'Body': io.BytesIO(f.read(end - start + 1))}
+
+    def head_object(self, Bucket, Key):
+        path = self.files[(Bucket, Key)]
+        return {'ContentLength': os.path.getsize(path), 'ETag': self.etag(path)}
+
+    def download_file(self, Bucket, Key, Filename):
+        shutil.copyfile(self.files[(Bucket, Key)], Filename)
+
+    def put_object(self, **kwargs):
+        return self.written.put_object(**kwargs)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None):
+        self.written.upload_fileobj(Fileobj, Bucket, Key, ExtraArgs)
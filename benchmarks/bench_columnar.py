@@ -0,0 +1,104 @@
+"""
+列指向エクスポートベンチマーク: サイズ・書き出しコスト・問い合わせ時間
+
+ジェネレーターで作成した1時間分のCSVについて、
+  - CSV / ZIP / 列指向ファイル（columnar.py）のサイズ
+  - scan_csv の書き出しあり・なしの所要時間
+  - 「指定した時間帯の CRITICAL を AppName 別に数える」問い合わせの所要時間
+    （ZIP を展開して CsvScanner で全行を読む場合と、列指向ファイルから必要な列だけ読む場合）
+を比較する。両者の問い合わせ結果が一致しない場合はエラー終了する。
+
+使用方法:
+    python benchmarks/bench_columnar.py
+    python benchmarks/bench_columnar.py --rows 500000 --repeat 5
+"""
+
+import io
+import time
+import zipfile
+import argparse
+import tempfile
+from collections import Counter
+
+import _common
+from _common import generate_zip, quiet
+
+DEFAULT_ROWS = 200000
+
+
+def best_of(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        with quiet():
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the columnar export')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                        help=f'Rows in the CSV (default: {DEFAULT_ROWS})')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (best is reported)')
+    parser.add_argument('--window', default='00:30-00:40',
+                        help='Time window of the query, HH:MM-HH:MM (default: 00:30-00:40)')
+    args = parser.parse_args()
+
+    import lambda_function
+    from csv_scanner import CsvScanner
+    from columnar import ColumnarReader, epoch
+
+    first, last = args.window.split('-')
+    start = epoch(f'2025-04-28T{first}:00Z')
+    end = epoch(f'2025-04-28T{last}:00Z')
+    start_text, end_text = f'2025-04-28T{first}:00Z'.encode(), f'2025-04-28T{last}:00Z'.encode()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_path = generate_zip(tmp, args.rows)
+        with zipfile.ZipFile(zip_path) as z:
+            data = z.read('00.csv')
+        zip_size = zip_path.stat().st_size
+
+        def scan_plain():
+            return lambda_function.scan_csv(io.BytesIO(data))
+
+        def scan_export():
+            sink = io.BytesIO()
+            lambda_function.scan_csv(io.BytesIO(data), sink)
+            return sink.getvalue()
+
+        plain_seconds, _ = best_of(scan_plain, args.repeat)
+        export_seconds, encoded = best_of(scan_export, args.repeat)
+
+        def query_zip():
+            with zipfile.ZipFile(zip_path) as z, z.open('00.csv') as member:
+                scanner = CsvScanner(io.BufferedReader(member, buffer_size=1024 * 1024))
+                ts_i, app_i, sev_i = scanner.column_indexes(['Timestamp', 'AppName', 'Severity'])
+                return Counter(fields[app_i].decode() for fields in scanner.rows(max(ts_i, app_i, sev_i))
+                               if fields[sev_i] == b'CRITICAL' and start_text <= fields[ts_i] < end_text)
+
+        def query_columnar():
+            reader = ColumnarReader(io.BytesIO(encoded))
+            return reader.count_by('AppName', where={'Severity': ['CRITICAL']}, start=start, end=end)
+
+        zip_seconds, expected = best_of(query_zip, args.repeat)
+        columnar_seconds, result = best_of(query_columnar, args.repeat)
+        if result != expected:
+            raise SystemExit(f"Query results differ: {dict(result)} != {dict(expected)}")
+
+    mb = 1024 * 1024
+    print(f"rows: {args.rows:,}")
+    print(f"size   CSV {len(data) / mb:8.2f} MB   ZIP {zip_size / mb:8.2f} MB   "
+          f"columnar {len(encoded) / mb:8.2f} MB ({len(encoded) / len(data):.1%} of CSV)")
+    print(f"scan   without export {plain_seconds:7.3f}s   with export {export_seconds:7.3f}s "
+          f"(+{(export_seconds - plain_seconds) / plain_seconds:.0%})")
+    print(f"query  {args.window} CRITICAL by AppName ({sum(result.values()):,} rows)")
+    print(f"       ZIP + CsvScanner {zip_seconds:7.3f}s   columnar {columnar_seconds:7.3f}s "
+          f"({zip_seconds / columnar_seconds:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+テストデータ生成ベンチマーク: generate_log_row (1行ずつ) vs バッチ生成 (batch.py)
+
+1時間分の行を CSV の文字列にするまでの rows/sec と、ZIP 圧縮を含めた
+create_hourly_log の所要時間・ZIP のサイズを生成方式ごとに比較する。
+生成した行の Severity / LogType / AppName の比率が方式間で大きく違う場合はエラー終了する。
+
+使用方法:
+    python benchmarks/bench_generate.py
+    python benchmarks/bench_generate.py --rows 1000000 --repeat 3
+    python benchmarks/bench_generate.py --engines numpy --compress-level 1
+"""
+
+import io
+import csv
+import time
+import random
+import argparse
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import _common  # noqa: F401  (generator を import できるようにする)
+from _common import quiet
+from generate import JuniperSyslogGenerator, DEFAULT_COMPRESS_LEVEL
+from batch import numpy
+
+DEFAULT_ROWS = 500000
+# 先頭が比較の基準
+DEFAULT_ENGINES = 'row,python,numpy'
+BASE_TIME = datetime(2025, 4, 28, 10)
+# 比率の許容差（行数が十分多ければ方式間の差は 0.005 未満）
+TOLERANCE = 0.01
+
+
+def make_generator(tmp, rows, threat_ratio, engine, compress_level):
+    with quiet():
+        return JuniperSyslogGenerator(tmp, BASE_TIME - timedelta(hours=10), 'srx-fw01',
+                                      rows, threat_ratio, engine=engine,
+                                      compress_level=compress_level)
+
+
+def render(generator, rows):
+    """rows 行を CSV の文字列にする（ZIP 圧縮なし）"""
+    if generator.batch:
+        out = io.StringIO()
+        generator.batch.write(out, BASE_TIME, rows)
+        return out.getvalue()
+    out = io.StringIO(newline='')
+    csv.writer(out).writerows([generator.generate_log_row(BASE_TIME) for _ in range(rows)])
+    return out.getvalue()
+
+
+def ratios(text):
+    """Severity / LogType / AppName ごとの行の比率"""
+    counts = Counter()
+    total = 0
+    for row in csv.reader(io.StringIO(text)):
+        counts.update([('Severity', row[4]), ('LogType', row[5]), ('AppName', row[2])])
+        total += 1
+    return {key: count / total for key, count in counts.items()}
+
+
+def best_of(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-row vs batched row generation')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                        help=f'Rows per hour (default: {DEFAULT_ROWS})')
+    parser.add_argument('--threat-ratio', type=float, default=0.1)
+    parser.add_argument('--engines', default=DEFAULT_ENGINES,
+                        help=f'Comma-separated engines, the first is the baseline (default: {DEFAULT_ENGINES})')
+    parser.add_argument('--compress-level', type=int, default=DEFAULT_COMPRESS_LEVEL,
+                        help=f'ZIP compression level 0-9 (default: {DEFAULT_COMPRESS_LEVEL})')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per engine (best is reported)')
+    args = parser.parse_args()
+
+    engines = [e for e in args.engines.split(',') if e != 'numpy' or numpy is not None]
+    if len(engines) < len(args.engines.split(',')):
+        print("NOTE: NumPy is not installed; skipping the numpy engine")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for engine in engines:
+            generator = make_generator(tmp, args.rows, args.threat_ratio, engine,
+                                       args.compress_level)
+            random.seed(1)
+            render_time, text = best_of(lambda: render(generator, args.rows), args.repeat)
+            with quiet():
+                zip_time, _ = best_of(lambda: generator.create_hourly_log(10), args.repeat)
+            zip_size = (Path(tmp) / '10.zip').stat().st_size
+            results[engine] = (render_time, zip_time, zip_size, ratios(text))
+
+    reference = results[engines[0]][-1]
+    for engine in engines[1:]:
+        observed = results[engine][-1]
+        worst = max(abs(observed.get(key, 0) - reference.get(key, 0))
+                    for key in set(reference) | set(observed))
+        if worst > TOLERANCE:
+            raise SystemExit(f"ERROR: {engine} distribution differs from {engines[0]} by {worst:.4f}")
+
+    print(f"rows: {args.rows:,}  threat ratio: {args.threat_ratio}  compress level: {args.compress_level}")
+    print(f"{'engine':<8} {'render s':>9} {'rows/s':>12} {'speedup':>8} {'zip s':>8} {'rows/s':>12} "
+          f"{'zip MB':>8}")
+    print('-' * 71)
+    base = results[engines[0]][0]
+    for engine in engines:
+        render_time, zip_time, zip_size, _ = results[engine]
+        print(f"{engine:<8} {render_time:>9.3f} {args.rows / render_time:>12,.0f} "
+              f"{base / render_time:>7.1f}x {zip_time:>8.3f} {args.rows / zip_time:>12,.0f} "
+              f"{zip_size / 1024 / 1024:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+取り込み方式ベンチマーク: /tmp 経由 (disk) vs ストリーム (stream)
+
+ジェネレーターで作成した1時間分のZIPを、lambda_function.ingest() の
+2つの経路で処理し、所要時間とピーク RSS を比較する。
+ピーク RSS を正しく測るため、計測は1回ごとに別プロセスで行う。
+
+使用方法:
+    python benchmarks/bench_ingest.py
+    python benchmarks/bench_ingest.py --rows 5000,50000 --repeat 3
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import _common
+from _common import generate_zip, peak_rss_mb, quiet, LocalDirS3Client
+
+DEFAULT_ROWS = '5000,50000,500000,5000000'
+MODES = ['disk', 'stream']
+
+
+def run_child(mode, zip_path):
+    """子プロセス側: 1回分の取り込みを計測して JSON を出力"""
+    import lambda_function
+
+    lambda_function.s3_client = LocalDirS3Client({('bench', 'raw/bench.zip'): zip_path})
+    lambda_function.INGEST_MODE = mode
+
+    with quiet():
+        start = time.perf_counter()
+        stats, = lambda_function.ingest('bench', 'raw/bench.zip')
+        elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'seconds': elapsed,
+        'peak_rss_mb': peak_rss_mb(),
+        'hours': len(stats['hourly_stats']),
+    }))
+
+
+def measure(mode, zip_path):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, str(zip_path)],
+        text=True,
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark disk vs stream ingest')
+    parser.add_argument('--rows', default=DEFAULT_ROWS,
+                        help=f'Comma separated rows per file (default: {DEFAULT_ROWS})')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per mode (best is reported)')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'ZIP'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    print(f"{'rows':>10} {'zip MB':>8} {'mode':>7} {'seconds':>9} {'rows/s':>12} {'peak RSS MB':>12}")
+    print('-' * 64)
+    for rows in [int(r) for r in args.rows.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            zip_path = generate_zip(tmp, rows)
+            zip_mb = zip_path.stat().st_size / 1024 / 1024
+            for mode in MODES:
+                runs = [measure(mode, zip_path) for _ in range(args.repeat)]
+                best = min(runs, key=lambda r: r['seconds'])
+                peak = max(r['peak_rss_mb'] for r in runs)
+                print(f"{rows:>10,} {zip_mb:>8.1f} {mode:>7} {best['seconds']:>9.3f} "
+                      f"{rows / best['seconds']:>12,.0f} {peak:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
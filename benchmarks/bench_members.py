@@ -0,0 +1,118 @@
+"""
+ZIP メンバー並列処理ベンチマーク: MEMBER_WORKERS 1 / 2 / 6
+
+ジェネレーターで作成した複数時間分の CSV を1つの ZIP にまとめ、
+lambda_function.ingest() を MEMBER_WORKERS を変えて処理する。
+Lambda の vCPU 数（メモリ 1,769MB で 1、10,240MB で 6）を再現するため、
+子プロセスの CPU アフィニティをワーカー数に合わせて制限する。
+コア数がワーカー数より少ないマシンでは制限できず、速度向上は頭打ちになる。
+
+使用方法:
+    python benchmarks/bench_members.py
+    python benchmarks/bench_members.py --rows 200000 --members 12 --mode disk
+"""
+
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import _common
+from _common import generate_zip, peak_rss_mb, quiet, LocalDirS3Client
+
+DEFAULT_WORKERS = '1,2,6'
+
+
+def build_bundle(output_dir, rows, members):
+    """1時間 rows 行 × members 時間分の CSV を1つの ZIP にまとめる"""
+    bundle = Path(output_dir) / 'bundle.zip'
+    with zipfile.ZipFile(bundle, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as out:
+        for hour in range(members):
+            hourly = generate_zip(output_dir, rows, hour)
+            with zipfile.ZipFile(hourly) as z:
+                name = f'{hour:02d}.csv'
+                with z.open(name) as src, out.open(name, 'w') as dst:
+                    while chunk := src.read(1024 * 1024):
+                        dst.write(chunk)
+            os.remove(hourly)
+    return bundle
+
+
+def run_child(mode, workers, zip_path):
+    """子プロセス側: 1回分の取り込みを計測して JSON を出力"""
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    pinned = len(cpus) >= workers
+    if pinned:
+        os.sched_setaffinity(0, cpus[:workers])
+
+    import lambda_function
+    import member_pool
+
+    lambda_function.s3_client = LocalDirS3Client({('bench', 'raw/bundle.zip'): zip_path})
+    # ワーカーにローカルのクライアントを引き継ぐため fork で起動する（このプロセスにはスレッドがない）
+    lambda_function.worker_s3_client = lambda: lambda_function.s3_client
+    member_pool.START_METHOD = 'fork'
+    lambda_function.INGEST_MODE = mode
+    lambda_function.MEMBER_WORKERS = workers
+
+    with quiet():
+        start = time.perf_counter()
+        stats, = lambda_function.ingest('bench', 'raw/bundle.zip')
+        elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'seconds': elapsed,
+        'peak_rss_mb': peak_rss_mb(),
+        'hours': len(stats['severity_stats']),
+        'pinned': pinned,
+    }))
+
+
+def measure(mode, workers, zip_path):
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, str(workers), str(zip_path)],
+        text=True,
+    )
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parallel ZIP member processing')
+    parser.add_argument('--rows', type=int, default=100000, help='Rows per member (default: 100000)')
+    parser.add_argument('--members', type=int, default=6, help='CSV members in the ZIP (default: 6)')
+    parser.add_argument('--workers', default=DEFAULT_WORKERS,
+                        help=f'Comma separated MEMBER_WORKERS (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--mode', choices=['stream', 'disk'], default='stream', help='INGEST_MODE')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per setting (best is reported)')
+    parser.add_argument('--child', nargs=3, metavar=('MODE', 'WORKERS', 'ZIP'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, workers, zip_path = args.child
+        run_child(mode, int(workers), zip_path)
+        return
+
+    total_rows = args.rows * args.members
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_path = build_bundle(tmp, args.rows, args.members)
+        zip_mb = zip_path.stat().st_size / 1024 / 1024
+        print(f"{args.members} members x {args.rows:,} rows ({zip_mb:.1f} MB), mode={args.mode}")
+        print(f"{'workers':>8} {'seconds':>9} {'rows/s':>12} {'speedup':>8} {'peak RSS MB':>12}")
+        print('-' * 53)
+        baseline = None
+        for workers in [int(w) for w in args.workers.split(',')]:
+            runs = [measure(args.mode, workers, zip_path) for _ in range(args.repeat)]
+            best = min(runs, key=lambda r: r['seconds'])
+            baseline = baseline or best['seconds']
+            note = '' if best['pinned'] else '  (not enough CPUs to pin)'
+            print(f"{workers:>8} {best['seconds']:>9.3f} {total_rows / best['seconds']:>12,.0f} "
+                  f"{baseline / best['seconds']:>7.2f}x {best['peak_rss_mb']:>12.1f}{note}")
+
+
+if __name__ == '__main__':
+    main()
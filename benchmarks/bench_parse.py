@@ -0,0 +1,104 @@
+"""
+CSV 解析ベンチマーク: csv.DictReader (従来実装) vs CsvScanner (高速パス)
+
+ジェネレーターで作成した1時間分のCSVを展開し、両実装の rows/sec を比較する。
+両者の集計結果が一致することも確認する。
+
+使用方法:
+    python benchmarks/bench_parse.py
+    python benchmarks/bench_parse.py --rows 500000 --repeat 5
+    python benchmarks/bench_parse.py --profile burst:hours=0,zipf   # 偏りのある負荷（generator/profiles.py）
+"""
+
+import csv
+import time
+import zipfile
+import argparse
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+import _common
+from _common import generate_zip, quiet
+
+DEFAULT_ROWS = 200000
+
+
+def legacy_parse_csv(csv_path):
+    """csv.DictReader による従来の parse_csv（比較用にそのまま残す）"""
+    stats = defaultdict(lambda: {'CRITICAL': 0, 'WARNING': 0})
+    log_date = None
+    hostname = None
+
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+
+        for row in reader:
+            if not log_date:
+                log_date = row['Timestamp'][:10]
+                hostname = row['Hostname']
+
+            severity = row['Severity']
+
+            if severity in ['CRITICAL', 'WARNING']:
+                hour = row['Timestamp'][11:13] + ':00'
+                stats[hour][severity] += 1
+
+    return {
+        'log_date': log_date,
+        'hostname': hostname,
+        'hourly_stats': dict(stats)
+    }
+
+
+def best_of(func, path, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        with quiet():
+            start = time.perf_counter()
+            result = func(path)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DictReader vs CsvScanner')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                        help=f'Rows in the CSV (default: {DEFAULT_ROWS})')
+    parser.add_argument('--threat-ratio', type=float, default=0.1)
+    parser.add_argument('--profile', default='flat',
+                        help='Generator load profile, e.g. burst:hours=0,zipf (default: flat)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per implementation (best is reported)')
+    args = parser.parse_args()
+
+    import lambda_function
+
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_path = generate_zip(tmp, args.rows, threat_ratio=args.threat_ratio,
+                                profile=args.profile)
+        with zipfile.ZipFile(zip_path) as z:
+            z.extractall(tmp)
+        csv_path = Path(tmp) / '00.csv'
+        # プロファイルによっては行数が --rows と異なる
+        with open(csv_path, 'rb') as f:
+            rows = sum(1 for _ in f) - 1
+
+        legacy_time, legacy_stats = best_of(legacy_parse_csv, csv_path, args.repeat)
+        fast_time, fast_stats = best_of(lambda_function.parse_csv, csv_path, args.repeat)
+
+    legacy_keys = ('log_date', 'hostname', 'hourly_stats')
+    if any(legacy_stats[k] != fast_stats[k] for k in legacy_keys):
+        raise SystemExit("ERROR: results differ between implementations")
+
+    print(f"rows: {rows:,}  profile: {args.profile}")
+    print(f"{'implementation':<16} {'seconds':>9} {'rows/s':>12}")
+    print('-' * 40)
+    print(f"{'DictReader':<16} {legacy_time:>9.3f} {rows / legacy_time:>12,.0f}")
+    print(f"{'CsvScanner':<16} {fast_time:>9.3f} {rows / fast_time:>12,.0f}")
+    print(f"speedup: {legacy_time / fast_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+集計ルールのベンチマーク: ルールなし vs コンパイル済みのルール（filter_rules.RuleSet）vs 1行ずつの評価
+
+ジェネレーターで作成した1時間分のCSVを parse_csv で集計し、次の場合の rows/sec を比較する。
+
+  - none:      ルールなし（従来の CRITICAL / WARNING の集計だけ）
+  - severity:  Severity だけのルール（集計カウンタから求めるため、行ごとのコストは増えない）
+  - soc:       AppName / LogType / Message の条件を含むルール（ディスパッチテーブル + まとめた正規表現、
+               Message だけのルールは読み込み単位ごとの文字列の検索）
+  - naive:     soc と同じルールを、行ごとに全ルールの条件と正規表現をそのまま評価する実装（比較用）
+  - check:     CsvScanner の行ごとに severity in ['CRITICAL', 'WARNING'] を判定する集計（判定だけのコストの比較用）
+  - baseline:  csv.DictReader の行ごとに severity in ['CRITICAL', 'WARNING'] を判定していた従来の parse_csv
+
+severity と soc が baseline より遅い場合、soc と naive のルール別件数が一致しない場合はエラー終了する。
+計測環境のばらつきを抑えるため、各ケースを1回ずつ順に実行するのを repeat 回繰り返し、
+ケースごとの CPU 時間（time.process_time）の最良値を比べる。
+
+使用方法:
+    python benchmarks/bench_rules.py
+    python benchmarks/bench_rules.py --rows 500000 --repeat 5
+    python benchmarks/bench_rules.py --rules rules.json   # 任意のルール（FILTER_RULES と同じ JSON）
+"""
+
+import re
+import json
+import zipfile
+import argparse
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+import _common
+from _common import generate_zip, interleaved_best
+from bench_parse import legacy_parse_csv as baseline_parse_csv
+
+DEFAULT_ROWS = 200000
+
+SEVERITY_RULES = [
+    {'name': 'critical', 'severity': 'CRITICAL'},
+    {'name': 'warning', 'severity': 'WARNING'},
+    {'name': 'urgent', 'severity': ['EMERGENCY', 'ALERT']},
+]
+
+SOC_RULES = SEVERITY_RULES + [
+    {'name': 'idp_error', 'severity': 'ERROR', 'app': 'RT_IDP'},
+    {'name': 'brute_force', 'message': 'brute force', 'ignore_case': True},
+    {'name': 'idp_scan', 'app': 'RT_IDP', 'log_type': 'THREAT', 'message': 'Port scan'},
+    {'name': 'sqli', 'log_type': 'THREAT', 'message': r'SQL injection|XSS'},
+]
+
+
+def naive_rule_counts(csv_path, rules):
+    """行ごとに全ルールの条件と正規表現を評価する実装（比較用）"""
+    from csv_scanner import CsvScanner
+
+    fields = (('severity', 'Severity'), ('app', 'AppName'), ('log_type', 'LogType'))
+    compiled = []
+    for rule in rules:
+        conditions = []
+        for key, column in fields:
+            if key in rule:
+                values = rule[key] if isinstance(rule[key], list) else [rule[key]]
+                conditions.append((column, {v.encode() for v in values}))
+        search = None
+        if 'message' in rule:
+            flags = re.IGNORECASE if rule.get('ignore_case') else 0
+            search = re.compile(rule['message'].encode(), flags).search
+        compiled.append((rule['name'], conditions, search))
+
+    counts = defaultdict(lambda: defaultdict(int))
+    with open(csv_path, 'rb') as f:
+        scanner = CsvScanner(f)
+        columns = ['Timestamp', 'Severity', 'AppName', 'LogType', 'Message']
+        index = dict(zip(columns, scanner.column_indexes(columns)))
+        for row in scanner.rows(max(index.values())):
+            hour = row[index['Timestamp']][11:13].decode() + ':00'
+            for name, conditions, search in compiled:
+                if all(row[index[column]] in values for column, values in conditions) and (
+                        search is None or search(row[index['Message']]) is not None):
+                    counts[hour][name] += 1
+    return {hour: dict(rules) for hour, rules in counts.items()}
+
+
+def check_parse_csv(csv_path):
+    """CsvScanner の行ごとに Severity のリストを判定する集計（判定だけのコストの比較用）"""
+    from csv_scanner import CsvScanner
+
+    stats = defaultdict(lambda: {'CRITICAL': 0, 'WARNING': 0})
+    with open(csv_path, 'rb') as f:
+        scanner = CsvScanner(f)
+        ts_i, sev_i = scanner.column_indexes(['Timestamp', 'Severity'])
+        for row in scanner.rows(max(ts_i, sev_i)):
+            severity = row[sev_i].decode()
+            if severity in ['CRITICAL', 'WARNING']:
+                stats[row[ts_i][11:13].decode() + ':00'][severity] += 1
+    return dict(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compiled filter rules')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                        help=f'Rows in the CSV (default: {DEFAULT_ROWS})')
+    parser.add_argument('--threat-ratio', type=float, default=0.1)
+    parser.add_argument('--rules', help='JSON file with the rules to use as "soc"')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case (best is reported)')
+    args = parser.parse_args()
+
+    import lambda_function
+    from filter_rules import RuleSet
+
+    soc_rules = json.loads(Path(args.rules).read_text()) if args.rules else SOC_RULES
+    # THREAT 行の追跡・テンプレート別集計は止め、ルールの評価だけの差を比べる
+    lambda_function.HEAVY_HITTER_CAPACITY = 0
+    lambda_function.HLL_PRECISION = 0
+    lambda_function.MESSAGE_TEMPLATES = 0
+
+    def run_with(rules):
+        def run():
+            lambda_function.filter_rules = RuleSet.parse(json.dumps(rules))
+            return lambda_function.parse_csv(csv_path)
+        return run
+
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_path = generate_zip(tmp, args.rows, threat_ratio=args.threat_ratio)
+        with zipfile.ZipFile(zip_path) as z:
+            z.extractall(tmp)
+        csv_path = Path(tmp) / '00.csv'
+
+        results = interleaved_best({
+            'none': run_with([]),
+            'severity': run_with(SEVERITY_RULES),
+            'soc': run_with(soc_rules),
+            'naive': lambda: naive_rule_counts(csv_path, soc_rules),
+            'check': lambda: check_parse_csv(csv_path),
+            'baseline': lambda: baseline_parse_csv(csv_path),
+        }, args.repeat)
+
+    if results['soc'][1].get('rule_stats', {}) != results['naive'][1]:
+        raise SystemExit("ERROR: rule counts differ between compiled and naive evaluation")
+    expected = results['none'][1]['hourly_stats']
+    if results['check'][1] != expected or results['baseline'][1]['hourly_stats'] != expected:
+        raise SystemExit("ERROR: CRITICAL/WARNING counts differ from the per-row check")
+
+    rows = args.rows
+    baseline = results['none'][0]
+    print(f"rows: {rows:,}  soc rules: {len(soc_rules)}")
+    print(f"{'case':<10} {'seconds':>9} {'rows/s':>12} {'vs none':>9}")
+    print('-' * 44)
+    for name, (seconds, _) in results.items():
+        print(f"{name:<10} {seconds:>9.3f} {rows / seconds:>12,.0f} {seconds / baseline:>8.2f}x")
+
+    # 目標: ルールを足しても、行ごとに Severity を判定していた従来の parse_csv より遅くならない
+    slower = [name for name in ('severity', 'soc') if results[name][0] > results['baseline'][0]]
+    if slower:
+        raise SystemExit(f"ERROR: {', '.join(slower)} slower than the baseline parse_csv")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Message のテンプレート別集計のベンチマーク: 無効 vs 先頭のキャッシュ（templates.TemplateCounts）vs 1行ずつの正規化
+
+ジェネレーターで作成した1時間分のCSVを parse_csv で集計し、次の場合の rows/sec を比較する。
+
+  - off:       テンプレート別集計なし（MESSAGE_TEMPLATES=0）
+  - templates: Message の先頭 → テンプレート番号 のキャッシュで数える（MESSAGE_TEMPLATES=64、既定）
+  - naive:     行ごとに接頭辞を正規化してテンプレート名を作り、名前の辞書で数える実装（比較用）
+
+目標は、テンプレート別集計の行ごとのコストが「キャッシュを1回引いて件数を1つ足す」のに近いこと。
+読み込み・分割のばらつきを除くため、分割済みの行（メモリ上）で次のループを比べ、
+(consume + templates) - consume が hit - loop の MAX_HIT_RATIO 倍を超えたらエラー終了する。
+
+  - loop:      行を順に読むだけ
+  - hit:       行ごとに Message の先頭のスライスで辞書を1回引き、件数を1つ足す
+  - consume:   Aggregator.consume（時 × Severity の集計）
+  - consume + templates: Aggregator.consume にテンプレート別集計を加えたもの
+
+templates と naive のテンプレート別件数が一致しない場合もエラー終了する。
+各ケースを1回ずつ順に実行するのを repeat 回繰り返し、CPU 時間の最良値を比べる。
+
+使用方法:
+    python benchmarks/bench_templates.py
+    python benchmarks/bench_templates.py --rows 500000 --repeat 5
+"""
+
+import zipfile
+import argparse
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+import _common
+from _common import generate_zip, interleaved_best
+
+DEFAULT_ROWS = 200000
+# テンプレート別集計の行ごとのコストの上限（キャッシュを1回引いて件数を1つ足すコストに対する倍率）
+MAX_HIT_RATIO = 2.0
+
+
+def naive_template_counts(csv_path):
+    """行ごとに Message を正規化してテンプレート名で数える実装（比較用）"""
+    from csv_scanner import CsvScanner
+    from templates import message_prefix, template_name
+
+    counts = defaultdict(lambda: defaultdict(int))
+    with open(csv_path, 'rb') as f:
+        scanner = CsvScanner(f)
+        ts_i, msg_i = scanner.column_indexes(['Timestamp', 'Message'])
+        for row in scanner.rows(max(ts_i, msg_i)):
+            hour = row[ts_i][11:13].decode() + ':00'
+            counts[hour][template_name(message_prefix(row[msg_i]))] += 1
+    return {hour: dict(templates) for hour, templates in counts.items()}
+
+
+def loop_cases(csv_path):
+    """分割済みの行で、行ごとのコストを比べるループ（キャッシュの検索・集計・テンプレート別集計）"""
+    from csv_scanner import CsvScanner
+    from aggregation import AggregationSpec, Aggregator
+    from templates import KEY_BYTES, TemplateCounts
+
+    with open(csv_path, 'rb') as f:
+        scanner = CsvScanner(f)
+        ts_i, sev_i, msg_i = scanner.column_indexes(['Timestamp', 'Severity', 'Message'])
+        # parse_csv と同じく Message は分割しない
+        rows = list(scanner.rows(msg_i - 1))
+
+    def loop():
+        for fields in rows:
+            pass
+
+    def hit():
+        cache = {}
+        counts = [0] * 1024
+        get = cache.get
+        for fields in rows:
+            key = fields[msg_i][:KEY_BYTES]
+            template_id = get(key)
+            if template_id is None:
+                template_id = cache[key] = len(cache) % len(counts)
+            counts[template_id] += 1
+
+    def consume():
+        Aggregator(AggregationSpec()).consume(rows, ts_i, sev_i)
+
+    def consume_templates():
+        Aggregator(AggregationSpec()).consume(rows, ts_i, sev_i,
+                                              templates=TemplateCounts(64).counter(msg_i))
+
+    return {'loop': loop, 'hit': hit, 'consume': consume, 'consume + templates': consume_templates}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark message template counting')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                        help=f'Rows in the CSV (default: {DEFAULT_ROWS})')
+    parser.add_argument('--threat-ratio', type=float, default=0.1)
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case (best is reported)')
+    args = parser.parse_args()
+
+    import lambda_function
+
+    # THREAT 行の追跡は止め、テンプレート別集計だけの差を比べる
+    lambda_function.HEAVY_HITTER_CAPACITY = 0
+    lambda_function.HLL_PRECISION = 0
+
+    def run_with(max_templates):
+        def run():
+            lambda_function.MESSAGE_TEMPLATES = max_templates
+            return lambda_function.parse_csv(csv_path)
+        return run
+
+    with tempfile.TemporaryDirectory() as tmp:
+        zip_path = generate_zip(tmp, args.rows, threat_ratio=args.threat_ratio)
+        with zipfile.ZipFile(zip_path) as z:
+            z.extractall(tmp)
+        csv_path = Path(tmp) / '00.csv'
+
+        results = interleaved_best({
+            'off': run_with(0),
+            'templates': run_with(64),
+            'naive': lambda: naive_template_counts(csv_path),
+        }, args.repeat)
+        loops = interleaved_best(loop_cases(csv_path), args.repeat * 2)
+
+    if results['templates'][1].get('template_stats') != results['naive'][1]:
+        raise SystemExit("ERROR: template counts differ between cached and naive counting")
+
+    rows = args.rows
+    baseline = results['off'][0]
+    templates = sum(len(t) for t in results['naive'][1].values())
+    print(f"rows: {rows:,}  templates (hour x template): {templates}")
+    print(f"{'case':<10} {'seconds':>9} {'rows/s':>12} {'vs off':>9}")
+    print('-' * 44)
+    for name, (seconds, _) in results.items():
+        print(f"{name:<10} {seconds:>9.3f} {rows / seconds:>12,.0f} {seconds / baseline:>8.2f}x")
+
+    # 目標: 行ごとのコストがキャッシュを1回引いて件数を1つ足すのに近い（MAX_HIT_RATIO 倍以内）
+    cost = loops['consume + templates'][0] - loops['consume'][0]
+    hit = loops['hit'][0] - loops['loop'][0]
+    print(f"per row: templates {cost / rows * 1e9:.0f} ns, cache hit + count {hit / rows * 1e9:.0f} ns "
+          f"({cost / hit:.2f}x, limit {MAX_HIT_RATIO}x)")
+    if cost > hit * MAX_HIT_RATIO:
+        raise SystemExit(f"ERROR: template counting costs more than {MAX_HIT_RATIO}x a cache hit per row")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+THREAT 行の追跡のベンチマーク: 無効 vs 上位追跡（HEAVY_HITTER_CAPACITY）vs ユニーク数（HLL_PRECISION）
+
+ジェネレーターで作成した1時間分のCSVを parse_csv で集計し、次の場合の rows/sec を
+THREAT 行の割合ごとに比較する。
+
+  - off:           THREAT 行の追跡なし（HEAVY_HITTER_CAPACITY=0、HLL_PRECISION=0）
+  - heavy_hitters: 送信元IP・宛先IP・宛先ポートの上位追跡（HEAVY_HITTER_CAPACITY=64）
+  - hll:           送信元IPのユニーク数の推定（HLL_PRECISION=12）
+  - both:          両方（Message の解析は1回で、両方の追跡器に渡す）
+
+各ケースを1回ずつ順に実行するのを repeat 回繰り返し、CPU 時間の最良値を比べる。
+
+使用方法:
+    python benchmarks/bench_threats.py
+    python benchmarks/bench_threats.py --rows 500000 --repeat 5 --threat-ratios 0.1,0.5
+"""
+
+import zipfile
+import argparse
+import tempfile
+from pathlib import Path
+
+import _common
+from _common import generate_zip, interleaved_best
+
+DEFAULT_ROWS = 200000
+DEFAULT_THREAT_RATIOS = '0.1,0.5'
+
+# case → lambda_function に設定する値
+CASES = {
+    'off': {'HEAVY_HITTER_CAPACITY': 0, 'HLL_PRECISION': 0},
+    'heavy_hitters': {'HEAVY_HITTER_CAPACITY': 64, 'HLL_PRECISION': 0},
+    'hll': {'HEAVY_HITTER_CAPACITY': 0, 'HLL_PRECISION': 12},
+    'both': {'HEAVY_HITTER_CAPACITY': 64, 'HLL_PRECISION': 12},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark THREAT row tracking')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS,
+                        help=f'Rows in the CSV (default: {DEFAULT_ROWS})')
+    parser.add_argument('--threat-ratios', default=DEFAULT_THREAT_RATIOS,
+                        help=f'Comma separated THREAT ratios (default: {DEFAULT_THREAT_RATIOS})')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case (best is reported)')
+    args = parser.parse_args()
+
+    import lambda_function
+
+    # テンプレート別集計は既定（有効）のまま、THREAT 行の追跡を加えた差を比べる
+    lambda_function.MESSAGE_TEMPLATES = 64
+
+    def run_with(settings, csv_path):
+        def run():
+            for name, value in settings.items():
+                setattr(lambda_function, name, value)
+            return lambda_function.parse_csv(csv_path)
+        return run
+
+    rows = args.rows
+    print(f"rows: {rows:,}")
+    print(f"{'threat':>6} {'case':<14} {'seconds':>9} {'rows/s':>12} {'vs off':>9}")
+    print('-' * 54)
+    for ratio in (float(r) for r in args.threat_ratios.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            zip_path = generate_zip(tmp, rows, threat_ratio=ratio, seed=1)
+            with zipfile.ZipFile(zip_path) as z:
+                z.extractall(tmp)
+            csv_path = Path(tmp) / '00.csv'
+            results = interleaved_best({name: run_with(settings, csv_path)
+                                        for name, settings in CASES.items()}, args.repeat)
+
+        baseline = results['off'][0]
+        for name, (seconds, _) in results.items():
+            print(f"{ratio:>6.0%} {name:<14} {seconds:>9.3f} {rows / seconds:>12,.0f} "
+                  f"{seconds / baseline:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""
+エンドツーエンド・ベンチマークスイート（ベースラインとの比較付き）
+
+JuniperSyslogGenerator でシードを固定したコーパス（1日分の時間別ZIP）を作り、
+S3 / DynamoDB をローカルのフェイクに差し替えて lambda_handler 全体を実行する。
+コーパスごとに次の値を計測する。
+
+  - rows/sec（lambda_handler の所要時間から算出、--repeat 回の最良値）
+  - ピークメモリ: RSS（/proc/self/status の VmHWM）と tracemalloc
+  - 段階別の所要時間: download / extract / parse / save / export / other
+
+段階別の時間はハンドラーが EMF で出力するメトリクス（lambda_function.metrics）から取る。
+入れ子になった段階は内側の時間を外側から差し引いた値で、other は所要時間の残り。
+レコードを並行処理するスレッドの時間は合算されるため、段階別の合計が所要時間と
+一致するよう既定ではハンドラーの MAX_WORKERS を 1 にする（--max-workers で変更できる）。
+
+結果は --save で JSON に保存できる。--compare で保存済みのベースラインと比べ、
+rows/sec の低下が --threshold（既定 15%）を超えたコーパスがあれば終了コード 1 で終わる。
+
+使用方法:
+    python benchmarks/suite.py                                   # small / medium / threats
+    python benchmarks/suite.py --corpus all --save benchmarks/baseline.json
+    python benchmarks/suite.py --compare benchmarks/baseline.json --threshold 0.10
+    python benchmarks/suite.py --corpus large --corpus-dir .bench-corpora --repeat 3
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+from collections import namedtuple
+
+import _common
+from _common import peak_rss_mb, quiet, LocalDirS3Client
+
+FORMAT_VERSION = 1
+STAGES = ('download', 'extract', 'parse', 'save', 'export', 'other')
+
+Corpus = namedtuple('Corpus', ['hours', 'rows_per_hour', 'threat_ratio', 'seed', 'profile'],
+                    defaults=('flat',))
+
+# コーパス: 時間数 × 1時間の行数、THREAT 行の割合、負荷の形（generator/profiles.py）
+CORPORA = {
+    'tiny': Corpus(1, 1000, 0.1, 1),
+    'small': Corpus(4, 10000, 0.1, 2),
+    'medium': Corpus(24, 20000, 0.1, 3),
+    'threats': Corpus(4, 50000, 0.5, 4),
+    'quiet': Corpus(4, 50000, 0.0, 5),
+    'large': Corpus(24, 100000, 0.1, 6),
+    'xlarge': Corpus(24, 250000, 0.1, 7),
+    'diurnal': Corpus(24, 20000, 0.1, 8, 'diurnal:amplitude=0.8'),
+    'burst': Corpus(24, 20000, 0.1, 9, 'burst:count=3:factor=2'),
+    'zipf': Corpus(4, 50000, 0.1, 10, 'zipf:s=1.2:sources=1000'),
+}
+DEFAULT_CORPORA = 'small,medium,threats'
+DEFAULT_THRESHOLD = 0.15
+
+CORPUS_DATE = datetime(2025, 4, 28)
+CORPUS_HOSTNAME = 'srx-fw01'
+BUCKET = 'bench'
+
+
+def corpus_rows(corpus):
+    if corpus.profile == 'flat':
+        return corpus.hours * corpus.rows_per_hour
+    from generate import planned_rows
+    return sum(planned_rows(CORPUS_HOSTNAME, CORPUS_DATE, hour, corpus.rows_per_hour,
+                            corpus.threat_ratio, corpus.seed, corpus.profile)
+               for hour in range(corpus.hours))
+
+
+def build_corpus(name, corpus, root):
+    """
+    コーパスを生成（root に同じ設定の生成済みコーパスがあれば再利用）
+
+    乱数のシードを固定するため、同じ設定からは毎回同じ内容の ZIP ができる
+    （時間ごとに独立した乱数で生成するため、プロセス数にもよらない）。
+
+    Returns:
+        list: 時間順の ZIP パス
+    """
+    from generate import generate_corpus
+
+    directory = (Path(root) / f"{name}-{corpus.hours}x{corpus.rows_per_hour}"
+                 f"-t{corpus.threat_ratio}-s{corpus.seed}")
+    if corpus.profile != 'flat':
+        # プロファイルの指定を変えたら作り直す
+        digest = hashlib.sha256(corpus.profile.encode('utf-8')).hexdigest()[:8]
+        directory = directory.with_name(f"{directory.name}-p{digest}")
+    paths = [directory / f"{hour:02d}.zip" for hour in range(corpus.hours)]
+    complete = directory / '.complete'
+    if complete.exists():
+        return paths
+
+    with quiet():
+        # NumPy の有無でコーパスの内容が変わらないよう、標準ライブラリのバッチ生成に固定する
+        failed = generate_corpus(directory, [CORPUS_DATE], [CORPUS_HOSTNAME], corpus.rows_per_hour,
+                                 corpus.threat_ratio, corpus.seed, engine='python',
+                                 workers=os.cpu_count() or 1, hours=corpus.hours,
+                                 profile=corpus.profile)
+    if failed:
+        raise SystemExit(f"ERROR: failed to generate corpus {name}")
+    complete.touch()
+    return paths
+
+
+# ============================================================
+# 子プロセス: 1回分の計測
+# ============================================================
+
+def run_child(paths, mode, max_workers, trace):
+    """子プロセス側: lambda_handler を1回実行して計測結果を JSON で出力"""
+    import tracemalloc
+    import lambda_function
+    from dynamodb_writer import BatchWriter
+    from tests.fakes import FakeDynamoDB
+
+    keys = [f"raw/{CORPUS_DATE:%Y-%m-%d}/{Path(p).name}" for p in paths]
+    dynamodb = FakeDynamoDB()
+    lambda_function.s3_client = LocalDirS3Client({(BUCKET, k): p for k, p in zip(keys, paths)})
+    lambda_function.worker_s3_client = lambda: lambda_function.s3_client
+    lambda_function.table = dynamodb.Table(lambda_function.DYNAMODB_TABLE)
+    lambda_function.batch_writer = BatchWriter(dynamodb, lambda_function.DYNAMODB_TABLE)
+    lambda_function.INGEST_MODE = mode
+    if max_workers:
+        lambda_function.MAX_WORKERS = max_workers
+
+    event = {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': k}}} for k in keys]}
+    rss_before = peak_rss_mb()
+    if trace:
+        tracemalloc.start()
+    with quiet():
+        start = time.perf_counter()
+        lambda_function.lambda_handler(event, None)
+        elapsed = time.perf_counter() - start
+    result = {'seconds': elapsed, 'peak_rss_mb': peak_rss_mb(), 'rss_before_mb': rss_before}
+    if trace:
+        result['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+    stages = lambda_function.metrics.to_dict()['seconds']
+    stages['other'] = max(0.0, elapsed - sum(stages.values()))
+    result['stages'] = stages
+    table = lambda_function.table
+    result['items'] = len(table.items)
+    result['rows'] = sum(int(count) for item in table.items.values()
+                         for count in item['severity_counts'].values())
+    print(json.dumps(result))
+
+
+def measure(paths, mode, max_workers, trace=False):
+    command = [sys.executable, os.path.abspath(__file__), '--child', mode,
+               '--max-workers', str(max_workers or 0)]
+    if trace:
+        command.append('--trace')
+    output = subprocess.check_output(command + [str(p) for p in paths], text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_corpus(name, corpus, root, mode, max_workers, repeat):
+    paths = build_corpus(name, corpus, root)
+    rows = corpus_rows(corpus)
+    runs = [measure(paths, mode, max_workers) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r['seconds'])
+    if best['rows'] != rows or best['items'] != corpus.hours:
+        raise SystemExit(f"{name}: expected {rows} rows in {corpus.hours} items, "
+                         f"got {best['rows']} rows in {best['items']} items")
+    traced = measure(paths, mode, max_workers, trace=True)
+    return {
+        'rows': rows,
+        'files': corpus.hours,
+        'threat_ratio': corpus.threat_ratio,
+        'profile': corpus.profile,
+        'zip_bytes': sum(os.path.getsize(p) for p in paths),
+        'seconds': best['seconds'],
+        'rows_per_second': rows / best['seconds'],
+        'peak_rss_mb': max(r['peak_rss_mb'] for r in runs),
+        'rss_before_mb': best['rss_before_mb'],
+        'tracemalloc_peak_mb': traced['tracemalloc_peak_mb'],
+        'stages': best['stages'],
+    }
+
+
+# ============================================================
+# ベースラインとの比較
+# ============================================================
+
+def compare(baseline, current, threshold, memory_threshold=None):
+    """
+    ベースラインと今回の結果を比べる
+
+    Args:
+        threshold (float): rows/sec の低下率の許容値（0.15 = 15%）
+        memory_threshold (float): tracemalloc のピークの増加率の許容値（None は比べない）
+
+    Returns:
+        list: コーパスごとの (name, baseline, current, change, regressions)
+            change は rows/sec の変化率、regressions は許容値を超えた項目の説明
+    """
+    rows = []
+    for name, result in current['corpora'].items():
+        base = baseline['corpora'].get(name)
+        if base is None:
+            rows.append((name, None, result, None, []))
+            continue
+        change = result['rows_per_second'] / base['rows_per_second'] - 1
+        regressions = []
+        if -change > threshold:
+            regressions.append(f"rows/s {change:+.1%} (threshold -{threshold:.0%})")
+        if memory_threshold is not None:
+            growth = result['tracemalloc_peak_mb'] / max(base['tracemalloc_peak_mb'], 1e-9) - 1
+            if growth > memory_threshold:
+                regressions.append(f"tracemalloc peak {growth:+.1%} (threshold +{memory_threshold:.0%})")
+        rows.append((name, base, result, change, regressions))
+    return rows
+
+
+def print_results(results):
+    print(f"{'corpus':>8} {'rows':>11} {'seconds':>9} {'rows/s':>11} {'RSS MB':>8} {'traced MB':>10}  "
+          + ' '.join(f"{stage:>8}" for stage in STAGES))
+    print('-' * (64 + 9 * len(STAGES)))
+    for name, r in results['corpora'].items():
+        print(f"{name:>8} {r['rows']:>11,} {r['seconds']:>9.3f} {r['rows_per_second']:>11,.0f} "
+              f"{r['peak_rss_mb']:>8.1f} {r['tracemalloc_peak_mb']:>10.1f}  "
+              + ' '.join(f"{r['stages'][stage]:>8.3f}" for stage in STAGES))
+
+
+def print_comparison(rows):
+    print(f"{'corpus':>8} {'baseline rows/s':>16} {'current rows/s':>15} {'change':>8}  status")
+    print('-' * 64)
+    for name, base, result, change, regressions in rows:
+        if base is None:
+            print(f"{name:>8} {'-':>16} {result['rows_per_second']:>15,.0f} {'-':>8}  no baseline")
+            continue
+        status = 'REGRESSION: ' + '; '.join(regressions) if regressions else 'ok'
+        print(f"{name:>8} {base['rows_per_second']:>16,.0f} {result['rows_per_second']:>15,.0f} "
+              f"{change:>+8.1%}  {status}")
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark suite for lambda_handler')
+    parser.add_argument('--corpus', default=DEFAULT_CORPORA,
+                        help=f"Comma separated corpora or 'all' ({', '.join(CORPORA)}; "
+                             f"default: {DEFAULT_CORPORA})")
+    parser.add_argument('--corpus-dir', help='Directory to keep generated corpora for reuse '
+                                             '(default: a temporary directory)')
+    parser.add_argument('--mode', choices=['stream', 'disk'], default='stream', help='INGEST_MODE')
+    parser.add_argument('--max-workers', type=int, default=1,
+                        help='MAX_WORKERS of the handler (default: 1, 0 keeps the Lambda default)')
+    parser.add_argument('--repeat', type=int, default=1, help='Timed runs per corpus (best is reported)')
+    parser.add_argument('--save', metavar='FILE', help='Write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='Compare with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Allowed rows/sec drop against the baseline (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--memory-threshold', type=float,
+                        help='Allowed tracemalloc peak growth against the baseline (default: not checked)')
+    parser.add_argument('--child', metavar='MODE', help=argparse.SUPPRESS)
+    parser.add_argument('--trace', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('paths', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.paths, args.child, args.max_workers, args.trace)
+        return
+
+    names = list(CORPORA) if args.corpus == 'all' else args.corpus.split(',')
+    unknown = [name for name in names if name not in CORPORA]
+    if unknown:
+        parser.error(f"unknown corpus: {', '.join(unknown)}")
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('format') != FORMAT_VERSION:
+            parser.error(f"{args.compare}: unsupported baseline format {baseline.get('format')}")
+
+    results = {
+        'format': FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'settings': {'mode': args.mode, 'max_workers': args.max_workers, 'repeat': args.repeat},
+        'corpora': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.corpus_dir or tmp
+        for name in names:
+            print(f"Running {name} ({corpus_rows(CORPORA[name]):,} rows)...", file=sys.stderr)
+            results['corpora'][name] = run_corpus(name, CORPORA[name], root, args.mode,
+                                                  args.max_workers, args.repeat)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print(f"\nSaved: {args.save}")
+
+    if baseline is not None:
+        print()
+        if baseline['settings'] != results['settings'] or baseline['environment'] != results['environment']:
+            print(f"NOTE: settings or environment differ from the baseline ({baseline['created_at']})")
+        rows = compare(baseline, results, args.threshold, args.memory_threshold)
+        print_comparison(rows)
+        if any(regressions for *_, regressions in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+"""
+ログ行のバッチ生成
+
+JuniperSyslogGenerator.generate_log_row() と同じ列・同じ分布の行を、
+まとめて（1時間分を batch_size 行ずつ）生成して CSV の行文字列にする。
+
+行ごとに random を15回ほど呼ぶ代わりに、列ごとに k 個まとめて抽選する。
+  - タイムスタンプ: その時間の 3600 秒分の文字列を作っておき、そこから選ぶ
+  - IP アドレス: 上位2オクテット（"10.x" / "172.16〜31.x" / "192.168" / グローバル）と
+    下位2オクテット（"c.d"）の文字列を作っておき、重み付きで選ぶ。
+    グローバルIPは generate_log_row の棄却法と同じく、有効な上位2オクテットの一様分布になる
+  - AppName / Severity / LogType / メッセージ: 組み合わせごとの確率で1回だけ選ぶ
+  - 宛先ポート × プロトコル: 18通りから選ぶ
+選んだ文字列を1回の f-string で CSV の行にし、書き込みも "".join() して1回で行う。
+
+抽選は NumPy があれば numpy.random.Generator で、無ければ random.choices で行う。
+どちらも乱数の種は random モジュール（または渡された random.Random）から取るため、
+random.seed() で結果を固定できる（NumPy の有無で生成される行は変わるが、分布は同じ）。
+"""
+
+import io
+import csv
+import random
+from collections import namedtuple
+from datetime import timedelta
+from functools import lru_cache
+from itertools import accumulate, repeat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# 1回に生成する行数の上限（メモリ使用量を抑えるため）
+DEFAULT_BATCH_SIZE = 25000
+
+ENGINES = ("auto", "numpy", "python")
+
+THREAT_APPS = ["RT_SCREEN", "RT_IDP"]
+# 脅威ログのうち CRITICAL の割合（残りは WARNING）
+DEFAULT_CRITICAL_RATIO = 0.3
+# (Severity, 確率)
+NORMAL_SEVERITIES = [("INFO", 0.5), ("NOTICE", 0.5)]
+DST_PORTS = [22, 80, 443, 53, 123, 8080]
+PROTOCOLS = ["tcp", "udp", "icmp"]
+# 宛先IPがプライベートIPになる確率
+DST_PRIVATE_RATIO = 0.6
+
+# 1時間の中で同じ性質の行のまとまり（profiles.py のプロファイルが作る）
+#   rows: 行数
+#   threat_ratio / critical_ratio: 脅威ログの割合 / 脅威ログのうち CRITICAL の割合
+#   seconds: タイムスタンプの範囲 (開始秒, 終了秒)。None なら 0〜3599 秒
+#   src / dst: 送信元・宛先IP (IP の一覧, 累積の重み or None)。None なら既定の分布
+#   services: "{宛先ポート} protocol={プロトコル}" の一覧。None なら全 18 通り
+Segment = namedtuple(
+    "Segment",
+    ["rows", "threat_ratio", "critical_ratio", "seconds", "src", "dst", "services"],
+    defaults=(DEFAULT_CRITICAL_RATIO, None, None, None, None),
+)
+
+
+@lru_cache(maxsize=None)
+def octet_suffixes():
+    """下位2オクテット ".c.d"（c: 0〜255、d: 1〜254）"""
+    return [f".{c}.{d}" for c in range(256) for d in range(1, 255)]
+
+
+@lru_cache(maxsize=None)
+def private_prefixes():
+    """
+    プライベートIPの上位2オクテットと累積の重み
+
+    10.0.0.0/8・172.16.0.0/12・192.168.0.0/16 をそれぞれ 1/3 で選ぶ（random_private_ip と同じ）。
+    """
+    prefixes = [f"10.{b}" for b in range(256)]
+    weights = [1 / 3 / 256] * 256
+    prefixes += [f"172.{b}" for b in range(16, 32)]
+    weights += [1 / 3 / 16] * 16
+    prefixes.append("192.168")
+    weights.append(1 / 3)
+    return prefixes, list(accumulate(weights))
+
+
+@lru_cache(maxsize=None)
+def global_prefixes():
+    """グローバルIPの上位2オクテット（random_global_ip が返しうる組み合わせ）"""
+    return [
+        f"{a}.{b}"
+        for a in range(1, 224)
+        if a not in (10, 127)
+        for b in range(256)
+        if not (a == 172 and 16 <= b <= 31) and not (a == 192 and b == 168)
+    ]
+
+
+@lru_cache(maxsize=None)
+def dst_prefixes():
+    """宛先IPの上位2オクテットと累積の重み（プライベート 6 : グローバル 4）"""
+    private, private_weights = private_prefixes()
+    public = global_prefixes()
+    prefixes = private + public
+    weights = [w * DST_PRIVATE_RATIO for w in private_weights]
+    step = (1 - DST_PRIVATE_RATIO) / len(public)
+    weights += [DST_PRIVATE_RATIO + step * (i + 1) for i in range(len(public))]
+    return prefixes, weights
+
+
+@lru_cache(maxsize=None)
+def src_ports():
+    return [str(port) for port in range(1024, 65536)]
+
+
+@lru_cache(maxsize=None)
+def services():
+    """Message の "{宛先ポート} protocol={プロトコル}" の部分"""
+    return [
+        f"{port} protocol={protocol}" for port in DST_PORTS for protocol in PROTOCOLS
+    ]
+
+
+def csv_field(value):
+    """csv.writer と同じ規則で1つの値を CSV のフィールドにする（必要な場合だけ引用符で囲む）"""
+    out = io.StringIO()
+    csv.writer(out, lineterminator="").writerow([value])
+    return out.getvalue()
+
+
+def row_kinds(
+    hostname,
+    threat_ratio,
+    threat_messages,
+    normal_messages,
+    severities,
+    critical_ratio=DEFAULT_CRITICAL_RATIO,
+):
+    """
+    Timestamp と IP・ポート以外の列の組み合わせと、その確率
+
+    Returns:
+        list: [(行の Hostname〜Message 先頭の部分, Message 末尾の部分, 確率), ...]
+              generate_log_row と同じく、脅威ログは AppName 2種 × CRITICAL 30% / WARNING 70%、
+              通常ログは AppName 4種 × INFO / NOTICE 50% ずつ、メッセージは AppName ごとに一様
+    """
+    host = csv_field(hostname)
+    kinds = []
+    normal_apps = list(normal_messages)
+    threat_severities = [("CRITICAL", critical_ratio), ("WARNING", 1 - critical_ratio)]
+    groups = [
+        ("THREAT", threat_ratio, THREAT_APPS, threat_messages, threat_severities),
+        ("NORMAL", 1 - threat_ratio, normal_apps, normal_messages, NORMAL_SEVERITIES),
+    ]
+    for log_type, ratio, apps, messages, severity_weights in groups:
+        for appname in apps:
+            for severity, severity_weight in severity_weights:
+                level = severities[severity]
+                app_messages = messages[appname]
+                for message in app_messages:
+                    weight = ratio / len(apps) * severity_weight / len(app_messages)
+                    head = f",{host},{appname},{level},{severity},{log_type},{message} "
+                    tail = f" SeverityLevel={level} Severity={severity}\r\n"
+                    kinds.append((head, tail, weight))
+    return kinds
+
+
+class PythonSampler:
+    """random.choices による抽選（標準ライブラリのみ）"""
+
+    def __init__(self, rand=random):
+        self.rand = rand
+        self.current = rand
+
+    def reseed(self, rand=None):
+        self.current = rand or self.rand
+
+    def choose(self, population, cum_weights=None, k=1):
+        """population から k 個選ぶ（cum_weights は累積の重み、None なら一様）"""
+        return self.current.choices(population, cum_weights=cum_weights, k=k)
+
+
+class NumpySampler:
+    """numpy.random.Generator による抽選（種は reseed() のたびに rand から取る）"""
+
+    # 変換した配列を保持する表の数の上限
+    MAX_ARRAYS = 64
+
+    def __init__(self, rand=random):
+        self.rand = rand
+        self.rng = None
+        # id(表) → (表, NumPy の配列)。表は使い回すため、毎回の変換を避ける
+        # （表そのものも保持するため、保持している間に id が別の表に再利用されることはない）
+        self.arrays = {}
+
+    def reseed(self, rand=None):
+        self.rng = numpy.random.default_rng((rand or self.rand).getrandbits(64))
+
+    def array(self, values, dtype):
+        cached = self.arrays.get(id(values))
+        if cached is None:
+            if len(self.arrays) >= self.MAX_ARRAYS:
+                del self.arrays[next(iter(self.arrays))]
+            array = numpy.empty(len(values), dtype=dtype)
+            array[:] = values
+            cached = self.arrays[id(values)] = (values, array)
+        return cached[1]
+
+    def choose(self, population, cum_weights=None, k=1):
+        if cum_weights is None:
+            index = self.rng.integers(0, len(population), size=k)
+        else:
+            cum = self.array(cum_weights, float)
+            index = numpy.searchsorted(cum, self.rng.random(k) * cum[-1], side="right")
+        return self.array(population, object)[index].tolist()
+
+
+def resolve_engine(engine):
+    """"auto" を NumPy の有無で "numpy" / "python" に決める"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine} (choose from {', '.join(ENGINES)})")
+    if engine == "auto":
+        return "numpy" if numpy is not None else "python"
+    if engine == "numpy" and numpy is None:
+        raise ImportError("engine 'numpy' requires NumPy (pip install numpy)")
+    return engine
+
+
+class BatchRowGenerator:
+    """
+    1時間分の行をまとめて生成する
+
+    Args:
+        hostname (str): Hostname 列の値
+        threat_ratio (float): 脅威ログの割合
+        threat_messages, normal_messages, severities (dict): generate.py の定義
+        engine (str): "auto" / "numpy" / "python"
+        rand: 乱数の種を取る random.Random（既定は random モジュール）
+    """
+
+    def __init__(self, hostname, threat_ratio, threat_messages, normal_messages,
+                 severities, engine="auto", rand=random):
+        self.engine = resolve_engine(engine)
+        self.hostname = hostname
+        self.threat_ratio = threat_ratio
+        self.messages = (threat_messages, normal_messages, severities)
+        # (threat_ratio, critical_ratio) → (組み合わせ, 累積の重み)
+        self.kind_tables = {}
+        self.src_prefixes, self.src_weights = private_prefixes()
+        self.dst_prefixes, self.dst_weights = dst_prefixes()
+        self.sampler = (NumpySampler if self.engine == "numpy" else PythonSampler)(rand)
+
+    def kinds(self, threat_ratio, critical_ratio=DEFAULT_CRITICAL_RATIO):
+        key = (threat_ratio, critical_ratio)
+        table = self.kind_tables.get(key)
+        if table is None:
+            kinds = row_kinds(
+                self.hostname, threat_ratio, *self.messages, critical_ratio=critical_ratio
+            )
+            table = self.kind_tables[key] = (
+                [(head, tail) for head, tail, _ in kinds],
+                list(accumulate(weight for _, _, weight in kinds)),
+            )
+        return table
+
+    def lines(self, base_time, count, rand=None, segment=None):
+        """
+        count 行分の CSV の行（"\\r\\n" 区切り、ヘッダーなし）
+
+        Args:
+            base_time (datetime): その時間の開始時刻（タイムスタンプは +0〜3599 秒）
+            count (int): 行数
+            rand: 乱数を取る random.Random（省略時はコンストラクタの rand）
+            segment (Segment): 行の性質（None ならコンストラクタの threat_ratio と既定の分布）
+
+        Returns:
+            list: 行の文字列
+        """
+        self.sampler.reseed(rand)
+        choose = self.sampler.choose
+        segment = segment or Segment(count, self.threat_ratio)
+        timestamps = hour_timestamps(base_time)
+        if segment.seconds:
+            timestamps = window_timestamps(base_time, *segment.seconds)
+        kinds, kind_weights = self.kinds(segment.threat_ratio, segment.critical_ratio)
+        columns = zip(
+            choose(timestamps, k=count),
+            choose(kinds, kind_weights, k=count),
+            *self.addresses(choose, segment.src, self.src_prefixes, self.src_weights, count),
+            choose(src_ports(), k=count),
+            *self.addresses(choose, segment.dst, self.dst_prefixes, self.dst_weights, count),
+            choose(segment.services or services(), k=count),
+        )
+        return [
+            f"{ts}{kind[0]}{src}{src_low}/{port} > {dst}{dst_low}/{service}{kind[1]}"
+            for ts, kind, src, src_low, port, dst, dst_low, service in columns
+        ]
+
+    @staticmethod
+    def addresses(choose, override, prefixes, weights, count):
+        """IP アドレスの列（上位2オクテット, 下位2オクテット）。override は IP の一覧から選ぶ"""
+        if override:
+            ips, ip_weights = override
+            return choose(ips, ip_weights, k=count), repeat("", count)
+        return choose(prefixes, weights, k=count), choose(octet_suffixes(), k=count)
+
+    def write(self, out, base_time, count, batch_size=None, rand=None, segment=None):
+        """count 行を batch_size 行（既定は DEFAULT_BATCH_SIZE）ずつ生成して out（テキストのファイル）に書き込む"""
+        batch_size = batch_size or DEFAULT_BATCH_SIZE
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            out.write("".join(self.lines(base_time, size, rand, segment)))
+
+
+@lru_cache(maxsize=32)
+def hour_timestamps(base_time):
+    """base_time から 3600 秒分のタイムスタンプ文字列（random_timestamp と同じ形式）"""
+    return [
+        (base_time + timedelta(seconds=offset)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        for offset in range(3600)
+    ]
+
+
+@lru_cache(maxsize=32)
+def window_timestamps(base_time, start, stop):
+    """base_time から start〜stop - 1 秒のタイムスタンプ文字列"""
+    return hour_timestamps(base_time)[start:stop]
@@ -1,11 +1,19 @@
+import io
 import os
 import csv
 import random
+import hashlib
 import zipfile
 import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 
+from batch import BatchRowGenerator, ENGINES, resolve_engine
+from profiles import Unit, make_profiles, plan
+
 # デフォルト設定
 # プロジェクトルート（このファイルの1つ上）にsource_logsを作成
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -15,6 +23,17 @@ DEFAULT_DATE = datetime(2025, 4, 28)
 DEFAULT_HOSTNAME = "srx-fw01"
 DEFAULT_ROWS_PER_HOUR = 5000
 DEFAULT_THREAT_RATIO = 0.1
+# 行の生成方式（batch.py）。"row" は generate_log_row で1行ずつ生成する従来の方式
+DEFAULT_ENGINE = "auto"
+GENERATOR_ENGINES = ENGINES + ("row",)
+DEFAULT_DAYS = 1
+# 負荷の形（profiles.py）。"flat" は1時間の行数・脅威ログの割合が一定で、時刻・IP は一様
+DEFAULT_PROFILE = "flat"
+# ZIP の圧縮レベル（0: 無圧縮、1: 最速 〜 9: 最小）
+DEFAULT_COMPRESS_LEVEL = 6
+# 1行の CSV の最大バイト数（Hostname を除く。ZIP64 が必要かの判定に使う）
+MAX_ROW_BYTES = 256
+DEFAULT_WORKERS = os.cpu_count() or 1
 
 # Juniper SRX風のアプリケーション名とメッセージ
 JUNOS_APPS = [
@@ -79,12 +98,46 @@ SEVERITIES = {
 
 
 class JuniperSyslogGenerator:
-    def __init__(self, output_dir, date, hostname, rows_per_hour, threat_ratio):
+    def __init__(
+        self,
+        output_dir,
+        date,
+        hostname,
+        rows_per_hour,
+        threat_ratio,
+        engine=DEFAULT_ENGINE,
+        seed=None,
+        compress_level=DEFAULT_COMPRESS_LEVEL,
+        profile=DEFAULT_PROFILE,
+    ):
+        if not 0 <= compress_level <= 9:
+            raise ValueError(f"compress_level must be 0-9: {compress_level}")
+        self.profile = profile or DEFAULT_PROFILE
+        self.profiles = make_profiles(profile, seed)
+        if self.profiles and engine == "row":
+            raise ValueError(f"profile {profile!r} is not supported by engine 'row'")
         self.output_dir = Path(output_dir)
         self.date = date
         self.hostname = hostname
         self.rows_per_hour = rows_per_hour
         self.threat_ratio = threat_ratio
+        # seed を指定すると、時間ごとに (seed, ホスト, 日付, 時) から乱数を作り直す（unit_seed）。
+        # None なら random モジュールの乱数をそのまま使う
+        self.seed = seed
+        self.rand = random
+        self.compress_level = compress_level
+        if engine == "row":
+            self.batch = None
+        else:
+            self.batch = BatchRowGenerator(
+                hostname,
+                threat_ratio,
+                THREAT_MESSAGES,
+                NORMAL_MESSAGES,
+                SEVERITIES,
+                engine=engine,
+            )
+        self.engine = self.batch.engine if self.batch else engine
 
         # --- ディレクトリの条件分岐処理 ---
         if self.output_dir.exists():
@@ -99,39 +152,39 @@ class JuniperSyslogGenerator:
 
     def random_timestamp(self, base_time):
         """ランダムなタイムスタンプ生成（秒単位でランダム）"""
-        offset = random.randint(0, 3599)
+        offset = self.rand.randint(0, 3599)
         return (base_time + timedelta(seconds=offset)).strftime("%Y-%m-%dT%H:%M:%SZ")
 
     def random_private_ip(self):
         """プライベートIPアドレスをランダム生成"""
-        choice = random.randint(1, 3)
+        choice = self.rand.randint(1, 3)
         if choice == 1:
-            return f"10.{random.randint(0,255)}.{random.randint(0,255)}.{random.randint(1,254)}"
+            return f"10.{self.rand.randint(0,255)}.{self.rand.randint(0,255)}.{self.rand.randint(1,254)}"
         elif choice == 2:
-            return f"172.{random.randint(16,31)}.{random.randint(0,255)}.{random.randint(1,254)}"
+            return f"172.{self.rand.randint(16,31)}.{self.rand.randint(0,255)}.{self.rand.randint(1,254)}"
         else:
-            return f"192.168.{random.randint(0,255)}.{random.randint(1,254)}"
+            return f"192.168.{self.rand.randint(0,255)}.{self.rand.randint(1,254)}"
 
     def random_global_ip(self, max_attempts=100):
         """グローバルIPアドレスをランダム生成"""
         for _ in range(max_attempts):
-            oct1 = random.randint(1, 223)
+            oct1 = self.rand.randint(1, 223)
             if oct1 in [10, 127]:
                 continue
-            oct2 = random.randint(0, 255)
+            oct2 = self.rand.randint(0, 255)
             if oct1 == 172 and 16 <= oct2 <= 31:
                 continue
             if oct1 == 192 and oct2 == 168:
                 continue
-            oct3 = random.randint(0, 255)
-            oct4 = random.randint(1, 254)
+            oct3 = self.rand.randint(0, 255)
+            oct4 = self.rand.randint(1, 254)
             return f"{oct1}.{oct2}.{oct3}.{oct4}"
         # フォールバック（滅多に到達しない）
         return "8.8.8.8"
 
     def random_dst_ip(self):
         """宛先IPをプライベート6:グローバル4の比率で生成"""
-        if random.random() < 0.6:
+        if self.rand.random() < 0.6:
             return self.random_private_ip()
         else:
             return self.random_global_ip()
@@ -141,20 +194,20 @@ class JuniperSyslogGenerator:
         timestamp = self.random_timestamp(base_time)
         src_ip = self.random_private_ip()
         dst_ip = self.random_dst_ip()
-        src_port = random.randint(1024, 65535)
-        dst_port = random.choice([22, 80, 443, 53, 123, 8080])
-        protocol = random.choice(["tcp", "udp", "icmp"])
+        src_port = self.rand.randint(1024, 65535)
+        dst_port = self.rand.choice([22, 80, 443, 53, 123, 8080])
+        protocol = self.rand.choice(["tcp", "udp", "icmp"])
 
         # 脅威ログか通常ログかを判定
-        if random.random() < self.threat_ratio:
-            appname = random.choice(["RT_SCREEN", "RT_IDP"])
-            severity = "CRITICAL" if random.random() < 0.3 else "WARNING"
-            message = random.choice(THREAT_MESSAGES[appname])
+        if self.rand.random() < self.threat_ratio:
+            appname = self.rand.choice(["RT_SCREEN", "RT_IDP"])
+            severity = "CRITICAL" if self.rand.random() < 0.3 else "WARNING"
+            message = self.rand.choice(THREAT_MESSAGES[appname])
             log_type = "THREAT"
         else:
-            appname = random.choice(list(NORMAL_MESSAGES.keys()))
-            severity = random.choice(["INFO", "NOTICE"])
-            message = random.choice(NORMAL_MESSAGES[appname])
+            appname = self.rand.choice(list(NORMAL_MESSAGES.keys()))
+            severity = self.rand.choice(["INFO", "NOTICE"])
+            message = self.rand.choice(NORMAL_MESSAGES[appname])
             log_type = "NORMAL"
 
         severity_level = SEVERITIES[severity]
@@ -176,42 +229,77 @@ class JuniperSyslogGenerator:
         ]
 
     def create_hourly_log(self, hour):
-        """1時間分のログファイルを生成してZIP圧縮"""
+        """
+        1時間分のログを生成してZIP圧縮
+
+        行は batch_size 行ずつ生成し、UTF-8 にエンコードしながら ZIP のメンバーに直接書き込む。
+        一時的な CSV ファイルは作らず、メモリ使用量は rows_per_hour によらない。
+        """
         try:
             base_time = self.date + timedelta(hours=hour)
             hour_str = f"{hour:02d}"
-            csv_path = self.output_dir / f"{hour_str}.csv"
-
-            with open(
-                csv_path, "w", newline="", encoding="utf-8", buffering=1024 * 1024
-            ) as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(
-                    [
-                        "Timestamp",
-                        "Hostname",
-                        "AppName",
-                        "SeverityLevel",
-                        "Severity",
-                        "LogType",
-                        "Message",
-                    ]
+            if self.seed is not None:
+                self.rand = random.Random(
+                    unit_seed(self.seed, self.hostname, self.date, hour)
                 )
 
-                # バッチ処理で効率化
-                rows = [
-                    self.generate_log_row(base_time) for _ in range(self.rows_per_hour)
-                ]
-                writer.writerows(rows)
+            if self.batch:
+                # プロファイルの乱数も (ホスト, 日付, 時) ごとの乱数から取る
+                unit = Unit(self.hostname, self.date, hour, self.rand)
+                segments = plan(
+                    self.profiles, self.rows_per_hour, self.threat_ratio, unit
+                )
+                rows = sum(segment.rows for segment in segments)
+            else:
+                rows = self.rows_per_hour
 
-            # ZIP圧縮
             zip_path = self.output_dir / f"{hour_str}.zip"
+            if self.compress_level == 0:
+                compression, compresslevel = zipfile.ZIP_STORED, None
+            else:
+                compression, compresslevel = zipfile.ZIP_DEFLATED, self.compress_level
+            # 書き込む前にサイズが分からないため、4GiB を超えうる場合は最初から ZIP64 にする
+            force_zip64 = (
+                rows * (MAX_ROW_BYTES + len(self.hostname.encode()))
+                > zipfile.ZIP64_LIMIT
+            )
+
+            # メンバーは名前で開き、ZipFile の compression / compresslevel を使わせる
+            # （更新日時は ZIP の既定の 1980-01-01 に固定され、同じ内容なら同じバイト列になる）
             with zipfile.ZipFile(
-                zip_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6
+                zip_path, "w", compression=compression, compresslevel=compresslevel
             ) as zipf:
-                zipf.write(csv_path, arcname=f"{hour_str}.csv")
-
-            os.remove(csv_path)
+                member = zipf.open(f"{hour_str}.csv", "w", force_zip64=force_zip64)
+                # ZIP のメンバーに UTF-8 でエンコードしながら書き込む（close でメンバーも閉じる）
+                with io.TextIOWrapper(member, encoding="utf-8", newline="") as csvfile:
+                    writer = csv.writer(csvfile)
+                    writer.writerow(
+                        [
+                            "Timestamp",
+                            "Hostname",
+                            "AppName",
+                            "SeverityLevel",
+                            "Severity",
+                            "LogType",
+                            "Message",
+                        ]
+                    )
+
+                    if self.batch:
+                        # 列ごとにまとめて抽選し、行の文字列をまとめて書き込む
+                        for segment in segments:
+                            self.batch.write(
+                                csvfile,
+                                base_time,
+                                segment.rows,
+                                rand=self.rand,
+                                segment=segment,
+                            )
+                    else:
+                        writer.writerows(
+                            self.generate_log_row(base_time)
+                            for _ in range(self.rows_per_hour)
+                        )
             return True
 
         except IOError as e:
@@ -227,6 +315,8 @@ class JuniperSyslogGenerator:
         print(f"Hostname: {self.hostname}")
         print(f"Rows per hour: {self.rows_per_hour:,}")
         print(f"Threat ratio: {self.threat_ratio*100:.1f}%")
+        print(f"Engine: {self.engine}")
+        print(f"Profile: {self.profile}")
         print("-" * 60)
 
         for hour in range(24):
@@ -240,6 +330,177 @@ class JuniperSyslogGenerator:
         print("You can now run run.py immediately.")
 
 
+def unit_seed(seed, hostname, date, hour):
+    """
+    (ホスト, 日付, 時) ごとの乱数の種
+
+    seed とこの3つだけから決まるため、どの順番・どのプロセスで生成しても同じ行になる。
+    """
+    key = f"{seed}/{hostname}/{date.strftime('%Y-%m-%d')}/{hour:02d}"
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big")
+
+
+def planned_rows(
+    hostname, date, hour, rows_per_hour, threat_ratio, seed, profile=DEFAULT_PROFILE
+):
+    """generate_corpus が (ホスト, 日付, 時) の ZIP に書く行数（ZIP を生成せずに求める）"""
+    profiles = make_profiles(profile, seed)
+    rand = random.Random(unit_seed(seed, hostname, date, hour))
+    unit = Unit(hostname, date, hour, rand)
+    return sum(s.rows for s in plan(profiles, rows_per_hour, threat_ratio, unit))
+
+
+def fleet_hostnames(hostname, hosts):
+    """
+    --hosts の値からホスト名の一覧を作る
+
+    数値 N なら hostname の末尾の数字を連番に置き換えて N 台（"srx-fw01" → srx-fw01, srx-fw02, ...）、
+    カンマ区切りならそのまま。1台なら hostname をそのまま使う。
+    """
+    if not str(hosts).isdigit():
+        return [name.strip() for name in str(hosts).split(",") if name.strip()]
+    count = int(hosts)
+    if count == 1:
+        return [hostname]
+    prefix = hostname.rstrip("0123456789")
+    width = max(len(hostname) - len(prefix) or 2, len(str(count)))
+    return [f"{prefix}{i:0{width}d}" for i in range(1, count + 1)]
+
+
+def unit_output_dir(output_dir, hostname, date, flat):
+    """(ホスト, 日付) の出力先。複数ホスト・複数日なら {output}/{日付}/{ホスト}/"""
+    if flat:
+        return Path(output_dir)
+    return Path(output_dir) / date.strftime("%Y-%m-%d") / hostname
+
+
+# ワーカープロセスの設定（init_worker で設定）
+_settings = None
+
+
+def init_worker(settings):
+    global _settings
+    _settings = settings
+
+
+@lru_cache(maxsize=64)
+def unit_generator(hostname, date):
+    """(ホスト, 日付) のジェネレーター（プロセス内で使い回す）"""
+    (
+        output_dir,
+        flat,
+        rows_per_hour,
+        threat_ratio,
+        seed,
+        engine,
+        compress_level,
+        profile,
+    ) = _settings
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        return JuniperSyslogGenerator(
+            unit_output_dir(output_dir, hostname, date, flat),
+            date,
+            hostname,
+            rows_per_hour,
+            threat_ratio,
+            engine=engine,
+            seed=seed,
+            compress_level=compress_level,
+            profile=profile,
+        )
+
+
+def generate_unit(unit):
+    """(日付, ホスト, 時) の1時間分を生成する"""
+    date, hostname, hour = unit
+    return unit, unit_generator(hostname, date).create_hourly_log(hour)
+
+
+def generate_corpus(
+    output_dir,
+    dates,
+    hostnames,
+    rows_per_hour,
+    threat_ratio,
+    seed,
+    engine=DEFAULT_ENGINE,
+    workers=1,
+    hours=24,
+    compress_level=DEFAULT_COMPRESS_LEVEL,
+    profile=DEFAULT_PROFILE,
+):
+    """
+    ホスト × 日付 × 時間（0時から hours 時間分）のログを並列に生成
+
+    (ホスト, 日付, 時) ごとに unit_seed() の乱数で生成するため、
+    同じ引数なら workers の値によらずバイト単位で同じ ZIP ができる。
+
+    Args:
+        output_dir (str): 出力先（1ホスト・1日なら {output}/HH.zip、それ以外は {output}/{日付}/{ホスト}/HH.zip）
+        dates (list): datetime の一覧
+        hostnames (list): ホスト名の一覧
+        seed (int): 乱数の種
+        workers (int): プロセス数（1 ならこのプロセスで生成）
+        hours (int): 1日に生成する時間数
+        compress_level (int): ZIP の圧縮レベル（0: 無圧縮 〜 9）
+        profile (str): 負荷の形（profiles.make_profiles の指定）
+
+    Returns:
+        list: 失敗した (日付, ホスト, 時) の一覧
+    """
+    flat = len(dates) == 1 and len(hostnames) == 1
+    unit_generator.cache_clear()
+    settings = (
+        str(output_dir),
+        flat,
+        rows_per_hour,
+        threat_ratio,
+        seed,
+        engine,
+        compress_level,
+        profile,
+    )
+    units = [
+        (date, host, hour)
+        for date in dates
+        for host in hostnames
+        for hour in range(hours)
+    ]
+    per_date = len(hostnames) * hours
+    failed = []
+
+    def report(results):
+        done = 0
+        for (date, host, hour), ok in results:
+            done += 1
+            if not ok:
+                failed.append((date, host, hour))
+            if flat:
+                if ok:
+                    print(f"✓ Hour {hour:02d}:00 completed")
+                else:
+                    print(f"✗ Hour {hour:02d}:00 failed")
+            elif done % per_date == 0:
+                print(
+                    f"✓ {date.strftime('%Y-%m-%d')}: "
+                    f"{len(hostnames)} hosts x {hours} hours ({done:,}/{len(units):,})",
+                    flush=True,
+                )
+
+    if workers <= 1:
+        init_worker(settings)
+        report(map(generate_unit, units))
+    else:
+        # 日付・ホストの順に近い単位をまとめて渡す（ワーカー内のキャッシュが効くように）
+        chunksize = max(1, min(hours, len(units) // (workers * 4)))
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=(settings,)
+        ) as executor:
+            report(executor.map(generate_unit, units, chunksize=chunksize))
+    unit_generator.cache_clear()
+    return failed
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Generate Juniper-style syslog test data (v2)"
@@ -277,6 +538,64 @@ def main():
         help=f"Threat log ratio 0.0-1.0 (default: {DEFAULT_THREAT_RATIO})",
     )
 
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=GENERATOR_ENGINES,
+        default=DEFAULT_ENGINE,
+        help="Row generation engine: auto (numpy if installed, else python), "
+        "numpy, python (stdlib batched) or row (one row at a time) "
+        f"(default: {DEFAULT_ENGINE})",
+    )
+
+    parser.add_argument(
+        "--hosts",
+        default="1",
+        help="Number of hosts (numbered after --hostname: srx-fw01, srx-fw02, ...) "
+        "or a comma-separated list of hostnames (default: 1)",
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=DEFAULT_DAYS,
+        help=f"Number of consecutive days starting at --date (default: {DEFAULT_DAYS})",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed; the same arguments and seed always produce identical "
+        "ZIP files (default: a random seed, printed so the run can be reproduced)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Worker processes (default: CPU count = {DEFAULT_WORKERS})",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--compress-level",
+        type=int,
+        choices=range(10),
+        default=DEFAULT_COMPRESS_LEVEL,
+        metavar="0-9",
+        help="ZIP compression level: 0 stores without compression, 1 is fastest, "
+        f"9 is smallest (default: {DEFAULT_COMPRESS_LEVEL})",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        default=DEFAULT_PROFILE,
+        help="Load shape: flat, or comma-separated profiles applied in order, "
+        "each name[:key=value...]: diurnal[:peak=14:amplitude=0.5], "
+        "burst[:hours=3+15:count=1:minutes=5:factor=1.0:critical=0.9:sources=3], "
+        "zipf[:s=1.1:sources=1000], replay:path=RATES.csv "
+        f"(default: {DEFAULT_PROFILE})",
+    )
+
     args = parser.parse_args()
 
     try:
@@ -289,15 +608,69 @@ def main():
         print("Error: Threat ratio must be between 0.0 and 1.0")
         return
 
-    generator = JuniperSyslogGenerator(
-        output_dir=args.output,
-        date=log_date,
-        hostname=args.hostname,
-        rows_per_hour=args.rows,
-        threat_ratio=args.threat_ratio,
+    if args.days < 1:
+        print("Error: Days must be 1 or more")
+        return
+
+    hostnames = fleet_hostnames(args.hostname, args.hosts)
+    if not hostnames:
+        print("Error: No hostnames given")
+        return
+
+    dates = [log_date + timedelta(days=i) for i in range(args.days)]
+    seed = args.seed
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    engine = resolve_engine(args.engine) if args.engine != "row" else "row"
+
+    try:
+        profiles = make_profiles(args.profile, seed)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        return
+    if profiles and engine == "row":
+        print("Error: Profiles are not supported by engine 'row'")
+        return
+
+    date_range = args.date
+    if args.days > 1:
+        date_range += f" .. {dates[-1].strftime('%Y-%m-%d')}"
+    host_range = hostnames[0]
+    if len(hostnames) > 1:
+        host_range += f" .. {hostnames[-1]}"
+    print(f"Generating Juniper-style syslog for {date_range}...")
+    print(f"Target Path: {args.output}")
+    print(f"Hosts: {len(hostnames)} ({host_range})")
+    print(f"Rows per hour: {args.rows:,}")
+    print(f"Threat ratio: {args.threat_ratio*100:.1f}%")
+    print(f"Engine: {engine}")
+    print(f"Profile: {args.profile}")
+    if args.seed is None:
+        print(f"Seed: {seed} (pass --seed {seed} to reproduce)")
+    else:
+        print(f"Seed: {seed}")
+    print(f"Workers: {args.workers}")
+    print(f"Compression level: {args.compress_level}")
+    print("-" * 60)
+
+    failed = generate_corpus(
+        args.output,
+        dates,
+        hostnames,
+        args.rows,
+        args.threat_ratio,
+        seed,
+        engine=engine,
+        workers=args.workers,
+        compress_level=args.compress_level,
+        profile=args.profile,
     )
 
-    generator.generate()
+    print("-" * 60)
+    total = len(dates) * len(hostnames) * 24
+    print(f"Done! {total - len(failed):,} ZIP files are ready in: {args.output}")
+    if failed:
+        print(f"Failed: {len(failed)} (see errors above)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+"""
+負荷の形（ワークロードプロファイル）
+
+既定では1時間の行数・脅威ログの割合が一定で、タイムスタンプと IP は一様に散らばる。
+プロファイルはこれを本番に近い偏りのある形に変える。
+
+  - diurnal: 時刻によって行数が変わる日周期（peak 時が最大、12時間ずれた時刻が最小）
+  - burst:   攻撃のバースト。数分間に、少数の攻撃元からの CRITICAL 中心の脅威ログを集中させる
+  - zipf:    送信元IPを Zipf 分布に従う少数のヘビーヒッターに偏らせる
+  - replay:  時間ごとの行数（と脅威ログの割合）を CSV の表から再生する
+
+プロファイルは "名前:キー=値:キー=値" の形で指定し、カンマ区切りで複数を左から順に適用する。
+
+    diurnal:peak=14:amplitude=0.6,burst:hours=3+15:minutes=5,zipf:s=1.2
+    replay:path=rates.csv,zipf
+
+各プロファイルは1時間分の Segment（batch.py）の一覧を受け取り、変えた一覧を返す。
+乱数は (ホスト, 日付, 時) ごとの乱数（generate.py の unit_seed）と seed だけから取るため、
+同じ seed なら生成の順番・プロセス数によらず同じ結果になる。
+"""
+
+import csv
+import math
+import random
+from collections import namedtuple
+from itertools import accumulate
+from pathlib import Path
+
+from batch import Segment, global_prefixes, private_prefixes, services
+
+# 1時間の計画を立てる対象（rand は (ホスト, 日付, 時) ごとの乱数）
+Unit = namedtuple("Unit", ["hostname", "date", "hour", "rand"])
+
+
+class Diurnal:
+    """
+    日周期: 行数に 1 + amplitude * cos(2π(hour - peak) / 24) を掛ける
+
+    1日の平均は元の行数のまま。
+    """
+
+    def __init__(self, seed, peak=14, amplitude=0.5):
+        self.peak = float(peak)
+        self.amplitude = float(amplitude)
+        if not 0 <= self.amplitude <= 1:
+            raise ValueError(f"diurnal amplitude must be 0-1: {amplitude}")
+
+    def factor(self, hour):
+        return 1 + self.amplitude * math.cos(2 * math.pi * (hour - self.peak) / 24)
+
+    def apply(self, segments, unit):
+        factor = self.factor(unit.hour)
+        return [s._replace(rows=round(s.rows * factor)) for s in segments]
+
+
+class Burst:
+    """
+    攻撃のバースト: その時間の行数 × factor 行の脅威ログを minutes 分間に追加する
+
+    攻撃元は sources 個のグローバルIP、宛先は1つのプライベートIPと1つのサービス、
+    脅威ログのうち critical の割合が CRITICAL。
+    hours（"3+15" のように + 区切り）を省略すると、(ホスト, 日付) ごとに count 個の時間を選ぶ。
+    """
+
+    def __init__(
+        self, seed, hours=None, count=1, minutes=5, factor=1.0, critical=0.9, sources=3
+    ):
+        self.seed = seed
+        self.hours = None
+        if hours is not None:
+            self.hours = {int(hour) for hour in str(hours).split("+")}
+        self.count = int(count)
+        self.seconds = int(float(minutes) * 60)
+        if not 0 < self.seconds <= 3600:
+            raise ValueError(f"burst minutes must be 1-60: {minutes}")
+        self.factor = float(factor)
+        self.critical = float(critical)
+        self.sources = int(sources)
+
+    def burst_hours(self, unit):
+        if self.hours is not None:
+            return self.hours
+        day = random.Random(
+            f"{self.seed}/burst/{unit.hostname}/{unit.date.strftime('%Y-%m-%d')}"
+        )
+        return set(day.sample(range(24), min(self.count, 24)))
+
+    def apply(self, segments, unit):
+        if unit.hour not in self.burst_hours(unit):
+            return segments
+        rand = unit.rand
+        start = rand.randrange(0, 3600 - self.seconds + 1)
+        prefixes, weights = private_prefixes()
+        attackers = [random_ip(rand, global_prefixes()) for _ in range(self.sources)]
+        target = random_ip(rand, prefixes, weights)
+        burst = Segment(
+            rows=round(sum(s.rows for s in segments) * self.factor),
+            threat_ratio=1.0,
+            critical_ratio=self.critical,
+            seconds=(start, start + self.seconds),
+            src=(attackers, None),
+            dst=([target], None),
+            services=[rand.choice(services())],
+        )
+        return segments + [burst]
+
+
+class Zipf:
+    """
+    ヘビーヒッター: 送信元IPを sources 個のプライベートIPから 1 / 順位^s の重みで選ぶ
+
+    IP の一覧は seed だけで決まり、全ホスト・全時間で共通。
+    送信元をすでに決めている Segment（burst の攻撃元など）は変えない。
+    """
+
+    def __init__(self, seed, s=1.1, sources=1000):
+        self.exponent = float(s)
+        self.sources = int(sources)
+        if self.sources < 1:
+            raise ValueError(f"zipf sources must be 1 or more: {sources}")
+        rand = random.Random(f"{seed}/zipf")
+        prefixes, weights = private_prefixes()
+        ips = [random_ip(rand, prefixes, weights) for _ in range(self.sources)]
+        cum_weights = list(
+            accumulate(1 / rank**self.exponent for rank in range(1, self.sources + 1))
+        )
+        self.src = (ips, cum_weights)
+
+    def apply(self, segments, unit):
+        return [s if s.src else s._replace(src=self.src) for s in segments]
+
+
+class Replay:
+    """
+    時間ごとの行数の表を再生する
+
+    CSV の列は hour, rows と、省略できる threat_ratio, date（YYYY-MM-DD）。
+    date のある行はその日だけ、ない行は毎日に使う。表にない時間は元の行数のまま。
+    先頭の Segment の行数を置き換えるため、他のプロファイルより前に指定する。
+    """
+
+    def __init__(self, seed, path):
+        self.rates = {}
+        with open(Path(path), newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                threat_ratio = row.get("threat_ratio") or None
+                key = (row.get("date") or None, int(row["hour"]))
+                self.rates[key] = (
+                    int(row["rows"]),
+                    float(threat_ratio) if threat_ratio is not None else None,
+                )
+
+    def apply(self, segments, unit):
+        date = unit.date.strftime("%Y-%m-%d")
+        rate = self.rates.get((date, unit.hour)) or self.rates.get((None, unit.hour))
+        if rate is None:
+            return segments
+        rows, threat_ratio = rate
+        first = segments[0]._replace(rows=rows)
+        if threat_ratio is not None:
+            first = first._replace(threat_ratio=threat_ratio)
+        return [first] + segments[1:]
+
+
+PROFILES = {
+    "diurnal": Diurnal,
+    "burst": Burst,
+    "zipf": Zipf,
+    "replay": Replay,
+}
+
+
+def random_ip(rand, prefixes, cum_weights=None):
+    """上位2オクテットの表から IP アドレスを1つ作る"""
+    prefix = rand.choices(prefixes, cum_weights=cum_weights)[0]
+    return f"{prefix}.{rand.randint(0, 255)}.{rand.randint(1, 254)}"
+
+
+def make_profiles(spec, seed):
+    """
+    "diurnal:peak=14,zipf:s=1.2" の形の指定からプロファイルの一覧を作る
+
+    空文字列・None・"flat" は一定の負荷（プロファイルなし）。
+
+    Raises:
+        ValueError: 知らないプロファイル名・パラメーター
+    """
+    profiles = []
+    for part in (spec or "").split(","):
+        name, *params = part.strip().split(":")
+        if name in ("", "flat"):
+            continue
+        if name not in PROFILES:
+            raise ValueError(
+                f"Unknown profile: {name} (choose from flat, {', '.join(PROFILES)})"
+            )
+        kwargs = {}
+        for param in params:
+            key, sep, value = param.partition("=")
+            if not sep:
+                raise ValueError(f"Profile parameter must be key=value: {param}")
+            kwargs[key] = value
+        try:
+            profiles.append(PROFILES[name](seed, **kwargs))
+        except TypeError as e:
+            raise ValueError(f"Invalid parameters for profile {name}: {e}") from None
+    return profiles
+
+
+def plan(profiles, rows_per_hour, threat_ratio, unit):
+    """1時間分の Segment の一覧（行数 0 の Segment は除く）"""
+    segments = [Segment(rows_per_hour, threat_ratio)]
+    for profile in profiles:
+        segments = profile.apply(segments, unit)
+    return [s for s in segments if s.rows > 0]
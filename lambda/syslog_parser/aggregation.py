@@ -0,0 +1,431 @@
+"""
+多次元集計エンジン
+
+1回のスキャンで 時間(時 or 分) × Severity(RFC5424 の8段階) × AppName を数える。
+カウンタは入れ子の dict ではなく、事前確保したフラットな整数配列に持ち、
+各次元の値は bytes → 番号 の辞書で引く（AppName は出現順に辞書エンコード）。
+
+    index = (time_id * N_SEVERITIES + severity_id) * n_apps + app_id
+
+集計結果は merge() で合算でき、to_dict() / from_dict() で JSON 化できる。
+"""
+
+# RFC5424 の Severity（generator/generate.py の SEVERITIES と同じ順序）
+SEVERITIES = ['EMERGENCY', 'ALERT', 'CRITICAL', 'ERROR', 'WARNING', 'NOTICE', 'INFO', 'DEBUG']
+# 上記以外の Severity 値
+OTHER_SEVERITY = 'OTHER'
+SEVERITY_NAMES = SEVERITIES + [OTHER_SEVERITY]
+N_SEVERITIES = len(SEVERITY_NAMES)
+
+# max_apps を超えた AppName をまとめる名前
+OTHER_APP = '(other)'
+
+DIMENSION_MINUTE = 'minute'
+DIMENSION_APP = 'app'
+DIMENSIONS = (DIMENSION_MINUTE, DIMENSION_APP)
+
+HOURS = 24
+MINUTES = 60
+
+
+class AggregationSpec:
+    """
+    集計する次元の設定
+
+    時 × Severity は常に集計する。minute を指定すると時間の粒度が分になり、
+    app を指定すると AppName 別にも数える。
+    """
+
+    def __init__(self, minute=False, app=False, max_apps=64):
+        self.minute = minute
+        self.app = app
+        self.max_apps = max_apps
+
+    @classmethod
+    def parse(cls, text, max_apps=64):
+        """
+        "minute,app" 形式の文字列から作成（環境変数 AGG_DIMENSIONS 用）
+
+        Raises:
+            ValueError: 未知の次元名
+        """
+        names = {name.strip() for name in (text or '').split(',') if name.strip()}
+        unknown = names - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown aggregation dimension: {', '.join(sorted(unknown))}")
+        return cls(minute=DIMENSION_MINUTE in names, app=DIMENSION_APP in names, max_apps=max_apps)
+
+    def to_dict(self):
+        return {'minute': self.minute, 'app': self.app, 'max_apps': self.max_apps}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class Aggregator:
+    """
+    フラット配列による多次元カウンタ
+
+    Attributes:
+        counts (list): 事前確保した整数配列（末尾の time_id は不正なタイムスタンプ用）
+        app_names (list): app_id → AppName
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.time_buckets = HOURS * MINUTES if spec.minute else HOURS
+        self.n_apps = spec.max_apps if spec.app else 1
+        # 最後の time_id は解析できないタイムスタンプ用
+        self.invalid_time = self.time_buckets
+        self.counts = [0] * ((self.time_buckets + 1) * N_SEVERITIES * self.n_apps)
+
+        # "2025-04-28T10:15:30Z"[11:16] → b"10:15" / [11:13] → b"10"
+        self.time_slice_end = 16 if spec.minute else 13
+        if spec.minute:
+            self.time_ids = {f'{h:02d}:{m:02d}'.encode(): h * MINUTES + m
+                             for h in range(HOURS) for m in range(MINUTES)}
+        else:
+            self.time_ids = {f'{h:02d}'.encode(): h for h in range(HOURS)}
+        self.severity_ids = {name.encode(): i for i, name in enumerate(SEVERITIES)}
+        self.other_severity = len(SEVERITIES)
+
+        self.app_ids = {}
+        self.app_names = []
+
+    def consume(self, rows, ts_i, sev_i, app_i=None, tap=None, dispatch=None, templates=None):
+        """
+        行を集計する（ホットループ）
+
+        Args:
+            rows: bytes フィールドのリストを返すイテラブル（csv_scanner.CsvScanner.rows）
+            ts_i, sev_i, app_i (int): Timestamp / Severity / AppName の列番号
+                （app 次元を使わない場合 app_i は不要）
+            tap (tuple): (列番号, 値, 関数) 列の値が一致する行を関数にも渡す
+                （THREAT 行の追跡などを同じスキャンで行う。ジェネレーターを挟むより速い）
+            dispatch (tuple): (キー関数, 表, 関数) 表.get(キー関数(行), 表.unseen) が None でない行を
+                関数(行, 表の値) にも渡す（filter_rules.RuleSet.dispatcher。表の検索はループの中で行う。
+                まだ表にないキーの項目は関数の側で作る）
+            templates (tuple): (列番号, バイト数, 辞書の get, 関数, カウンタ, 種類数)
+                行[列番号] の先頭のバイト数のスライスで辞書を引き、時 × 番号のカウンタを数える
+                （templates.TemplateCounts.counter。辞書にない行は 関数(行) が番号を返す）
+        """
+        counts = self.counts
+        time_get = self.time_ids.get
+        severity_get = self.severity_ids.get
+        invalid_time = self.invalid_time
+        other_severity = self.other_severity
+        end = self.time_slice_end
+        ns = N_SEVERITIES
+        app_get = self.app_ids.get
+        na = self.n_apps
+        if tap is not None:
+            tap_i, tap_value, tap_func = tap
+        if dispatch is not None:
+            key, table, dispatch_func = dispatch
+            # dict のサブクラスの [] は __missing__ の確認で遅くなるため、get で引く
+            lookup = table.get
+            unseen = table.unseen
+
+        if templates is not None:
+            self._consume_templates(rows, ts_i, sev_i, app_i, tap, dispatch, templates)
+            return
+
+        # 行ごとの分岐を避けるため、app 次元・tap・dispatch の有無でループを分ける
+        if dispatch is not None and self.spec.app:
+            for fields in rows:
+                app = app_get(fields[app_i])
+                if app is None:
+                    app = self._add_app(fields[app_i])
+                counts[(time_get(fields[ts_i][11:end], invalid_time) * ns
+                        + severity_get(fields[sev_i], other_severity)) * na + app] += 1
+                entry = lookup(key(fields), unseen)
+                if entry is not None:
+                    dispatch_func(fields, entry)
+                if tap is not None and fields[tap_i] == tap_value:
+                    tap_func(fields)
+        elif dispatch is not None and tap is not None:
+            for fields in rows:
+                counts[time_get(fields[ts_i][11:end], invalid_time) * ns
+                       + severity_get(fields[sev_i], other_severity)] += 1
+                entry = lookup(key(fields), unseen)
+                if entry is not None:
+                    dispatch_func(fields, entry)
+                if fields[tap_i] == tap_value:
+                    tap_func(fields)
+        elif dispatch is not None:
+            for fields in rows:
+                counts[time_get(fields[ts_i][11:end], invalid_time) * ns
+                       + severity_get(fields[sev_i], other_severity)] += 1
+                entry = lookup(key(fields), unseen)
+                if entry is not None:
+                    dispatch_func(fields, entry)
+        elif self.spec.app and tap is not None:
+            for fields in rows:
+                app = app_get(fields[app_i])
+                if app is None:
+                    app = self._add_app(fields[app_i])
+                counts[(time_get(fields[ts_i][11:end], invalid_time) * ns
+                        + severity_get(fields[sev_i], other_severity)) * na + app] += 1
+                if fields[tap_i] == tap_value:
+                    tap_func(fields)
+        elif self.spec.app:
+            for fields in rows:
+                app = app_get(fields[app_i])
+                if app is None:
+                    app = self._add_app(fields[app_i])
+                counts[(time_get(fields[ts_i][11:end], invalid_time) * ns
+                        + severity_get(fields[sev_i], other_severity)) * na + app] += 1
+        elif tap is not None:
+            for fields in rows:
+                counts[time_get(fields[ts_i][11:end], invalid_time) * ns
+                       + severity_get(fields[sev_i], other_severity)] += 1
+                if fields[tap_i] == tap_value:
+                    tap_func(fields)
+        else:
+            for fields in rows:
+                counts[time_get(fields[ts_i][11:end], invalid_time) * ns
+                       + severity_get(fields[sev_i], other_severity)] += 1
+
+    def _consume_templates(self, rows, ts_i, sev_i, app_i, tap, dispatch, templates):
+        """consume() の templates を数えるループ（テンプレートの時は時間の番号から求める）"""
+        counts = self.counts
+        time_get = self.time_ids.get
+        severity_get = self.severity_ids.get
+        invalid_time = self.invalid_time
+        other_severity = self.other_severity
+        end = self.time_slice_end
+        ns = N_SEVERITIES
+        msg_i, key_bytes, template_get, add_template, template_counts, nt = templates
+        # 時間の番号 → 時（分の粒度なら 60 で割る。解析できないタイムスタンプは HOURS になる）
+        per_hour = MINUTES if self.spec.minute else 1
+
+        if tap is None and dispatch is None and not self.spec.app:
+            # テンプレート別集計だけ
+            for fields in rows:
+                time_id = time_get(fields[ts_i][11:end], invalid_time)
+                counts[time_id * ns + severity_get(fields[sev_i], other_severity)] += 1
+                template_id = template_get(fields[msg_i][:key_bytes])
+                if template_id is None:
+                    template_id = add_template(fields)
+                template_counts[time_id // per_hour * nt + template_id] += 1
+            return
+
+        if tap is not None and dispatch is None and not self.spec.app:
+            # 既定の設定（テンプレート別集計 + THREAT 行の追跡）
+            tap_i, tap_value, tap_func = tap
+            for fields in rows:
+                time_id = time_get(fields[ts_i][11:end], invalid_time)
+                counts[time_id * ns + severity_get(fields[sev_i], other_severity)] += 1
+                template_id = template_get(fields[msg_i][:key_bytes])
+                if template_id is None:
+                    template_id = add_template(fields)
+                template_counts[time_id // per_hour * nt + template_id] += 1
+                if fields[tap_i] == tap_value:
+                    tap_func(fields)
+            return
+
+        app_get = self.app_ids.get
+        na = self.n_apps
+        use_app = self.spec.app
+        if tap is not None:
+            tap_i, tap_value, tap_func = tap
+        if dispatch is not None:
+            key, table, dispatch_func = dispatch
+            lookup = table.get
+            unseen = table.unseen
+        for fields in rows:
+            time_id = time_get(fields[ts_i][11:end], invalid_time)
+            index = time_id * ns + severity_get(fields[sev_i], other_severity)
+            if use_app:
+                app = app_get(fields[app_i])
+                if app is None:
+                    app = self._add_app(fields[app_i])
+                index = index * na + app
+            counts[index] += 1
+            template_id = template_get(fields[msg_i][:key_bytes])
+            if template_id is None:
+                template_id = add_template(fields)
+            template_counts[time_id // per_hour * nt + template_id] += 1
+            if dispatch is not None:
+                entry = lookup(key(fields), unseen)
+                if entry is not None:
+                    dispatch_func(fields, entry)
+            if tap is not None and fields[tap_i] == tap_value:
+                tap_func(fields)
+
+    def _add_app(self, app):
+        """AppName に番号を割り当てる（上限を超えたら OTHER_APP）"""
+        name = app.decode('utf-8', 'replace')
+        if len(self.app_names) < self.n_apps - 1:
+            app_id = len(self.app_names)
+            self.app_names.append(name)
+        else:
+            app_id = self._other_app_id()
+        self.app_ids[app] = app_id
+        return app_id
+
+    def _other_app_id(self):
+        if OTHER_APP not in self.app_names:
+            self.app_names.append(OTHER_APP)
+        return self.app_names.index(OTHER_APP)
+
+    # ------------------------------------------------------------------
+    # 集計結果の取り出し
+    # ------------------------------------------------------------------
+
+    def total_rows(self):
+        return sum(self.counts)
+
+    def invalid_rows(self):
+        """タイムスタンプから時間を取り出せなかった行数"""
+        block = N_SEVERITIES * self.n_apps
+        start = self.invalid_time * block
+        return sum(self.counts[start:start + block])
+
+    def _hour_severity_totals(self):
+        """[hour][severity_id] → 件数（分・AppName は合算）"""
+        per_time = MINUTES if self.spec.minute else 1
+        na = self.n_apps
+        totals = [[0] * N_SEVERITIES for _ in range(HOURS)]
+        counts = self.counts
+        for t in range(self.time_buckets):
+            row = totals[t // per_time]
+            base = t * N_SEVERITIES * na
+            for s in range(N_SEVERITIES):
+                offset = base + s * na
+                row[s] += sum(counts[offset:offset + na])
+        return totals
+
+    def hourly_stats(self, targets):
+        """
+        従来形式の時間別統計（対象 Severity が1件以上ある時間のみ）
+
+        Returns:
+            dict: {'10:00': {'CRITICAL': 15, 'WARNING': 43}, ...}
+        """
+        target_ids = [(name, SEVERITY_NAMES.index(name)) for name in targets]
+        result = {}
+        for hour, row in enumerate(self._hour_severity_totals()):
+            if any(row[i] for _, i in target_ids):
+                result[f'{hour:02d}:00'] = {name: row[i] for name, i in target_ids}
+        return result
+
+    def severity_stats(self):
+        """
+        時間別の全 Severity 件数（1件以上ある時間・Severity のみ）
+
+        Returns:
+            dict: {'10:00': {'CRITICAL': 15, 'INFO': 4210, ...}, ...}
+        """
+        result = {}
+        for hour, row in enumerate(self._hour_severity_totals()):
+            counts = {SEVERITY_NAMES[s]: n for s, n in enumerate(row) if n}
+            if counts:
+                result[f'{hour:02d}:00'] = counts
+        return result
+
+    def minute_stats(self):
+        """
+        時間別・Severity 別の分単位件数（spec.minute の場合のみ）
+
+        Returns:
+            dict: {'10:00': {'CRITICAL': [60個の件数], ...}, ...}
+        """
+        if not self.spec.minute:
+            return {}
+        na = self.n_apps
+        counts = self.counts
+        result = {}
+        for hour in range(HOURS):
+            per_severity = {}
+            for s in range(N_SEVERITIES):
+                series = []
+                for minute in range(MINUTES):
+                    offset = ((hour * MINUTES + minute) * N_SEVERITIES + s) * na
+                    series.append(sum(counts[offset:offset + na]))
+                if any(series):
+                    per_severity[SEVERITY_NAMES[s]] = series
+            if per_severity:
+                result[f'{hour:02d}:00'] = per_severity
+        return result
+
+    def app_stats(self):
+        """
+        時間別・AppName 別の Severity 件数（spec.app の場合のみ）
+
+        Returns:
+            dict: {'10:00': {'RT_IDP': {'CRITICAL': 3, 'WARNING': 9}, ...}, ...}
+        """
+        if not self.spec.app:
+            return {}
+        per_time = MINUTES if self.spec.minute else 1
+        na = self.n_apps
+        counts = self.counts
+        result = {}
+        for t in range(self.time_buckets):
+            hour_key = f'{t // per_time:02d}:00'
+            base = t * N_SEVERITIES * na
+            for s in range(N_SEVERITIES):
+                offset = base + s * na
+                for app_id, name in enumerate(self.app_names):
+                    n = counts[offset + app_id]
+                    if n:
+                        apps = result.setdefault(hour_key, {})
+                        severities = apps.setdefault(name, {})
+                        severities[SEVERITY_NAMES[s]] = severities.get(SEVERITY_NAMES[s], 0) + n
+        return result
+
+    # ------------------------------------------------------------------
+    # 合算・シリアライズ
+    # ------------------------------------------------------------------
+
+    def merge(self, other):
+        """
+        同じ spec の集計結果を合算する（AppName の番号は名前で対応付け直す）
+        """
+        if other.spec.to_dict() != self.spec.to_dict():
+            raise ValueError("Cannot merge aggregators with different specs")
+        if not self.spec.app:
+            self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+            return self
+
+        remap = []
+        for name in other.app_names:
+            if name in self.app_names:
+                remap.append(self.app_names.index(name))
+            elif name != OTHER_APP and len(self.app_names) < self.n_apps - 1:
+                self.app_names.append(name)
+                remap.append(len(self.app_names) - 1)
+            else:
+                remap.append(self._other_app_id())
+        for app, app_id in other.app_ids.items():
+            self.app_ids.setdefault(app, remap[app_id])
+
+        na = self.n_apps
+        counts = self.counts
+        for block in range(0, len(other.counts), na):
+            for app_id, target in enumerate(remap):
+                n = other.counts[block + app_id]
+                if n:
+                    counts[block + target] += n
+        return self
+
+    def to_dict(self):
+        """JSON 化できる形に変換（ゼロ以外のカウンタのみ）"""
+        return {
+            'spec': self.spec.to_dict(),
+            'app_names': list(self.app_names),
+            'counts': {str(i): n for i, n in enumerate(self.counts) if n},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregator = cls(AggregationSpec.from_dict(data['spec']))
+        for name in data['app_names']:
+            aggregator.app_names.append(name)
+            if name != OTHER_APP:
+                aggregator.app_ids[name.encode('utf-8')] = len(aggregator.app_names) - 1
+        for index, n in data['counts'].items():
+            aggregator.counts[int(index)] = n
+        return aggregator
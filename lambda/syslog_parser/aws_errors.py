@@ -0,0 +1,19 @@
+"""
+AWS エラー判定ヘルパー
+
+botocore を import せずに ClientError 互換の例外からエラーコードを取り出す。
+"""
+
+
+def error_code(error):
+    """
+    例外の AWS エラーコードを返す
+
+    Args:
+        error (Exception): botocore.exceptions.ClientError 互換の例外
+
+    Returns:
+        str | None: 'ProvisionedThroughputExceededException', 'PreconditionFailed' 等
+    """
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code')
@@ -0,0 +1,133 @@
+"""
+ホスト・時刻（0〜23時）ごとの CRITICAL 件数のベースラインと異常スコア
+
+過去の時間別アイテムを問い合わせる代わりに、ホストごとに24個（時刻ごと）の要約だけを持ち、
+新しい時間の件数が来るたびに O(1) で更新する。
+
+    平均・分散は指数加重（EWMA）で、重み a = max(alpha, 1 / 件数)
+    （最初の 1/alpha 日は Welford 法と同じ単純平均・母分散、その後は直近を重くした移動平均）
+
+      diff = x - mean
+      mean = mean + a * diff
+      var  = (1 - a) * (var + a * diff * diff)
+
+スコアは更新する前のベースラインに対する z スコア。件数のばらつきは少なくともポアソン分布程度
+（分散 ≥ 平均、かつ ≥ 1）とみなし、件数の少ない時刻で小さな変化が大きなスコアにならないようにする。
+ベースラインの件数が min_samples に満たない間はスコアを出さない。
+
+同じ日の同じ時刻を再処理した場合は、その日の更新を置き換える（1つ前の要約から更新し直す）ため、
+何度処理しても同じ結果になる。最後に更新した日より前の日（順序の入れ替わったバックフィル）は
+現在のベースラインで採点するだけで、ベースラインは更新しない。
+"""
+
+import math
+
+DEFAULT_ALPHA = 0.1
+DEFAULT_MIN_SAMPLES = 7
+# 異常とみなすスコアの絶対値（ログとメトリクス AnomalousHours 用）
+ALERT_SCORE = 3.0
+# 出力するスコア・平均・標準偏差の小数点以下の桁数
+DIGITS = 2
+
+
+class Baseline:
+    """
+    1つの時刻の CRITICAL 件数の要約
+
+    Attributes:
+        samples (int): 反映した日数
+        mean (float): 指数加重平均
+        var (float): 指数加重分散
+    """
+
+    def __init__(self, samples=0, mean=0.0, var=0.0):
+        self.samples = samples
+        self.mean = mean
+        self.var = var
+
+    def updated(self, value, alpha):
+        """value を反映したベースライン（自身は変えない）"""
+        samples = self.samples + 1
+        a = max(alpha, 1.0 / samples)
+        diff = value - self.mean
+        return Baseline(samples, self.mean + a * diff, (1 - a) * (self.var + a * diff * diff))
+
+    def std(self):
+        return math.sqrt(self.var)
+
+    def score(self, value, min_samples):
+        """
+        value の z スコア（ベースラインの日数が足りなければ None）
+        """
+        if self.samples < min_samples:
+            return None
+        return (value - self.mean) / math.sqrt(max(self.var, self.mean, 1.0))
+
+    def to_dict(self):
+        return {'samples': self.samples, 'mean': self.mean, 'var': self.var}
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data:
+            return cls()
+        return cls(data['samples'], data['mean'], data['var'])
+
+
+def hour_slot(hour):
+    """'10:00' → '10'（ベースラインの時刻のキー）"""
+    return hour[:2]
+
+
+def score_hours(doc, hostname, log_date, counts, alpha=DEFAULT_ALPHA, min_samples=DEFAULT_MIN_SAMPLES):
+    """
+    ベースラインの JSON に1日分の時間別件数を反映し、各時間を採点する
+
+    rollup.update_json_document の merge として使えるよう、doc は変えずに新しい JSON を返す。
+
+    Args:
+        doc (dict): 現在のベースラインの JSON（なければ None）
+        counts (dict): {'10:00': 12, ...} 時間 → CRITICAL 件数
+        alpha (float): 指数加重の重み（0〜1、大きいほど直近の日を重くする）
+        min_samples (int): スコアを出すのに必要なベースラインの日数
+
+    Returns:
+        tuple: (新しい JSON, {'10:00': {'score': 4.21, 'mean': 3.2, 'std': 1.1, 'samples': 14}, ...})
+            score はベースラインの日数が足りない時間には含めない
+
+    JSON:
+        {"hostname": "srx-fw01", "alpha": 0.1,
+         "hours": {"10": {"last_date": "2025-04-28", "current": {...}, "previous": {...}}, ...}}
+        current は last_date までを反映した要約、previous は last_date を反映する前の要約
+    """
+    hours = dict((doc or {}).get('hours', {}))
+    results = {}
+    for hour, value in sorted(counts.items()):
+        slot = hour_slot(hour)
+        state = hours.get(slot)
+        if state is None:
+            base = Baseline()
+        elif log_date == state['last_date']:
+            base = Baseline.from_dict(state['previous'])
+        else:
+            base = Baseline.from_dict(state['current'])
+
+        result = {'mean': round(base.mean, DIGITS), 'std': round(base.std(), DIGITS),
+                  'samples': base.samples}
+        score = base.score(value, min_samples)
+        if score is not None:
+            result['score'] = round(score, DIGITS)
+        results[hour] = result
+
+        if state is None or log_date >= state['last_date']:
+            hours[slot] = {
+                'last_date': log_date,
+                'current': base.updated(value, alpha).to_dict(),
+                'previous': base.to_dict(),
+            }
+
+    new_doc = {
+        'hostname': hostname,
+        'alpha': alpha,
+        'hours': {slot: hours[slot] for slot in sorted(hours)},
+    }
+    return new_doc, results
@@ -0,0 +1,137 @@
+"""
+時間予算つきの CSV 読み込み（チェックポイントと再開）
+
+Lambda のタイムアウトまでに読み切れない大きな CSV を、呼び出しをまたいで集計するための部品。
+
+  - BudgetReader: 解凍済みCSVを読み、残り時間が reserve を切ったらレコードの区切りで EOF にする。
+    読み終えた位置（解凍後のバイトオフセット）を offset に持つ
+  - 再開時は同じ BudgetReader に offset を渡す。ヘッダー行だけを通したあと offset までを読み捨てるため、
+    CsvScanner には「ヘッダー + 続きのレコード」がつながった1つの CSV に見える
+
+Deflate は途中から展開できないため、再開時も先頭から解凍し直す（解析よりずっと速い）。
+区切りはクォートの外の改行だけにする（CsvScanner がフィールド内改行として連結する行の途中では切らない）。
+クォートの内外は CsvScanner と同じ csv_scanner.quote_state で判定する。
+残り時間の確認は読み込み単位（STREAM_CHUNK_SIZE）ごとの1回だけで、行ごとの処理には入らない。
+"""
+
+import io
+
+from csv_scanner import FIELD_START, QUOTED, quote_state
+
+NEWLINE = b'\n'
+
+
+class BudgetReader(io.RawIOBase):
+    """
+    残り時間がなくなったらレコードの区切りで読み込みを打ち切るストリーム
+
+    Args:
+        stream: 解凍済みCSVのバイトストリーム（read(n) を持つ）
+        remaining (callable): 呼び出しの残り時間（ミリ秒）を返す関数（None は打ち切らない）
+        reserve_ms (int): 残り時間がこれを切ったら打ち切る（保存・出力と引き継ぎに残す時間）
+        offset (int): 再開する位置（解凍後のバイトオフセット、0 は先頭から）
+        header_end (int): 再開時のヘッダー行の終わりの位置（offset > 0 の場合に必要）
+
+    Attributes:
+        offset (int): ここまで読み終えた位置（打ち切った場合は次の再開位置）
+        header_end (int): ヘッダー行の終わりの位置（見つかるまで None）
+        stopped (bool): 残り時間がなくなって打ち切った
+    """
+
+    def __init__(self, stream, remaining=None, reserve_ms=0, offset=0, header_end=None):
+        if offset and header_end is None:
+            raise ValueError("header_end is required to resume from an offset")
+        self.stream = stream
+        self.remaining = remaining
+        self.reserve_ms = reserve_ms
+        self.header_end = header_end
+        self.offset = 0
+        self.stopped = False
+        # 読み終えた部分の終わりのクォートの状態（csv_scanner.quote_state）
+        self.state = FIELD_START
+        # ヘッダー行が見つかるまでに読んだ部分
+        self.head = b''
+        # 再開時に読み捨てる範囲 [header_end, resume_offset)
+        self.resume_offset = offset
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read(self, size=-1):
+        if self.stopped:
+            return b''
+        size = io.DEFAULT_BUFFER_SIZE if size is None or size < 0 else size
+        if self.resume_offset:
+            if self.offset >= self.header_end:
+                self._skip_to(self.resume_offset)
+            else:
+                # ヘッダー行を越えて読まない（その先は再開位置まで読み捨てる）
+                size = min(size, self.header_end - self.offset)
+        data = self.stream.read(size)
+        if not data:
+            return data
+
+        if self.header_end is None:
+            self._find_header(data)
+        elif not self.resume_offset and self._expired():
+            end = next(record_ends(data, self.state), None)
+            if end is not None:
+                data = data[:end]
+                self.stopped = True
+        self.state = quote_state(data, self.state)
+        self.offset += len(data)
+        return data
+
+    def close(self):
+        self.stream.close()
+        super().close()
+
+    def _expired(self):
+        return self.remaining is not None and self.remaining() < self.reserve_ms
+
+    def _find_header(self, data):
+        """最初の空でないレコードの終わりをヘッダー行の終わりにする"""
+        self.head += data
+        previous = 0
+        for end in record_ends(self.head):
+            if self.head[previous:end].strip():
+                self.header_end = end
+                self.head = b''
+                return
+            previous = end
+
+    def _skip_to(self, offset):
+        """offset までを読み捨てる（Deflate は先頭から解凍し直すしかない）"""
+        while self.offset < offset:
+            data = self.stream.read(min(offset - self.offset, 1024 * 1024))
+            if not data:
+                break
+            self.offset += len(data)
+        self.resume_offset = 0
+
+
+def record_ends(data, state=FIELD_START):
+    """
+    data の中のレコードの終わり（クォートの外の改行の直後）の位置
+
+    Args:
+        data (bytes): 読み込んだ部分
+        state (int): data の前までのクォートの状態（csv_scanner.quote_state）
+
+    Yields:
+        int: 改行の次の位置
+    """
+    start = 0
+    while True:
+        newline = data.find(NEWLINE, start)
+        if newline < 0:
+            return
+        state = quote_state(data, state, start, newline + 1)
+        start = newline + 1
+        if state != QUOTED:
+            yield start
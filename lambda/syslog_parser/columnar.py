@@ -0,0 +1,461 @@
+"""
+パース済み行の列指向エクスポート
+
+CSV の行を列ごとにまとめて保存し、後から必要な列だけを読んで集計できるようにする。
+標準ライブラリ（array / zlib / json）だけで読み書きする。
+
+ファイル形式（.slcol）:
+    MAGIC
+    行グループ × 列のチャンク（zlib 圧縮）
+    フッター（JSON: 列定義・辞書・行グループごとのチャンク位置と統計）
+    フッター長（4バイト, little endian）
+    MAGIC
+
+列のエンコーディング:
+    epoch   Timestamp を UTC のエポック秒（int64）にし、直前の行との差分で保存
+            （解析できない行は行番号をフッターに記録し、読み込み時は None）
+    dict    値の種類が少ない列（Hostname / AppName / SeverityLevel / Severity / LogType）は
+            ファイル全体で共通の辞書の番号（uint8 / uint16 / uint32）で保存
+    str     Message は長さ（uint32）の配列と UTF-8 バイト列の連結で保存
+
+行グループごとに Timestamp の最小・最大と辞書列に現れた番号を持つため、
+時間や値で絞り込む読み込みでは該当しない行グループを展開せずに読み飛ばせる。
+"""
+
+import io
+import sys
+import json
+import zlib
+import struct
+import itertools
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+
+MAGIC = b'SLCOL1'
+VERSION = 1
+
+# 1行グループの行数（書き込み時はこの行数分の行をメモリに保持する）
+ROW_GROUP_SIZE = 65536
+
+# zlib の圧縮レベル（6 にすると 2割ほど小さくなるが、圧縮時間は2倍以上かかる）
+DEFAULT_LEVEL = 3
+
+ENCODING_EPOCH = 'epoch'
+ENCODING_DICT = 'dict'
+ENCODING_STR = 'str'
+
+# (列名, エンコーディング)
+COLUMNS = (
+    ('Timestamp', ENCODING_EPOCH),
+    ('Hostname', ENCODING_DICT),
+    ('AppName', ENCODING_DICT),
+    ('SeverityLevel', ENCODING_DICT),
+    ('Severity', ENCODING_DICT),
+    ('LogType', ENCODING_DICT),
+    ('Message', ENCODING_STR),
+)
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+ENCODINGS = dict(COLUMNS)
+
+# 解析できない Timestamp
+INVALID_TIME = -(1 << 63)
+
+_FOOTER_LENGTH = struct.Struct('<I')
+# ファイルは little endian で書く
+_SWAP = sys.byteorder != 'little'
+
+
+class ColumnarError(Exception):
+    """列指向ファイルとして読めない"""
+
+
+def _pack(values):
+    """array → little endian のバイト列"""
+    if _SWAP:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode, data):
+    """little endian のバイト列 → array"""
+    values = array(typecode)
+    values.frombytes(data)
+    if _SWAP:
+        values.byteswap()
+    return values
+
+
+def _code_typecode(max_code):
+    if max_code < 1 << 8:
+        return 'B'
+    if max_code < 1 << 16:
+        return 'H'
+    return 'I'
+
+
+class EpochParser:
+    """
+    "2025-04-28T10:15:30Z" 形式の Timestamp をエポック秒にする
+
+    分までの先頭 16 バイトごとにエポック秒をキャッシュし、秒だけを足す。
+    それ以外の形式（小数秒・タイムゾーン付き）は datetime.fromisoformat で解析する。
+    """
+
+    def __init__(self):
+        self.minutes = {}
+
+    def __call__(self, value):
+        if len(value) == 20 and value[19:] == b'Z' and value[16:17] == b':':
+            minute = self.minutes.get(value[:16])
+            if minute is None:
+                minute = self._parse(value[:16] + b':00Z')
+                if minute == INVALID_TIME:
+                    return INVALID_TIME
+                self.minutes[value[:16]] = minute
+            seconds = value[17:19]
+            if seconds.isdigit():
+                return minute + int(seconds)
+            return INVALID_TIME
+        return self._parse(value)
+
+    @staticmethod
+    def _parse(value):
+        try:
+            text = value.decode('ascii')
+            if text.endswith('Z'):
+                text = text[:-1] + '+00:00'
+            parsed = datetime.fromisoformat(text)
+        except (UnicodeDecodeError, ValueError):
+            return INVALID_TIME
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp())
+
+
+class ColumnarWriter:
+    """
+    列指向ファイルの書き込み
+
+    使用例:
+        writer = ColumnarWriter(f, scanner.column_indexes(COLUMN_NAMES))
+        for fields in writer.record(rows):
+            aggregate(fields)
+        writer.close()
+
+    Args:
+        f: 書き込み先のバイナリストリーム（先頭から順に書くだけなのでシーク不要）
+        indexes (list): COLUMNS の各列に対応する行内の列番号
+        row_group_size (int): 1行グループの行数
+        level (int): zlib の圧縮レベル
+    """
+
+    def __init__(self, f, indexes, row_group_size=ROW_GROUP_SIZE, level=DEFAULT_LEVEL):
+        self.f = f
+        self.indexes = list(indexes)
+        self.row_group_size = row_group_size
+        self.level = level
+        self.rows = 0
+        self.row_groups = []
+        self.buffer = []
+        # 列名 → {bytes 値: 番号}
+        self.dictionaries = {name: {} for name, encoding in COLUMNS if encoding == ENCODING_DICT}
+        self.epoch = EpochParser()
+        self.offset = 0
+        self.closed = False
+        self._write(MAGIC)
+
+    def append(self, fields):
+        """1行追加する（bytes フィールドのリスト。行グループ分たまったら書き出す）"""
+        self.buffer.append(fields)
+        if len(self.buffer) >= self.row_group_size:
+            self.flush()
+
+    def extend(self, rows):
+        for _ in self.record(rows):
+            pass
+
+    def record(self, rows):
+        """rows をそのまま返しながら追加する（集計と同じスキャンで書き出す）"""
+        size = self.row_group_size
+        for fields in rows:
+            buffer = self.buffer
+            buffer.append(fields)
+            if len(buffer) >= size:
+                self.flush()
+            yield fields
+
+    def flush(self):
+        """たまっている行を1つの行グループとして書き出す"""
+        rows = self.buffer
+        if not rows:
+            return
+        self.buffer = []
+        group = {'rows': len(rows), 'chunks': {}, 'codes': {}}
+        for (name, encoding), i in zip(COLUMNS, self.indexes):
+            values = [fields[i] for fields in rows]
+            if encoding == ENCODING_EPOCH:
+                data, stats = self._encode_epoch(values)
+                group.update(stats)
+            elif encoding == ENCODING_DICT:
+                data, typecode, present = self._encode_dict(name, values)
+                group['codes'][name] = present
+            else:
+                data = self._encode_str(values)
+            compressed = zlib.compress(data, self.level)
+            chunk = {'offset': self.offset, 'length': len(compressed)}
+            if encoding == ENCODING_DICT:
+                chunk['type'] = typecode
+            self._write(compressed)
+            group['chunks'][name] = chunk
+        self.rows += len(rows)
+        self.row_groups.append(group)
+
+    def _encode_epoch(self, values):
+        # 1行グループ内の Timestamp の種類は行数よりずっと少ない（同じ秒が続く）
+        cache = {}
+        get = cache.get
+        seconds = [get(value) for value in values]
+        if None in seconds:
+            parse = self.epoch
+            for i, value in enumerate(values):
+                if seconds[i] is None:
+                    second = get(value)
+                    if second is None:
+                        second = cache[value] = parse(value)
+                    seconds[i] = second
+        valid = [s for s in seconds if s != INVALID_TIME]
+        stats = {'ts_min': min(valid, default=None), 'ts_max': max(valid, default=None)}
+        if len(valid) < len(seconds):
+            # 解析できない行は直前の値で埋めて（差分 0）、行番号を統計に残す
+            invalid = [i for i, s in enumerate(seconds) if s == INVALID_TIME]
+            previous = valid[0] if valid else 0
+            for i, s in enumerate(seconds):
+                if s == INVALID_TIME:
+                    seconds[i] = previous
+                else:
+                    previous = s
+            stats['invalid'] = invalid
+        # 差分にすると同じ秒・隣の秒が 0 / 1 になり、圧縮がよく効く
+        deltas = array('q', [b - a for a, b in zip([0] + seconds, seconds)])
+        return _pack(deltas), stats
+
+    def _encode_dict(self, name, values):
+        mapping = self.dictionaries[name]
+        get = mapping.get
+        codes = [get(value) for value in values]
+        if None in codes:
+            # 新しい値がある行グループだけ1行ずつ番号を割り当てる
+            for i, value in enumerate(values):
+                if codes[i] is None:
+                    code = get(value)
+                    if code is None:
+                        code = mapping[value] = len(mapping)
+                    codes[i] = code
+        typecode = _code_typecode(len(mapping) - 1)
+        return _pack(array(typecode, codes)), typecode, sorted(set(codes))
+
+    def _encode_str(self, values):
+        lengths = array('I', map(len, values))
+        return _pack(lengths) + b''.join(values)
+
+    def close(self):
+        """残りの行とフッターを書き出す（ストリーム自体は閉じない）"""
+        if self.closed:
+            return
+        self.flush()
+        footer = {
+            'version': VERSION,
+            'rows': self.rows,
+            'columns': [{'name': name, 'encoding': encoding} for name, encoding in COLUMNS],
+            'dictionaries': {
+                name: [value.decode('utf-8', 'replace') for value in mapping]
+                for name, mapping in self.dictionaries.items()
+            },
+            'row_groups': self.row_groups,
+        }
+        data = json.dumps(footer, separators=(',', ':')).encode('utf-8')
+        self._write(data + _FOOTER_LENGTH.pack(len(data)) + MAGIC)
+        self.closed = True
+
+    def _write(self, data):
+        self.f.write(data)
+        self.offset += len(data)
+
+
+class ColumnarReader:
+    """
+    列指向ファイルの読み込み
+
+    必要な列のチャンクだけをシークして読む。辞書列の絞り込みは番号のまま比較し、
+    行グループの統計で該当しない行グループは読み飛ばす。
+
+    使用例:
+        reader = ColumnarReader(f)
+        reader.count_by('AppName', where={'Severity': ['CRITICAL']},
+                        start=epoch('2025-04-28T03:00:00Z'), end=epoch('2025-04-28T04:00:00Z'))
+        for ts, message in reader.scan(['Timestamp', 'Message'], where={'LogType': ['THREAT']}):
+            ...
+
+    Attributes:
+        rows (int): 総行数
+        dictionaries (dict): 列名 → 値のリスト（番号の順）
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.chunk_reads = 0
+        f.seek(-(len(MAGIC) + _FOOTER_LENGTH.size), io.SEEK_END)
+        tail = f.read(len(MAGIC) + _FOOTER_LENGTH.size)
+        if len(tail) != len(MAGIC) + _FOOTER_LENGTH.size or not tail.endswith(MAGIC):
+            raise ColumnarError("Not a columnar file (missing trailer)")
+        length, = _FOOTER_LENGTH.unpack(tail[:_FOOTER_LENGTH.size])
+        f.seek(-(len(MAGIC) + _FOOTER_LENGTH.size + length), io.SEEK_END)
+        footer = json.loads(f.read(length))
+        if footer.get('version') != VERSION:
+            raise ColumnarError(f"Unsupported version: {footer.get('version')}")
+        self.footer = footer
+        self.rows = footer['rows']
+        self.columns = [c['name'] for c in footer['columns']]
+        self.encodings = {c['name']: c['encoding'] for c in footer['columns']}
+        self.dictionaries = footer['dictionaries']
+        self.row_groups = footer['row_groups']
+
+    def read_column(self, group, name, decode=True):
+        """
+        行グループ1つ分の列を読む
+
+        Args:
+            group (dict): self.row_groups の要素
+            name (str): 列名
+            decode (bool): False の場合、辞書列は番号のまま返す
+
+        Returns:
+            list / array: Timestamp はエポック秒（解析できなかった行は None）、
+                辞書列は値（decode=False なら番号）、Message は str
+        """
+        if name not in self.encodings:
+            raise KeyError(f"Column not found: {name}")
+        chunk = group['chunks'][name]
+        self.f.seek(chunk['offset'])
+        data = zlib.decompress(self.f.read(chunk['length']))
+        self.chunk_reads += 1
+        encoding = self.encodings[name]
+        n = group['rows']
+
+        if encoding == ENCODING_EPOCH:
+            values = list(itertools.accumulate(_unpack('q', data)))
+            for i in group.get('invalid', ()):
+                values[i] = None
+            return values
+        if encoding == ENCODING_DICT:
+            codes = _unpack(chunk['type'], data)
+            if not decode:
+                return codes
+            dictionary = self.dictionaries[name]
+            return [dictionary[code] for code in codes]
+        lengths = _unpack('I', data[:4 * n])
+        body = data[4 * n:]
+        values = []
+        position = 0
+        for length in lengths:
+            values.append(body[position:position + length].decode('utf-8', 'replace'))
+            position += length
+        return values
+
+    def _codes(self, where):
+        """where の値 → 辞書列の番号の集合"""
+        codes = {}
+        for name, values in (where or {}).items():
+            if self.encodings.get(name) != ENCODING_DICT:
+                raise ValueError(f"Filtering is only supported on dictionary columns: {name}")
+            dictionary = self.dictionaries[name]
+            wanted = set(values)
+            codes[name] = {code for code, value in enumerate(dictionary) if value in wanted}
+        return codes
+
+    def _groups(self, codes, start, end):
+        """統計から条件に合う行のありうる行グループを選ぶ"""
+        for group in self.row_groups:
+            if any(not wanted.intersection(group['codes'][name]) for name, wanted in codes.items()):
+                continue
+            if start is not None or end is not None:
+                if group['ts_min'] is None:
+                    continue
+                if start is not None and group['ts_max'] < start:
+                    continue
+                if end is not None and group['ts_min'] >= end:
+                    continue
+            yield group
+
+    def _mask(self, group, codes, start, end):
+        """行グループ内の条件に合う行の番号（条件がなければ None）"""
+        mask = None
+        for name, wanted in codes.items():
+            column = self.read_column(group, name, decode=False)
+            rows = (range(len(column)) if mask is None else mask)
+            mask = [i for i in rows if column[i] in wanted]
+        if start is not None or end is not None:
+            timestamps = self.read_column(group, 'Timestamp')
+            lo = start if start is not None else -(1 << 63)
+            hi = end if end is not None else 1 << 63
+            rows = range(len(timestamps)) if mask is None else mask
+            mask = [i for i in rows
+                    if timestamps[i] is not None and lo <= timestamps[i] < hi]
+        return mask
+
+    def scan(self, columns=None, where=None, start=None, end=None):
+        """
+        条件に合う行の指定列を返す
+
+        Args:
+            columns (list): 読む列（None なら全列）
+            where (dict): 辞書列の値の条件 {'Severity': ['CRITICAL', 'WARNING']}
+            start, end (int): Timestamp の範囲（エポック秒、start 以上 end 未満）
+
+        Yields:
+            tuple: columns の順の値
+        """
+        columns = list(columns or self.columns)
+        codes = self._codes(where)
+        for group in self._groups(codes, start, end):
+            mask = self._mask(group, codes, start, end)
+            if mask is not None and not mask:
+                continue
+            data = [self.read_column(group, name) for name in columns]
+            if mask is None:
+                yield from zip(*data)
+            else:
+                for i in mask:
+                    yield tuple(column[i] for column in data)
+
+    def count_by(self, column, where=None, start=None, end=None):
+        """
+        辞書列の値ごとの行数（値は復号せず番号のまま数える）
+
+        Returns:
+            collections.Counter: {値: 行数}
+        """
+        if self.encodings.get(column) != ENCODING_DICT:
+            raise ValueError(f"count_by is only supported on dictionary columns: {column}")
+        codes = self._codes(where)
+        counts = Counter()
+        for group in self._groups(codes, start, end):
+            mask = self._mask(group, codes, start, end)
+            values = self.read_column(group, column, decode=False)
+            if mask is None:
+                counts.update(values)
+            else:
+                counts.update(values[i] for i in mask)
+        dictionary = self.dictionaries[column]
+        return Counter({dictionary[code]: n for code, n in counts.items()})
+
+
+def epoch(text):
+    """'2025-04-28T03:00:00Z' → エポック秒（scan / count_by の範囲指定用）"""
+    value = EpochParser()(text.encode('ascii'))
+    if value == INVALID_TIME:
+        raise ValueError(f"Invalid timestamp: {text}")
+    return value
+
@@ -0,0 +1,220 @@
+"""
+高速 CSV スキャナ
+
+バッファ付きバイトストリームを行単位で読み、必要な列だけを bytes のまま取り出す。
+行ごとの dict 生成や、使わない列（特に幅の広い Message）のデコードを行わない。
+
+クォートを含む行（区切り文字や改行を含むフィールド）のみ csv モジュールで解析し、
+それ以外は bytes.split による高速パスで処理する。結果は csv.reader と同じフィールド値になる。
+
+フィールド内改行として次の行を連結するかは、csv.reader と同じ規則で決める（quote_state）。
+クォートはフィールドの先頭にある場合だけクォートの始まりで、それ以外（"disk 5" bay" など）は文字として扱う。
+"""
+
+import io
+import csv
+from operator import itemgetter
+
+DELIMITER = b','
+QUOTE = b'"'
+UTF8_BOM = b'\xef\xbb\xbf'
+
+# クォートの状態（csv.reader の既定の方言・strict=False と同じ遷移）
+FIELD_START = 0       # フィールドの先頭（レコードの先頭を含む）
+UNQUOTED = 1          # クォートで始まらないフィールドの中（クォートは文字）
+QUOTED = 2            # クォートで始まるフィールドの中（区切り文字・改行も値の一部）
+QUOTE_IN_QUOTED = 3   # クォートの中で " を読んだ直後（"" のエスケープか、クォートの終わり）
+# 各状態で " を読んだ後の状態
+AFTER_QUOTE = (QUOTED, UNQUOTED, QUOTE_IN_QUOTED, QUOTED)
+# フィールド・レコードの区切り（bytes の要素は int）
+SEPARATORS = frozenset(b',\r\n')
+
+
+def quote_state(data, state=FIELD_START, start=0, end=None):
+    """
+    data[start:end] を読んだ後のクォートの状態
+
+    " の位置だけを find で辿り、その間の文字列は最後の1文字で状態を決める
+    （クォートのない行が多くても、コストはクォートの数に比例する）。
+
+    Args:
+        data (bytes): CSV の一部
+        state (int): data[start] の前までの状態
+
+    Returns:
+        int: FIELD_START / UNQUOTED / QUOTED / QUOTE_IN_QUOTED
+            （QUOTED で終わる行は、フィールド内改行として次の行に続く）
+    """
+    end = len(data) if end is None else end
+    position = start
+    while True:
+        quote = data.find(QUOTE, position, end)
+        stop = end if quote < 0 else quote
+        if stop > position and state != QUOTED:
+            # クォートの外の文字列: 区切りで終われば次のフィールドの先頭、それ以外はフィールドの途中
+            state = FIELD_START if data[stop - 1] in SEPARATORS else UNQUOTED
+        if quote < 0:
+            return state
+        state = AFTER_QUOTE[state]
+        position = quote + 1
+
+
+class CsvScanner:
+    """
+    ヘッダー付き CSV のバイトストリームスキャナ
+
+    使用例:
+        scanner = CsvScanner(f)
+        ts_i, sev_i = scanner.column_indexes(['Timestamp', 'Severity'])
+        for fields in scanner.rows(max(ts_i, sev_i)):
+            hour = fields[ts_i][11:13]
+
+    Attributes:
+        columns (list): ヘッダーの列名（空ファイルの場合は空リスト）
+    """
+
+    def __init__(self, stream, encoding='utf-8'):
+        """
+        Args:
+            stream: 行単位で反復できるバイナリストリーム（open(..., 'rb') / io.BufferedReader）
+            encoding (str): クォート行のフォールバック解析時と列名のデコードに使う文字コード
+        """
+        self.stream = stream
+        self.encoding = encoding
+        self.columns = []
+
+        header = self._next_record(iter(stream))
+        if header is not None:
+            if header and header[0].startswith(UTF8_BOM):
+                header[0] = header[0][len(UTF8_BOM):]
+            self.columns = [name.decode(encoding) for name in header]
+
+    def column_indexes(self, names):
+        """
+        列名から列番号を引く（ヘッダー解析は1回だけ）
+
+        Raises:
+            KeyError: ヘッダーに存在しない列名の場合
+        """
+        indexes = []
+        for name in names:
+            if name not in self.columns:
+                raise KeyError(f"Column not found in CSV header: {name}")
+            indexes.append(self.columns.index(name))
+        return indexes
+
+    def rows(self, max_index):
+        """
+        データ行を bytes フィールドのリストとして返す
+
+        Args:
+            max_index (int): 呼び出し側が参照する最大の列番号
+                それより右の列は分割せず、末尾の1要素にまとめたまま返す
+
+        Yields:
+            list: bytes フィールド（長さは max_index + 1 以上を保証。最終列より左で分割をやめる場合は、
+                分割しない残りの要素を含めて max_index + 2 以上）
+        """
+        last_column = len(self.columns) - 1
+        # 最終列を参照しない場合は改行を含む残りを分割しない（Message を切らない）
+        split_all = max_index >= last_column
+        maxsplit = -1 if split_all else max_index + 1
+        width = max_index + 1
+        # クォート行は全列を分割する。分割しない列がある場合は、高速パスの行（width + 1 要素）と
+        # 区別できるよう width + 2 要素以上にする（field_getter）
+        padded = width if split_all else width + 2
+        # 列数の足りない行も、分割しない列がある場合は残りの要素（空）まで埋める
+        short = width if split_all else width + 1
+        lines = iter(self.stream)
+
+        for line in lines:
+            if QUOTE in line:
+                for fields in self._fallback(line, lines):
+                    if len(fields) < padded:
+                        fields.extend([b''] * (padded - len(fields)))
+                    yield fields
+                continue
+
+            if len(line) < 3 and not line.strip(b'\r\n'):
+                # 空行は csv.reader と同様に読み飛ばす
+                continue
+            if split_all:
+                line = line.rstrip(b'\r\n')
+            fields = line.split(DELIMITER, maxsplit)
+            if len(fields) <= width:
+                # 列数の足りない行: 末尾フィールドに改行が残っている
+                fields[-1] = fields[-1].rstrip(b'\r\n')
+                if len(fields) < short:
+                    fields.extend([b''] * (short - len(fields)))
+            yield fields
+
+    def field_getter(self, max_index, index):
+        """
+        rows(max_index) の行から列 index の値を取り出す関数
+
+        max_index より右の列は rows() が分割しないため、呼ばれた行でだけ残りを分割して取り出す
+        （Message のように一部の行でしか参照しない列を、全行では分割しない）。
+        値は全列を分割した場合（rows(index)）と同じになる。
+
+        Args:
+            max_index (int): rows() に渡した最大の列番号
+            index (int): 取り出す列番号
+
+        Returns:
+            callable: 関数(行) → bytes
+        """
+        if index <= max_index or max_index >= len(self.columns) - 1:
+            return itemgetter(index)
+        width = max_index + 1
+        # 残り（fields[width]）の中での位置
+        position = index - width
+
+        def get(fields):
+            if len(fields) != width + 1:
+                # クォート行（全列を分割済み）か、列の足りない行
+                return fields[index] if index < len(fields) else b''
+            parts = fields[width].split(DELIMITER, position + 1)
+            if len(parts) > position + 1:
+                return parts[position]
+            if len(parts) == position + 1:
+                # 最後の列: 改行が残っている
+                return parts[position].rstrip(b'\r\n')
+            return b''
+
+        return get
+
+    def _next_record(self, lines):
+        """ヘッダー行を1レコード分読む（空行は読み飛ばす）"""
+        for line in lines:
+            if QUOTE in line:
+                fields = next(self._fallback(line, lines), None)
+            else:
+                line = line.rstrip(b'\r\n')
+                fields = line.split(DELIMITER) if line else None
+            if fields is not None:
+                return fields
+        return None
+
+    def _fallback(self, line, lines):
+        """
+        クォートを含むレコードを csv モジュールで解析
+
+        行末がクォートの中（QUOTED）の間はフィールド内改行とみなして次の行を連結する。
+        連結したブロックから csv.reader が返すレコードをすべて返す（空行は除く）。
+
+        Yields:
+            list: bytes フィールド
+        """
+        record = [line]
+        state = quote_state(line)
+        while state == QUOTED:
+            following = next(lines, None)
+            if following is None:
+                break
+            record.append(following)
+            state = quote_state(following, state)
+
+        block = b''.join(record).decode(self.encoding)
+        for parsed in csv.reader(io.StringIO(block, newline='')):
+            if parsed:
+                yield [field.encode(self.encoding) for field in parsed]
@@ -0,0 +1,236 @@
+"""
+DynamoDB バッチ書き込み
+
+BatchWriteItem で最大25件ずつまとめて書き込み、UnprocessedItems やスロットリングを
+ジッター付き指数バックオフで再送する。同時に発行するリクエスト数は max_in_flight で制限する。
+
+client には batch_write_item(RequestItems=...) を持つオブジェクトを渡す
+（boto3 の DynamoDB サービスリソース / クライアント、またはテスト用フェイク）。
+低レベルクライアントを使う場合は serialize=serialize_item を指定し、
+Python の値を DynamoDB の型付き属性値（{'S': ...}, {'N': ...}）に変換して渡す。
+サービスリソースと違い、リソースモデルの読み込みが不要なためコールドスタートが軽い。
+"""
+
+import time
+import random
+import threading
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_errors import error_code
+
+# BatchWriteItem の1リクエストあたりの上限件数
+MAX_BATCH_SIZE = 25
+
+# スロットリングとみなすエラーコード
+THROTTLE_ERROR_CODES = (
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+)
+
+
+class BatchWriteError(Exception):
+    """リトライ上限を超えても書き込めなかったアイテムがある"""
+
+    def __init__(self, message, unprocessed_count, report):
+        super().__init__(message)
+        self.unprocessed_count = unprocessed_count
+        self.report = report
+
+
+class BatchWriter:
+    """
+    リトライ対応の BatchWriteItem ライター
+
+    1つのインスタンスをコンテナ内で共有すると、複数レコードを並行処理していても
+    同時リクエスト数の上限（max_in_flight）が全体で守られる。
+    """
+
+    def __init__(self, client, table_name, batch_size=MAX_BATCH_SIZE, max_in_flight=4,
+                 max_retries=8, base_delay=0.05, max_delay=2.0, serialize=None,
+                 sleep=time.sleep, rand=random.random):
+        """
+        Args:
+            client: batch_write_item(RequestItems=...) を持つオブジェクト
+            table_name (str): 書き込み先テーブル名
+            batch_size (int): 1リクエストあたりの件数（最大25）
+            max_in_flight (int): 同時に発行するリクエスト数の上限
+            max_retries (int): 1バッチあたりの再送回数の上限
+            base_delay (float): バックオフの初期値（秒）
+            max_delay (float): バックオフの上限（秒）
+            serialize (callable): アイテムを client の形式に変換する関数
+                （低レベルクライアントでは serialize_item、None は変換しない）
+            sleep, rand: テスト用に差し替え可能な待機関数・乱数関数
+        """
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+        self.client = client
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.serialize = serialize
+        self.sleep = sleep
+        self.rand = rand
+        self._executor = None
+        self._lock = threading.Lock()
+        # 呼び出し元スレッドが複数あっても同時リクエスト数を上限内に抑える
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def write(self, items):
+        """
+        アイテムをバッチに分けて書き込む
+
+        Args:
+            items (list): 書き込むアイテム（client の形式に合わせた dict）
+
+        Returns:
+            dict: 書き込みレポート
+                {
+                  'items': 48, 'batches': 2, 'requests': 3,
+                  'retries': 1, 'throttles': 1, 'unprocessed': 0,
+                  'batch_stats': [
+                    {'items': 25, 'attempts': 2, 'throttles': 1, 'unprocessed': 0, 'latency_ms': 61.2},
+                    {'items': 23, 'attempts': 1, 'throttles': 0, 'unprocessed': 0, 'latency_ms': 8.4}
+                  ]
+                }
+
+        Raises:
+            BatchWriteError: リトライ上限を超えて未処理のアイテムが残った場合
+        """
+        if self.serialize is not None:
+            items = [self.serialize(item) for item in items]
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+
+        if len(batches) <= 1 or self.max_in_flight <= 1:
+            batch_stats = [self._write_batch(batch) for batch in batches]
+        else:
+            executor = self._get_executor()
+            batch_stats = [f.result() for f in [executor.submit(self._write_batch, b) for b in batches]]
+
+        report = {
+            'items': len(items),
+            'batches': len(batches),
+            'requests': sum(s['attempts'] for s in batch_stats),
+            'retries': sum(s['attempts'] - 1 for s in batch_stats),
+            'throttles': sum(s['throttles'] for s in batch_stats),
+            'unprocessed': sum(s['unprocessed'] for s in batch_stats),
+            'batch_stats': batch_stats,
+        }
+
+        if report['unprocessed']:
+            raise BatchWriteError(
+                f"{report['unprocessed']} items were not written after {self.max_retries} retries",
+                report['unprocessed'], report)
+        return report
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_in_flight, thread_name_prefix='ddb-writer')
+            return self._executor
+
+    def _write_batch(self, batch):
+        """1バッチ分を UnprocessedItems がなくなるまで再送"""
+        requests = [{'PutRequest': {'Item': item}} for item in batch]
+        attempts = 0
+        throttles = 0
+        start = time.perf_counter()
+
+        while requests:
+            if attempts > self.max_retries:
+                break
+            if attempts > 0:
+                self.sleep(self._backoff(attempts))
+            attempts += 1
+
+            try:
+                with self._in_flight:
+                    response = self.client.batch_write_item(RequestItems={self.table_name: requests})
+            except Exception as e:
+                if error_code(e) not in THROTTLE_ERROR_CODES:
+                    raise
+                throttles += 1
+                continue
+
+            requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if requests:
+                # 部分的な未処理はスロットリングによるもの
+                throttles += 1
+
+        return {
+            'items': len(batch),
+            'attempts': attempts,
+            'throttles': throttles,
+            'unprocessed': len(requests),
+            'latency_ms': round((time.perf_counter() - start) * 1000, 3),
+        }
+
+    def _backoff(self, attempt):
+        """フルジッター付き指数バックオフ（秒）"""
+        return self.rand() * min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+
+
+def serialize_item(item):
+    """
+    アイテムを低レベルクライアントの型付き属性値に変換する
+
+    boto3.dynamodb.types.TypeSerializer と同じ規則（float は Decimal で渡す必要がある）。
+
+    Returns:
+        dict: {'log_date': {'S': '2025-04-28'}, 'critical_count': {'N': '15'}, ...}
+    """
+    return {name: serialize_value(value) for name, value in item.items()}
+
+
+def serialize_value(value):
+    """Python の値 → DynamoDB の型付き属性値"""
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, (int, Decimal)):
+        return {'N': str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {'B': bytes(value)}
+    if isinstance(value, dict):
+        return {'M': {str(k): serialize_value(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {'L': [serialize_value(v) for v in value]}
+    if isinstance(value, (set, frozenset)) and value:
+        if all(isinstance(v, str) for v in value):
+            return {'SS': sorted(value)}
+        if all(isinstance(v, (int, Decimal)) and not isinstance(v, bool) for v in value):
+            return {'NS': sorted(str(v) for v in value)}
+    if isinstance(value, float):
+        raise TypeError('Float types are not supported. Use Decimal types instead.')
+    raise TypeError(f'Unsupported type "{type(value).__name__}" for value: {value!r}')
+
+
+def deserialize_item(item):
+    """serialize_item() の逆変換（数値は boto3 のリソースと同じく Decimal）"""
+    return {name: deserialize_value(value) for name, value in item.items()}
+
+
+def deserialize_value(value):
+    """DynamoDB の型付き属性値 → Python の値"""
+    (kind, data), = value.items()
+    if kind == 'N':
+        return Decimal(data)
+    if kind == 'M':
+        return {k: deserialize_value(v) for k, v in data.items()}
+    if kind == 'L':
+        return [deserialize_value(v) for v in data]
+    if kind == 'NULL':
+        return None
+    if kind == 'SS':
+        return set(data)
+    if kind == 'NS':
+        return {Decimal(v) for v in data}
+    return data
@@ -0,0 +1,538 @@
+"""
+設定で追加できる集計ルール（フィルタールールエンジン）
+
+CRITICAL / WARNING 以外に数えたい分類（RT_IDP の ERROR、Message に "brute force" を含む行など）を
+JSON のルールで宣言し、コンテナごとに1回だけコンパイルして時間別に数える。
+
+    [
+      {"name": "idp_error", "severity": "ERROR", "app": "RT_IDP"},
+      {"name": "brute_force", "message": "brute force", "ignore_case": true},
+      {"name": "emergency", "severity": ["EMERGENCY", "ALERT"]}
+    ]
+
+条件は Severity / AppName / LogType（値、または値のリストのいずれかに一致）と Message（正規表現の検索）で、
+1つのルールの条件はすべて満たす必要がある。1行が複数のルールに一致した場合はそれぞれに数える。
+
+  - Severity だけのルールは行ごとには評価せず、集計カウンタ（aggregation.Aggregator）の
+    時 × Severity の件数から求める（スキャンのコストは増えない）
+  - それ以外のルールは、条件に使われている列（Severity / AppName / LogType）の値の組を辞書で1回引き、
+    その組で成り立ちうるルールだけを評価する（ディスパッチテーブル。組ごとの項目は初出時に作る）
+  - Message だけが条件で、パターンが文字列（"brute force" や "SQL injection|XSS" のような | 区切りの並び）の
+    ルールは行ごとには評価しない。CSV を読み込み単位（ブロック）ごとに bytes.find で探し、
+    見つかった行だけを分割して確かめる（MessageScan。文字列を含まない行のコストは増えない）
+  - Message は全行では分割せず、ディスパッチテーブルで候補になった行でだけ取り出す（CsvScanner.field_getter）
+  - ignore_case で Message の条件が文字列だけのルールは、正規表現を使わず lower() した Message を bytes の in で探す
+    （IGNORECASE の正規表現は文字列の高速な検索が使えず、lower() + in の約3倍かかる）
+  - それ以外の Message の条件は、その組で候補になるルールのパターンをまとめた1つの正規表現で検索し、
+    一致した行だけ個々のパターンで確かめる（候補が1つなら検索1回だけ）
+"""
+
+import io
+import re
+import json
+from operator import itemgetter
+
+from aggregation import SEVERITIES, HOURS
+from checkpoint import record_ends
+from csv_scanner import CsvScanner, DELIMITER, QUOTE
+
+# ルールの条件に使える列（ルールのキー → CSV の列名）
+FIELD_COLUMNS = (
+    ('severity', 'Severity'),
+    ('app', 'AppName'),
+    ('log_type', 'LogType'),
+)
+MESSAGE_COLUMN = 'Message'
+TIMESTAMP_COLUMN = 'Timestamp'
+RULE_KEYS = {'name', 'message', 'ignore_case'} | {key for key, _ in FIELD_COLUMNS}
+
+# "2025-04-28T10:15:30Z"[11:13] → 時間の番号（不正なタイムスタンプは HOURS）
+HOUR_IDS = {f'{h:02d}'.encode(): h for h in range(HOURS)}
+# 正規表現の特殊文字（| 以外を含まないパターンは文字列の検索で評価できる）
+REGEX_SPECIAL = re.compile(rb'[.^$*+?{}\[\]\\()]')
+
+
+class FilterRule:
+    """
+    1つの集計ルール
+
+    Attributes:
+        name (str): ルール名（時間別統計のキー）
+        values (dict): 列名 → 一致させる値の frozenset（bytes、条件のない列は含めない）
+        pattern (bytes): Message を検索する正規表現（条件がなければ None）
+        ignore_case (bool): pattern の大文字・小文字を区別しない
+        literals (tuple): pattern が文字列の | 区切りの並びだけなら、その文字列（ignore_case なら小文字にする。
+            それ以外は None で、正規表現で検索する）
+    """
+
+    def __init__(self, name, values=None, pattern=None, ignore_case=False):
+        self.name = name
+        self.values = values or {}
+        self.pattern = pattern
+        self.ignore_case = ignore_case
+        self.search = None
+        self.literals = None
+        if pattern is not None:
+            self.search = re.compile(pattern, re.IGNORECASE if ignore_case else 0).search
+            self.literals = literal_alternatives(pattern, ignore_case)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Raises:
+            ValueError: 名前がない、未知のキー、条件がない、正規表現が不正
+        """
+        if not isinstance(data, dict) or not data.get('name'):
+            raise ValueError(f"Filter rule needs a name: {data!r}")
+        name = str(data['name'])
+        unknown = set(data) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown filter rule key in {name}: {', '.join(sorted(unknown))}")
+
+        values = {}
+        for key, column in FIELD_COLUMNS:
+            value = data.get(key)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = [value]
+            values[column] = frozenset(str(v).encode('utf-8') for v in value)
+
+        pattern = data.get('message')
+        if pattern is not None:
+            pattern = str(pattern).encode('utf-8')
+        if not values and pattern is None:
+            raise ValueError(f"Filter rule {name} has no conditions")
+        try:
+            return cls(name, values, pattern, bool(data.get('ignore_case')))
+        except re.error as e:
+            raise ValueError(f"Invalid message pattern in filter rule {name}: {e}") from None
+
+    def severity_only(self):
+        """Severity だけの条件で、集計カウンタの件数から求められるか"""
+        severities = self.values.get('Severity')
+        return (self.pattern is None and list(self.values) == ['Severity']
+                and all(s.decode('utf-8') in SEVERITIES for s in severities))
+
+    def admits(self, columns, key):
+        """列 columns の値の組 key で成り立ちうるか（Message の条件は見ない）"""
+        for column, value in zip(columns, key):
+            allowed = self.values.get(column)
+            if allowed is not None and value not in allowed:
+                return False
+        return True
+
+    def scoped_pattern(self):
+        """まとめた正規表現に入れるための、フラグを内側に閉じ込めたパターン"""
+        return (b'(?i:' if self.ignore_case else b'(?:') + self.pattern + b')'
+
+
+def literal_alternatives(pattern, ignore_case=False):
+    """
+    正規表現の特殊文字を含まないパターンを、文字列のタプルにする（ignore_case なら小文字にする）
+
+    bytes の正規表現の IGNORECASE は ASCII の英字だけを同一視するため、bytes.lower() した Message を
+    探した結果と同じになる。
+
+    Returns:
+        tuple: (b'sql injection', b'xss') など（空の選択肢や特殊文字がある場合は None）
+    """
+    alternatives = pattern.split(b'|')
+    if any(not alternative or REGEX_SPECIAL.search(alternative) for alternative in alternatives):
+        return None
+    if ignore_case:
+        return tuple(alternative.lower() for alternative in alternatives)
+    return tuple(alternatives)
+
+
+class RuleSet:
+    """
+    コンパイル済みのルールの集合
+
+    Attributes:
+        rules (list): FilterRule（定義順）
+        severity_rules (list): (ルール名, Severity 名のリスト) 集計カウンタから求めるルール
+        row_rules (list): FilterRule 集計カウンタから求められないルール（RuleCounts の番号はこの順）
+        scan_rules (list): (ルール番号, FilterRule) Message だけが条件で文字列のパターンのルール
+            （読み込み単位ごとに数える。MessageScan）
+        dispatch_rules (list): (ルール番号, FilterRule) 行ごとにディスパッチテーブルで評価するルール
+        key_columns (list): ディスパッチテーブルのキーにする列名
+    """
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        names = [rule.name for rule in self.rules]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate filter rule name: {', '.join(duplicates)}")
+
+        self.severity_rules = [
+            (rule.name, sorted(s.decode('utf-8') for s in rule.values['Severity']))
+            for rule in self.rules if rule.severity_only()
+        ]
+        self.row_rules = [rule for rule in self.rules if not rule.severity_only()]
+        self.scan_rules = [(rule_id, rule) for rule_id, rule in enumerate(self.row_rules)
+                           if not rule.values and rule.literals is not None]
+        scanned = {rule_id for rule_id, _ in self.scan_rules}
+        self.dispatch_rules = [(rule_id, rule) for rule_id, rule in enumerate(self.row_rules)
+                               if rule_id not in scanned]
+        # Message の正規表現だけのルールしかなくても、キーには Severity を使う（表の項目はどの値でも同じになる）
+        self.key_columns = [column for _, column in FIELD_COLUMNS
+                            if any(column in rule.values for _, rule in self.dispatch_rules)]
+        if self.dispatch_rules and not self.key_columns:
+            self.key_columns = ['Severity']
+        patterns = [rule.scoped_pattern() for rule in self.row_rules if rule.pattern is not None]
+        if patterns:
+            # まとめた正規表現がコンパイルできることを先に確かめる（グローバルなインラインフラグなど）
+            try:
+                re.compile(b'|'.join(patterns))
+            except re.error as e:
+                raise ValueError(f"Filter rule patterns cannot be combined: {e}") from None
+
+    @classmethod
+    def parse(cls, text):
+        """
+        JSON のルールのリストから作成（環境変数 FILTER_RULES / S3 のルールファイル用）
+
+        {"rules": [...]} の形も受け付ける。空文字列はルールなし。
+
+        Raises:
+            ValueError: JSON やルールが不正
+        """
+        if not text or not text.strip():
+            return cls()
+        data = json.loads(text)
+        if isinstance(data, dict) and 'rules' in data:
+            data = data['rules']
+        if not isinstance(data, list):
+            raise ValueError("Filter rules must be a JSON list")
+        return cls(FilterRule.from_dict(rule) for rule in data)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def names(self):
+        return [rule.name for rule in self.rules]
+
+    def columns(self):
+        """行ごとの評価に必要な CSV の列名（Message は候補の行でだけ取り出す）"""
+        columns = list(self.key_columns)
+        if any(rule.pattern is not None for rule in self.row_rules):
+            columns.append(MESSAGE_COLUMN)
+        return columns
+
+    def new_counts(self):
+        return RuleCounts([rule.name for rule in self.row_rules])
+
+    def prefilter(self, stream, counts, buffer_size=io.DEFAULT_BUFFER_SIZE):
+        """
+        scan_rules を読み込み単位ごとに数えながら stream をそのまま読むストリームにする
+
+        Args:
+            stream: ヘッダー付き CSV のバイナリストリーム（read(n) を持つ）
+            counts (RuleCounts): 数える先
+
+        Returns:
+            行単位で反復できるバイナリストリーム（scan_rules がなければ stream をそのまま返す）
+        """
+        if not self.scan_rules:
+            return stream
+        return io.BufferedReader(MessageScan(stream, self, counts), buffer_size=buffer_size)
+
+    def dispatcher(self, ts_i, indexes, counts, message=None):
+        """
+        行ごとの評価を Aggregator.consume の dispatch に渡す形にする
+
+        キー関数（operator.itemgetter）で条件の列の値の組を取り出し、ディスパッチテーブルを引く。
+        どのルールも成り立たない組の行は表の検索だけで終わり、関数は呼ばれない。
+
+        Args:
+            ts_i (int): Timestamp の列番号
+            indexes (dict): 列名 → 列番号（key_columns の列を含む）
+            counts (RuleCounts): 数える先
+            message (callable): 行から Message を取り出す関数（CsvScanner.field_getter。
+                None なら indexes の Message の列をそのまま使う）
+
+        Returns:
+            tuple: (キー関数, DispatchTable, 関数(行, 表の値))（dispatch_rules がなければ None）
+        """
+        if not self.dispatch_rules:
+            return None
+        n = len(self.row_rules)
+        values = counts.counts
+        hour_get = HOUR_IDS.get
+        invalid = HOURS
+        if message is None and MESSAGE_COLUMN in indexes:
+            message = itemgetter(indexes[MESSAGE_COLUMN])
+
+        table = DispatchTable(self, self.key_columns)
+        unseen = table.unseen
+
+        def count(fields, entry):
+            if entry is unseen:
+                entry = table[key(fields)]
+                if entry is None:
+                    return
+            static, folded, search, candidates = entry
+            base = hour_get(fields[ts_i][11:13], invalid) * n
+            for rule_id in static:
+                values[base + rule_id] += 1
+            if folded:
+                lowered = message(fields).lower()
+                for rule_id, literals in folded:
+                    for literal in literals:
+                        if literal in lowered:
+                            values[base + rule_id] += 1
+                            break
+            if search is not None:
+                text = message(fields)
+                if search(text) is not None:
+                    for rule_id, confirm in candidates:
+                        if confirm is None or confirm(text) is not None:
+                            values[base + rule_id] += 1
+
+        key = itemgetter(*(indexes[column] for column in self.key_columns))
+        return key, table, count
+
+    def hourly_stats(self, aggregator, counts=None):
+        """
+        時間別のルールごとの件数（1件以上あるルール・時間のみ）
+
+        Args:
+            aggregator (Aggregator): Severity だけのルールを求める集計カウンタ
+            counts (RuleCounts): 行ごとに評価したルールの件数（評価していなければ None）
+
+        Returns:
+            dict: {'10:00': {'idp_error': 3, 'brute_force': 12}, ...}（ルールは定義順）
+        """
+        per_hour = {}
+        for hour, severities in aggregator.severity_stats().items():
+            for name, names in self.severity_rules:
+                n = sum(severities.get(severity, 0) for severity in names)
+                if n:
+                    per_hour.setdefault(hour, {})[name] = n
+        if counts is not None:
+            for hour, rules in counts.hourly_stats().items():
+                per_hour.setdefault(hour, {}).update(rules)
+
+        order = {name: i for i, name in enumerate(self.names())}
+        return {hour: dict(sorted(rules.items(), key=lambda item: order.get(item[0], len(order))))
+                for hour, rules in sorted(per_hour.items())}
+
+
+class DispatchTable(dict):
+    """
+    列の値の組 → (必ず一致するルール番号, [(ルール番号, lower() した Message で探す文字列)],
+                   まとめた検索関数, [(ルール番号, 確認の検索関数)])
+
+    どのルールも成り立たない組は None。初めて見た組の項目はその場で作って保存する。
+    行ごとの検索は get(組, unseen) で行い、unseen が返った行で [] を引いて項目を作る。
+    """
+
+    # まだ項目を作っていない組（get の既定値）
+    unseen = object()
+
+    def __init__(self, rule_set, columns):
+        super().__init__()
+        self.rule_set = rule_set
+        self.columns = columns
+
+    def __missing__(self, value):
+        key = (value,) if len(self.columns) == 1 else value
+        static = []
+        folded = []
+        candidates = []
+        for rule_id, rule in self.rule_set.dispatch_rules:
+            if not rule.admits(self.columns, key):
+                continue
+            if rule.pattern is None:
+                static.append(rule_id)
+            elif rule.ignore_case and rule.literals is not None:
+                folded.append((rule_id, rule.literals))
+            else:
+                candidates.append((rule_id, rule))
+
+        search = None
+        confirms = ()
+        if len(candidates) == 1:
+            rule_id, rule = candidates[0]
+            search, confirms = rule.search, ((rule_id, None),)
+        elif candidates:
+            search = re.compile(b'|'.join(rule.scoped_pattern() for _, rule in candidates)).search
+            confirms = tuple((rule_id, rule.search) for rule_id, rule in candidates)
+
+        entry = None
+        if static or folded or candidates:
+            entry = (tuple(static), tuple(folded), search, confirms)
+        self[value] = entry
+        return entry
+
+
+class MessageScan(io.RawIOBase):
+    """
+    Message だけが条件で文字列のパターンのルール（RuleSet.scan_rules）を数えながら、CSV をそのまま通すストリーム
+
+    読み込んだ部分のうち最後のレコードの区切りまでを1つのブロックにして、ルールの文字列を bytes.find で探し
+    （ignore_case のルールがあればブロックを1回だけ lower() する）、見つかった行だけを分割して
+    Message をルールのパターンで確かめる。文字列を含まない行には何もしない。
+    クォートを含むブロックは CsvScanner で1行ずつ分割して確かめる（フィールド内改行・区切り文字を含む行）。
+    最初のレコードをヘッダー行として列の位置を決め、ルールに必要な列（RuleSet.columns()）がなければ数えない。
+
+    Args:
+        stream: ヘッダー付き CSV のバイナリストリーム（read(n) を持つ）
+        rule_set (RuleSet): 数えるルール
+        counts (RuleCounts): 数える先
+    """
+
+    def __init__(self, stream, rule_set, counts):
+        self.stream = stream
+        self.rules = rule_set.scan_rules
+        self.required = [TIMESTAMP_COLUMN] + rule_set.columns()
+        self.values = counts.counts
+        self.n = len(counts.names)
+        self.folded = any(rule.ignore_case for _, rule in self.rules)
+        self.enabled = True
+        # ヘッダー行（見つかるまで None）と、区切りまで読めていない部分
+        self.header = None
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        if self.enabled:
+            if data:
+                self._feed(data)
+            elif self.pending:
+                # 最後のレコード（改行で終わらない）
+                pending, self.pending = self.pending, b''
+                if self.header is not None:
+                    self._scan(pending)
+        return data
+
+    def close(self):
+        self.stream.close()
+        super().close()
+
+    def _feed(self, data):
+        buffer = self.pending + data
+        if self.header is None:
+            start = self._find_header(buffer)
+            if start is None:
+                self.pending = buffer
+                return
+            if not self.enabled:
+                self.pending = b''
+                return
+            buffer = buffer[start:]
+        if QUOTE in buffer:
+            end = 0
+            for end in record_ends(buffer):
+                pass
+        else:
+            end = buffer.rfind(b'\n') + 1
+        self.pending = buffer[end:]
+        if end:
+            self._scan(buffer[:end])
+
+    def _find_header(self, buffer):
+        """最初の空でないレコードをヘッダー行にして列の位置を決める（見つからなければ None）"""
+        previous = 0
+        for end in record_ends(buffer):
+            if buffer[previous:end].strip():
+                self.header = buffer[:end]
+                columns = CsvScanner(io.BytesIO(self.header)).columns
+                if not set(self.required) <= set(columns):
+                    self.enabled = False
+                    return end
+                self.ts_i = columns.index(TIMESTAMP_COLUMN)
+                self.msg_i = columns.index(MESSAGE_COLUMN)
+                self.max_index = max(self.ts_i, self.msg_i)
+                return end
+            previous = end
+        return None
+
+    def _scan(self, block):
+        """レコードの区切りで終わる（または CSV の最後の）ブロックのルールを数える"""
+        if QUOTE in block:
+            scanner = CsvScanner(io.BytesIO(self.header + block))
+            for fields in scanner.rows(self.max_index):
+                for rule_id, rule in self.rules:
+                    self._count(rule_id, rule, fields)
+            return
+        lowered = block.lower() if self.folded else None
+        for rule_id, rule in self.rules:
+            haystack = lowered if rule.ignore_case else block
+            seen = set()
+            for literal in rule.literals:
+                position = haystack.find(literal)
+                while position >= 0:
+                    start = block.rfind(b'\n', 0, position) + 1
+                    end = block.find(b'\n', position) + 1 or len(block)
+                    if start not in seen:
+                        seen.add(start)
+                        line = block[start:end]
+                        # CsvScanner と同じく空行は読み飛ばし、全列を分割する
+                        if len(line) >= 3 or line.strip(b'\r\n'):
+                            self._count(rule_id, rule, line.rstrip(b'\r\n').split(DELIMITER))
+                    position = haystack.find(literal, end)
+
+    def _count(self, rule_id, rule, fields):
+        message = fields[self.msg_i] if self.msg_i < len(fields) else b''
+        if rule.search(message) is not None:
+            timestamp = fields[self.ts_i] if self.ts_i < len(fields) else b''
+            self.values[HOUR_IDS.get(timestamp[11:13], HOURS) * self.n + rule_id] += 1
+
+
+class RuleCounts:
+    """
+    行ごとに評価したルールの時間別件数
+
+    カウンタはフラットな整数配列で、index = hour_id * len(names) + rule_id
+    （最後の hour_id は解析できないタイムスタンプ用で、集計結果には含めない）。
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.counts = [0] * ((HOURS + 1) * len(self.names))
+
+    def hourly_stats(self):
+        """
+        Returns:
+            dict: {'10:00': {'idp_error': 3, ...}, ...}（1件以上あるルール・時間のみ）
+        """
+        n = len(self.names)
+        result = {}
+        for hour in range(HOURS):
+            base = hour * n
+            rules = {name: self.counts[base + i] for i, name in enumerate(self.names)
+                     if self.counts[base + i]}
+            if rules:
+                result[f'{hour:02d}:00'] = rules
+        return result
+
+    def merge(self, other):
+        if other.names != self.names:
+            raise ValueError("Cannot merge rule counts of different rule sets")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        return self
+
+    def to_dict(self):
+        """JSON 化できる形に変換（ゼロ以外のカウンタのみ）"""
+        return {
+            'names': list(self.names),
+            'counts': {str(i): n for i, n in enumerate(self.counts) if n},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        counts = cls(data['names'])
+        for index, n in data['counts'].items():
+            counts.counts[int(index)] = n
+        return counts
@@ -0,0 +1,230 @@
+"""
+ヘビーヒッター（上位の送信元IP・宛先IP・宛先ポート）の追跡
+
+THREAT 行の Message に含まれる "src_ip/src_port > dst_ip/dst_port" から
+（threats.threat_observer で取り出す）時間別に送信元IP・宛先IP・宛先ポートの上位を数える。
+
+正確な件数の dict は値の種類数に比例してメモリを使うため、Misra-Gries 要約
+（Frequent アルゴリズム）で種類数を capacity 個程度に抑える。
+カウンタが 2 * capacity 個を超えたら (capacity + 1) 番目の件数を全体から引いて
+0 以下を捨てる。件数は真の値の下限で、誤差（真の値 - 件数）は error 以下、
+error は total / (capacity + 1) 以下になる。
+
+要約同士は merge() で合算でき（件数と error をそれぞれ足す）、
+ファイル・ホストをまたいだ上位を保存済みの要約から求められる。
+"""
+
+from operator import itemgetter
+from collections import Counter
+
+from threats import consume_threats
+
+DIMENSIONS = ('src_ip', 'dst_ip', 'dst_port')
+
+
+class FrequentItems:
+    """
+    Misra-Gries 要約
+
+    Attributes:
+        capacity (int): 保持するカウンタ数の目安（最大 2 * capacity）
+        counts (dict): 値 → 件数（真の値の下限）
+        total (int): 追加した件数の合計
+        error (int): 件数の誤差の上限（要約に含まれない値の件数もこれ以下）
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+        self.error = 0
+
+    def update(self, item, count=1):
+        counts = self.counts
+        current = counts.get(item)
+        if current is None:
+            counts[item] = count
+            if len(counts) > 2 * self.capacity:
+                self.compact(self.capacity)
+        else:
+            counts[item] = current + count
+        self.total += count
+
+    def update_counts(self, counts):
+        """
+        まとめて数えた 値 → 件数 を足す
+
+        正確な件数は誤差 0 の要約なので merge() と同じく足してから1回だけ詰める
+        （誤差の上限は1件ずつ update() した場合と同じ total / (capacity + 1)）。
+        """
+        self.total += sum(counts.values())
+        mine = self.counts
+        if len(counts) > len(mine):
+            # 少ない方を多い方に足す
+            mine, counts = dict(counts), mine
+        get = mine.get
+        for item, n in counts.items():
+            mine[item] = get(item, 0) + n
+        self.counts = mine
+        if len(mine) > 2 * self.capacity:
+            self.compact(self.capacity)
+
+    def compact(self, size):
+        """(size + 1) 番目の件数を全体から引き、カウンタを size 個以下にする"""
+        if len(self.counts) <= size:
+            return
+        ranked = sorted(self.counts.items(), key=itemgetter(1), reverse=True)
+        threshold = ranked[size][1]
+        self.counts = {item: n - threshold for item, n in ranked[:size] if n > threshold}
+        self.error += threshold
+
+    def merge(self, other):
+        """他の要約を合算する"""
+        for item, n in other.counts.items():
+            self.counts[item] = self.counts.get(item, 0) + n
+        self.total += other.total
+        self.error += other.error
+        if len(self.counts) > 2 * self.capacity:
+            self.compact(self.capacity)
+        return self
+
+    def top(self, n):
+        """件数の多い順に上位 n 個（同数は値の順）"""
+        return sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+
+    def truncated(self, n):
+        """
+        上位 n 個だけを残した要約
+
+        落とした値の件数は (n + 1) 番目以下なので、その件数を error に加える。
+        残した値の件数は変えないため、出力用の上位リストとしてそのまま使える。
+        """
+        items = self.top(n + 1)
+        result = FrequentItems(max(self.capacity, n))
+        result.counts = dict(items[:n])
+        result.total = self.total
+        result.error = self.error + (items[n][1] if len(items) > n else 0)
+        return result
+
+    def to_dict(self):
+        """JSON / DynamoDB に保存できる形（値は str、件数の多い順）"""
+        return {
+            'total': self.total,
+            'error': self.error,
+            'items': [[_text(item), n] for item, n in self.top(len(self.counts))],
+        }
+
+    @classmethod
+    def from_dict(cls, data, capacity=None):
+        result = cls(capacity or max(len(data['items']), 1))
+        result.counts = {item.encode('utf-8'): int(n) for item, n in data['items']}
+        result.total = int(data['total'])
+        result.error = int(data['error'])
+        return result
+
+
+class HeavyHitters:
+    """
+    時間別の送信元IP・宛先IP・宛先ポートの Misra-Gries 要約
+
+    使用例:
+        tracker = HeavyHitters(capacity=64)
+        # 集計と同じスキャンの中で THREAT 行だけを渡す
+        observe, flush = threats.threat_observer(ts_i, msg_i, [tracker])
+        aggregator.consume(rows, ts_i, sev_i, tap=(type_i, threats.THREAT_LOG_TYPE, observe))
+        flush()
+        tracker.hourly_stats()
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # b'10' → [src_ip, dst_ip, dst_port] の要約
+        self.by_hour = {}
+
+    def add(self, hour, src_ip, dst_ip, dst_port):
+        """THREAT 行1行分を数える"""
+        summaries = self._summaries(hour)
+        summaries[0].update(src_ip)
+        summaries[1].update(dst_ip)
+        summaries[2].update(dst_port)
+
+    def add_batch(self, hour, src_ips, dst_ips, dst_ports):
+        """同じ時間の THREAT 行をまとめて数える（threats.threat_observer から呼ばれる）"""
+        for summary, values in zip(self._summaries(hour), (src_ips, dst_ips, dst_ports)):
+            summary.update_counts(Counter(values))
+
+    def _summaries(self, hour):
+        summaries = self.by_hour.get(hour)
+        if summaries is None:
+            summaries = self.by_hour[hour] = [FrequentItems(self.capacity) for _ in DIMENSIONS]
+        return summaries
+
+    def consume(self, rows, ts_i, type_i, msg_i):
+        """THREAT 行を数える（集計とは別にスキャンする場合）"""
+        consume_threats(rows, ts_i, type_i, msg_i, [self])
+
+    def merge(self, other):
+        """他の HeavyHitters を時間ごとに合算する"""
+        for hour, summaries in other.by_hour.items():
+            for summary, theirs in zip(self._summaries(hour), summaries):
+                summary.merge(theirs)
+        return self
+
+    def hourly_stats(self):
+        """
+        時間別の要約（1件以上ある時間のみ、値は最大 2 * capacity 個）
+
+        Returns:
+            dict: {'10:00': {'src_ip': {'total': 512, 'error': 3, 'items': [['10.0.0.1', 210], ...]},
+                             'dst_ip': {...}, 'dst_port': {...}}, ...}
+        """
+        result = {}
+        for hour in sorted(self.by_hour):
+            entry = {}
+            for name, summary in zip(DIMENSIONS, self.by_hour[hour]):
+                entry[name] = summary.to_dict()
+            result[f'{hour.decode()}:00'] = entry
+        return result
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'hours': self.hourly_stats()}
+
+    @classmethod
+    def from_dict(cls, data):
+        tracker = cls(data['capacity'])
+        for hour, entry in data['hours'].items():
+            tracker.by_hour[hour[:2].encode()] = [
+                FrequentItems.from_dict(entry[name], tracker.capacity) for name in DIMENSIONS]
+        return tracker
+
+
+def top_view(entry, n):
+    """
+    保存済みの時間別要約（hourly_stats() の値）を上位 n 個に絞る（日次JSON用）
+    """
+    return {name: FrequentItems.from_dict(data).truncated(n).to_dict()
+            for name, data in entry.items()}
+
+
+def merge_views(entries, n):
+    """
+    複数の要約（ホスト別など）を合算して上位 n 個に絞る
+
+    Returns:
+        dict: {'src_ip': {...}, 'dst_ip': {...}, 'dst_port': {...}}（要約がない次元は含まない）
+    """
+    entries = list(entries)
+    merged = {}
+    for entry in entries:
+        for name, data in entry.items():
+            if name not in merged:
+                # 合算途中で詰めない（件数を減らさない）だけの容量を取る
+                merged[name] = FrequentItems(max(n * len(entries), 1))
+            merged[name].merge(FrequentItems.from_dict(data))
+    return {name: merged[name].truncated(n).to_dict() for name in DIMENSIONS if name in merged}
+
+
+def _text(item):
+    return item.decode('utf-8', 'replace') if isinstance(item, bytes) else item
@@ -0,0 +1,235 @@
+"""
+HyperLogLog による異なり数（攻撃元IPのユニーク数）の推定
+
+正確な集合は値の種類数に比例してメモリを使い、時間別のユニーク数を足しても
+日のユニーク数にはならない。HyperLogLog は 2^precision バイトのレジスタだけで
+ユニーク数を推定でき（標準誤差 約 1.04 / sqrt(2^precision)）、
+レジスタ同士の要素ごとの max で和集合のスケッチを作れる。
+
+時間別のスケッチを DynamoDB のアイテムと日次JSONに保存しておけば、
+日・週単位のユニーク数を元の ZIP を読み直さずに求められる。
+
+精度の違うスケッチ（HLL_PRECISION を変える前後に保存したものなど）は、
+高い方を低い方の精度に畳んでから合算する（folded()）。畳んだレジスタは、
+同じ値を低い精度のスケッチに追加した場合と同じになる。
+"""
+
+import math
+import zlib
+import base64
+import hashlib
+
+DEFAULT_PRECISION = 12
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+HASH_BITS = 64
+# 値のハッシュ（blake2b の 8 バイト）。update() は引数の解釈を省くためコピーして使う
+HASH = hashlib.blake2b(digest_size=HASH_BITS // 8)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog スケッチ
+
+    Attributes:
+        precision (int): レジスタ数の log2（4〜16）
+        registers (bytearray): 2^precision 個のレジスタ
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self._rank_bits = HASH_BITS - precision
+        self._rank_mask = (1 << self._rank_bits) - 1
+
+    def add(self, item):
+        """
+        値を追加する
+
+        Args:
+            item (bytes): 値
+        """
+        x = int.from_bytes(hashlib.blake2b(item, digest_size=8).digest(), 'big')
+        index = x >> self._rank_bits
+        # 残りのビットの先頭から数えた最初の 1 の位置（1 始まり）
+        rank = self._rank_bits - (x & self._rank_mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, items):
+        """
+        複数の値を追加する（add() を値ごとに呼ぶより速い）
+
+        Args:
+            items: bytes の値のイテラブル（重複は除いて渡すと速い）
+        """
+        registers = self.registers
+        rank_bits = self._rank_bits
+        rank_mask = self._rank_mask
+        new_hash = HASH.copy
+        from_bytes = int.from_bytes
+        for item in items:
+            h = new_hash()
+            h.update(item)
+            x = from_bytes(h.digest(), 'big')
+            index = x >> rank_bits
+            rank = rank_bits - (x & rank_mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other):
+        """和集合のスケッチにする（レジスタごとの max。精度が違う場合は低い方に畳む）"""
+        if other.precision > self.precision:
+            other = other.folded(self.precision)
+        elif other.precision < self.precision:
+            folded = self.folded(other.precision)
+            self.precision = folded.precision
+            self._rank_bits = folded._rank_bits
+            self._rank_mask = folded._rank_mask
+            self.registers = folded.registers
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def folded(self, precision):
+        """
+        精度を precision に下げたスケッチ
+
+        下げた分のビットは番号の下位から順位を求めるビットの先頭に移る。
+        レジスタごとに求め直して max を取るため、同じ値を追加した場合と同じレジスタになる。
+
+        Raises:
+            ValueError: precision が今の精度より高い
+        """
+        if precision > self.precision:
+            raise ValueError("Cannot fold a sketch to a higher precision")
+        result = HyperLogLog(precision)
+        shift = self.precision - precision
+        low_mask = (1 << shift) - 1
+        registers = result.registers
+        for index, rank in enumerate(self.registers):
+            if rank == 0:
+                continue
+            low = index & low_mask
+            # 移ったビットに 1 があればそこで順位が決まり、なければ元の順位に移ったビット数を足す
+            rank = shift - low.bit_length() + 1 if low else rank + shift
+            index >>= shift
+            if rank > registers[index]:
+                registers[index] = rank
+        return result
+
+    def estimate(self):
+        """ユニーク数の推定値"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # 小さい値は空きレジスタ数から求める（Linear Counting）
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def memory_bytes(self):
+        """レジスタのバイト数"""
+        return len(self.registers)
+
+    def to_dict(self):
+        """
+        JSON / DynamoDB に保存できる形
+
+        Returns:
+            dict: {'precision': 12, 'registers': 'zlib 圧縮 + base64', 'estimate': 123}
+        """
+        return {
+            'precision': self.precision,
+            'registers': base64.b64encode(zlib.compress(bytes(self.registers))).decode('ascii'),
+            'estimate': self.estimate(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(int(data['precision']))
+        registers = zlib.decompress(base64.b64decode(data['registers']))
+        if len(registers) != len(sketch.registers):
+            raise ValueError("Register count does not match precision")
+        sketch.registers = bytearray(registers)
+        return sketch
+
+
+class HourlyDistinct:
+    """
+    時間別の攻撃元IP（THREAT 行の送信元IP）の HyperLogLog
+
+    threats.threat_observer に渡して使う（heavy_hitters.HeavyHitters と同じ）。
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        # b'10' → HyperLogLog
+        self.by_hour = {}
+
+    def add(self, hour, src_ip, dst_ip, dst_port):
+        """THREAT 行1行分を追加する"""
+        self._sketch(hour).add(src_ip)
+
+    def add_batch(self, hour, src_ips, dst_ips, dst_ports):
+        """
+        同じ時間の THREAT 行をまとめて追加する（threats.threat_observer から呼ばれる）
+
+        同じ送信元IPは何度追加してもレジスタが変わらないため、重複を除いてからハッシュする
+        （攻撃の多い時間ほど同じ送信元が続く）。
+        """
+        self._sketch(hour).update(set(src_ips))
+
+    def _sketch(self, hour):
+        sketch = self.by_hour.get(hour)
+        if sketch is None:
+            sketch = self.by_hour[hour] = HyperLogLog(self.precision)
+        return sketch
+
+    def merge(self, other):
+        """他の HourlyDistinct を時間ごとに合算する（精度が違う場合は低い方に畳む）"""
+        if other.precision < self.precision:
+            self.precision = other.precision
+            self.by_hour = {hour: sketch.folded(self.precision) for hour, sketch in self.by_hour.items()}
+        for hour, sketch in other.by_hour.items():
+            if hour in self.by_hour:
+                self.by_hour[hour].merge(sketch)
+            else:
+                self.by_hour[hour] = HyperLogLog(self.precision).merge(sketch)
+        return self
+
+    def hourly_stats(self):
+        """
+        時間別のスケッチ
+
+        Returns:
+            dict: {'10:00': {'precision': 12, 'registers': '...', 'estimate': 123}, ...}
+        """
+        return {f'{hour.decode()}:00': self.by_hour[hour].to_dict() for hour in sorted(self.by_hour)}
+
+    def to_dict(self):
+        return {'precision': self.precision, 'hours': self.hourly_stats()}
+
+    @classmethod
+    def from_dict(cls, data):
+        tracker = cls(data['precision'])
+        for hour, sketch in data['hours'].items():
+            tracker.by_hour[hour[:2].encode()] = HyperLogLog.from_dict(sketch)
+        return tracker
+
+
+def merge_sketches(sketches):
+    """
+    保存済みのスケッチ（to_dict() の値）を合算する（精度が違う場合は最も低い精度に畳む）
+
+    Returns:
+        dict: 合算したスケッチ（to_dict() 形式）、スケッチがなければ None
+    """
+    merged = None
+    for data in sketches:
+        sketch = HyperLogLog.from_dict(data)
+        merged = sketch if merged is None else merged.merge(sketch)
+    return merged.to_dict() if merged is not None else None
@@ -0,0 +1,72 @@
+"""
+DynamoDB キー設計
+
+single (従来):
+    PK: log_date        SK: hour
+    1台の機器のみを想定。同じ時間帯を複数ホストが書くと上書きされる。
+
+multi_host:
+    ホスト別アイテム
+        PK: pk = "HOST#{hostname}#{log_date}"   SK: sk = "{hour}"
+    フリート集計用アイテム（ホスト別アイテムの複製）
+        PK: pk = "FLEET#{log_date}#{shard}"     SK: sk = "{hour}#{hostname}"
+
+    ホスト×日付でパーティションが分かれるため、多数のホストが同じ日に書き込んでも
+    1パーティションに集中しない。フリート集計用アイテムはホスト名のハッシュで
+    FLEET_SHARDS 個のパーティションに分散し、読み出し時に全シャードを Query して時間別に合算する。
+    どちらも put による上書きのため、同じファイルを再処理しても結果は変わらない。
+"""
+
+import zlib
+
+SCHEMA_SINGLE = 'single'
+SCHEMA_MULTI_HOST = 'multi_host'
+SCHEMAS = (SCHEMA_SINGLE, SCHEMA_MULTI_HOST)
+
+HOST_PREFIX = 'HOST#'
+FLEET_PREFIX = 'FLEET#'
+
+
+def host_partition(hostname, log_date):
+    """ホスト別アイテムのパーティションキー"""
+    return f"{HOST_PREFIX}{hostname}#{log_date}"
+
+
+def fleet_shard(hostname, shards):
+    """ホスト名からフリート集計用シャード番号を決める（プロセスをまたいで安定）"""
+    return zlib.crc32(hostname.encode('utf-8')) % shards
+
+
+def fleet_partition(log_date, shard):
+    """フリート集計用アイテムのパーティションキー"""
+    return f"{FLEET_PREFIX}{log_date}#{shard}"
+
+
+def fleet_sort_key(hour, hostname):
+    """フリート集計用アイテムのソートキー（時間順に並ぶ）"""
+    return f"{hour}#{hostname}"
+
+
+def build_items(schema, attributes, shards):
+    """
+    時間別アイテムの属性に、キー設計に応じたキー属性を付けて返す
+
+    Args:
+        schema (str): SCHEMA_SINGLE / SCHEMA_MULTI_HOST
+        attributes (dict): log_date, hour, hostname を含むアイテム属性
+        shards (int): フリート集計用シャード数
+
+    Returns:
+        list: 書き込むアイテム（single は1件、multi_host はホスト別 + フリート集計用の2件）
+    """
+    if schema == SCHEMA_SINGLE:
+        return [attributes]
+
+    log_date = attributes['log_date']
+    hour = attributes['hour']
+    hostname = attributes['hostname']
+    return [
+        {'pk': host_partition(hostname, log_date), 'sk': hour, **attributes},
+        {'pk': fleet_partition(log_date, fleet_shard(hostname, shards)),
+         'sk': fleet_sort_key(hour, hostname), **attributes},
+    ]
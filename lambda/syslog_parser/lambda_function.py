@@ -9,37 +9,192 @@ Created: 2025-12-30
 """
 
 import os
+import io
 import json
+import time
 import boto3
 import zipfile
-import csv
+import shutil
+import functools
+import itertools
+import tempfile
+import threading
 from datetime import datetime
+from decimal import Decimal
 from collections import defaultdict
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import rollup
+import baselines
+import zip_stream
+import member_pool
+from metrics import Metrics
+from ledger import Ledger, CLAIMED, DONE
+from checkpoint import BudgetReader
+from zip_stream import ZipStreamError
+from aws_errors import error_code
+from csv_scanner import CsvScanner
+from aggregation import AggregationSpec, Aggregator
+from heavy_hitters import HeavyHitters, top_view, merge_views
+from hyperloglog import HourlyDistinct, merge_sketches
+from threats import THREAT_LOG_TYPE, threat_observer
+from filter_rules import RuleSet
+from templates import TemplateCounts
+from partials import PartialAggregate, merge_partials
+from s3_range import open_s3_object
+from dynamodb_writer import BatchWriter, serialize_item
+from key_schema import (
+    SCHEMA_SINGLE, SCHEMA_MULTI_HOST, build_items, host_partition, fleet_partition
+)
 
 # 環境変数
-DYNAMODB_TABLE = os.environ['DYNAMODB_TABLE']
+# DynamoDB を使う処理の時点で必要（インポートだけなら未設定でもよい）
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', '')
 OUTPUT_BUCKET = os.environ.get('OUTPUT_BUCKET', 'syslog-output-235270183100')
+# 取り込み方式: stream (S3 から直接解凍・集計) / disk (/tmp に展開してから集計)
+INGEST_MODE = os.environ.get('INGEST_MODE', 'stream')
+# ストリーム取り込み時に解凍済みCSVを読み込む単位
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', str(1024 * 1024)))
+# 処理済みオブジェクトの台帳テーブル（空なら使わない。重複配信・再アップロードも毎回解析する）
+LEDGER_TABLE = os.environ.get('LEDGER_TABLE', '')
+# 台帳のリースの長さ（秒）。呼び出しの残り時間がわからない場合だけ使う
+LEDGER_LEASE_SECONDS = int(os.environ.get('LEDGER_LEASE_SECONDS', '900'))
+# 台帳の項目を残す日数（テーブルの TTL 属性 expires_at）
+LEDGER_RETENTION_DAYS = int(os.environ.get('LEDGER_RETENTION_DAYS', '30'))
+# 残り時間がこの秒数を切ったら CSV の読み込みを打ち切り、途中集計を保存して
+# 続きを別の呼び出しに引き継ぐ（保存・出力と引き継ぎに残す時間。0 で無効）
+CHECKPOINT_RESERVE_SECONDS = int(os.environ.get('CHECKPOINT_RESERVE_SECONDS', '60'))
+# 途中集計（チェックポイント）を OUTPUT_BUCKET に保存するキーの接頭辞
+CHECKPOINT_PREFIX = os.environ.get('CHECKPOINT_PREFIX', 'checkpoints/')
+# 1回の呼び出しで並行処理するレコード数の上限
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '4'))
+# DynamoDB BatchWriteItem の同時リクエスト数の上限（コンテナ全体）
+DYNAMODB_MAX_IN_FLIGHT = int(os.environ.get('DYNAMODB_MAX_IN_FLIGHT', '4'))
+# DynamoDB キー設計: single (log_date/hour) / multi_host (ホスト×日付パーティション)
+TABLE_SCHEMA = os.environ.get('TABLE_SCHEMA', SCHEMA_SINGLE)
+# multi_host のフリート集計用パーティションのシャード数
+FLEET_SHARDS = int(os.environ.get('FLEET_SHARDS', '8'))
+# 日次JSONの出力方式: rollup (既存JSONへのマージ) / query (DynamoDBから作り直し)
+EXPORT_MODE = os.environ.get('EXPORT_MODE', 'rollup')
+# 日次JSONと一緒に更新するロールアップ（カンマ区切り: weekly, monthly。空なら作らない）
+ROLLUP_PERIODS = rollup.parse_periods(os.environ.get('ROLLUP_PERIODS', 'weekly,monthly'))
+# 出力する JSON の圧縮: gzip (ContentEncoding: gzip で保存) / none
+JSON_COMPRESSION = os.environ.get('JSON_COMPRESSION', 'gzip')
+# 日次JSON・ロールアップの Cache-Control
+JSON_CACHE_CONTROL = os.environ.get('JSON_CACHE_CONTROL', 'public, max-age=300')
+# マニフェストの Cache-Control（ダッシュボードが毎回最新のハッシュを取れるよう再検証させる）
+MANIFEST_CACHE_CONTROL = os.environ.get('MANIFEST_CACHE_CONTROL', 'no-cache')
+# 追加で集計する次元（カンマ区切り: minute, app）。時 × Severity は常に集計
+AGG_SPEC = AggregationSpec.parse(os.environ.get('AGG_DIMENSIONS', ''),
+                                 max_apps=int(os.environ.get('AGG_MAX_APPS', '64')))
+# 追加で数える集計ルール（filter_rules.py の JSON。空ならルールなし）
+FILTER_RULES = os.environ.get('FILTER_RULES', '')
+# 集計ルールの JSON を読む S3 の場所（s3://bucket/key、設定すると FILTER_RULES より優先）
+FILTER_RULES_S3 = os.environ.get('FILTER_RULES_S3', '')
+# THREAT 行の送信元IP・宛先IP・宛先ポートの上位を追跡する要約のサイズ（0 で無効）
+# THREAT 行だけ Message から送信元・宛先を取り出し、要約の更新は threats.BATCH_ROWS 行ごとにまとめる。
+# 解析の時間は THREAT 10% で約 1.1〜1.4 倍、50% で約 2 倍（benchmarks/bench_threats.py）
+HEAVY_HITTER_CAPACITY = int(os.environ.get('HEAVY_HITTER_CAPACITY', '64'))
+# 日次JSONに出力する上位の件数
+HEAVY_HITTER_TOP_N = int(os.environ.get('HEAVY_HITTER_TOP_N', '10'))
+# THREAT 行の送信元IPのユニーク数を推定する HyperLogLog の精度（レジスタ数 2^n、0 で無効）
+# 送信元IPは threats.BATCH_ROWS 行ごとに重複を除いてからハッシュする。精度を変えても、変える前の
+# スケッチとは低い方の精度に畳んで合算する。解析の時間は THREAT 10% で約 1.2〜1.5 倍、50% で約 2 倍
+# （HEAVY_HITTER_CAPACITY と併用すると 50% で約 2.2〜2.4 倍。benchmarks/bench_threats.py）
+HLL_PRECISION = int(os.environ.get('HLL_PRECISION', '12'))
+# Message のテンプレート（イベント種別）の種類の上限（templates.py、"(other)" を含む。0 で無効）
+# 集計のループの中で Message の先頭の固定長のスライスでキャッシュを1回引いて数える。
+# 行ごとのコストはキャッシュを1回引いて件数を1つ足す程度（benchmarks/bench_templates.py）
+MESSAGE_TEMPLATES = int(os.environ.get('MESSAGE_TEMPLATES', '64'))
+# ホスト・時刻ごとの CRITICAL 件数のベースライン（baselines.py）を保存する OUTPUT_BUCKET の接頭辞（空なら異常スコアを出さない）
+BASELINE_PREFIX = os.environ.get('BASELINE_PREFIX', 'baselines/')
+# ベースラインの指数加重の重み（大きいほど直近の日を重くする）
+BASELINE_ALPHA = float(os.environ.get('BASELINE_ALPHA', str(baselines.DEFAULT_ALPHA)))
+# 異常スコアを出すのに必要なベースラインの日数
+BASELINE_MIN_SAMPLES = int(os.environ.get('BASELINE_MIN_SAMPLES', str(baselines.DEFAULT_MIN_SAMPLES)))
+# ZIP 内の複数の CSV メンバーを並列に処理するプロセス数（既定: 1 = 逐次処理、0 でプロセスから見える CPU 数）
+# 2 以上では stream 取り込みのたびにセントラルディレクトリをレンジ GET で読むため、
+# 複数メンバーの ZIP を受け取る環境でだけ指定する
+MEMBER_WORKERS = int(os.environ.get('MEMBER_WORKERS', '1')) or member_pool.default_workers()
+# パース済みの行を列指向ファイルで OUTPUT_BUCKET に書き出すキーの接頭辞（空なら書き出さない）
+COLUMNAR_PREFIX = os.environ.get('COLUMNAR_PREFIX', '')
+# 列指向ファイルの zlib 圧縮レベル（既定は columnar.DEFAULT_LEVEL と同じ）
+COLUMNAR_LEVEL = int(os.environ.get('COLUMNAR_LEVEL', '3'))
+# disk 取り込み時の作業ディレクトリの親
+TMP_DIR = os.environ.get('TMP_DIR', '/tmp')
+# 呼び出しごとのメトリクス（EMF）の CloudWatch 名前空間（空なら出力しない）
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'SyslogAnalytics')
+# メトリクスのディメンションにする関数名（Lambda ランタイムが設定する）
+FUNCTION_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'syslog-parser')
+
+# フリート全体JSONのホスト名
+FLEET_HOSTNAME = 'fleet'
+
+# 公開中の JSON とその内容のハッシュの一覧
+MANIFEST_KEY = 'data/manifest.json'
+
+# リースに足す余裕（秒）。呼び出しの残り時間に足し、タイムアウトまではリースが切れないようにする
+LEDGER_LEASE_GRACE_SECONDS = 30
+
+# 列指向ファイルをメモリに置く上限（超えた分は TMP_DIR の一時ファイル）
+COLUMNAR_SPOOL_SIZE = 32 * 1024 * 1024
+
+# stream 取り込みで CSV メンバーの数を調べる時のレンジ GET の大きさ（末尾のセントラルディレクトリだけを読む）
+CENTRAL_DIRECTORY_READ_SIZE = 64 * 1024
+
+# 集計対象の Severity
+TARGET_SEVERITIES = ('CRITICAL', 'WARNING')
 
-# AWSクライアント初期化（グローバル変数で再利用）
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table(DYNAMODB_TABLE)
+# 時間別アイテムの多次元集計属性 → 日次JSONのキー
+HOUR_ATTRIBUTE_KEYS = (
+    ('severity_counts', 'severities'),
+    ('minute_counts', 'minutes'),
+    ('app_counts', 'apps'),
+    ('rule_counts', 'rules'),
+    ('template_counts', 'templates'),
+    ('anomaly', 'anomaly'),
+)
+
+# AWSクライアント（初回の使用時に get_*() で作成し、コンテナ内で再利用する）
+# インポート時には作らないため、使わない経路では初期化コストがかからない。
+# テストやベンチマークではフェイクを代入して差し替える。
+# ワーカースレッドからは呼び出しのみ行う（実体は thread-safe な低レベルクライアント）
+s3_client = None
+dynamodb_client = None
+table = None          # EXPORT_MODE=query の問い合わせ専用（サービスリソース）
+batch_writer = None
+ledger = None         # LEDGER_TABLE の台帳（ledger.Ledger）
+filter_rules = None   # コンパイル済みの集計ルール（filter_rules.RuleSet、get_filter_rules()）
+lambda_client = None  # 続きの呼び出し（チェックポイントからの再開）の非同期 Invoke 用
+_client_lock = threading.RLock()
+
+# 現在の呼び出しの段階別の所要時間とカウンタ（lambda_handler の開始時に作り直す）
+metrics = Metrics()
+# 現在の呼び出しの残り時間（ミリ秒）を返す関数（lambda_handler で設定。None の間は読み込みを打ち切らない）
+remaining_time = None
 
 
 def lambda_handler(event, context):
     """
     メインハンドラー
     
+    イベント内の全レコードを MAX_WORKERS 本のスレッドで並行処理する。
+    S3ダウンロードやDynamoDB書き込みの待ち時間がオブジェクト間で重なる。
+    LEDGER_TABLE を設定すると、処理済みのオブジェクト（同じキー・ETag）の重複配信は解析せずに返る。
+    残り時間が CHECKPOINT_RESERVE_SECONDS を切ると読み込みを打ち切り、途中集計を保存して
+    続きの呼び出し（{"continuation": {...}}）を非同期に起動する。
+    終了時（失敗した場合も）に、呼び出し全体のメトリクスを EMF の JSON で1行出力する。
+    warm-up イベント（{"warmup": true}）ではクライアントの作成だけ行って返る。
+    
     Args:
         event (dict): S3イベント通知
             {
               "Records": [{
                 "s3": {
                   "bucket": {"name": "bucket-name"},
-                  "object": {"key": "raw/2025-04-28/10.zip"}
+                  "object": {"key": "raw/2025-04-28/10.zip", "eTag": "...", "versionId": "..."}
                 }
-              }]
+              }, ...]
             }
         context (LambdaContext): Lambda実行コンテキスト
     
@@ -47,57 +202,497 @@ def lambda_handler(event, context):
         dict: 処理結果
             {
               'statusCode': 200,
-              'body': 'Successfully processed ...'
+              'body': '{"message": ..., "results": [{"key": ..., "status": "success", ...}]}'
             }
+            status は success / skipped（処理済み）/ busy（他の呼び出しが処理中）/
+            continued（続きの呼び出しに引き継いだ）/ error
     
     Raises:
-        Exception: S3アクセスエラー、ZIP解凍エラー等
+        RecordProcessingError: 1件以上のレコードが失敗（error / busy）した場合
+            （S3 非同期呼び出しのリトライに任せる。保存処理は上書きのため再実行しても安全で、
+            台帳があれば処理済みのレコードは再試行でも解析しない）
     """
+    global metrics, remaining_time
+    if is_warm_up_event(event):
+        initialized = warm_up()
+        print(f"Warm-up: {initialized}")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'message': 'Warmed up', 'initialized': initialized})
+        }
+    
+    metrics = Metrics()
+    remaining_time = time_budget(context)
+    print("=== Lambda Function Started ===")
+    
     try:
-        print("=== Lambda Function Started ===")
+        # 1. イベントから全レコードのS3情報取得（続きの呼び出しではチェックポイントの1件）
+        continuation = event.get('continuation')
+        if continuation:
+            records = [(continuation['bucket'], continuation['key'],
+                        continuation['etag'], continuation.get('version_id'))]
+        else:
+            records = extract_s3_objects(event)
+        print(f"Records: {len(records)}")
+        metrics.add('records', len(records))
+        
+        # 2. レコードごとに並行処理（結果はイベント内の順序を保つ）
+        lease_seconds = ledger_lease_seconds(context)
+        workers = max(1, min(MAX_WORKERS, len(records)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                lambda r: process_record(*r, lease_seconds=lease_seconds,
+                                         continuation=continuation), records))
         
-        # 1. イベントからS3情報取得
-        bucket, key = extract_s3_info(event)
+        failed = [r for r in results if r['status'] not in ('success', 'skipped', 'continued')]
+        metrics.add('failed_records', len(failed))
+        metrics.add('duplicate_records', sum(r['status'] == 'skipped' for r in results))
+        metrics.add('continued_records', sum(r['status'] == 'continued' for r in results))
+    finally:
+        emit_metrics(context)
+        remaining_time = None
+    
+    if failed:
+        print(f"ERROR: {len(failed)}/{len(results)} records failed")
+        raise RecordProcessingError(results)
+    
+    print("=== Lambda Function Completed ===")
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': f'Successfully processed {len(results)} objects',
+            'results': results
+        })
+    }
+
+
+def is_warm_up_event(event):
+    """warm-up イベント（{"warmup": true}、EventBridge のスケジュールなどから送る）か"""
+    return isinstance(event, dict) and event.get('warmup') is True
+
+
+def warm_up():
+    """
+    初回の呼び出しで作るクライアントや import を先に済ませる
+    
+    warm-up イベントと、プロビジョニングされた同時実行の初期化時に呼ばれる。
+    
+    Returns:
+        dict: 初期化したもの → 所要時間（ミリ秒）
+    """
+    steps = [('s3_client', get_s3_client), ('batch_writer', get_batch_writer)]
+    if EXPORT_MODE != 'rollup':
+        steps.append(('table', get_table))
+    if MEMBER_WORKERS > 1:
+        steps.append(('member_pool', functools.partial(member_pool.preload, (__name__,))))
+    if COLUMNAR_PREFIX:
+        steps.append(('columnar', lambda: __import__('columnar')))
+    if LEDGER_TABLE:
+        steps.append(('ledger', get_ledger))
+    if FILTER_RULES or FILTER_RULES_S3:
+        steps.append(('filter_rules', get_filter_rules))
+    
+    initialized = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        initialized[name] = round((time.perf_counter() - start) * 1000, 1)
+    return initialized
+
+
+def get_s3_client():
+    """S3 クライアント（初回のみ作成）"""
+    return _get_or_create('s3_client', lambda: boto3.client('s3'))
+
+
+def get_dynamodb_client():
+    """DynamoDB の低レベルクライアント（初回のみ作成）"""
+    return _get_or_create('dynamodb_client', lambda: boto3.client('dynamodb'))
+
+
+def get_batch_writer():
+    """
+    DynamoDB への書き込み（初回のみ作成）
+    
+    サービスリソースではなく低レベルクライアントに、アイテムを型付き属性値に変換して渡す。
+    """
+    return _get_or_create('batch_writer', lambda: BatchWriter(
+        get_dynamodb_client(), dynamodb_table_name(),
+        max_in_flight=DYNAMODB_MAX_IN_FLIGHT, serialize=serialize_item))
+
+
+def get_table():
+    """EXPORT_MODE=query の問い合わせに使う DynamoDB テーブル（サービスリソース、初回のみ作成）"""
+    return _get_or_create('table', lambda: boto3.resource('dynamodb').Table(dynamodb_table_name()))
+
+
+def get_lambda_client():
+    """Lambda クライアント（続きの呼び出しの起動用、初回のみ作成）"""
+    return _get_or_create('lambda_client', lambda: boto3.client('lambda'))
+
+
+def get_ledger():
+    """処理済みオブジェクトの台帳（LEDGER_TABLE、初回のみ作成）"""
+    return _get_or_create('ledger', lambda: Ledger(
+        get_dynamodb_client(), LEDGER_TABLE, retention_seconds=LEDGER_RETENTION_DAYS * 86400))
+
+
+def get_filter_rules():
+    """
+    集計ルール（FILTER_RULES_S3 または FILTER_RULES、初回のみ読み込んでコンパイル）
+    
+    Raises:
+        ValueError: ルールの JSON や正規表現が不正、FILTER_RULES_S3 が s3:// でない
+    """
+    return _get_or_create('filter_rules', load_filter_rules)
+
+
+def load_filter_rules():
+    """集計ルールを読み込んでコンパイルする"""
+    text = FILTER_RULES
+    if FILTER_RULES_S3:
+        if not FILTER_RULES_S3.startswith('s3://') or '/' not in FILTER_RULES_S3[len('s3://'):]:
+            raise ValueError(f"FILTER_RULES_S3 must be s3://bucket/key: {FILTER_RULES_S3}")
+        bucket, key = FILTER_RULES_S3[len('s3://'):].split('/', 1)
+        text = get_s3_client().get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')
+    rules = RuleSet.parse(text)
+    if rules:
+        print(f"Filter rules: {', '.join(rules.names())}")
+    return rules
+
+
+def ledger_lease_seconds(context):
+    """
+    台帳のリースの長さ（秒）
+    
+    呼び出しの残り時間 + LEDGER_LEASE_GRACE_SECONDS。Lambda はタイムアウトで呼び出しを止めるため、
+    処理の途中で落ちた呼び出しのリースも、タイムアウトの少し後には他の呼び出し（S3 の再試行）が引き継げる。
+    残り時間がわからない場合（ローカル実行など）は LEDGER_LEASE_SECONDS。
+    """
+    remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    remaining = remaining() if callable(remaining) else None
+    if not isinstance(remaining, int):
+        return LEDGER_LEASE_SECONDS
+    return remaining / 1000 + LEDGER_LEASE_GRACE_SECONDS
+
+
+def time_budget(context):
+    """
+    読み込みを打ち切るかの判定に使う、呼び出しの残り時間（ミリ秒）の関数
+    
+    Returns:
+        callable: context.get_remaining_time_in_millis
+            （CHECKPOINT_RESERVE_SECONDS が 0 か、残り時間がわからない場合は None）
+    """
+    remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if CHECKPOINT_RESERVE_SECONDS <= 0 or not callable(remaining):
+        return None
+    return remaining if isinstance(remaining(), int) else None
+
+
+def dynamodb_table_name():
+    """
+    Raises:
+        RuntimeError: DYNAMODB_TABLE が未設定の場合
+    """
+    if not DYNAMODB_TABLE:
+        raise RuntimeError("DYNAMODB_TABLE is not set")
+    return DYNAMODB_TABLE
+
+
+def _get_or_create(name, create):
+    """モジュール変数 name が未作成なら create() で作って保存する（スレッド間で1回だけ）"""
+    value = globals()[name]
+    if value is None:
+        with _client_lock:
+            value = globals()[name]
+            if value is None:
+                value = create()
+                globals()[name] = value
+    return value
+
+
+def emit_metrics(context):
+    """
+    現在の呼び出しのメトリクスを EMF の JSON で1行出力（METRICS_NAMESPACE が空なら出力しない）
+    
+    ディメンションは FunctionName。リクエストIDはメトリクスにしない項目として付ける。
+    """
+    if not METRICS_NAMESPACE:
+        return
+    properties = {}
+    request_id = getattr(context, 'aws_request_id', None)
+    if isinstance(request_id, str):
+        properties['RequestId'] = request_id
+    metrics.emit(METRICS_NAMESPACE, {'FunctionName': FUNCTION_NAME}, properties)
+
+
+class TimeBudgetExceeded(Exception):
+    """
+    残り時間がなくなり、最後まで読めなかった CSV メンバーがある
+    
+    Attributes:
+        partials (list): メンバーごとの途中集計（読み終えていないものは resume_offset を持つ）
+    """
+    
+    def __init__(self, partials):
+        self.partials = partials
+        offsets = {p.name: p.resume_offset for p in partials if not p.complete()}
+        super().__init__(f"Time budget exceeded: {offsets}")
+
+
+class RecordProcessingError(Exception):
+    """
+    一部または全部のレコード処理に失敗した
+    
+    Attributes:
+        results (list): レコードごとの処理結果（成功分も含む）
+    """
+    
+    def __init__(self, results):
+        self.results = results
+        super().__init__(json.dumps({'results': results}))
+
+
+def process_record(bucket, key, etag=None, version_id=None, lease_seconds=None,
+                   continuation=None):
+    """
+    S3オブジェクト1件を処理（台帳の確認 → 取り込み → DynamoDB保存 → 台帳に処理済みを記録）
+    
+    LEDGER_TABLE が設定されている場合、同じキー・ETag のオブジェクトを処理済みなら
+    解析せずに skipped を返し、他の呼び出しが処理中なら busy を返す（失敗として S3 の再試行に任せる）。
+    残り時間がなくなった場合は途中集計をチェックポイントとして保存し、続きの呼び出しを起動して
+    continued を返す（台帳のリースは続きの呼び出しが引き継ぐ）。続きの呼び出しでは
+    チェックポイントの途中集計に残りを数えるため、DynamoDB・JSON への保存は最後に1回だけ行われる。
+    例外はここで捕捉し、レコード単位の結果として返す（台帳のリースは手放す）。
+    台帳を使う場合、JSON の出力に失敗したレコードも処理済みにせず、リースを手放して error を返す。
+    
+    Args:
+        bucket (str): S3バケット名
+        key (str): S3オブジェクトキー
+        etag (str): S3イベントの eTag（None の場合、台帳を使うなら head_object で取得）
+        version_id (str): S3イベントの versionId（台帳に記録するだけ）
+        lease_seconds (float): 台帳のリースの長さ（None は LEDGER_LEASE_SECONDS）
+        continuation (dict): 続きの呼び出しのイベントの continuation（continue_record() 参照）
+    
+    Returns:
+        dict: {'bucket', 'key', 'status': 'success', 'log_date', 'total_hours'}
+              （ZIP に複数ホスト・複数日の CSV があった場合は 'groups' も付く）
+              または {'bucket', 'key', 'status': 'skipped', 'log_date', 'total_hours'}（処理済み）
+              または {'bucket', 'key', 'status': 'busy'}（他の呼び出しが処理中）
+              または {'bucket', 'key', 'status': 'continued', 'segment', 'checkpoint'}
+              または {'bucket', 'key', 'status': 'error', 'error'}
+    """
+    claim = None
+    try:
         print(f"Processing: s3://{bucket}/{key}")
         
-        # 2. ZIPダウンロード
-        local_zip = download_zip(bucket, key)
-        print(f"Downloaded to: {local_zip}")
+        # 続きの呼び出し: チェックポイントの途中集計を読み込む
+        resume = None
+        if continuation:
+            resume = load_checkpoint(continuation)
+            if resume is None:
+                print(f"Skipped: object was replaced after the checkpoint ({key})")
+                return {'bucket': bucket, 'key': key, 'status': 'skipped', 'reason': 'replaced'}
         
-        # 3. CSV解凍
-        csv_path = extract_csv(local_zip)
-        print(f"Extracted to: {csv_path}")
+        # 台帳で重複を確認し、処理の権利を取る（続きの呼び出しは前の呼び出しのリースを引き継ぐ）
+        if LEDGER_TABLE:
+            claim = claim_record(bucket, key, etag, version_id, lease_seconds,
+                                 owner=(continuation or {}).get('owner'))
+            if claim.status != CLAIMED:
+                return ledger_result(bucket, key, claim)
         
-        # 4. CSV解析
-        stats = parse_csv(csv_path)
-        print(f"Parsed log_date: {stats['log_date']}")
-        print(f"Total hours: {len(stats['hourly_stats'])}")
+        # ZIP取得 → CSV解凍 → CSV解析（ホスト・日付ごと）
+        try:
+            stats_list = ingest(bucket, key, resume)
+        except TimeBudgetExceeded as e:
+            return continue_record(bucket, key, etag, version_id, claim, e.partials, continuation)
         
-        # 5. DynamoDB保存
-        save_to_dynamodb(stats, key)
-        print(f"Saved to DynamoDB: {DYNAMODB_TABLE}")
+        exported = True
+        for stats in stats_list:
+            print(f"Parsed log_date: {stats['log_date']} host: {stats['hostname']} ({key})")
+            print(f"Total hours: {len(stats['hourly_stats'])} ({key})")
+            
+            # DynamoDB保存
+            with metrics.span('save'):
+                exported = save_to_dynamodb(stats, key) and exported
+            print(f"Saved to DynamoDB: {DYNAMODB_TABLE} ({key})")
         
-        print("=== Lambda Function Completed ===")
+        # 台帳に処理済みと記録すると、以降の配信は JSON を出力し直さないため、
+        # JSON の出力に失敗したらリースを手放して失敗にし、S3 の再試行で出力し直させる
+        if claim is not None and not exported:
+            release_claim(claim)
+            return {'bucket': bucket, 'key': key, 'status': 'error',
+                    'error': 'Failed to export JSON (ledger lease released for retry)'}
         
-        return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'message': f'Successfully processed {key}',
-                'log_date': stats['log_date'],
-                'total_hours': len(stats['hourly_stats'])
-            })
+        result = {
+            'bucket': bucket,
+            'key': key,
+            'status': 'success',
+            'log_date': stats_list[0]['log_date'],
+            'total_hours': sum(len(stats['hourly_stats']) for stats in stats_list)
         }
+        if len(stats_list) > 1:
+            result['groups'] = [{'log_date': stats['log_date'], 'hostname': stats['hostname']}
+                                for stats in stats_list]
+        
+        if claim is not None and not get_ledger().complete(
+                claim, {'log_date': result['log_date'], 'total_hours': result['total_hours']}):
+            print(f"WARNING: Ledger lease was taken over during processing ({key})")
+        if continuation:
+            delete_checkpoint(continuation['checkpoint'])
+        return result
         
     except Exception as e:
-        print(f"ERROR: {str(e)}")
+        print(f"ERROR: {key}: {str(e)}")
         import traceback
         traceback.print_exc()
-        raise
+        if claim is not None and claim.status == CLAIMED:
+            release_claim(claim)
+        return {
+            'bucket': bucket,
+            'key': key,
+            'status': 'error',
+            'error': str(e)
+        }
+
+
+def claim_record(bucket, key, etag, version_id, lease_seconds, owner=None):
+    """
+    台帳でオブジェクトの処理の権利を取る
+    
+    owner（続きの呼び出しで、前の呼び出しのリースの owner）のリースが残っていれば延長して引き継ぐ。
+    
+    Returns:
+        ledger.Claim
+    """
+    if not etag:
+        etag = get_s3_client().head_object(Bucket=bucket, Key=key)['ETag']
+    if lease_seconds is None:
+        lease_seconds = LEDGER_LEASE_SECONDS
+    if owner:
+        claim = get_ledger().extend(bucket, key, etag, owner, lease_seconds)
+        if claim is not None:
+            return claim
+    return get_ledger().claim(bucket, key, etag, lease_seconds, version_id=version_id)
+
+
+def ledger_result(bucket, key, claim):
+    """処理しなかったレコード（処理済み / 他の呼び出しが処理中）の結果"""
+    if claim.status == DONE:
+        print(f"Skipped: already processed ({claim.object_id})")
+        return {
+            'bucket': bucket,
+            'key': key,
+            'status': 'skipped',
+            'log_date': claim.item.get('log_date'),
+            'total_hours': claim.item.get('total_hours')
+        }
+    print(f"Busy: being processed by another invocation ({claim.object_id})")
+    return {'bucket': bucket, 'key': key, 'status': 'busy'}
+
+
+def release_claim(claim):
+    """失敗したレコードのリースを手放す（手放せなくてもリースの期限後には引き継げる）"""
+    try:
+        get_ledger().release(claim)
+    except Exception as e:
+        print(f"WARNING: Failed to release ledger lease ({claim.object_id}): {str(e)}")
+
+
+def continue_record(bucket, key, etag, version_id, claim, partials, continuation):
+    """
+    途中集計をチェックポイントとして保存し、続きの呼び出しを非同期に起動する
+    
+    チェックポイント: s3://{OUTPUT_BUCKET}/{CHECKPOINT_PREFIX}{bucket}/{key}/{ETag}.json（gzip）
+        {'bucket', 'key', 'etag', 'segment', 'members': [PartialAggregate.to_dict(), ...]}
+    続きの呼び出しのイベント:
+        {'continuation': {'bucket', 'key', 'etag', 'version_id', 'checkpoint', 'segment', 'owner'}}
+    
+    Args:
+        claim (ledger.Claim): 台帳のリース（台帳を使わない場合は None）
+        partials (list): メンバーごとの途中集計
+        continuation (dict): この呼び出しの continuation（最初の呼び出しでは None）
+    
+    Returns:
+        dict: {'bucket', 'key', 'status': 'continued', 'segment', 'checkpoint'}
+    """
+    if not etag:
+        etag = get_s3_client().head_object(Bucket=bucket, Key=key)['ETag']
+    etag = etag.strip('"')
+    segment = (continuation or {}).get('segment', 0) + 1
+    checkpoint_key = f"{CHECKPOINT_PREFIX}{bucket}/{key}/{etag}.json"
+    
+    with metrics.span('export'):
+        document = {
+            'bucket': bucket,
+            'key': key,
+            'etag': etag,
+            'segment': segment,
+            'members': [partial.to_dict() for partial in partials],
+        }
+        get_s3_client().put_object(Bucket=OUTPUT_BUCKET, Key=checkpoint_key,
+                                   **rollup.json_object(document, compress=True))
+    
+    get_lambda_client().invoke(
+        FunctionName=FUNCTION_NAME,
+        InvocationType='Event',
+        Payload=json.dumps({'continuation': {
+            'bucket': bucket,
+            'key': key,
+            'etag': etag,
+            'version_id': version_id,
+            'checkpoint': checkpoint_key,
+            'segment': segment,
+            'owner': claim.owner if claim is not None else None,
+        }}))
+    
+    offsets = {p.name: p.resume_offset for p in partials if not p.complete()}
+    print(f"Checkpoint: s3://{OUTPUT_BUCKET}/{checkpoint_key} segment {segment} {offsets} ({key})")
+    return {
+        'bucket': bucket,
+        'key': key,
+        'status': 'continued',
+        'segment': segment,
+        'checkpoint': checkpoint_key
+    }
+
+
+def load_checkpoint(continuation):
+    """
+    チェックポイントの途中集計を読み込む
+    
+    Returns:
+        dict: メンバー名 → PartialAggregate（計測値は前の呼び出しで出力済みのため空にする）
+              オブジェクトがチェックポイントの後に置き換えられていた場合は None
+    """
+    head = get_s3_client().head_object(Bucket=continuation['bucket'], Key=continuation['key'])
+    if head['ETag'].strip('"') != continuation['etag']:
+        return None
+    response = get_s3_client().get_object(Bucket=OUTPUT_BUCKET, Key=continuation['checkpoint'])
+    document = rollup.decode_document(response['Body'].read())
+    resume = {}
+    for data in document['members']:
+        partial = PartialAggregate.from_dict(data)
+        partial.metrics = Metrics()
+        resume[partial.name] = partial
+    print(f"Resuming from checkpoint: segment {continuation['segment']} "
+          f"({sum(not p.complete() for p in resume.values())}/{len(resume)} members unfinished)")
+    return resume
+
+
+def delete_checkpoint(checkpoint_key):
+    """処理を終えたチェックポイントを削除する（残っても次の処理には使われない）"""
+    try:
+        get_s3_client().delete_object(Bucket=OUTPUT_BUCKET, Key=checkpoint_key)
+    except Exception as e:
+        print(f"WARNING: Failed to delete checkpoint {checkpoint_key}: {str(e)}")
 
 
 def extract_s3_info(event):
     """
-    S3イベントからバケット名とキーを抽出
+    S3イベントから先頭レコードのバケット名とキーを抽出
     
     Args:
         event (dict): S3イベント
@@ -105,52 +700,290 @@ def extract_s3_info(event):
     Returns:
         tuple: (bucket_name, object_key)
     """
-    record = event['Records'][0]
-    bucket = record['s3']['bucket']['name']
-    key = record['s3']['object']['key']
-    return bucket, key
+    return extract_s3_records(event)[0]
 
 
-def download_zip(bucket, key):
+def extract_s3_records(event):
     """
-    S3からZIPファイルをダウンロード
+    S3イベントから全レコードのバケット名とキーを抽出
+    
+    Args:
+        event (dict): S3イベント
+    
+    Returns:
+        list: [(bucket_name, object_key), ...]
+    """
+    return [(bucket, key) for bucket, key, _, _ in extract_s3_objects(event)]
+
+
+def extract_s3_objects(event):
+    """
+    S3イベントから全レコードのバケット名・キー・ETag・バージョンIDを抽出
+    
+    Args:
+        event (dict): S3イベント
+    
+    Returns:
+        list: [(bucket_name, object_key, etag, version_id), ...]（イベントにない値は None）
+    """
+    objects = []
+    for record in event['Records']:
+        bucket = record['s3']['bucket']['name']
+        obj = record['s3']['object']
+        objects.append((bucket, obj['key'], obj.get('eTag'), obj.get('versionId')))
+    return objects
+
+
+def ingest(bucket, key, resume=None):
+    """
+    ZIPを取得して全てのCSVメンバーを集計する（取り込み方式の切り替え）
+    
+    INGEST_MODE=stream の場合は /tmp を使わずに S3 から直接解凍・集計する。
+    ストリーム展開できない ZIP だった場合は /tmp 経由の処理にフォールバックする。
+    CSV メンバーが複数ある場合は MEMBER_WORKERS 個までのプロセスで並列に処理し、
+    途中集計を (log_date, hostname) ごとに合算する。
     
     Args:
         bucket (str): S3バケット名
         key (str): S3オブジェクトキー
+        resume (dict): チェックポイントの途中集計（メンバー名 → PartialAggregate、load_checkpoint()）
     
     Returns:
-        str: ローカルファイルパス
+        list: parse_csv()の返り値と同じ構造の dict（ホスト・日付ごと、通常は1件）
+    
+    Raises:
+        TimeBudgetExceeded: 残り時間がなくなり、最後まで読めなかったメンバーがある場合
     """
-    local_path = '/tmp/input.zip'
-    s3_client.download_file(bucket, key, local_path)
-    return local_path
+    partials = ingest_partials(bucket, key, resume)
+    # ワーカープロセスで計測した解凍・解析の時間も呼び出し全体に合算する
+    for partial in partials:
+        metrics.merge(partial.metrics)
+    if not all(partial.complete() for partial in partials):
+        raise TimeBudgetExceeded(partials)
+    return [build_stats(partial) for partial in merge_partials(partials)]
 
 
-def extract_csv(zip_path):
+def ingest_partials(bucket, key, resume=None):
     """
-    ZIPを解凍してCSVパスを返す
+    ZIPの全CSVメンバーの途中集計を取得
+    
+    Returns:
+        list: PartialAggregate（メンバーの順）
+    """
+    if INGEST_MODE == 'stream':
+        try:
+            partials = stream_zip(bucket, key, resume)
+            print("Ingest mode: stream")
+            return partials
+        except ZipStreamError as e:
+            print(f"WARNING: Stream ingest unavailable ({str(e)}), falling back to /tmp")
+    
+    # オブジェクトごとに専用の作業ディレクトリを使う（並行処理時の衝突防止）
+    work_dir = tempfile.mkdtemp(prefix='syslog-', dir=TMP_DIR)
+    try:
+        # 2. ZIPダウンロード
+        with metrics.span('download'):
+            local_zip = download_zip(bucket, key, work_dir)
+        metrics.add('bytes_in', os.path.getsize(local_zip))
+        print(f"Downloaded to: {local_zip}")
+        
+        # 3. CSVメンバーを展開せずに ZIP から直接読んで集計
+        return zip_partials(local_zip, bucket, key, resume)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def zip_partials(zip_path, bucket, key, resume=None):
+    """
+    ローカルの ZIP の全CSVメンバーの途中集計（disk 取り込み・バックフィル共通）
     
     Args:
         zip_path (str): ZIPファイルパス
+        bucket (str), key (str): 元の S3 オブジェクト（列指向ファイルの書き出し先の決定に使う）
+        resume (dict): チェックポイントの途中集計（scan_member() 参照）
+    
+    Returns:
+        list: PartialAggregate（メンバーの順）
+    """
+    with zipfile.ZipFile(zip_path) as z:
+        names = csv_members(z)
+    return scan_members(functools.partial(zipfile.ZipFile, zip_path), names, bucket, key, resume)
+
+
+def stream_zip(bucket, key, resume=None):
+    """
+    S3オブジェクトを /tmp を使わずに解凍しながら集計
+    
+    レスポンスボディを先頭から順に展開する（zip_stream）。
+    MEMBER_WORKERS が 2 以上の場合は先に末尾のセントラルディレクトリだけをレンジ GET で読み（s3_range）、
+    CSV メンバーが複数あれば、メンバーごとにワーカープロセスがそれぞれ必要な範囲だけを読んで展開する。
+    メンバーが1つなら並列にする意味がないため、1回の GET で順に展開する。
+    順に展開する場合、残り時間がなくなって打ち切ったメンバーより後ろは読まない（返り値に含めない）。
+    
+    Args:
+        bucket (str): S3バケット名
+        key (str): S3オブジェクトキー
+        resume (dict): チェックポイントの途中集計（scan_member() 参照）
     
     Returns:
-        str: CSVファイルパス
+        list: PartialAggregate（メンバーの順）
     
     Raises:
+        ZipStreamError: ストリーム展開に対応していない ZIP の場合
         Exception: ZIP内にCSVが見つからない場合
     """
-    extract_dir = '/tmp/extracted'
-    Path(extract_dir).mkdir(exist_ok=True)
+    if MEMBER_WORKERS > 1:
+        # ワーカーのレンジ GET の時間は解凍（extract）に含まれる
+        with metrics.span('download'), open_s3_object(get_s3_client(), bucket, key,
+                                                      buffer_size=CENTRAL_DIRECTORY_READ_SIZE) as f:
+            raw = f.raw
+            with zipfile.ZipFile(f) as z:
+                names = csv_members(z)
+        if len(names) > 1:
+            metrics.add('bytes_in', raw.size)
+            return scan_members(
+                functools.partial(open_s3_archive, bucket, key, raw.size, raw.etag, os.getpid()),
+                names, bucket, key, resume)
     
-    with zipfile.ZipFile(zip_path, 'r') as z:
-        z.extractall(extract_dir)
-        csv_files = [f for f in z.namelist() if f.endswith('.csv')]
-        
-        if not csv_files:
-            raise Exception("No CSV file found in ZIP")
-        
-        return f"{extract_dir}/{csv_files[0]}"
+    partials = []
+    source = (bucket, key, os.getpid())
+    body = get_s3_client().get_object(Bucket=bucket, Key=key)['Body']
+    body = metrics.reader(body, 'download', 'bytes_in')
+    members = zip_stream.iter_members(body)
+    try:
+        for name, member in members:
+            if name.endswith('.csv'):
+                partials.append(scan_member(member, name, source, resume))
+                if partials[-1].resume_offset is not None:
+                    # 残り時間がない: 残りのメンバーは読み捨て（解凍）せずに打ち切る
+                    # チェックポイントにないメンバーは続きの呼び出しで先頭から読む
+                    break
+    finally:
+        members.close()
+        body.close()
+    if not partials:
+        raise Exception("No CSV file found in ZIP")
+    return partials
+
+
+def open_s3_archive(bucket, key, size, etag, parent_pid):
+    """
+    S3 上の ZIP をレンジ GET で開く（member_pool の各ワーカーで呼ばれる）
+    
+    ワーカープロセスではハンドラーの接続プールを使わず、プロセスごとに新しいクライアントを作る。
+    """
+    client = process_s3_client(parent_pid)
+    return zipfile.ZipFile(open_s3_object(client, bucket, key, size, etag))
+
+
+def process_s3_client(parent_pid):
+    """
+    このプロセスで使う S3 クライアント
+    
+    parent_pid のプロセス（ハンドラー）では get_s3_client() をそのまま使い、
+    member_pool のワーカープロセスではプロセスごとに1つ作って使い回す。
+    """
+    global _worker_client
+    pid = os.getpid()
+    if pid == parent_pid:
+        return get_s3_client()
+    if _worker_client is None or _worker_client[0] != pid:
+        _worker_client = (pid, worker_s3_client())
+    return _worker_client[1]
+
+
+_worker_client = None
+
+
+def worker_s3_client():
+    """ワーカープロセス用の S3 クライアント（既定セッションのロックも引き継がない）"""
+    return boto3.session.Session().client('s3')
+
+
+def csv_members(z):
+    """
+    ZIP内のCSVメンバー名
+    
+    Raises:
+        Exception: ZIP内にCSVが見つからない場合
+    """
+    names = [info.filename for info in z.infolist()
+             if not info.is_dir() and info.filename.endswith('.csv')]
+    if not names:
+        raise Exception("No CSV file found in ZIP")
+    return names
+
+
+def scan_members(open_archive, names, bucket, key, resume=None):
+    """
+    CSVメンバーを MEMBER_WORKERS 個までのプロセスで集計
+    
+    Args:
+        open_archive (callable): ZIP を開く関数（各ワーカーで呼ばれる）
+        names (list): CSVメンバー名
+        bucket (str), key (str): 元の S3 オブジェクト（列指向ファイルの書き出し先の決定に使う）
+        resume (dict): チェックポイントの途中集計（scan_member() 参照）
+    
+    Returns:
+        list: PartialAggregate（names の順）
+    """
+    if len(names) > 1:
+        print(f"CSV members: {len(names)} (workers: {min(MEMBER_WORKERS, len(names))})")
+    # ルールはハンドラーで1回だけ読み込み、コンパイル済みのものをワーカーに渡す
+    rules = get_filter_rules()
+    deadline = None if remaining_time is None else time.time() * 1000 + remaining_time()
+    # ワーカーには pickle できる形（to_dict()）で渡す
+    saved = {name: partial.to_dict() for name, partial in (resume or {}).items()}
+    scan = functools.partial(scan_saved_member, source=(bucket, key, os.getpid()), resume=saved)
+    return member_pool.process_members(open_archive, names, scan, PartialAggregate.from_dict,
+                                       MEMBER_WORKERS, initializer=init_member_worker,
+                                       initargs=(rules, deadline), preload_modules=(__name__,))
+
+
+def scan_saved_member(stream, name, source, resume):
+    """scan_member() の resume を to_dict() の形で受け取る版（member_pool のワーカー用）"""
+    previous = resume.get(name)
+    if previous is None:
+        return scan_member(stream, name, source)
+    return scan_member(stream, name, source, {name: PartialAggregate.from_dict(previous)})
+
+
+def init_member_worker(rules, deadline):
+    """
+    member_pool のワーカープロセスの初期化
+    
+    forkserver から起動したワーカーはハンドラーの状態を持たないため、
+    ハンドラーで読み込んだ集計ルールと、呼び出しの残り時間の期限を受け取る。
+    
+    Args:
+        rules (RuleSet): コンパイル済みの集計ルール（get_filter_rules()）
+        deadline (float): 呼び出しの期限（time.time() のミリ秒。None なら読み込みを打ち切らない）
+    """
+    global filter_rules, remaining_time
+    filter_rules = rules
+    remaining_time = None if deadline is None else functools.partial(remaining_until, deadline)
+
+
+def remaining_until(deadline):
+    """deadline（time.time() のミリ秒）までの残り時間（ミリ秒）"""
+    return int(deadline - time.time() * 1000)
+
+
+def download_zip(bucket, key, work_dir):
+    """
+    S3からZIPファイルをダウンロード
+    
+    Args:
+        bucket (str): S3バケット名
+        key (str): S3オブジェクトキー
+        work_dir (str): オブジェクト専用の作業ディレクトリ
+    
+    Returns:
+        str: ローカルファイルパス
+    """
+    local_path = f"{work_dir}/input.zip"
+    get_s3_client().download_file(bucket, key, local_path)
+    return local_path
 
 
 def parse_csv(csv_path):
@@ -172,37 +1005,268 @@ def parse_csv(csv_path):
         }
     
     処理内容:
-        1. CSV読み込み (csv.DictReader)
-        2. Timestamp から時間抽出 (文字列スライス)
-        3. Severity フィルタ (CRITICAL, WARNING)
-        4. 時間別カウント (defaultdict)
-    """
-    stats = defaultdict(lambda: {'CRITICAL': 0, 'WARNING': 0})
-    log_date = None
-    hostname = None
-    total_rows = 0
-    filtered_rows = 0
-    
-    with open(csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
+        1. CSV読み込み (csv_scanner.CsvScanner, bytes のまま必要な列だけ分割)
+        2. Timestamp から時間抽出 (bytes スライス)
+        3. (時間, Severity) 別カウント (dict)
+        4. Severity フィルタ (CRITICAL, WARNING) と文字列化は最後に1回だけ
+    """
+    with open(csv_path, 'rb', buffering=STREAM_CHUNK_SIZE) as f:
+        return build_stats(scan_csv(f))
+
+
+def parse_csv_stream(stream):
+    """
+    解凍済みCSVのバイトストリームを解析して時間別統計を作成
+    
+    STREAM_CHUNK_SIZE 単位でバッファリングしながら読むため、
+    メモリ使用量はファイルサイズに依存しない。
+    
+    Args:
+        stream: 読み取り可能なバイナリストリーム（zip_stream.MemberReader 等）
+    
+    Returns:
+        dict: parse_csv()の返り値と同じ構造
+    """
+    return build_stats(scan_member(stream))
+
+
+def scan_member(stream, name=None, source=None, resume=None):
+    """
+    解凍済みCSVのバイトストリームを途中集計（ZIP メンバー1つ分）
+    
+    STREAM_CHUNK_SIZE 単位でバッファリングしながら読むため、
+    メモリ使用量はファイルサイズに依存しない。
+    COLUMNAR_PREFIX が設定されていれば、同じスキャンで行を列指向ファイルにも書き出す。
+    解凍（stream の read）・解析・書き出しの所要時間は返り値の metrics に記録する。
+    呼び出しの残り時間が CHECKPOINT_RESERVE_SECONDS を切るとレコードの区切りで読み込みを打ち切り、
+    返り値の resume_offset に再開位置を記録する（checkpoint.BudgetReader）。
+    
+    Args:
+        stream: 解凍済みCSVのバイトストリーム
+        name (str): ZIP 内のメンバー名
+        source (tuple): (bucket, key, parent_pid) 元の S3 オブジェクトと
+            ハンドラーのプロセスID（列指向ファイルを書き出す場合に必要）
+        resume (dict): チェックポイントの途中集計（メンバー名 → PartialAggregate）
+            読み終えていたメンバーは読まずにそのまま返し、打ち切ったメンバーは続きをその途中集計に数える
+    
+    Returns:
+        PartialAggregate
+    """
+    previous = (resume or {}).get(name)
+    if previous is not None and previous.complete():
+        return previous
+    start = previous.resume_offset if previous is not None else 0
+    
+    scan = Metrics()
+    with scan.span('parse'):
+        budget = BudgetReader(scan.reader(stream, 'extract', 'csv_bytes'), remaining_time,
+                              CHECKPOINT_RESERVE_SECONDS * 1000, offset=start,
+                              header_end=previous.header_end if previous is not None else None)
+        f = io.BufferedReader(budget, buffer_size=STREAM_CHUNK_SIZE)
+        if not COLUMNAR_PREFIX or source is None:
+            partial = scan_csv(f, partial=previous)
+        else:
+            with tempfile.SpooledTemporaryFile(max_size=COLUMNAR_SPOOL_SIZE, dir=TMP_DIR) as sink:
+                partial = scan_csv(f, sink, partial=previous)
+                if partial.log_date is not None and sink.tell():
+                    with scan.span('export'):
+                        export_columnar(sink, partial, name, *source, start=start)
+    partial.metrics = scan
+    partial.name = name
+    partial.resume_offset = budget.offset if budget.stopped else None
+    partial.header_end = budget.header_end
+    return partial
+
+
+def export_columnar(sink, partial, name, bucket, key, parent_pid, start=0):
+    """
+    列指向ファイルを OUTPUT_BUCKET に保存
+    
+    キー: {COLUMNAR_PREFIX}{log_date}/{hostname}/{ZIP名}/{メンバー名}.slcol
+    チェックポイントから再開した続きの行は別のファイル（{メンバー名}.{再開位置}.slcol）にする。
+    
+    Args:
+        start (int): 書き出す行の CSV 上の開始位置（解凍後のバイトオフセット）
+    
+    Returns:
+        str: 保存先のキー
+    """
+    archive = key.rsplit('/', 1)[-1]
+    if archive.endswith('.zip'):
+        archive = archive[:-len('.zip')]
+    member = name or 'data.csv'
+    if member.endswith('.csv'):
+        member = member[:-len('.csv')]
+    if start:
+        member = f"{member}.{start}"
+    columnar_key = f"{COLUMNAR_PREFIX}{partial.log_date}/{partial.hostname}/{archive}/{member}.slcol"
+    
+    size = sink.tell()
+    sink.seek(0)
+    process_s3_client(parent_pid).upload_fileobj(
+        sink, OUTPUT_BUCKET, columnar_key,
+        ExtraArgs={'ContentType': 'application/octet-stream'})
+    print(f"Columnar export: s3://{OUTPUT_BUCKET}/{columnar_key} ({size} bytes)")
+    return columnar_key
+
+
+def scan_csv(f, sink=None, partial=None):
+    """
+    CSVバイトストリームを途中集計（parse_csv / scan_member 共通）
+    
+    AGG_SPEC で指定された次元（時/分 × Severity × AppName）と
+    THREAT 行の送信元・宛先、集計ルール（Severity だけのルール以外）、
+    Message のテンプレートを1回のスキャンで数える。
+    
+    Args:
+        f: 行単位で反復できるバイナリストリーム
+        sink: 行を列指向ファイル（columnar.ColumnarWriter）で書き出す先
+            （None なら書き出さない。CSV に必要な列がない場合も書き出さない）
+        partial (PartialAggregate): 続きを数える途中集計（チェックポイントからの再開、None は新規）
+    
+    Returns:
+        PartialAggregate: build_stats() で parse_csv() の返り値に変換する
+    """
+    if partial is None:
+        partial = PartialAggregate(Aggregator(AGG_SPEC))
+    aggregator = partial.aggregator
+    heavy_hitters = partial.heavy_hitters
+    distinct_sources = partial.distinct_sources
+    rule_counts = partial.rule_counts
+    template_counts = partial.template_counts
+    log_date = partial.log_date
+    hostname = partial.hostname
+    
+    rules = get_filter_rules()
+    if rules.scan_rules:
+        # Message だけが条件のルールは行ごとに評価せず、読み込み単位ごとに文字列を探して数える
+        if rule_counts is None:
+            rule_counts = rules.new_counts()
+        f = rules.prefilter(f, rule_counts, buffer_size=STREAM_CHUNK_SIZE)
+    scanner = CsvScanner(f)
+    
+    if scanner.columns:
+        columns = ['Timestamp', 'Hostname', 'Severity']
+        if AGG_SPEC.app:
+            columns.append('AppName')
+        track_threats = ((HEAVY_HITTER_CAPACITY > 0 or HLL_PRECISION > 0)
+                         and {'LogType', 'Message'} <= set(scanner.columns))
+        if track_threats:
+            columns.append('LogType')
+        count_templates = MESSAGE_TEMPLATES > 0 and 'Message' in scanner.columns
+        evaluate_rules = bool(rules.dispatch_rules)
+        if rules.row_rules and not set(rules.columns()) <= set(scanner.columns):
+            print("WARNING: Filter rules skipped (missing columns)")
+            evaluate_rules = False
+        if evaluate_rules:
+            # Message は候補の行でだけ取り出す（field_getter）
+            columns.extend(c for c in rules.key_columns if c not in columns)
+        index = dict(zip(columns, scanner.column_indexes(columns)))
+        ts_i, host_i, sev_i = index['Timestamp'], index['Hostname'], index['Severity']
+        app_i = index.get('AppName')
         
-        for row in reader:
-            total_rows += 1
-            
-            # 初回のみ日付とホスト名取得
-            if not log_date:
+        writer = None
+        if sink is not None:
+            from columnar import COLUMN_NAMES, ColumnarWriter
+            if set(COLUMN_NAMES) <= set(scanner.columns):
+                writer = ColumnarWriter(sink, scanner.column_indexes(COLUMN_NAMES),
+                                        level=COLUMNAR_LEVEL)
+            else:
+                print("WARNING: Columnar export skipped (missing columns)")
+        max_index = max(index.values())
+        if writer is not None:
+            max_index = max(max_index, *writer.indexes)
+        if count_templates or track_threats:
+            # テンプレートは Message の先頭だけで数え、THREAT 行は Message の中を検索する。
+            # Message は分割せず、行の Message から始まる要素を使う
+            msg_i = scanner.column_indexes(['Message'])[0]
+            max_index = max(max_index, msg_i - 1)
+        rows = scanner.rows(max_index)
+        
+        # 初回のみ日付とホスト名取得（再開時は最初の呼び出しで取得済み）
+        first = next(rows, None)
+        if first is not None:
+            if log_date is None:
                 # "2025-04-28T10:15:30Z" → "2025-04-28"
-                log_date = row['Timestamp'][:10]
-                hostname = row['Hostname']
-            
-            severity = row['Severity']
-            
-            # CRITICAL/WARNING のみカウント
-            if severity in ['CRITICAL', 'WARNING']:
-                filtered_rows += 1
-                # "2025-04-28T10:15:30Z" → "10:00"
-                hour = row['Timestamp'][11:13] + ':00'
-                stats[hour][severity] += 1
+                log_date = first[ts_i][:10].decode('utf-8')
+                hostname = first[host_i].decode('utf-8')
+            rows = itertools.chain([first], rows)
+        
+        tap = flush_threats = None
+        if track_threats:
+            # 同じスキャンの中で THREAT 行の送信元・宛先を追跡する
+            trackers = []
+            if HEAVY_HITTER_CAPACITY > 0:
+                if heavy_hitters is None:
+                    heavy_hitters = HeavyHitters(HEAVY_HITTER_CAPACITY)
+                trackers.append(heavy_hitters)
+            if HLL_PRECISION > 0:
+                if distinct_sources is None:
+                    distinct_sources = HourlyDistinct(HLL_PRECISION)
+                trackers.append(distinct_sources)
+            threat_message = None
+            if msg_i < len(scanner.columns) - 1:
+                # 後ろの列まで検索しないよう Message を取り出す（最後の列なら残りは Message + 改行で、検索結果は同じ）
+                threat_message = scanner.field_getter(max_index, msg_i)
+            observe, flush_threats = threat_observer(ts_i, msg_i, trackers, threat_message)
+            tap = (index['LogType'], THREAT_LOG_TYPE, observe)
+        
+        dispatch = None
+        if evaluate_rules:
+            # 同じスキャンの中で集計ルールを評価する
+            if rule_counts is None:
+                rule_counts = rules.new_counts()
+            message = None
+            if 'Message' in rules.columns():
+                message = scanner.field_getter(max_index, scanner.column_indexes(['Message'])[0])
+            dispatch = rules.dispatcher(ts_i, index, rule_counts, message)
+        
+        templates = None
+        if count_templates:
+            # 同じスキャンの中で Message のテンプレートを数える
+            if template_counts is None:
+                template_counts = TemplateCounts(MESSAGE_TEMPLATES)
+            templates = template_counts.counter(msg_i, scanner.field_getter(max_index, msg_i))
+        if writer is not None:
+            rows = writer.record(rows)
+        aggregator.consume(rows, ts_i, sev_i, app_i, tap=tap, dispatch=dispatch, templates=templates)
+        if flush_threats is not None:
+            flush_threats()
+        if writer is not None:
+            writer.close()
+    
+    partial.log_date, partial.hostname = log_date, hostname
+    partial.heavy_hitters, partial.distinct_sources = heavy_hitters, distinct_sources
+    partial.rule_counts = rule_counts
+    partial.template_counts = template_counts
+    return partial
+
+
+def build_stats(partial):
+    """
+    途中集計から parse_csv() の返り値を作成
+    
+    Args:
+        partial (PartialAggregate): scan_csv() の返り値（合算済みでもよい）
+    
+    Returns:
+        dict: parse_csv()の返り値と同じ構造に加えて
+            'severity_stats': {'10:00': {'CRITICAL': 15, 'INFO': 4210, ...}}
+            'minute_stats':   {'10:00': {'CRITICAL': [60個の件数], ...}}  (AGG_DIMENSIONS に minute)
+            'app_stats':      {'10:00': {'RT_IDP': {'CRITICAL': 3}}}       (AGG_DIMENSIONS に app)
+            'heavy_hitters':  {'10:00': {'src_ip': {...}, 'dst_ip': {...}, 'dst_port': {...}}}
+                              (HEAVY_HITTER_CAPACITY > 0、heavy_hitters.HeavyHitters.hourly_stats())
+            'distinct_sources': {'10:00': {'precision': 12, 'registers': '...', 'estimate': 123}}
+                              (HLL_PRECISION > 0、hyperloglog.HourlyDistinct.hourly_stats())
+            'rule_stats':     {'10:00': {'idp_error': 3, 'brute_force': 12}}
+                              (集計ルールがある場合、filter_rules.RuleSet.hourly_stats())
+            'template_stats': {'10:00': {'RT_SCREEN_TCP: SYN flood attack detected': 12}}
+                              (MESSAGE_TEMPLATES > 0、templates.TemplateCounts.hourly_stats())
+    """
+    aggregator = partial.aggregator
+    hourly_stats = aggregator.hourly_stats(TARGET_SEVERITIES)
+    total_rows = aggregator.total_rows()
+    filtered_rows = sum(sum(c.values()) for c in hourly_stats.values())
     
     print(f"CSV Statistics:")
     print(f"  Total rows: {total_rows}")
@@ -211,25 +1275,58 @@ def parse_csv(csv_path):
         print(f"  Filter ratio: {filtered_rows/total_rows*100:.1f}%")
     else:
         print(f"  Filter ratio: N/A (no data)")
+    metrics.add('rows_scanned', total_rows)
+    metrics.add('rows_kept', filtered_rows)
+    invalid_rows = aggregator.invalid_rows()
+    if invalid_rows:
+        print(f"  WARNING: Rows with unparsable Timestamp: {invalid_rows}")
+    rules = get_filter_rules()
+    rule_stats = rules.hourly_stats(aggregator, partial.rule_counts) if rules else None
+    if rule_stats is not None:
+        matched = defaultdict(int)
+        for counts in rule_stats.values():
+            for name, n in counts.items():
+                matched[name] += n
+        print(f"  Rule matches: {', '.join(f'{name}={matched[name]}' for name in rules.names())}")
     
-    return {
-        'log_date': log_date,
-        'hostname': hostname,
-        'hourly_stats': dict(stats)
+    stats = {
+        'log_date': partial.log_date,
+        'hostname': partial.hostname,
+        'hourly_stats': hourly_stats,
+        'severity_stats': aggregator.severity_stats()
     }
+    if aggregator.spec.minute:
+        stats['minute_stats'] = aggregator.minute_stats()
+    if aggregator.spec.app:
+        stats['app_stats'] = aggregator.app_stats()
+    if partial.heavy_hitters is not None:
+        stats['heavy_hitters'] = partial.heavy_hitters.hourly_stats()
+    if partial.distinct_sources is not None:
+        stats['distinct_sources'] = partial.distinct_sources.hourly_stats()
+    if rule_stats is not None:
+        stats['rule_stats'] = rule_stats
+    if partial.template_counts is not None:
+        stats['template_stats'] = partial.template_counts.hourly_stats()
+    return stats
 
 
 def save_to_dynamodb(stats, file_name):
     """
     DynamoDBに時間別統計を保存 + S3にJSON出力
     
+    書き込みは dynamodb_writer.BatchWriter で BatchWriteItem にまとめる。
+    
     Args:
         stats (dict): parse_csv()の返り値
         file_name (str): S3オブジェクトキー
     
-    DynamoDBスキーマ:
+    DynamoDBスキーマ (TABLE_SCHEMA=single):
         PK: log_date (String)
         SK: hour (String)
+    DynamoDBスキーマ (TABLE_SCHEMA=multi_host, key_schema 参照):
+        PK: pk = "HOST#{hostname}#{log_date}" / "FLEET#{log_date}#{shard}" (String)
+        SK: sk = "{hour}" / "{hour}#{hostname}" (String)
+    共通:
         Attributes:
             - critical_count (Number)
             - warning_count (Number)
@@ -237,20 +1334,36 @@ def save_to_dynamodb(stats, file_name):
             - hostname (String)
             - processed_at (String)
             - file_name (String)
+            - severity_counts (Map)  Severity → 件数（全 Severity）
+            - minute_counts (Map)    Severity → 分単位件数のリスト（AGG_DIMENSIONS に minute）
+            - app_counts (Map)       AppName → Severity → 件数（AGG_DIMENSIONS に app）
+            - heavy_hitters (Map)    送信元IP・宛先IP・宛先ポートの要約（THREAT 行がある時間）
+            - src_ip_sketch (Map)    送信元IPの HyperLogLog（THREAT 行がある時間）
+            - rule_counts (Map)      集計ルール名 → 件数（FILTER_RULES / FILTER_RULES_S3）
+            - template_counts (Map)  Message のテンプレート → 件数（MESSAGE_TEMPLATES > 0）
+            - anomaly (Map)          CRITICAL 件数の異常スコアとベースライン（BASELINE_PREFIX、score_anomalies 参照）
+    
+    Returns:
+        bool: JSON を出力できたか（export_to_s3_json() 参照）
     """
     log_date = stats['log_date']
     hostname = stats['hostname']
     processed_at = datetime.utcnow().isoformat() + 'Z'
     
-    saved_count = 0
+    # ホスト・時刻ごとのベースラインで採点し、ベースラインを更新
+    anomalies = score_anomalies(stats)
+    if anomalies is not None:
+        stats = {**stats, 'anomaly_stats': anomalies}
     
-    # 時間ごとにアイテム作成
-    for hour, counts in stats['hourly_stats'].items():
-        critical = counts['CRITICAL']
-        warning = counts['WARNING']
+    # 時間ごとにアイテム作成（キー属性は TABLE_SCHEMA に従う）
+    items = []
+    for hour in stats_hours(stats):
+        counts = stats['hourly_stats'].get(hour, {})
+        critical = counts.get('CRITICAL', 0)
+        warning = counts.get('WARNING', 0)
         total = critical + warning
         
-        table.put_item(Item={
+        items.extend(build_items(TABLE_SCHEMA, {
             'log_date': log_date,
             'hour': hour,
             'critical_count': critical,
@@ -258,28 +1371,137 @@ def save_to_dynamodb(stats, file_name):
             'total_count': total,
             'hostname': hostname,
             'processed_at': processed_at,
-            'file_name': file_name
-        })
-        
-        saved_count += 1
+            'file_name': file_name,
+            **hour_attributes(stats, hour)
+        }, FLEET_SHARDS))
     
-    print(f"DynamoDB: Saved {saved_count} items")
+    # BatchWriteItem でまとめて書き込み（最大25件/リクエスト、未処理分は再送）
+    report = get_batch_writer().write(items)
+    metrics.add('dynamodb_items', report['items'])
+    metrics.add('dynamodb_requests', report['requests'])
+    metrics.add('dynamodb_retries', report['retries'])
+    metrics.add('dynamodb_throttles', report['throttles'])
+    latencies = [b['latency_ms'] for b in report['batch_stats']]
+    print(f"DynamoDB: Saved {report['items']} items "
+          f"(batches: {report['batches']}, requests: {report['requests']}, "
+          f"retries: {report['retries']}, throttles: {report['throttles']}, "
+          f"max batch latency: {max(latencies, default=0):.1f}ms)")
     
     # === S3にJSON出力（ダッシュボード用） ===
-    export_to_s3_json(stats, processed_at)
+    return export_to_s3_json(stats, processed_at)
+
+
+def stats_hours(stats):
+    """
+    集計結果に含まれる全ての時間（CRITICAL/WARNING が0件の時間も含む）
+    
+    Returns:
+        list: ['00:00', '01:00', ...]（ソート済み）
+    """
+    return sorted(set(stats['hourly_stats']) | set(stats.get('severity_stats', {})))
+
+
+def hour_attributes(stats, hour):
+    """
+    時間別アイテムに追加する多次元集計の属性
+    
+    Returns:
+        dict: severity_counts / minute_counts / app_counts / heavy_hitters / src_ip_sketch /
+              rule_counts / template_counts / anomaly（集計したもののみ）
+    """
+    attributes = {}
+    if 'severity_stats' in stats:
+        attributes['severity_counts'] = stats['severity_stats'].get(hour, {})
+    if 'minute_stats' in stats:
+        attributes['minute_counts'] = stats['minute_stats'].get(hour, {})
+    if 'app_stats' in stats:
+        attributes['app_counts'] = stats['app_stats'].get(hour, {})
+    if hour in stats.get('heavy_hitters', {}):
+        attributes['heavy_hitters'] = stats['heavy_hitters'][hour]
+    if hour in stats.get('distinct_sources', {}):
+        attributes['src_ip_sketch'] = stats['distinct_sources'][hour]
+    if 'rule_stats' in stats:
+        attributes['rule_counts'] = stats['rule_stats'].get(hour, {})
+    if 'template_stats' in stats:
+        attributes['template_counts'] = stats['template_stats'].get(hour, {})
+    if hour in stats.get('anomaly_stats', {}):
+        # DynamoDB は float を受け付けないため Decimal にする
+        attributes['anomaly'] = {key: Decimal(str(value)) if isinstance(value, float) else value
+                                 for key, value in stats['anomaly_stats'][hour].items()}
+    return attributes
+
+
+def score_anomalies(stats):
+    """
+    時間別の CRITICAL 件数をホスト・時刻ごとのベースラインで採点し、ベースラインを更新する
+    
+    ベースラインは s3://{OUTPUT_BUCKET}/{BASELINE_PREFIX}{hostname}.json に
+    ETag 条件付き PUT で保存する（baselines.score_hours、1時間あたり O(1) の更新）。
+    更新に失敗しても集計結果の保存は続ける（メトリクス BaselineFailures と ERROR の JSON ログを出す）。
+    
+    Returns:
+        dict: {'10:00': {'score': 4.21, 'mean': 3.2, 'std': 1.1, 'samples': 14}, ...}
+            （BASELINE_PREFIX が空、または更新に失敗した場合は None）
+    """
+    if not BASELINE_PREFIX:
+        return None
+    hostname = stats['hostname']
+    counts = {hour: stats['hourly_stats'].get(hour, {}).get('CRITICAL', 0)
+              for hour in stats_hours(stats)}
+    scored = {}
+    
+    def merge(current):
+        doc, scored['hours'] = baselines.score_hours(
+            current, hostname, stats['log_date'], counts,
+            alpha=BASELINE_ALPHA, min_samples=BASELINE_MIN_SAMPLES)
+        return doc
+    
+    json_key = f"{BASELINE_PREFIX}{hostname}.json"
+    try:
+        rollup.update_json_document(get_s3_client(), OUTPUT_BUCKET, json_key, merge)
+    except Exception as e:
+        # 権限不足などで失敗し続けても気付けるよう、メトリクス BaselineFailures と構造化ログに残す
+        metrics.add('baseline_failures')
+        print(json.dumps({
+            'level': 'ERROR',
+            'message': 'Failed to update baseline',
+            'bucket': OUTPUT_BUCKET,
+            'key': json_key,
+            'error_code': error_code(e),
+            'error': str(e),
+        }))
+        return None
+    
+    anomalous = {hour: result['score'] for hour, result in scored['hours'].items()
+                 if abs(result.get('score', 0)) >= baselines.ALERT_SCORE}
+    metrics.add('anomalous_hours', len(anomalous))
+    if anomalous:
+        print(f"Anomalous CRITICAL counts ({hostname}): "
+              f"{', '.join(f'{hour}={score:+.2f}' for hour, score in sorted(anomalous.items()))}")
+    return scored['hours']
 
 
 def export_to_s3_json(stats, processed_at):
     """
     S3にJSON形式で統計データを出力（ダッシュボード用）
-    DynamoDBから該当日の全時間データを取得してJSONを生成
+    
+    EXPORT_MODE=rollup (デフォルト): 既存の日次JSONに今回の時間別カウントをマージ
+    EXPORT_MODE=query: DynamoDBから該当日の全時間データを取得してJSONを生成し直す
     
     Args:
         stats (dict): parse_csv()の返り値
         processed_at (str): 処理日時（ISO 8601形式）
     
     出力先:
-        s3://{OUTPUT_BUCKET}/data/{log_date}.json
+        single:     s3://{OUTPUT_BUCKET}/data/{log_date}.json
+        multi_host: s3://{OUTPUT_BUCKET}/data/{log_date}.json (フリート全体)
+                    s3://{OUTPUT_BUCKET}/data/hosts/{hostname}/{log_date}.json (ホスト別)
+        共通:       s3://{OUTPUT_BUCKET}/data/weekly/{YYYY-Www}.json (ROLLUP_PERIODS)
+                    s3://{OUTPUT_BUCKET}/data/monthly/{YYYY-MM}.json (ROLLUP_PERIODS)
+                    s3://{OUTPUT_BUCKET}/data/manifest.json
+        ロールアップは data/{log_date}.json の日ごとの要約（rollup.merge_period）、
+        マニフェストは data/ 直下の JSON の一覧と内容のハッシュ（rollup.merge_manifest）。
+        JSON_COMPRESSION=gzip なら空白なしの JSON を gzip 圧縮して ContentEncoding: gzip で保存する。
     
     JSONフォーマット:
         {
@@ -287,56 +1509,286 @@ def export_to_s3_json(stats, processed_at):
           "hostname": "srx-fw01",
           "processed_at": "2025-04-28T12:34:56Z",
           "hourly_stats": [
-            {"hour": "00:00", "critical": 15, "warning": 43, "total": 58},
-            {"hour": "01:00", "critical": 12, "warning": 38, "total": 50},
+            {"hour": "00:00", "critical": 15, "warning": 43, "total": 58,
+             "severities": {"CRITICAL": 15, "WARNING": 43, "INFO": 4210, ...},
+             "minutes": {"CRITICAL": [...60件...], ...},     (AGG_DIMENSIONS に minute)
+             "apps": {"RT_IDP": {"CRITICAL": 3, ...}, ...},  (AGG_DIMENSIONS に app)
+             "heavy_hitters": {                                (THREAT 行がある時間)
+               "src_ip": {"total": 512, "error": 3, "items": [["10.0.0.1", 210], ...]},
+               "dst_ip": {...}, "dst_port": {...}},
+             "distinct_src_ips": 87,                           (THREAT 行がある時間)
+             "src_ip_sketch": {"precision": 12, "registers": "...", "estimate": 87},
+             "anomaly": {"score": 0.84, "mean": 12.4, "std": 3.1, "samples": 14}},  (BASELINE_PREFIX)
             ...
-          ]
+          ],
+          "distinct_src_ips": 1520,      日全体の送信元IPのユニーク数（時間別スケッチの合算）
+          "src_ip_sketch": {...}
         }
-    """
-    log_date = stats['log_date']
-    hostname = stats['hostname']
+        フリート全体の JSON は hostname が "fleet" になり、
+        "hosts" (ホスト名一覧) と各時間の "hosts" (その時間に集計されたホスト数) が付く。
+        heavy_hitters の items は件数の多い順に上位 HEAVY_HITTER_TOP_N 個。
+        件数は真の値の下限で、誤差は error 以下（フリート全体はホスト別の要約を合算）。
+        rollup の場合は各時間に "by_host" (ホスト別の内訳) も付く。
     
-    # DynamoDBから該当日の全時間データを取得
+    Returns:
+        bool: 出力できたか（失敗は例外にせず、メトリクス ExportFailures と WARNING を出して False を返す）
+    """
     try:
-        response = table.query(
-            KeyConditionExpression='log_date = :date',
-            ExpressionAttributeValues={
-                ':date': log_date
-            }
-        )
-        
-        # 時間別データを配列に変換（ソート済み）
-        hourly_list = []
-        for item in sorted(response['Items'], key=lambda x: x['hour']):
-            hourly_list.append({
-                'hour': item['hour'],
-                'critical': int(item['critical_count']),  # Decimal → int
-                'warning': int(item['warning_count']),     # Decimal → int
-                'total': int(item['total_count'])          # Decimal → int
-            })
-        
-        # JSON構造作成
-        output_data = {
-            'log_date': log_date,
-            'hostname': hostname,
-            'processed_at': processed_at,
-            'total_hours': len(hourly_list),
-            'hourly_stats': hourly_list
-        }
-        
-        # S3にアップロード（バケットポリシーで公開）
-        json_key = f"data/{log_date}.json"
-        
-        s3_client.put_object(
-            Bucket=OUTPUT_BUCKET,
-            Key=json_key,
-            Body=json.dumps(output_data, ensure_ascii=False, indent=2),
-            ContentType='application/json'
-        )
-        print(f"JSON exported to s3://{OUTPUT_BUCKET}/{json_key} ({len(hourly_list)} hours)")
+        with metrics.span('export'):
+            if EXPORT_MODE == 'rollup':
+                export_rollup(stats, processed_at)
+            else:
+                export_from_query(stats, processed_at)
+        return True
         
     except Exception as e:
         print(f"WARNING: Failed to export JSON: {str(e)}")
         import traceback
         traceback.print_exc()
-        # DynamoDB保存が成功していればエラーにしない
+        metrics.add('export_failures')
+        # DynamoDB保存が成功していればエラーにしない（台帳を使う場合は process_record で再試行させる）
+        return False
+
+
+def export_rollup(stats, processed_at, update=None):
+    """
+    既存の日次JSONに今回の時間別カウントをマージして書き戻す（EXPORT_MODE=rollup）
+    
+    ETag 条件付き PUT で更新するため、同じ日のファイルが同時に処理されても
+    更新が失われない。DynamoDB への問い合わせは行わない。
+    
+    Args:
+        update (callable): update(json_key, merge) で JSON を更新する関数
+            （既定は S3 の update_json。バックフィルではローカルの書き出し先に差し替える）
+    """
+    update = update or update_json
+    log_date = stats['log_date']
+    hostname = stats['hostname']
+    entries = rollup.hourly_entries(stats, top_n=HEAVY_HITTER_TOP_N)
+    
+    if TABLE_SCHEMA == SCHEMA_MULTI_HOST:
+        # ホスト別
+        update(f"data/hosts/{hostname}/{log_date}.json",
+               lambda doc: rollup.merge_daily(doc, log_date, hostname, processed_at, entries))
+        
+        # フリート全体
+        daily = update(f"data/{log_date}.json",
+                       lambda doc: rollup.merge_fleet(doc, log_date, FLEET_HOSTNAME, hostname,
+                                                      processed_at, entries,
+                                                      top_n=HEAVY_HITTER_TOP_N))
+    else:
+        daily = update(f"data/{log_date}.json",
+                       lambda doc: rollup.merge_daily(doc, log_date, hostname, processed_at, entries))
+    
+    export_periods(daily, processed_at, update)
+
+
+def export_periods(daily, processed_at, update):
+    """
+    日次JSON（data/{log_date}.json）の要約を週・月のロールアップに反映し、マニフェストを更新
+    
+    Args:
+        daily (dict): 書き込んだ日次JSON
+        update (callable): update(json_key, merge) -> doc で JSON を更新する関数
+    """
+    log_date = daily['log_date']
+    summary = rollup.day_summary(daily)
+    entries = {(rollup.DAILY, log_date): rollup.manifest_entry(daily)}
+    for resolution in ROLLUP_PERIODS:
+        period = rollup.period_name(resolution, log_date)
+        doc = update(f"data/{resolution}/{period}.json",
+                     lambda current: rollup.merge_period(current, resolution, period,
+                                                         daily['hostname'], processed_at, summary,
+                                                         daily.get('src_ip_sketch')))
+        entries[(resolution, period)] = rollup.manifest_entry(doc)
+    update(MANIFEST_KEY, lambda current: rollup.merge_manifest(current, processed_at, entries))
+
+
+def json_put_args(json_key):
+    """JSON の put_object に追加で渡す引数（Cache-Control）"""
+    if json_key == MANIFEST_KEY:
+        return {'CacheControl': MANIFEST_CACHE_CONTROL}
+    return {'CacheControl': JSON_CACHE_CONTROL}
+
+
+def update_json(json_key, merge):
+    """
+    S3上のJSONを条件付きPUTで更新（競合時は読み直してリトライ）
+    
+    Returns:
+        dict: 書き込んだ JSON
+    """
+    doc, conflicts = rollup.update_json_document(
+        get_s3_client(), OUTPUT_BUCKET, json_key, merge,
+        compress=JSON_COMPRESSION == 'gzip', put_args=json_put_args(json_key))
+    print(f"JSON merged into s3://{OUTPUT_BUCKET}/{json_key} (conflicts: {conflicts})")
+    return doc
+
+
+def export_from_query(stats, processed_at):
+    """
+    DynamoDBから該当日の全時間データを取得して日次JSONを作り直す（EXPORT_MODE=query）
+    """
+    log_date = stats['log_date']
+    hostname = stats['hostname']
+    
+    # DynamoDBから該当日の全時間データを取得
+    if TABLE_SCHEMA == SCHEMA_MULTI_HOST:
+        # ホスト別
+        items = query_items('pk', host_partition(hostname, log_date))
+        put_json(f"data/hosts/{hostname}/{log_date}.json",
+                 build_daily_json(log_date, hostname, processed_at, items))
+        
+        # フリート全体（全シャードを合算）
+        fleet_items = []
+        for shard in range(FLEET_SHARDS):
+            fleet_items.extend(query_items('pk', fleet_partition(log_date, shard)))
+        daily = build_fleet_json(log_date, processed_at, fleet_items)
+    else:
+        items = query_items('log_date', log_date)
+        daily = build_daily_json(log_date, hostname, processed_at, items)
+    put_json(f"data/{log_date}.json", daily)
+    
+    # ロールアップとマニフェストは日次JSONと同じくマージで更新する
+    export_periods(daily, processed_at, update_json)
+
+
+def query_items(key_name, value):
+    """
+    パーティションキーで全アイテムを取得（ページング対応）
+    
+    Args:
+        key_name (str): パーティションキーの属性名
+        value (str): パーティションキーの値
+    
+    Returns:
+        list: アイテム
+    """
+    items = []
+    kwargs = {
+        'KeyConditionExpression': f'{key_name} = :value',
+        'ExpressionAttributeValues': {':value': value},
+        'ConsistentRead': True,
+    }
+    while True:
+        response = get_table().query(**kwargs)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def build_daily_json(log_date, hostname, processed_at, items):
+    """
+    1ホスト分の時間別アイテムから日次JSONを作成
+    
+    Returns:
+        dict: export_to_s3_json() の JSON フォーマット
+    """
+    # 時間別データを配列に変換（ソート済み）
+    hourly_list = []
+    for item in sorted(items, key=lambda x: x['hour']):
+        entry = {
+            'hour': item['hour'],
+            'critical': int(item['critical_count']),  # Decimal → int
+            'warning': int(item['warning_count']),     # Decimal → int
+            'total': int(item['total_count'])          # Decimal → int
+        }
+        for attribute, key in HOUR_ATTRIBUTE_KEYS:
+            if attribute in item:
+                entry[key] = decimal_to_int(item[attribute])
+        if 'heavy_hitters' in item:
+            entry['heavy_hitters'] = top_view(item['heavy_hitters'], HEAVY_HITTER_TOP_N)
+        if 'src_ip_sketch' in item:
+            entry.update(rollup.distinct_entry(decimal_to_int(item['src_ip_sketch'])))
+        hourly_list.append(entry)
+    
+    # JSON構造作成
+    return {
+        'log_date': log_date,
+        'hostname': hostname,
+        'processed_at': processed_at,
+        'total_hours': len(hourly_list),
+        'hourly_stats': hourly_list,
+        **rollup.daily_distinct(hourly_list)
+    }
+
+
+def build_fleet_json(log_date, processed_at, items):
+    """
+    全ホストのフリート集計用アイテムを時間別に合算して日次JSONを作成
+    
+    Returns:
+        dict: export_to_s3_json() の JSON フォーマット（hostname は "fleet"）
+    """
+    totals = defaultdict(lambda: {'critical': 0, 'warning': 0, 'total': 0, 'hosts': 0})
+    heavy_hitters = defaultdict(list)
+    sketches = defaultdict(list)
+    hosts = set()
+    for item in items:
+        hour = totals[item['hour']]
+        hour['critical'] += int(item['critical_count'])
+        hour['warning'] += int(item['warning_count'])
+        hour['total'] += int(item['total_count'])
+        hour['hosts'] += 1
+        if 'severity_counts' in item:
+            severities = hour.setdefault('severities', {})
+            for severity, count in item['severity_counts'].items():
+                severities[severity] = severities.get(severity, 0) + int(count)
+        for attribute, key in (('rule_counts', 'rules'), ('template_counts', 'templates')):
+            if attribute in item:
+                totals_by_name = hour.setdefault(key, {})
+                for name, count in item[attribute].items():
+                    totals_by_name[name] = totals_by_name.get(name, 0) + int(count)
+        if 'heavy_hitters' in item:
+            heavy_hitters[item['hour']].append(item['heavy_hitters'])
+        if 'src_ip_sketch' in item:
+            sketches[item['hour']].append(decimal_to_int(item['src_ip_sketch']))
+        hosts.add(item['hostname'])
+    
+    for hour, summaries in heavy_hitters.items():
+        totals[hour]['heavy_hitters'] = merge_views(summaries, HEAVY_HITTER_TOP_N)
+    for hour, hour_sketches in sketches.items():
+        totals[hour].update(rollup.distinct_entry(merge_sketches(hour_sketches)))
+    hourly_list = [{'hour': hour, **totals[hour]} for hour in sorted(totals)]
+    
+    return {
+        'log_date': log_date,
+        'hostname': FLEET_HOSTNAME,
+        'processed_at': processed_at,
+        'hosts': sorted(hosts),
+        'total_hours': len(hourly_list),
+        'hourly_stats': hourly_list,
+        **rollup.daily_distinct(hourly_list)
+    }
+
+
+def decimal_to_int(value):
+    """
+    DynamoDB から取得した値の Decimal を int に変換（Map / List の中も変換、小数は float）
+    """
+    if isinstance(value, dict):
+        return {k: decimal_to_int(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decimal_to_int(v) for v in value]
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def put_json(json_key, output_data):
+    """
+    S3にJSONをアップロード（CloudFront経由で公開）
+    """
+    get_s3_client().put_object(
+        Bucket=OUTPUT_BUCKET,
+        Key=json_key,
+        **rollup.json_object(output_data, compress=JSON_COMPRESSION == 'gzip'),
+        **json_put_args(json_key)
+    )
+    print(f"JSON exported to s3://{OUTPUT_BUCKET}/{json_key} ({output_data['total_hours']} hours)")
+
+
+# プロビジョニングされた同時実行では、初期化（インポート）の時点でクライアントまで作っておく
+if os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'provisioned-concurrency':
+    warm_up()
@@ -0,0 +1,208 @@
+"""
+処理済みオブジェクトの台帳（冪等な取り込み）
+
+S3 イベント通知は少なくとも1回の配信で、同じ raw/<date>/<hour>.zip が再アップロードされることもある。
+台帳は (バケット, キー, ETag) ごとに処理の状態を DynamoDB の条件付き書き込みで記録し、
+同じ内容のオブジェクトを2回解析しないようにする。
+
+状態:
+  - claimed: 処理中。owner（処理中の呼び出し）と lease_expires（リースの期限、UNIX 秒）を持つ
+  - done:    処理済み。処理結果の要約（log_date, total_hours）を持つ
+
+  1. lookup: 強い整合性の GetItem 1回で状態を確認する。done なら重複、期限内の claimed なら処理中
+  2. claim:  項目がないか、リースの切れた claimed の場合だけ条件付き PutItem で claimed にする
+             （同時に届いた重複のうち1つだけが成功する。落ちた呼び出しのリースは期限後に引き継げる）
+  3. complete / release: 自分が owner の場合だけ done にする / 項目を消す（失敗時、すぐ再試行できるように）
+  extend: チェックポイントから再開する続きの呼び出しが、前の呼び出しのリースを引き継いで延長する
+
+client には DynamoDB の低レベルクライアント（get_item / put_item / delete_item）を渡す
+（テストでは tests/fakes.py の FakeDynamoDBClient）。
+"""
+
+import time
+import uuid
+from collections import namedtuple
+
+from aws_errors import error_code
+
+# 台帳の状態
+CLAIMED = 'claimed'
+DONE = 'done'
+
+# claim() の結果: status は 'claimed'（処理してよい）/ 'done'（処理済み）/ 'busy'（他の呼び出しが処理中）
+Claim = namedtuple('Claim', ['status', 'object_id', 'owner', 'item'])
+
+# 条件付き書き込みの条件を満たさなかった場合のエラーコード
+CONDITION_FAILED = 'ConditionalCheckFailedException'
+
+# claim() で条件付き書き込みをやり直す回数の上限（他の呼び出しの release と重なった場合）
+MAX_CLAIM_ATTEMPTS = 3
+
+# status / owner は DynamoDB の予約語のため属性名のプレースホルダーを使う
+_NAMES = {'#id': 'object_id', '#status': 'status', '#owner': 'owner', '#lease': 'lease_expires'}
+
+
+class Ledger:
+    """
+    (バケット, キー, ETag) ごとの処理状態
+
+    スレッドセーフ（状態は DynamoDB 側にだけ持つ）。
+    """
+
+    def __init__(self, client, table_name, retention_seconds=30 * 86400, clock=time.time):
+        """
+        Args:
+            client: DynamoDB の低レベルクライアント
+            table_name (str): 台帳のテーブル名（パーティションキー object_id: S）
+            retention_seconds (int): 項目を残す期間（expires_at 属性、テーブルの TTL で削除）
+            clock (callable): 現在時刻（UNIX 秒、テスト用に差し替え可能）
+        """
+        self.client = client
+        self.table_name = table_name
+        self.retention_seconds = retention_seconds
+        self.clock = clock
+
+    @staticmethod
+    def object_id(bucket, key, etag):
+        """台帳のキー（ETag は引用符を除く。S3 イベントの eTag には引用符がない）"""
+        etag = etag.strip('"')
+        return f'{bucket}/{key}#{etag}'
+
+    def lookup(self, object_id):
+        """
+        object_id の台帳の項目（強い整合性の読み込み）
+
+        Returns:
+            dict | None: {'object_id', 'status', 'owner', 'lease_expires', ...}（数値は int）
+        """
+        response = self.client.get_item(
+            TableName=self.table_name, Key={'object_id': {'S': object_id}}, ConsistentRead=True)
+        item = response.get('Item')
+        return _from_attributes(item) if item else None
+
+    def claim(self, bucket, key, etag, lease_seconds, version_id=None):
+        """
+        オブジェクトの処理を始める権利を取る
+
+        Args:
+            bucket (str), key (str), etag (str): 処理するオブジェクト
+            lease_seconds (float): リースの長さ（この時間を過ぎると他の呼び出しが引き継げる）
+            version_id (str): オブジェクトのバージョン（記録のみ）
+
+        Returns:
+            Claim: status が 'claimed' の場合だけ処理して complete() / release() を呼ぶ
+        """
+        object_id = self.object_id(bucket, key, etag)
+        owner = uuid.uuid4().hex
+        item = None
+        for _ in range(MAX_CLAIM_ATTEMPTS):
+            item = self.lookup(object_id)
+            now = self.clock()
+            if item is not None and item['status'] == DONE:
+                return Claim(DONE, object_id, None, item)
+            if item is not None and item.get('lease_expires', 0) > now:
+                return Claim('busy', object_id, item.get('owner'), item)
+
+            claimed = {
+                'object_id': object_id,
+                'bucket': bucket,
+                'key': key,
+                'etag': etag.strip('"'),
+                'status': CLAIMED,
+                'owner': owner,
+                'lease_expires': int(now + lease_seconds) + 1,
+                'claimed_at': int(now),
+                'attempts': (item or {}).get('attempts', 0) + 1,
+                'expires_at': int(now) + self.retention_seconds,
+            }
+            if version_id:
+                claimed['version_id'] = version_id
+            try:
+                self.client.put_item(
+                    TableName=self.table_name, Item=_to_attributes(claimed),
+                    ConditionExpression=('attribute_not_exists(#id) OR '
+                                         '(#status = :claimed AND #lease <= :now)'),
+                    ExpressionAttributeNames=_names('#id', '#status', '#lease'),
+                    ExpressionAttributeValues={':claimed': {'S': CLAIMED},
+                                               ':now': {'N': str(int(now))}})
+                return Claim(CLAIMED, object_id, owner, claimed)
+            except Exception as e:
+                if error_code(e) != CONDITION_FAILED:
+                    raise
+                # 他の呼び出しが先に claim / complete した（次の lookup で確認する）
+        return Claim('busy', object_id, None, item)
+
+    def extend(self, bucket, key, etag, owner, lease_seconds):
+        """
+        owner のリースを引き継いで延長する（チェックポイントから再開する続きの呼び出し用）
+
+        Returns:
+            Claim: status が 'claimed'。owner のリースでなくなっていた場合は None
+        """
+        object_id = self.object_id(bucket, key, etag)
+        item = self.lookup(object_id)
+        if item is None or item['status'] != CLAIMED or item.get('owner') != owner:
+            return None
+        item['lease_expires'] = int(self.clock() + lease_seconds) + 1
+        claim = Claim(CLAIMED, object_id, owner, item)
+        if not self._if_owner(claim, lambda condition: self.client.put_item(
+                TableName=self.table_name, Item=_to_attributes(item), **condition)):
+            return None
+        return claim
+
+    def complete(self, claim, result):
+        """
+        処理済みにする
+
+        Args:
+            claim (Claim): claim() の結果（status が 'claimed'）
+            result (dict): 記録する処理結果の要約（str / int の値）
+
+        Returns:
+            bool: False はリースが他の呼び出しに引き継がれていた場合（出力は上書きのため問題ない）
+        """
+        now = int(self.clock())
+        done = {name: value for name, value in claim.item.items()
+                if name not in ('owner', 'lease_expires')}
+        done.update(result)
+        done.update({'status': DONE, 'completed_at': now,
+                     'expires_at': now + self.retention_seconds})
+        return self._if_owner(claim, lambda condition: self.client.put_item(
+            TableName=self.table_name, Item=_to_attributes(done), **condition))
+
+    def release(self, claim):
+        """
+        処理に失敗したリースを手放す（再試行がリースの期限を待たずに claim できる）
+
+        Returns:
+            bool: False はリースが他の呼び出しに引き継がれていた場合
+        """
+        return self._if_owner(claim, lambda condition: self.client.delete_item(
+            TableName=self.table_name, Key={'object_id': {'S': claim.object_id}}, **condition))
+
+    def _if_owner(self, claim, write):
+        try:
+            write({'ConditionExpression': '#owner = :owner',
+                   'ExpressionAttributeNames': _names('#owner'),
+                   'ExpressionAttributeValues': {':owner': {'S': claim.owner}}})
+            return True
+        except Exception as e:
+            if error_code(e) != CONDITION_FAILED:
+                raise
+            return False
+
+
+def _names(*placeholders):
+    return {placeholder: _NAMES[placeholder] for placeholder in placeholders}
+
+
+def _to_attributes(item):
+    """str / int の値だけの項目 → 型付き属性値"""
+    return {name: {'N': str(value)} if isinstance(value, int) else {'S': str(value)}
+            for name, value in item.items()}
+
+
+def _from_attributes(item):
+    """型付き属性値 → str / int の値"""
+    return {name: int(value['N']) if 'N' in value else value.get('S')
+            for name, value in item.items()}
@@ -0,0 +1,192 @@
+"""
+ZIP メンバーの並列処理
+
+ZIP 内の複数の CSV メンバーを、メンバー単位で別プロセスに割り当てて展開・集計する。
+Lambda には /dev/shm がなく multiprocessing.Pool / Queue（セマフォを使う）が動かないため、
+multiprocessing.Process と Pipe だけで組む。
+
+各ワーカーは自分で ZIP を開き（open_archive）、親から受け取ったメンバー名を
+1つずつ処理して結果を to_dict() で返す。メンバーの大きさに差があっても、
+処理の終わったワーカーから次のメンバーを渡すので偏りにくい。
+
+ワーカーは forkserver から起動する（START_METHOD）。ハンドラーはレコードをスレッドで並行処理するため、
+スレッドのいるプロセスから fork すると、他のスレッドが持っていたロック（boto3 の接続プール、
+logging、import のロックなど）が子プロセスで解放されずにデッドロックすることがある。
+forkserver はスレッドのないサーバープロセス（fork + exec で起動）から fork するため、この問題がない。
+サーバーで preload_modules を import しておけば、ワーカーの起動はミリ秒単位で済む。
+
+forkserver から起動したワーカーはハンドラーのモジュール状態を持たないため、
+open_archive・scan・initializer とその引数は pickle できるもの（モジュールの関数・functools.partial）にし、
+ハンドラーで作った状態は initializer で渡す。
+multiprocessing はメンバーが複数ある ZIP を処理するときに初めて import する（コールドスタート短縮）。
+"""
+
+import os
+
+# ワーカーの起動方式（'fork' は親の状態をそのまま引き継ぐ。スレッドのないプロセスでのみ使う）
+START_METHOD = 'forkserver'
+
+
+class MemberProcessingError(Exception):
+    """1つ以上のメンバーの処理に失敗した"""
+
+    def __init__(self, message, errors):
+        super().__init__(message)
+        self.errors = errors
+
+
+def default_workers():
+    """
+    このプロセスから見える CPU 数
+
+    Lambda ではメモリ設定によらず 2 以上を返すことがある（使える CPU 時間はメモリ設定に比例するため、
+    小さいメモリ設定ではワーカーを増やしても速くならない）。
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def process_members(open_archive, names, scan, load, workers,
+                    initializer=None, initargs=(), preload_modules=()):
+    """
+    ZIP メンバーを並列に処理する
+
+    Args:
+        open_archive (callable): open_archive() -> zipfile.ZipFile（各ワーカーで呼ばれる）
+        names (list): 処理するメンバー名
+        scan (callable): scan(member_stream, name) -> to_dict() を持つ途中集計
+        load (callable): load(dict) -> 途中集計（to_dict() の逆変換）
+        workers (int): プロセス数の上限（1 以下またはメンバーが1つなら同じプロセスで処理）
+        initializer (callable): ワーカーの開始時に initializer(*initargs) を呼ぶ（同じプロセスで処理する場合は呼ばない）
+        preload_modules (tuple): forkserver で先に import しておくモジュール名（preload() 参照）
+
+    Returns:
+        list: names と同じ順の途中集計
+
+    Raises:
+        MemberProcessingError: 処理に失敗したメンバーがある場合
+    """
+    workers = min(workers, len(names))
+    if workers <= 1:
+        with open_archive() as archive:
+            results = []
+            for name in names:
+                with archive.open(name) as member:
+                    results.append(scan(member, name))
+            return results
+
+    multiprocessing, wait = preload(preload_modules)
+    context = multiprocessing.get_context(START_METHOD)
+    queue = list(reversed(names))
+    assigned = {}
+    processes = []
+    results = {}
+    errors = {}
+
+    for _ in range(workers):
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(target=_worker, args=(child_conn, open_archive, scan, initializer, initargs),
+                                  daemon=True)
+        process.start()
+        child_conn.close()
+        processes.append(process)
+        name = queue.pop()
+        parent_conn.send(name)
+        assigned[parent_conn] = name
+
+    try:
+        while assigned:
+            for conn in wait(list(assigned)):
+                name = assigned[conn]
+                try:
+                    status, payload = conn.recv()
+                except EOFError:
+                    # ワーカーが異常終了した（メモリ不足で kill された場合など）
+                    errors[name] = "Worker exited unexpectedly"
+                    del assigned[conn]
+                    conn.close()
+                    continue
+
+                if status == 'ok':
+                    results[name] = payload
+                else:
+                    errors[name] = payload
+
+                if queue and status == 'ok':
+                    name = queue.pop()
+                    conn.send(name)
+                    assigned[conn] = name
+                else:
+                    conn.send(None)
+                    del assigned[conn]
+                    conn.close()
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+    # 失敗したワーカーに割り当てられるはずだったメンバー
+    for name in queue:
+        errors.setdefault(name, "Not processed")
+    if errors:
+        details = '; '.join(f"{name}: {error.splitlines()[-1]}" for name, error in errors.items())
+        raise MemberProcessingError(f"{len(errors)} of {len(names)} members failed ({details})", errors)
+    return [load(results[name]) for name in names]
+
+
+def preload(modules=()):
+    """
+    並列処理に使うモジュールを import し、forkserver を起動する（warm-up で先に呼んでおける）
+
+    forkserver はプロセスで最初に使う時に起動し、その時の modules をサーバーで import する
+    （起動後に呼んだ場合の modules は無視される）。
+
+    Args:
+        modules (tuple): forkserver で import しておくモジュール名（ワーカーに渡す関数のモジュール）
+
+    Returns:
+        tuple: (multiprocessing, multiprocessing.connection.wait)
+    """
+    import traceback  # noqa: F401  ワーカーでのエラー報告用（fork 前に読み込んでおく）
+    import multiprocessing
+    from multiprocessing.connection import wait
+    if START_METHOD == 'forkserver':
+        from multiprocessing import forkserver
+        if modules:
+            multiprocessing.get_context('forkserver').set_forkserver_preload(list(modules))
+        forkserver.ensure_running()
+    return multiprocessing, wait
+
+
+def _worker(conn, open_archive, scan, initializer=None, initargs=()):
+    """ワーカープロセス: 受け取ったメンバー名を None が来るまで処理"""
+    import traceback
+
+    try:
+        if initializer is not None:
+            initializer(*initargs)
+        with open_archive() as archive:
+            while True:
+                name = conn.recv()
+                if name is None:
+                    break
+                try:
+                    with archive.open(name) as member:
+                        conn.send(('ok', scan(member, name).to_dict()))
+                except Exception:
+                    conn.send(('error', traceback.format_exc()))
+                    # 以降のメンバーは他のワーカーに任せる
+                    conn.recv()
+                    break
+    except Exception:
+        try:
+            conn.send(('error', traceback.format_exc()))
+            conn.recv()
+        except (EOFError, OSError):
+            pass
+    finally:
+        conn.close()
@@ -0,0 +1,179 @@
+"""
+呼び出し単位のメトリクス（CloudWatch Embedded Metric Format）
+
+処理段階（download / extract / parse / save / export）ごとの所要時間と、
+読み込んだバイト数・行数・DynamoDB のリクエスト数などのカウンタを1回の呼び出し分ためて、
+最後に EMF の JSON を1行だけ出力する。CloudWatch Logs がこの行からメトリクスを作るため、
+PutMetricData の API 呼び出しは不要。
+
+段階の計測は span() で囲んだ範囲と、reader() で包んだストリームの read の時間で行う。
+入れ子になった段階は内側の時間を外側から差し引く（stream 取り込みでは
+S3 からの読み込みが解凍の中で、解凍が CSV 解析の中で行われる）。
+計測は関数の呼び出しとチャンク（STREAM_CHUNK_SIZE）単位の read だけで、行ごとの処理には入らない。
+"""
+
+import io
+import sys
+import json
+import time
+import threading
+import contextlib
+
+STAGES = ('download', 'extract', 'parse', 'save', 'export')
+
+# カウンタ名 → (EMF のメトリクス名, 単位)
+COUNTERS = {
+    'records': ('Records', 'Count'),
+    'failed_records': ('FailedRecords', 'Count'),
+    'duplicate_records': ('DuplicateRecords', 'Count'),
+    'continued_records': ('ContinuedRecords', 'Count'),
+    'bytes_in': ('BytesIn', 'Bytes'),
+    'csv_bytes': ('CsvBytes', 'Bytes'),
+    'rows_scanned': ('RowsScanned', 'Count'),
+    'rows_kept': ('RowsKept', 'Count'),
+    'anomalous_hours': ('AnomalousHours', 'Count'),
+    'baseline_failures': ('BaselineFailures', 'Count'),
+    'export_failures': ('ExportFailures', 'Count'),
+    'dynamodb_items': ('DynamoDBItems', 'Count'),
+    'dynamodb_requests': ('DynamoDBRequests', 'Count'),
+    'dynamodb_retries': ('DynamoDBRetries', 'Count'),
+    'dynamodb_throttles': ('DynamoDBThrottles', 'Count'),
+}
+
+# 入れ子の段階を差し引くためのスレッドごとのスタック（Metrics インスタンスをまたいで共有）
+_spans = threading.local()
+
+
+class Metrics:
+    """
+    段階別の所要時間とカウンタ
+
+    スレッドセーフ。to_dict() / from_dict() / merge() で
+    ワーカープロセスの計測値を呼び出し全体に合算できる。
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """stage の処理を囲む（内側の別の段階の時間は含めない）"""
+        stack = _spans.__dict__.setdefault('stack', [])
+        start = self.clock()
+        stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - start
+            inner = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self.lock:
+                self.seconds[stage] += elapsed - inner
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def reader(self, stream, stage, counter=None):
+        """read の時間を stage に、読んだバイト数を counter に計上するストリーム"""
+        return TimedReader(stream, self, stage, counter)
+
+    def merge(self, other):
+        """他の計測値（Metrics または to_dict() の dict）を合算する"""
+        data = other if isinstance(other, dict) else other.to_dict()
+        with self.lock:
+            for stage, seconds in data['seconds'].items():
+                self.seconds[stage] += seconds
+            for name, value in data['counters'].items():
+                self.counters[name] += value
+        return self
+
+    def to_dict(self):
+        with self.lock:
+            return {'seconds': dict(self.seconds), 'counters': dict(self.counters)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls().merge(data)
+
+    def to_emf(self, namespace, dimensions, timestamp=None, properties=None):
+        """
+        EMF のドキュメント
+
+        Args:
+            namespace (str): CloudWatch の名前空間
+            dimensions (dict): ディメンション名 → 値
+            timestamp (float): UNIX 時刻（秒、None は現在時刻）
+            properties (dict): メトリクスにしない追加の項目（リクエストIDなど）
+
+        Returns:
+            dict: 時間は {段階}Time（ミリ秒）、Duration（呼び出し全体）、
+                  RowsPerSecond（RowsScanned / Duration）と COUNTERS のメトリクス
+        """
+        duration = self.clock() - self.started
+        data = self.to_dict()
+        values = {f"{stage.capitalize()}Time": round(seconds * 1000, 3)
+                  for stage, seconds in data['seconds'].items()}
+        units = dict.fromkeys(values, 'Milliseconds')
+        values['Duration'] = round(duration * 1000, 3)
+        units['Duration'] = 'Milliseconds'
+        for name, (metric, unit) in COUNTERS.items():
+            values[metric] = data['counters'][name]
+            units[metric] = unit
+        values['RowsPerSecond'] = round(data['counters']['rows_scanned'] / duration, 1) if duration > 0 else 0
+        units['RowsPerSecond'] = 'Count/Second'
+
+        return {
+            '_aws': {
+                'Timestamp': int((time.time() if timestamp is None else timestamp) * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [sorted(dimensions)],
+                    'Metrics': [{'Name': name, 'Unit': units[name]} for name in values],
+                }],
+            },
+            **dimensions,
+            **(properties or {}),
+            **values,
+        }
+
+    def emit(self, namespace, dimensions, properties=None, out=None):
+        """EMF の JSON を1行出力する（out を省略すると標準出力 = CloudWatch Logs）"""
+        line = json.dumps(self.to_emf(namespace, dimensions, properties=properties),
+                          separators=(',', ':'))
+        print(line, file=out or sys.stdout, flush=True)
+        return line
+
+
+class TimedReader(io.RawIOBase):
+    """read / readinto の時間とバイト数を Metrics に計上する読み込みストリーム"""
+
+    def __init__(self, stream, metrics, stage, counter=None):
+        self.stream = stream
+        self.metrics = metrics
+        self.stage = stage
+        self.counter = counter
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        with self.metrics.span(self.stage):
+            data = self.stream.read() if size is None or size < 0 else self.stream.read(size)
+        if self.counter:
+            self.metrics.add(self.counter, len(data))
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.stream.close()
+        super().close()
@@ -0,0 +1,138 @@
+"""
+CSV 1ファイル（ZIP のメンバー1つ）分の途中集計
+
+集計カウンタ（aggregation.Aggregator）と THREAT 行の追跡器
+（heavy_hitters.HeavyHitters / hyperloglog.HourlyDistinct）、集計ルールの件数
+（filter_rules.RuleCounts）、Message のテンプレート別の件数（templates.TemplateCounts）、スキャンの計測値
+（metrics.Metrics）をまとめて持ち、merge() で合算、to_dict() / from_dict() でプロセス間の受け渡しや保存ができる。
+時間予算で読み込みを打ち切った途中集計は resume_offset（再開位置）を持ち、
+保存した途中集計に続きを数えると、打ち切らずに読んだ場合と同じ集計になる（checkpoint.py）。
+"""
+
+from aggregation import Aggregator
+from filter_rules import RuleCounts
+from heavy_hitters import HeavyHitters
+from hyperloglog import HourlyDistinct
+from metrics import Metrics
+from templates import TemplateCounts
+
+
+class PartialAggregate:
+    """
+    途中集計
+
+    Attributes:
+        log_date (str): 最初の行の日付（データ行がなければ None）
+        hostname (str): 最初の行のホスト名（データ行がなければ None）
+        aggregator (Aggregator): 時間 × Severity (× AppName) のカウンタ
+        heavy_hitters (HeavyHitters): THREAT 行の上位追跡（無効の場合は None）
+        distinct_sources (HourlyDistinct): THREAT 行の送信元IPのユニーク数（無効の場合は None）
+        rule_counts (RuleCounts): 行ごとに評価した集計ルールの件数（ルールがない場合は None）
+        template_counts (TemplateCounts): Message のテンプレート別の件数（無効の場合は None）
+        metrics (Metrics): 解凍・解析の所要時間と読み込んだバイト数
+            （ワーカープロセスで計測した値をハンドラーに返すために持つ）
+        name (str): ZIP のメンバー名
+        resume_offset (int): 読み込みを打ち切った位置（解凍後のバイトオフセット、読み終えていれば None）
+        header_end (int): ヘッダー行の終わりの位置（再開時に使う）
+    """
+
+    def __init__(self, aggregator, log_date=None, hostname=None,
+                 heavy_hitters=None, distinct_sources=None, metrics=None,
+                 name=None, resume_offset=None, header_end=None, rule_counts=None,
+                 template_counts=None):
+        self.aggregator = aggregator
+        self.log_date = log_date
+        self.hostname = hostname
+        self.heavy_hitters = heavy_hitters
+        self.distinct_sources = distinct_sources
+        self.rule_counts = rule_counts
+        self.template_counts = template_counts
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.name = name
+        self.resume_offset = resume_offset
+        self.header_end = header_end
+
+    def complete(self):
+        """メンバーを最後まで読んだか"""
+        return self.resume_offset is None
+
+    def group_key(self):
+        """同じ日次データとして合算する単位"""
+        return (self.log_date, self.hostname)
+
+    def merge(self, other):
+        """他の途中集計を合算する（追跡器は片方にしかなければそのまま引き継ぐ）"""
+        self.aggregator.merge(other.aggregator)
+        self.metrics.merge(other.metrics)
+        if self.log_date is None:
+            self.log_date, self.hostname = other.log_date, other.hostname
+        for name in ('heavy_hitters', 'distinct_sources', 'rule_counts', 'template_counts'):
+            mine, theirs = getattr(self, name), getattr(other, name)
+            if theirs is None:
+                continue
+            if mine is None:
+                setattr(self, name, theirs)
+            else:
+                mine.merge(theirs)
+        return self
+
+    def to_dict(self):
+        return {
+            'log_date': self.log_date,
+            'hostname': self.hostname,
+            'aggregator': self.aggregator.to_dict(),
+            'heavy_hitters': self.heavy_hitters.to_dict() if self.heavy_hitters else None,
+            'distinct_sources': self.distinct_sources.to_dict() if self.distinct_sources else None,
+            'rule_counts': self.rule_counts.to_dict() if self.rule_counts else None,
+            'template_counts': self.template_counts.to_dict() if self.template_counts else None,
+            'metrics': self.metrics.to_dict(),
+            'name': self.name,
+            'resume_offset': self.resume_offset,
+            'header_end': self.header_end,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            Aggregator.from_dict(data['aggregator']),
+            log_date=data['log_date'],
+            hostname=data['hostname'],
+            heavy_hitters=(HeavyHitters.from_dict(data['heavy_hitters'])
+                           if data.get('heavy_hitters') else None),
+            distinct_sources=(HourlyDistinct.from_dict(data['distinct_sources'])
+                              if data.get('distinct_sources') else None),
+            rule_counts=RuleCounts.from_dict(data['rule_counts']) if data.get('rule_counts') else None,
+            template_counts=(TemplateCounts.from_dict(data['template_counts'])
+                             if data.get('template_counts') else None),
+            metrics=Metrics.from_dict(data['metrics']) if data.get('metrics') else None,
+            name=data.get('name'),
+            resume_offset=data.get('resume_offset'),
+            header_end=data.get('header_end'),
+        )
+
+
+def merge_partials(partials):
+    """
+    途中集計を (log_date, hostname) ごとに合算する
+
+    1つの ZIP に複数ホスト・複数日の CSV がまとめられていても、
+    ホスト・日付ごとに別の集計結果になる。データ行のない途中集計は
+    他に集計結果があればそのいずれにも含めない。
+
+    Returns:
+        list: PartialAggregate（最初に現れた順）
+    """
+    groups = {}
+    empty = None
+    for partial in partials:
+        if partial.log_date is None:
+            empty = partial if empty is None else empty.merge(partial)
+            continue
+        key = partial.group_key()
+        if key in groups:
+            groups[key].merge(partial)
+        else:
+            groups[key] = partial
+    if not groups and empty is not None:
+        return [empty]
+    return list(groups.values())
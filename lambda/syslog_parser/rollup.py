@@ -0,0 +1,451 @@
+"""
+日次JSONのインクリメンタル更新
+
+S3 上の日次JSONを読み、今回のファイルの時間別カウントだけを差し替えて書き戻す。
+書き戻しは ETag 条件付き PUT（IfMatch / 新規作成時は IfNoneMatch='*'）で行い、
+他の書き込みと競合した場合は最新の内容を読み直してマージし直す。
+
+DynamoDB から日全体を読み直す必要がないため、1ファイルあたりのコストは
+その日にすでに保存済みの時間数に依存しない。時間ごとの値は上書きなので、
+同じファイルを再処理しても結果は変わらない。
+
+日次JSONを更新したら、その日を含む週・月のロールアップ（日ごとの要約）と、
+公開中の JSON とその内容のハッシュの一覧（マニフェスト）も同じ方法で更新する。
+マージした JSON には更新のたびに1増える revision を付け、ロールアップとマニフェストは
+revision の大きい方を残す（並行して処理したファイルの古い要約で上書きしないため）。
+ダッシュボードは1か月分を1ファイルで取得でき、ハッシュが変わらない JSON は取得し直さない。
+JSON は空白なしで出力し、compress=True なら gzip 圧縮する（ContentEncoding: gzip で配信）。
+"""
+
+import gzip
+import json
+import time
+import random
+import hashlib
+from datetime import date
+
+from aws_errors import error_code
+from heavy_hitters import top_view, merge_views
+from hyperloglog import merge_sketches
+
+# 条件付き PUT の競合とみなすエラーコード
+CONFLICT_ERROR_CODES = ('PreconditionFailed', 'ConditionalRequestConflict')
+# オブジェクトが存在しない
+NOT_FOUND_ERROR_CODES = ('NoSuchKey', '404', 'NotFound')
+
+# ロールアップの期間 → その期間の名前（"2025-W18" / "2025-04"）を日付から求める関数
+PERIODS = {
+    'weekly': lambda day: '{0}-W{1:02d}'.format(*day.isocalendar()),
+    'monthly': lambda day: f"{day:%Y-%m}",
+}
+# マニフェストの日次JSONの一覧のキー
+DAILY = 'daily'
+# マニフェストに載せるハッシュの桁数（SHA-256 の16進の先頭）
+HASH_LENGTH = 16
+
+
+# parse_csv() の多次元集計 → 日次JSONのキー
+STATS_KEYS = (
+    ('severity_stats', 'severities'),
+    ('minute_stats', 'minutes'),
+    ('app_stats', 'apps'),
+    ('rule_stats', 'rules'),
+    ('template_stats', 'templates'),
+    ('anomaly_stats', 'anomaly'),
+)
+
+
+class RollupConflictError(Exception):
+    """リトライ上限まで競合が続き、更新できなかった"""
+
+
+def update_json_document(s3_client, bucket, key, merge, max_retries=10,
+                         base_delay=0.05, max_delay=1.0, sleep=time.sleep, rand=random.random,
+                         compress=False, put_args=None):
+    """
+    S3 上の JSON を読み取り → マージ → ETag 条件付きで書き戻す
+
+    Args:
+        s3_client: boto3 S3 クライアント
+        bucket (str): バケット名
+        key (str): オブジェクトキー
+        merge (callable): merge(current_doc or None) -> new_doc
+            競合時は最新の内容で再度呼ばれるため、副作用を持たないこと
+        compress (bool): gzip 圧縮して ContentEncoding: gzip で書き込む
+        put_args (dict): put_object に追加で渡す引数（CacheControl など）
+        max_retries (int): 競合時の再試行回数の上限
+        base_delay, max_delay (float): ジッター付き指数バックオフ（秒）
+        sleep, rand: テスト用に差し替え可能な待機関数・乱数関数
+
+    Returns:
+        tuple: (new_doc, conflicts)
+
+    Raises:
+        RollupConflictError: リトライ上限まで競合が続いた場合
+    """
+    conflicts = 0
+    for attempt in range(max_retries + 1):
+        current, etag = read_json_document(s3_client, bucket, key)
+        doc = merge(current)
+
+        condition = {'IfMatch': etag} if etag is not None else {'IfNoneMatch': '*'}
+        try:
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=key,
+                **json_object(doc, compress),
+                **(put_args or {}),
+                **condition
+            )
+            return doc, conflicts
+        except Exception as e:
+            if error_code(e) not in CONFLICT_ERROR_CODES:
+                raise
+            conflicts += 1
+            sleep(rand() * min(max_delay, base_delay * (2 ** attempt)))
+
+    raise RollupConflictError(f"Gave up updating s3://{bucket}/{key} after {conflicts} conflicts")
+
+
+def read_json_document(s3_client, bucket, key):
+    """
+    S3 上の JSON と ETag を取得
+
+    Returns:
+        tuple: (doc, etag)  存在しない場合は (None, None)
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        if error_code(e) in NOT_FOUND_ERROR_CODES:
+            return None, None
+        raise
+    body = response['Body']
+    try:
+        return decode_document(body.read()), response['ETag']
+    finally:
+        body.close()
+
+
+def encode_document(doc, compress=False):
+    """
+    JSON を空白なしの UTF-8 にする（compress=True なら gzip 圧縮）
+
+    gzip のヘッダーの時刻は 0 に固定するため、同じ内容なら同じバイト列になる。
+    """
+    data = json.dumps(doc, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if compress:
+        data = gzip.compress(data, compresslevel=9, mtime=0)
+    return data
+
+
+def decode_document(data):
+    """encode_document() の逆（gzip 圧縮・インデント付きの旧形式も読める）"""
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    return json.loads(data)
+
+
+def json_object(doc, compress=False):
+    """put_object の Body / ContentType（/ ContentEncoding）"""
+    args = {'Body': encode_document(doc, compress), 'ContentType': 'application/json'}
+    if compress:
+        args['ContentEncoding'] = 'gzip'
+    return args
+
+
+def content_hash(doc):
+    """JSON の内容のハッシュ（圧縮の有無によらない）"""
+    return hashlib.sha256(encode_document(doc)).hexdigest()[:HASH_LENGTH]
+
+
+def hourly_entries(stats, top_n=10):
+    """
+    parse_csv() の返り値を日次JSONの hourly_stats 形式に変換
+
+    CRITICAL/WARNING が0件でも、他の Severity の行がある時間は含める。
+    ヘビーヒッターの要約は上位 top_n 個に絞る。
+
+    Returns:
+        dict: {'10:00': {'hour': '10:00', 'critical': 15, 'warning': 43, 'total': 58,
+                         'severities': {...}, 'minutes': {...}, 'apps': {...}, 'rules': {...},
+                         'templates': {...}, 'anomaly': {...},
+                         'heavy_hitters': {...}, 'distinct_src_ips': 87, 'src_ip_sketch': {...}}, ...}
+              severities / minutes / apps / rules / templates / anomaly / heavy_hitters / distinct_src_ips は
+              集計したもののみ
+    """
+    hourly_stats = stats['hourly_stats']
+    optional = [(key, stats[name]) for name, key in STATS_KEYS if name in stats]
+    hours = set(hourly_stats).union(*(values for _, values in optional))
+
+    entries = {}
+    for hour in sorted(hours):
+        counts = hourly_stats.get(hour, {})
+        critical = counts.get('CRITICAL', 0)
+        warning = counts.get('WARNING', 0)
+        entry = {
+            'hour': hour,
+            'critical': critical,
+            'warning': warning,
+            'total': critical + warning,
+        }
+        for key, values in optional:
+            entry[key] = values.get(hour, {})
+        if hour in stats.get('heavy_hitters', {}):
+            entry['heavy_hitters'] = top_view(stats['heavy_hitters'][hour], top_n)
+        if hour in stats.get('distinct_sources', {}):
+            entry.update(distinct_entry(stats['distinct_sources'][hour]))
+        entries[hour] = entry
+    return entries
+
+
+def merge_daily(current, log_date, hostname, processed_at, entries):
+    """
+    1ホスト分の日次JSONに今回の時間別カウントを反映
+
+    Args:
+        current (dict | None): 既存の日次JSON
+        entries (dict): hourly_entries() の返り値
+
+    Returns:
+        dict: export_to_s3_json() の JSON フォーマット
+    """
+    hours = {h['hour']: h for h in (current or {}).get('hourly_stats', [])}
+    hours.update(entries)
+    hourly_list = [hours[hour] for hour in sorted(hours)]
+
+    return {
+        'log_date': log_date,
+        'hostname': hostname,
+        'processed_at': processed_at,
+        'revision': next_revision(current),
+        'total_hours': len(hourly_list),
+        'hourly_stats': hourly_list,
+        **daily_distinct(hourly_list),
+    }
+
+
+def merge_fleet(current, log_date, fleet_hostname, hostname, processed_at, entries, top_n=10):
+    """
+    フリート全体の日次JSONに1ホスト分の時間別カウントを反映
+
+    各時間の by_host にホスト別の値（CRITICAL/WARNING と Severity 別・集計ルール別・テンプレート別の件数）を持ち、
+    合計はそこから計算し直す。ヘビーヒッターはホスト別の要約を合算して上位 top_n 個に絞る。
+    分単位・AppName 別の内訳はホスト別JSONにのみ出力する。
+    同じホスト・時間の値は置き換えなので、再処理しても二重計上されない。
+
+    Returns:
+        dict: フリート全体の JSON フォーマット（hostname は fleet_hostname）
+    """
+    hours = {h['hour']: h for h in (current or {}).get('hourly_stats', [])}
+
+    for hour, entry in entries.items():
+        by_host = dict(hours.get(hour, {}).get('by_host', {}))
+        contribution = {
+            'critical': entry['critical'],
+            'warning': entry['warning'],
+            'total': entry['total'],
+        }
+        for key in ('severities', 'rules', 'templates', 'anomaly', 'heavy_hitters', 'src_ip_sketch'):
+            if key in entry:
+                contribution[key] = entry[key]
+        by_host[hostname] = contribution
+
+        merged = {
+            'hour': hour,
+            'critical': sum(c['critical'] for c in by_host.values()),
+            'warning': sum(c['warning'] for c in by_host.values()),
+            'total': sum(c['total'] for c in by_host.values()),
+            'hosts': len(by_host),
+        }
+        for key in ('severities', 'rules', 'templates'):
+            totals = sum_counts(c.get(key, {}) for c in by_host.values())
+            if totals:
+                merged[key] = totals
+        summaries = [c['heavy_hitters'] for c in by_host.values() if 'heavy_hitters' in c]
+        if summaries:
+            merged['heavy_hitters'] = merge_views(summaries, top_n)
+        sketches = [c['src_ip_sketch'] for c in by_host.values() if 'src_ip_sketch' in c]
+        if sketches:
+            merged.update(distinct_entry(merge_sketches(sketches)))
+        merged['by_host'] = by_host
+        hours[hour] = merged
+
+    hourly_list = [hours[hour] for hour in sorted(hours)]
+    hosts = sorted({host for h in hourly_list for host in h.get('by_host', {})})
+
+    return {
+        'log_date': log_date,
+        'hostname': fleet_hostname,
+        'processed_at': processed_at,
+        'revision': next_revision(current),
+        'hosts': hosts,
+        'total_hours': len(hourly_list),
+        'hourly_stats': hourly_list,
+        **daily_distinct(hourly_list),
+    }
+
+
+def next_revision(current):
+    """マージ後の JSON の revision（EXPORT_MODE=query で作り直した JSON など、ないものは 0 とみなす）"""
+    return (current or {}).get('revision', 0) + 1
+
+
+def day_summary(doc):
+    """
+    日次JSONを週・月のロールアップに載せる1日分の要約にする
+
+    Returns:
+        dict: {'log_date': '2025-04-28', 'revision': 3, 'critical': 360, 'warning': 1032, 'total': 1392,
+               'hours': 24, 'hourly_critical': [...24件...], 'hourly_warning': [...24件...],
+               'severities': {...}, 'rules': {...}, 'templates': {...}, 'distinct_src_ips': 1520, 'hosts': 3}
+              severities / rules / templates / distinct_src_ips / hosts は日次JSONにあるもののみ
+    """
+    critical = [0] * 24
+    warning = [0] * 24
+    for entry in doc['hourly_stats']:
+        hour = int(entry['hour'][:2])
+        critical[hour] = entry['critical']
+        warning[hour] = entry['warning']
+    severities = sum_counts(entry.get('severities', {}) for entry in doc['hourly_stats'])
+    rules = sum_counts(entry.get('rules', {}) for entry in doc['hourly_stats'])
+    templates = sum_counts(entry.get('templates', {}) for entry in doc['hourly_stats'])
+    summary = {
+        'log_date': doc['log_date'],
+        'revision': doc.get('revision', 0),
+        'critical': sum(critical),
+        'warning': sum(warning),
+        'total': sum(critical) + sum(warning),
+        'hours': len(doc['hourly_stats']),
+        'hourly_critical': critical,
+        'hourly_warning': warning,
+    }
+    if severities:
+        summary['severities'] = severities
+    if rules:
+        summary['rules'] = rules
+    if templates:
+        summary['templates'] = templates
+    if 'distinct_src_ips' in doc:
+        summary['distinct_src_ips'] = doc['distinct_src_ips']
+    if 'hosts' in doc:
+        summary['hosts'] = len(doc['hosts'])
+    return summary
+
+
+def sum_counts(counts_list):
+    """名前 → 件数 の dict を名前ごとに合計する"""
+    totals = {}
+    for counts in counts_list:
+        for name, count in counts.items():
+            totals[name] = totals.get(name, 0) + count
+    return totals
+
+
+def parse_periods(text):
+    """
+    "weekly,monthly" 形式の文字列からロールアップの期間の一覧を作る（環境変数 ROLLUP_PERIODS 用）
+
+    Raises:
+        ValueError: 未知の期間
+    """
+    names = [name.strip() for name in (text or '').split(',') if name.strip()]
+    unknown = set(names) - set(PERIODS)
+    if unknown:
+        raise ValueError(f"Unknown rollup period: {', '.join(sorted(unknown))}")
+    return [name for name in PERIODS if name in names]
+
+
+def period_name(resolution, log_date):
+    """log_date（YYYY-MM-DD）を含む期間の名前（PERIODS）"""
+    return PERIODS[resolution](date.fromisoformat(log_date))
+
+
+def merge_period(current, resolution, period, hostname, processed_at, summary, sketch=None):
+    """
+    週・月のロールアップに1日分の要約を反映
+
+    同じ日の要約は置き換えなので、再処理しても二重計上されない。
+    すでにある要約の方が revision が大きければ（新しい日次JSONから作られていれば）そちらを残す。
+    送信元IPのユニーク数は日のスケッチを合算した期間全体の推定値
+    （スケッチの合算は最大値をとるため、同じ日を再処理しても増えない）。
+
+    Args:
+        current (dict | None): 既存のロールアップ
+        resolution (str): 'weekly' / 'monthly'
+        period (str): period_name() の値
+        summary (dict): day_summary() の返り値
+        sketch (dict): その日の送信元IPのスケッチ（日次JSONの src_ip_sketch）
+
+    Returns:
+        dict: {'resolution': 'monthly', 'period': '2025-04', 'hostname': ..., 'processed_at': ...,
+               'total_days': 2, 'critical': ..., 'warning': ..., 'total': ...,
+               'daily_stats': [day_summary(), ...], 'distinct_src_ips': ..., 'src_ip_sketch': {...}}
+    """
+    days = {d['log_date']: d for d in (current or {}).get('daily_stats', [])}
+    existing = days.get(summary['log_date'])
+    if existing is None or existing.get('revision', 0) <= summary['revision']:
+        days[summary['log_date']] = summary
+    daily_list = [days[day] for day in sorted(days)]
+
+    doc = {
+        'resolution': resolution,
+        'period': period,
+        'hostname': hostname,
+        'processed_at': processed_at,
+        'revision': next_revision(current),
+        'total_days': len(daily_list),
+        'critical': sum(d['critical'] for d in daily_list),
+        'warning': sum(d['warning'] for d in daily_list),
+        'total': sum(d['total'] for d in daily_list),
+        'daily_stats': daily_list,
+    }
+    sketches = [s for s in ((current or {}).get('src_ip_sketch'), sketch) if s]
+    if sketches:
+        doc.update(distinct_entry(merge_sketches(sketches)))
+    return doc
+
+
+def manifest_entry(doc):
+    """マニフェストに載せる JSON の内容のハッシュと revision"""
+    return {'hash': content_hash(doc), 'revision': doc.get('revision', 0)}
+
+
+def merge_manifest(current, processed_at, entries):
+    """
+    マニフェストに公開中の JSON のハッシュを反映（revision の大きい方を残す）
+
+    Args:
+        entries (dict): {(DAILY / 'weekly' / 'monthly', '2025-04-28' などの名前): manifest_entry()}
+
+    Returns:
+        dict: {'processed_at': ..., 'revision': ...,
+               'daily': {'2025-04-28': {'hash': 'ab12...', 'revision': 3}, ...},
+               'weekly': {'2025-W18': {...}}, 'monthly': {'2025-04': {...}}}
+              （名前の昇順。ダッシュボードは日付・期間の一覧としても使う）
+    """
+    doc = {'processed_at': processed_at, 'revision': next_revision(current)}
+    for section in (DAILY, *PERIODS):
+        merged = dict((current or {}).get(section, {}))
+        for (kind, name), entry in entries.items():
+            existing = merged.get(name)
+            if kind == section and (existing is None or existing['revision'] <= entry['revision']):
+                merged[name] = entry
+        doc[section] = dict(sorted(merged.items()))
+    return doc
+
+
+def distinct_entry(sketch):
+    """時間別エントリに付ける送信元IPのユニーク数とスケッチ"""
+    return {'distinct_src_ips': sketch['estimate'], 'src_ip_sketch': sketch}
+
+
+def daily_distinct(hourly_list):
+    """
+    時間別スケッチを合算した日全体の送信元IPのユニーク数
+
+    Returns:
+        dict: {'distinct_src_ips': 1520, 'src_ip_sketch': {...}}（スケッチがなければ空）
+    """
+    sketch = merge_sketches(h['src_ip_sketch'] for h in hourly_list if 'src_ip_sketch' in h)
+    return distinct_entry(sketch) if sketch is not None else {}
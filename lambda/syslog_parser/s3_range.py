@@ -0,0 +1,93 @@
+"""
+S3 オブジェクトをシーク可能なファイルとして読む
+
+zipfile.ZipFile は末尾のセントラルディレクトリを読んでから各メンバーへシークするため、
+レンジ GET でランダムアクセスできれば /tmp にダウンロードせずに任意のメンバーを開ける。
+複数プロセスがそれぞれ別のメンバーを並行して展開する場合に使う。
+
+読み込みは io.BufferedReader（buffer_size ごとのレンジ GET）を通して行い、
+途中でオブジェクトが置き換えられた場合に備えて ETag を IfMatch で固定する。
+"""
+
+import io
+
+# 1回のレンジ GET で読む大きさ
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    レンジ GET によるシーク可能な読み込み専用ストリーム
+
+    Args:
+        client: boto3 S3 クライアント
+        bucket (str): バケット名
+        key (str): オブジェクトキー
+        size (int): オブジェクトサイズ（None の場合は head_object で取得）
+        etag (str): 読み込み中に固定する ETag（None の場合は head_object で取得）
+    """
+
+    def __init__(self, client, bucket, key, size=None, etag=None):
+        super().__init__()
+        if size is None or etag is None:
+            head = client.head_object(Bucket=bucket, Key=key)
+            size, etag = head['ContentLength'], head['ETag']
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.position = 0
+        self.requests = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError("Negative seek position")
+        self.position = position
+        return position
+
+    def readinto(self, buffer):
+        if self.position >= self.size or not len(buffer):
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self.key,
+            Range=f'bytes={self.position}-{end}', IfMatch=self.etag)
+        body = response['Body']
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        self.requests += 1
+        n = len(data)
+        buffer[:n] = data
+        self.position += n
+        return n
+
+
+def open_s3_object(client, bucket, key, size=None, etag=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    S3 オブジェクトをバッファ付きのシーク可能なストリームとして開く
+
+    Returns:
+        io.BufferedReader
+    """
+    return io.BufferedReader(S3RangeReader(client, bucket, key, size, etag),
+                             buffer_size=buffer_size)
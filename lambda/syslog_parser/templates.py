@@ -0,0 +1,181 @@
+"""
+Message のテンプレート（イベント種別）ごとの時間別件数
+
+Juniper の Message は「イベントタグ + 固定の文 + 可変のパラメータ」の形をしている。
+
+    RT_IDP_ATTACK_LOG: SQL injection attack detected 10.0.1.5/51234 > 203.0.113.7/443 protocol=tcp ...
+
+送信元・宛先（"IP/ポート > IP/ポート"）より前の部分を接頭辞として取り出し、
+数字を含む単語を "<*>" に置き換えてテンプレート名にする（"User 1234 logged in" と "User 99 logged in" は
+同じテンプレート）。
+
+行ごとには接頭辞を切り出さず、Message の先頭 KEY_BYTES バイト（イベントタグと続く固定の文）の
+bytes スライス → テンプレート番号 の辞書（キャッシュ）を集計のループの中で引いて数える
+（Aggregator.consume の templates。行ごとのコストはスライス1回と辞書の検索1回）。
+キャッシュにない先頭の行だけ Message 全体から接頭辞とテンプレート名を求める。
+
+  - 宛先のない Message は最初の "key=value" より前を接頭辞にする
+  - 先頭 KEY_BYTES バイトが同じ Message は、最初に見た行のテンプレートに数える
+    （テンプレートの固定の文が KEY_BYTES バイトより長く、その先だけが違うテンプレートは区別しない）
+  - テンプレートは max_templates 種類まで番号を割り当て、超えた分は OTHER_TEMPLATE にまとめる
+  - キャッシュは CACHE_SIZE 件を超えたら作り直す（可変の部分が先頭に入る短い Message でも大きくならない）
+
+カウンタは merge() で合算（テンプレートの番号は名前で対応付け直す）、to_dict() / from_dict() で JSON 化できる。
+"""
+
+import re
+from operator import itemgetter
+
+from aggregation import HOURS
+
+# max_templates を超えたテンプレートをまとめる名前
+OTHER_TEMPLATE = '(other)'
+# キャッシュのキーにする Message の先頭のバイト数（イベントタグと続く固定の文が入る長さ）
+KEY_BYTES = 32
+# Message の先頭 → テンプレート番号 のキャッシュの上限
+CACHE_SIZE = 4096
+# 可変の部分として "<*>" に置き換える単語（数字を含む）
+VARIABLE_TOKEN = re.compile(rb'[^ ]*[0-9][^ ]*')
+WILDCARD = b'<*>'
+
+
+def message_prefix(message):
+    """
+    テンプレートを決める Message の接頭辞（送信元・宛先やパラメータより前）
+
+    Returns:
+        bytes: b'RT_IDP_ATTACK_LOG: SQL injection attack detected' など
+    """
+    head, sep, _ = message.partition(b' > ')
+    if sep:
+        # "... 10.0.1.5/51234" の送信元を除く
+        return head.rpartition(b' ')[0]
+    i = head.find(b'=')
+    if i >= 0:
+        return head[:max(head.rfind(b' ', 0, i), 0)]
+    return head
+
+
+def template_name(prefix):
+    """接頭辞に残った可変の部分を "<*>" に置き換えたテンプレート名（空なら "<*>"）"""
+    name = VARIABLE_TOKEN.sub(WILDCARD, prefix).decode('utf-8', 'replace').strip()
+    return name or WILDCARD.decode()
+
+
+class TemplateCounts:
+    """
+    テンプレートごとの時間別件数
+
+    カウンタはフラットな整数配列で、index = hour_id * max_templates + template_id
+    （最後の hour_id は解析できないタイムスタンプ用で、集計結果には含めない）。
+
+    Attributes:
+        max_templates (int): テンプレートの種類の上限（OTHER_TEMPLATE を含む）
+        names (list): template_id → テンプレート名
+        ids (dict): テンプレート名 → template_id
+        prefixes (dict): Message の先頭 KEY_BYTES バイト（bytes）→ template_id のキャッシュ
+    """
+
+    def __init__(self, max_templates=64):
+        if max_templates < 2:
+            raise ValueError("max_templates must be at least 2")
+        self.max_templates = max_templates
+        self.names = []
+        self.ids = {}
+        self.prefixes = {}
+        self.counts = [0] * ((HOURS + 1) * max_templates)
+
+    def counter(self, msg_i, message=None):
+        """
+        集計のループの中で数えるための組（Aggregator.consume の templates に渡す）
+
+        Args:
+            msg_i (int): 行の Message の列番号（Message 以降を分割しない行では、Message から始まる残りの要素）
+            message (callable): 行から Message を取り出す関数（CsvScanner.field_getter。
+                None なら行[msg_i] をそのまま使う）。キャッシュにない行でだけ呼ぶ
+
+        Returns:
+            tuple: (列番号, 先頭のバイト数, キャッシュの get, 関数(行) → template_id, カウンタ, max_templates)
+        """
+        if message is None:
+            message = itemgetter(msg_i)
+
+        def add(fields):
+            return self._add_prefix(fields[msg_i][:KEY_BYTES], message(fields))
+
+        return msg_i, KEY_BYTES, self.prefixes.get, add, self.counts, self.max_templates
+
+    def _add_prefix(self, key, message):
+        if len(self.prefixes) >= CACHE_SIZE:
+            self.prefixes.clear()
+        template_id = self._template_id(template_name(message_prefix(message)))
+        self.prefixes[key] = template_id
+        return template_id
+
+    def _template_id(self, name):
+        """テンプレート名に番号を割り当てる（上限を超えたら OTHER_TEMPLATE）"""
+        template_id = self.ids.get(name)
+        if template_id is not None:
+            return template_id
+        if name == OTHER_TEMPLATE or len(self.names) >= self.max_templates - 1:
+            # 上限を超えた名前は覚えない（同じ接頭辞はキャッシュから OTHER_TEMPLATE になる）
+            return self._other_id()
+        self.names.append(name)
+        template_id = len(self.names) - 1
+        self.ids[name] = template_id
+        return template_id
+
+    def _other_id(self):
+        if OTHER_TEMPLATE not in self.names:
+            self.names.append(OTHER_TEMPLATE)
+            self.ids[OTHER_TEMPLATE] = len(self.names) - 1
+        return self.names.index(OTHER_TEMPLATE)
+
+    def hourly_stats(self):
+        """
+        Returns:
+            dict: {'10:00': {'RT_SCREEN_TCP: SYN flood attack detected': 12, ...}, ...}
+                （1件以上あるテンプレート・時間のみ、件数の多い順）
+        """
+        nt = self.max_templates
+        result = {}
+        for hour in range(HOURS):
+            base = hour * nt
+            templates = [(name, self.counts[base + i]) for i, name in enumerate(self.names)
+                         if self.counts[base + i]]
+            if templates:
+                templates.sort(key=lambda item: (-item[1], item[0]))
+                result[f'{hour:02d}:00'] = dict(templates)
+        return result
+
+    def merge(self, other):
+        """他のファイルの件数を合算する（テンプレートの番号は名前で対応付け直す）"""
+        if other.max_templates != self.max_templates:
+            raise ValueError("Cannot merge template counts with different max_templates")
+        remap = [self._template_id(name) for name in other.names]
+        nt = self.max_templates
+        counts = self.counts
+        for block in range(0, len(other.counts), nt):
+            for template_id, target in enumerate(remap):
+                n = other.counts[block + template_id]
+                if n:
+                    counts[block + target] += n
+        return self
+
+    def to_dict(self):
+        """JSON 化できる形に変換（ゼロ以外のカウンタのみ、接頭辞のキャッシュは含めない）"""
+        return {
+            'max_templates': self.max_templates,
+            'names': list(self.names),
+            'counts': {str(i): n for i, n in enumerate(self.counts) if n},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        counts = cls(data['max_templates'])
+        for name in data['names']:
+            counts.names.append(name)
+            counts.ids[name] = len(counts.names) - 1
+        for index, n in data['counts'].items():
+            counts.counts[int(index)] = n
+        return counts
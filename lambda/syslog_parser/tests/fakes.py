@@ -0,0 +1,405 @@
+"""
+ローカルテスト用の AWS フェイク
+
+boto3 を使わずに lambda_function の S3 / DynamoDB 呼び出しを再現する。
+ユニットテストとベンチマーク（benchmarks/）から共通で利用する。
+"""
+
+import io
+import re
+import json
+import hashlib
+import shutil
+import time
+import random
+import threading
+from decimal import Decimal
+from pathlib import Path
+
+from dynamodb_writer import deserialize_item
+
+
+class FakeS3Client:
+    """
+    インメモリ S3 クライアント
+
+    ETag を返し、put_object の条件付き書き込み（IfMatch / IfNoneMatch='*'）に対応する。
+
+    objects: {(bucket, key): bytes}
+    metadata: {(bucket, key): put_object に渡された Body 以外の引数}
+
+    list_prefixes を指定すると、実行ロールの s3:ListBucket がその接頭辞に限られる場合を再現する
+    （接頭辞の外の存在しないキーの get_object は NoSuchKey ではなく AccessDenied になる）。
+    """
+
+    def __init__(self, get_latency=0.0, list_prefixes=None):
+        self.objects = {}
+        self.list_prefixes = list_prefixes
+        self.metadata = {}
+        self.get_latency = get_latency
+        self.lock = threading.Lock()
+        self.conflicts = 0
+        self.get_requests = 0
+
+    @staticmethod
+    def etag(data):
+        return '"' + hashlib.md5(data).hexdigest() + '"'
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        with self.lock:
+            current = self.objects.get((Bucket, Key))
+            if IfNoneMatch == '*' and current is not None:
+                self.conflicts += 1
+                raise FakeClientError('PreconditionFailed', 'At least one of the pre-conditions failed')
+            if IfMatch is not None and (current is None or self.etag(current) != IfMatch):
+                self.conflicts += 1
+                raise FakeClientError('PreconditionFailed', 'At least one of the pre-conditions failed')
+            self.objects[(Bucket, Key)] = Body
+            self.metadata[(Bucket, Key)] = kwargs
+        return {'ETag': self.etag(Body)}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None):
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj.read(), **(ExtraArgs or {}))
+
+    def put_file(self, bucket, key, path):
+        """ローカルファイルをオブジェクトとして登録（テスト準備用）"""
+        with open(path, 'rb') as f:
+            self.objects[(bucket, key)] = f.read()
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        with self.lock:
+            data = self.objects.get((Bucket, Key))
+            self.get_requests += 1
+        if data is None:
+            if self.list_prefixes is not None and not Key.startswith(tuple(self.list_prefixes)):
+                raise FakeClientError('AccessDenied', 'Access Denied')
+            raise FakeClientError('NoSuchKey', 'The specified key does not exist.')
+        etag = self.etag(data)
+        if IfMatch is not None and IfMatch != etag:
+            raise FakeClientError('PreconditionFailed', 'At least one of the pre-conditions failed.')
+        if self.get_latency:
+            time.sleep(self.get_latency)
+        if Range is not None:
+            # "bytes=start-end"（end を含む）
+            start, end = (int(n) for n in Range[len('bytes='):].split('-'))
+            data = data[start:end + 1]
+        return {'Body': io.BytesIO(data), 'ETag': etag, 'ContentLength': len(data)}
+
+    def head_object(self, Bucket, Key):
+        with self.lock:
+            data = self.objects.get((Bucket, Key))
+        if data is None:
+            raise FakeClientError('404', 'Not Found')
+        return {'ETag': self.etag(data), 'ContentLength': len(data)}
+
+    def delete_object(self, Bucket, Key):
+        with self.lock:
+            self.objects.pop((Bucket, Key), None)
+            self.metadata.pop((Bucket, Key), None)
+        return {}
+
+    def download_file(self, Bucket, Key, Filename):
+        body = self.get_object(Bucket=Bucket, Key=Key)['Body']
+        with open(Filename, 'wb') as f:
+            shutil.copyfileobj(body, f)
+
+
+def iam_list_prefixes(path=None):
+    """
+    terraform/iam.tf で s3:ListBucket を許可した接頭辞（FakeS3Client の list_prefixes 用）
+
+    Returns:
+        list: ['data/', ...]（"s3:prefix" 条件の値から末尾の * を除いたもの）
+    """
+    path = path or Path(__file__).resolve().parents[3] / 'terraform' / 'iam.tf'
+    text = Path(path).read_text(encoding='utf-8')
+    prefixes = []
+    for values in re.findall(r'"s3:prefix"\s*=\s*\[(.*?)\]', text, re.DOTALL):
+        prefixes.extend(value.rstrip('*') for value in re.findall(r'"([^"]*)"', values))
+    return prefixes
+
+
+class FakeLambdaClient:
+    """
+    Lambda クライアントのフェイク（invoke の記録のみ）
+
+    invocations: [(FunctionName, InvocationType, Payload を JSON として読んだ値)]
+    """
+
+    def __init__(self):
+        self.invocations = []
+        self.lock = threading.Lock()
+
+    def invoke(self, FunctionName, InvocationType='RequestResponse', Payload=b'{}', **kwargs):
+        with self.lock:
+            self.invocations.append((FunctionName, InvocationType, json.loads(Payload)))
+        return {'StatusCode': 202 if InvocationType == 'Event' else 200}
+
+
+class FakeTable:
+    """
+    インメモリ DynamoDB テーブル（boto3 Table リソース相当）
+
+    Args:
+        key_names (tuple): (パーティションキー名, ソートキー名)
+        page_size (int): query の1ページあたりの件数（None は全件）
+
+    items: {(partition_value, sort_value): item}
+    """
+
+    def __init__(self, key_names=('log_date', 'hour'), page_size=None):
+        self.key_names = key_names
+        self.page_size = page_size
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def key_of(self, item):
+        return tuple(item[name] for name in self.key_names)
+
+    def put_item(self, Item, **kwargs):
+        with self.lock:
+            self.items[self.key_of(Item)] = dict(Item)
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        with self.lock:
+            item = self.items.get(self.key_of(Key))
+        return {'Item': dict(item)} if item is not None else {}
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues,
+              ExclusiveStartKey=None, **kwargs):
+        # "<partition_key> = :placeholder" 形式のみ対応
+        name, placeholder = [part.strip() for part in KeyConditionExpression.split('=')]
+        if name != self.key_names[0]:
+            raise FakeClientError('ValidationException', f'Query key mismatch: {name}')
+        value = ExpressionAttributeValues[placeholder]
+
+        with self.lock:
+            keys = sorted(key for key in self.items if key[0] == value)
+            if ExclusiveStartKey is not None:
+                start = self.key_of(ExclusiveStartKey)
+                keys = [key for key in keys if key > start]
+            page = keys if self.page_size is None else keys[:self.page_size]
+            items = [dict(self.items[key]) for key in page]
+
+        response = {'Items': items, 'Count': len(items)}
+        if len(page) < len(keys):
+            response['LastEvaluatedKey'] = dict(zip(self.key_names, page[-1]))
+        return response
+
+
+class FakeDynamoDBClient:
+    """
+    インメモリ DynamoDB 低レベルクライアント（get_item / put_item / delete_item）
+
+    型付き属性値の項目をそのまま保存し、ConditionExpression の条件付き書き込みに対応する
+    （attribute_exists / attribute_not_exists、比較演算子、AND / OR / NOT、括弧）。
+
+    Args:
+        key_name (str): パーティションキー名
+
+    tables: {table_name: {partition_value: item}}
+    """
+
+    def __init__(self, key_name='object_id'):
+        self.key_name = key_name
+        self.tables = {}
+        self.lock = threading.Lock()
+        self.calls = {'get_item': 0, 'put_item': 0, 'delete_item': 0}
+
+    def items(self, table_name):
+        return self.tables.setdefault(table_name, {})
+
+    def get_item(self, TableName, Key, **kwargs):
+        with self.lock:
+            self.calls['get_item'] += 1
+            item = self.items(TableName).get(Key[self.key_name]['S'])
+        return {'Item': dict(item)} if item is not None else {}
+
+    def put_item(self, TableName, Item, **kwargs):
+        key = Item[self.key_name]['S']
+        with self.lock:
+            self.calls['put_item'] += 1
+            self._check(self.items(TableName).get(key), **kwargs)
+            self.items(TableName)[key] = dict(Item)
+        return {}
+
+    def delete_item(self, TableName, Key, **kwargs):
+        key = Key[self.key_name]['S']
+        with self.lock:
+            self.calls['delete_item'] += 1
+            self._check(self.items(TableName).get(key), **kwargs)
+            self.items(TableName).pop(key, None)
+        return {}
+
+    @staticmethod
+    def _check(item, ConditionExpression=None, ExpressionAttributeNames=None,
+               ExpressionAttributeValues=None):
+        if ConditionExpression is None:
+            return
+        condition = ConditionParser(ConditionExpression, ExpressionAttributeNames or {},
+                                    ExpressionAttributeValues or {})
+        if not condition.evaluate(item or {}):
+            raise FakeClientError('ConditionalCheckFailedException', 'The conditional request failed')
+
+
+class ConditionParser:
+    """DynamoDB の ConditionExpression の一部を評価する（FakeDynamoDBClient 用）"""
+
+    TOKEN = re.compile(r'\s*(<>|<=|>=|[=<>(),]|[#:]?\w+)')
+    COMPARE = {
+        '=': lambda a, b: a == b,
+        '<>': lambda a, b: a != b,
+        '<': lambda a, b: a < b,
+        '<=': lambda a, b: a <= b,
+        '>': lambda a, b: a > b,
+        '>=': lambda a, b: a >= b,
+    }
+
+    def __init__(self, expression, names, values):
+        self.tokens = self.TOKEN.findall(expression)
+        self.names = names
+        self.values = values
+
+    def evaluate(self, item):
+        self.item = item
+        self.position = 0
+        result = self._or()
+        if self.position != len(self.tokens):
+            raise FakeClientError('ValidationException', f'Invalid ConditionExpression: {self.tokens}')
+        return result
+
+    def _next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _peek(self):
+        return self.tokens[self.position].upper() if self.position < len(self.tokens) else None
+
+    def _or(self):
+        result = self._and()
+        while self._peek() == 'OR':
+            self._next()
+            result = self._and() or result
+        return result
+
+    def _and(self):
+        result = self._not()
+        while self._peek() == 'AND':
+            self._next()
+            result = self._not() and result
+        return result
+
+    def _not(self):
+        if self._peek() == 'NOT':
+            self._next()
+            return not self._not()
+        return self._term()
+
+    def _term(self):
+        token = self._next()
+        if token == '(':
+            result = self._or()
+            self._next()
+            return result
+        if token in ('attribute_exists', 'attribute_not_exists'):
+            self._next()
+            name = self._name(self._next())
+            self._next()
+            return (name in self.item) == (token == 'attribute_exists')
+        left = self._operand(token)
+        operator = self._next()
+        right = self._operand(self._next())
+        if left is None or right is None:
+            return False
+        return self.COMPARE[operator](left, right)
+
+    def _name(self, token):
+        return self.names.get(token, token)
+
+    def _operand(self, token):
+        value = self.values[token] if token.startswith(':') else self.item.get(self._name(token))
+        if value is None:
+            return None
+        (kind, data), = value.items()
+        return Decimal(data) if kind == 'N' else data
+
+
+class FakeClientError(Exception):
+    """botocore.exceptions.ClientError 互換の例外（response['Error']['Code'] を持つ）"""
+
+    def __init__(self, code, message=''):
+        super().__init__(f"An error occurred ({code}): {message}")
+        self.response = {'Error': {'Code': code, 'Message': message}}
+
+
+class FakeDynamoDB:
+    """
+    インメモリ DynamoDB（boto3 サービスリソースの batch_write_item 相当）
+
+    スロットリングや部分的な未処理（UnprocessedItems）を注入できる。
+    typed=True の場合は低レベルクライアントと同じく型付き属性値（{'S': ...}）のアイテムを受け取り、
+    Python の値に戻してテーブルに保存する（数値は Decimal）。
+
+    Args:
+        throttle_rate (float): リクエスト全体をスロットリング例外にする確率
+        unprocessed_rate (float): 各アイテムを UnprocessedItems として返す確率
+        latency (float): 1リクエストあたりの擬似レイテンシ（秒）
+        seed (int): 障害注入の乱数シード
+        key_names, page_size: Table() で作成する FakeTable に渡す
+        typed (bool): 型付き属性値のアイテムを受け取る（低レベルクライアント）
+    """
+
+    def __init__(self, throttle_rate=0.0, unprocessed_rate=0.0, latency=0.0, seed=0,
+                 key_names=('log_date', 'hour'), page_size=None, typed=False):
+        self.tables = {}
+        self.key_names = key_names
+        self.page_size = page_size
+        self.typed = typed
+        self.throttle_rate = throttle_rate
+        self.unprocessed_rate = unprocessed_rate
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def Table(self, name):
+        with self.lock:
+            if name not in self.tables:
+                self.tables[name] = FakeTable(self.key_names, self.page_size)
+            return self.tables[name]
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            throttled = self.random.random() < self.throttle_rate
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if throttled:
+                raise FakeClientError('ProvisionedThroughputExceededException', 'throttled')
+
+            unprocessed = {}
+            for table_name, requests in RequestItems.items():
+                if len(requests) > 25:
+                    raise FakeClientError('ValidationException', 'Too many items in batch')
+                table = self.Table(table_name)
+                for request in requests:
+                    with self.lock:
+                        skip = self.random.random() < self.unprocessed_rate
+                    if skip:
+                        unprocessed.setdefault(table_name, []).append(request)
+                    else:
+                        item = request['PutRequest']['Item']
+                        table.put_item(Item=deserialize_item(item) if self.typed else item)
+            return {'UnprocessedItems': unprocessed}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
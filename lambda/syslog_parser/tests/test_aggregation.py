@@ -0,0 +1,183 @@
+"""
+多次元集計エンジンのテスト
+
+aggregation.Aggregator の集計結果・合算・シリアライズと、
+lambda_function への組み込み（AGG_DIMENSIONS）をテスト
+"""
+
+import unittest
+import io
+import json
+import sys
+import zipfile
+from collections import Counter
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import lambda_function
+import rollup
+from aggregation import AggregationSpec, Aggregator, OTHER_APP
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB
+
+TS, APP, SEV = 0, 1, 2
+
+ROWS = [
+    (b'2025-04-28T10:15:30Z', b'RT_IDP', b'CRITICAL'),
+    (b'2025-04-28T10:15:59Z', b'RT_IDP', b'CRITICAL'),
+    (b'2025-04-28T10:59:00Z', b'RT_SCREEN', b'WARNING'),
+    (b'2025-04-28T10:00:00Z', b'RT_FLOW', b'INFO'),
+    (b'2025-04-28T23:30:00Z', b'RT_FLOW', b'DEBUG'),
+    (b'2025-04-28T11:00:00Z', b'RT_IDP', b'UNKNOWN'),
+    (b'broken', b'RT_IDP', b'CRITICAL'),
+]
+
+
+def aggregate(rows, spec):
+    aggregator = Aggregator(spec)
+    aggregator.consume([list(row) for row in rows], TS, SEV, APP)
+    return aggregator
+
+
+def reference(rows):
+    """(hour, severity) → 件数 を素朴に数える"""
+    return Counter((ts[11:13].decode() + ':00', sev.decode()) for ts, _, sev in rows if ts != b'broken')
+
+
+class TestAggregationSpec(unittest.TestCase):
+    """AggregationSpec.parse のテスト"""
+
+    def test_parse(self):
+        spec = AggregationSpec.parse(' minute , app', max_apps=8)
+        self.assertEqual(spec.to_dict(), {'minute': True, 'app': True, 'max_apps': 8})
+        self.assertEqual(AggregationSpec.parse('').to_dict()['minute'], False)
+
+    def test_unknown_dimension(self):
+        with self.assertRaises(ValueError):
+            AggregationSpec.parse('minute,region')
+
+
+class TestAggregator(unittest.TestCase):
+    """Aggregator の集計結果テスト"""
+
+    def test_hourly_stats(self):
+        for spec in (AggregationSpec(), AggregationSpec(minute=True, app=True)):
+            aggregator = aggregate(ROWS, spec)
+            self.assertEqual(aggregator.hourly_stats(('CRITICAL', 'WARNING')),
+                             {'10:00': {'CRITICAL': 2, 'WARNING': 1}})
+            self.assertEqual(aggregator.total_rows(), len(ROWS))
+            self.assertEqual(aggregator.invalid_rows(), 1)
+
+    def test_severity_stats(self):
+        aggregator = aggregate(ROWS, AggregationSpec(app=True))
+        expected = reference(ROWS)
+        expected[('11:00', 'OTHER')] = expected.pop(('11:00', 'UNKNOWN'))
+        actual = Counter({(hour, sev): n for hour, counts in aggregator.severity_stats().items()
+                          for sev, n in counts.items()})
+        self.assertEqual(actual, expected)
+
+    def test_minute_stats(self):
+        stats = aggregate(ROWS, AggregationSpec(minute=True)).minute_stats()
+        critical = stats['10:00']['CRITICAL']
+        self.assertEqual(len(critical), 60)
+        self.assertEqual(critical[15], 2)
+        self.assertEqual(sum(critical), 2)
+        self.assertEqual(stats['10:00']['WARNING'][59], 1)
+        self.assertNotIn('ALERT', stats['10:00'])
+
+    def test_app_stats(self):
+        stats = aggregate(ROWS, AggregationSpec(app=True)).app_stats()
+        self.assertEqual(stats['10:00'], {
+            'RT_IDP': {'CRITICAL': 2},
+            'RT_SCREEN': {'WARNING': 1},
+            'RT_FLOW': {'INFO': 1},
+        })
+
+    def test_app_overflow(self):
+        """max_apps を超えた AppName は OTHER_APP にまとめる"""
+        rows = [(b'2025-04-28T10:00:00Z', f'APP{i}'.encode(), b'CRITICAL') for i in range(5)]
+        aggregator = aggregate(rows, AggregationSpec(app=True, max_apps=3))
+        self.assertEqual(aggregator.app_stats()['10:00'], {
+            'APP0': {'CRITICAL': 1},
+            'APP1': {'CRITICAL': 1},
+            OTHER_APP: {'CRITICAL': 3},
+        })
+
+
+class TestAggregatorMerge(unittest.TestCase):
+    """merge / to_dict / from_dict のテスト"""
+
+    def test_merge_matches_single_pass(self):
+        spec = AggregationSpec(minute=True, app=True)
+        # AppName の出現順が異なる2つの集計結果を合算
+        merged = aggregate(ROWS[:3], spec).merge(aggregate(list(reversed(ROWS[3:])), spec))
+        single = aggregate(ROWS, spec)
+        self.assertEqual(merged.app_stats(), single.app_stats())
+        self.assertEqual(merged.minute_stats(), single.minute_stats())
+        self.assertEqual(merged.severity_stats(), single.severity_stats())
+
+    def test_merge_rejects_different_specs(self):
+        with self.assertRaises(ValueError):
+            aggregate(ROWS, AggregationSpec()).merge(aggregate(ROWS, AggregationSpec(app=True)))
+
+    def test_round_trip(self):
+        aggregator = aggregate(ROWS, AggregationSpec(minute=True, app=True))
+        restored = Aggregator.from_dict(json.loads(json.dumps(aggregator.to_dict())))
+        self.assertEqual(restored.counts, aggregator.counts)
+        self.assertEqual(restored.app_stats(), aggregator.app_stats())
+        # 復元後も同じ AppName は同じ番号で数える
+        restored.consume([list(ROWS[0])], TS, SEV, APP)
+        self.assertEqual(restored.app_stats()['10:00']['RT_IDP'], {'CRITICAL': 3})
+
+
+class TestHandlerDimensions(unittest.TestCase):
+    """AGG_DIMENSIONS を指定した場合の保存内容テスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB()
+        self.table = self.dynamodb.Table('stats')
+        self.originals = (lambda_function.s3_client, lambda_function.batch_writer,
+                          lambda_function.AGG_SPEC)
+        lambda_function.s3_client = self.s3
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+        lambda_function.AGG_SPEC = AggregationSpec(minute=True, app=True)
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.batch_writer,
+         lambda_function.AGG_SPEC) = self.originals
+
+    def test_items_and_json(self):
+        lines = ['Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\n']
+        for ts, app, sev in ROWS[:5]:
+            lines.append(f'{ts.decode()},srx-fw01,{app.decode()},2,{sev.decode()},THREAT,msg\n')
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr('10.csv', ''.join(lines))
+        self.s3.objects[('in', 'raw/10.zip')] = out.getvalue()
+
+        event = {'Records': [{'s3': {'bucket': {'name': 'in'}, 'object': {'key': 'raw/10.zip'}}}]}
+        lambda_function.lambda_handler(event, None)
+
+        item = self.table.items[('2025-04-28', '10:00')]
+        self.assertEqual(item['severity_counts'], {'CRITICAL': 2, 'WARNING': 1, 'INFO': 1})
+        self.assertEqual(item['minute_counts']['CRITICAL'][15], 2)
+        self.assertEqual(item['app_counts']['RT_FLOW'], {'INFO': 1})
+        # CRITICAL/WARNING のない時間も Severity 別件数は保存する
+        self.assertEqual(self.table.items[('2025-04-28', '23:00')]['critical_count'], 0)
+
+        body = self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json')]
+        hours = {h['hour']: h for h in rollup.decode_document(body)['hourly_stats']}
+        self.assertEqual(hours['10:00']['severities'], {'CRITICAL': 2, 'WARNING': 1, 'INFO': 1})
+        self.assertEqual(hours['10:00']['apps']['RT_IDP'], {'CRITICAL': 2})
+        self.assertEqual(hours['23:00']['severities'], {'DEBUG': 1})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,197 @@
+"""
+バックフィル（scripts/backfill.py）のテスト
+
+ローカルの ZIP の並列集計が Lambda と同じ日次JSONになるか、
+日付での絞り込み、状態ファイルからの再開、失敗したファイルの扱いをテスト
+"""
+
+import unittest
+import io
+import json
+import random
+import sys
+import tempfile
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# テストデータ生成に generator、テスト対象に scripts を使う
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / 'generator'))
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / 'scripts'))
+
+import lambda_function
+import backfill
+import rollup
+from generate import JuniperSyslogGenerator
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB
+
+DATES = ('2025-04-27', '2025-04-28')
+HOURS = (9, 10, 11)
+
+
+def generate_tree(root, rows=300):
+    """{root}/YYYY-MM-DD/HH.zip を generator で作る"""
+    random.seed(11)
+    for date in DATES:
+        generator = JuniperSyslogGenerator(str(Path(root) / date), datetime.strptime(date, '%Y-%m-%d'),
+                                           'srx-fw01', rows, 0.2)
+        for hour in HOURS:
+            generator.create_hourly_log(hour)
+
+
+def without_processed_at(doc):
+    return {k: v for k, v in doc.items() if k != 'processed_at'}
+
+
+class BackfillTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name) / 'in'
+        self.state = str(Path(self.tmp.name) / 'state.jsonl')
+        generate_tree(self.root)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_backfill(self, sink=None, resume=False, start=None, end=None):
+        sink = sink or backfill.MemorySink(lambda_function)
+        files = backfill.find_zips([self.root], start, end)
+        summary = backfill.backfill(files, sink, self.state, workers=2, resume=resume,
+                                    progress_interval=0)
+        return sink, summary
+
+
+class TestBackfill(BackfillTestCase):
+    """並列集計と書き出しのテスト"""
+
+    def test_same_documents_as_lambda(self):
+        """Lambda で1ファイルずつ処理した場合と同じ日次JSONになるか"""
+        sink, summary = self.run_backfill()
+        self.assertEqual(summary['files'], len(DATES) * len(HOURS))
+        self.assertEqual(summary['rows'], 300 * len(DATES) * len(HOURS))
+        self.assertGreater(summary['rows_per_second'], 0)
+
+        s3 = FakeS3Client()
+        dynamodb = FakeDynamoDB()
+        originals = (lambda_function.s3_client, lambda_function.table, lambda_function.batch_writer,
+                     lambda_function.BASELINE_PREFIX)
+        try:
+            lambda_function.s3_client = s3
+            lambda_function.table = dynamodb.Table('stats')
+            lambda_function.batch_writer = BatchWriter(dynamodb, 'stats')
+            # JSON の書き出しだけのバックフィルは異常スコアを出さない（ベースラインは時系列順の処理が前提）
+            lambda_function.BASELINE_PREFIX = ''
+            keys = []
+            for path, name in backfill.find_zips([self.root]):
+                s3.put_file('in', f'raw/{name}', path)
+                keys.append(f'raw/{name}')
+            lambda_function.lambda_handler(
+                {'Records': [{'s3': {'bucket': {'name': 'in'}, 'object': {'key': key}}} for key in keys]},
+                None)
+        finally:
+            (lambda_function.s3_client, lambda_function.table, lambda_function.batch_writer,
+             lambda_function.BASELINE_PREFIX) = originals
+
+        self.assertEqual(sorted(sink.documents),
+                         sorted([f'data/{date}.json' for date in DATES]
+                                + ['data/manifest.json', 'data/monthly/2025-04.json',
+                                   'data/weekly/2025-W17.json', 'data/weekly/2025-W18.json']))
+        for key, doc in sink.documents.items():
+            expected = rollup.decode_document(s3.objects[(lambda_function.OUTPUT_BUCKET, key)])
+            if key == lambda_function.MANIFEST_KEY:
+                # ハッシュは processed_at を含む内容から計算するため、名前と revision だけ比べる
+                for section in (rollup.DAILY, *rollup.PERIODS):
+                    self.assertEqual(
+                        {name: entry['revision'] for name, entry in doc[section].items()},
+                        {name: entry['revision'] for name, entry in expected[section].items()})
+            else:
+                self.assertEqual(without_processed_at(doc), without_processed_at(expected))
+
+    def test_json_directory(self):
+        output = Path(self.tmp.name) / 'out'
+        self.run_backfill(backfill.JsonDirSink(lambda_function, output))
+        doc = json.loads((output / 'data' / '2025-04-28.json').read_text(encoding='utf-8'))
+        self.assertEqual([h['hour'] for h in doc['hourly_stats']], ['09:00', '10:00', '11:00'])
+
+    def test_date_range(self):
+        files = backfill.find_zips([self.root], start='2025-04-28')
+        self.assertEqual([name for _, name in files], [f'2025-04-28/{h:02d}.zip' for h in HOURS])
+        # 日付ディレクトリを直接指定しても絞り込める
+        self.assertEqual(len(backfill.find_zips([self.root / '2025-04-27'], end='2025-04-27')), 3)
+        self.assertEqual(backfill.find_zips([self.root], start='2025-05-01'), [])
+
+
+class TestResume(BackfillTestCase):
+    """状態ファイルからの再開のテスト"""
+
+    def test_resume_skips_completed(self):
+        self.run_backfill(end='2025-04-27')
+        sink, summary = self.run_backfill(resume=True)
+        self.assertEqual((summary['files'], summary['skipped']), (3, 3))
+        self.assertEqual({stats['log_date'] for _, stats in sink.results}, {'2025-04-28'})
+
+        # 途中で切れた行があっても読める
+        with open(self.state, 'a', encoding='utf-8') as f:
+            f.write('{"path": "2025-04-28/1')
+        _, summary = self.run_backfill(resume=True)
+        self.assertEqual((summary['files'], summary['skipped']), (0, 6))
+
+    def test_changed_file_is_reprocessed(self):
+        self.run_backfill()
+        path = self.root / '2025-04-28' / '10.zip'
+        with zipfile.ZipFile(path, 'a') as z:
+            z.writestr('extra.txt', 'x')
+        _, summary = self.run_backfill(resume=True)
+        self.assertEqual((summary['files'], summary['skipped']), (1, 5))
+
+    def test_without_resume_starts_over(self):
+        self.run_backfill()
+        _, summary = self.run_backfill()
+        self.assertEqual((summary['files'], summary['skipped']), (6, 0))
+
+    def test_failed_file_is_not_recorded(self):
+        bad = self.root / '2025-04-28' / '12.zip'
+        bad.write_bytes(b'not a zip')
+        _, summary = self.run_backfill()
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(summary['failures'][0]['path'], '2025-04-28/12.zip')
+
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, 'w') as z:
+            z.writestr('12.csv', 'Timestamp,Hostname,Severity\n2025-04-28T12:00:00Z,srx-fw01,CRITICAL\n')
+        bad.write_bytes(out.getvalue())
+        sink, summary = self.run_backfill(resume=True)
+        self.assertEqual((summary['files'], summary['failed']), (1, 0))
+        self.assertEqual(sink.results[0][1]['hourly_stats'], {'12:00': {'CRITICAL': 1, 'WARNING': 0}})
+
+
+class TestProgress(unittest.TestCase):
+
+    def test_report(self):
+        now = [100.0]
+        out = io.StringIO()
+        progress = backfill.Progress(4, interval=10, out=out, clock=lambda: now[0])
+        now[0] = 102.0
+        progress.update(1000)
+        now[0] = 103.0
+        progress.update(1000)   # interval 未満なので表示しない
+        now[0] = 104.0
+        progress.update(2000, failed=True)
+        progress.update(0)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0], '[1/4  25.0%] rows 1,000  500 rows/s  elapsed 0:00:02  eta 0:00:06')
+        self.assertTrue(lines[1].startswith('[4/4 100.0%] rows 4,000  1,000 rows/s'))
+        self.assertTrue(lines[1].endswith('failed 1'))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
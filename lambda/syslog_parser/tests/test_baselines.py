@@ -0,0 +1,251 @@
+"""
+CRITICAL 件数のベースラインと異常スコアのテスト
+
+baselines.Baseline の更新（Welford 法・指数加重）と採点、score_hours の再処理・順序の入れ替わり、
+lambda_function への組み込み（ジェネレーターの burst プロファイルで作った日を異常と判定するか）をテスト
+"""
+
+import unittest
+import io
+import sys
+import json
+import math
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from contextlib import redirect_stdout
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# ジェネレーター（generator/generate.py）
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / 'generator'))
+
+import lambda_function
+import rollup
+import baselines
+from baselines import Baseline, score_hours
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB, iam_list_prefixes
+from generate import JuniperSyslogGenerator
+
+START = datetime(2025, 4, 1)
+DAYS = 10
+SEED = 20250401
+
+
+class TestBaseline(unittest.TestCase):
+    """Baseline の更新と採点のテスト"""
+
+    def test_welford_then_ewma(self):
+        """最初の 1/alpha 日は単純平均・母分散、その後は指数加重になるか"""
+        values = [12, 9, 15, 11, 10, 14, 8, 13, 12, 10]
+        base = Baseline()
+        for value in values:
+            base = base.updated(value, alpha=0.1)
+
+        self.assertEqual(base.samples, 10)
+        self.assertAlmostEqual(base.mean, statistics.mean(values))
+        self.assertAlmostEqual(base.var, statistics.pvariance(values))
+
+        after = base.updated(40, alpha=0.1)
+        self.assertAlmostEqual(after.mean, base.mean + 0.1 * (40 - base.mean))
+        self.assertGreater(after.var, base.var)
+
+    def test_score(self):
+        """日数が足りない間はスコアを出さず、分散は平均（ポアソン分布）と1を下限にするか"""
+        base = Baseline()
+        for _ in range(7):
+            base = base.updated(100, alpha=0.1)
+
+        self.assertIsNone(base.score(100, min_samples=8))
+        # 分散 0 でも、ばらつきは sqrt(平均) = 10 とみなす
+        self.assertAlmostEqual(base.score(130, min_samples=7), 3.0)
+        self.assertAlmostEqual(Baseline(7, 0.0, 0.0).score(2, min_samples=7), 2.0)
+
+
+class TestScoreHours(unittest.TestCase):
+    """score_hours の JSON の更新のテスト"""
+
+    def run_days(self, values, doc=None, start=START):
+        results = []
+        for day, value in enumerate(values):
+            log_date = (start + timedelta(days=day)).strftime('%Y-%m-%d')
+            doc, scored = score_hours(doc, 'fw', log_date, {'10:00': value}, min_samples=3)
+            results.append(scored['10:00'])
+        return doc, results
+
+    def test_scores_against_previous_days(self):
+        """その日を反映する前のベースラインで採点するか"""
+        doc, results = self.run_days([10, 12, 8, 10, 60])
+
+        self.assertEqual([r['samples'] for r in results], [0, 1, 2, 3, 4])
+        self.assertNotIn('score', results[2])
+        self.assertEqual(results[4]['mean'], 10.0)
+        self.assertAlmostEqual(results[4]['score'], round(50 / math.sqrt(10), 2))
+        self.assertEqual(doc['hours']['10']['current']['samples'], 5)
+
+    def test_reprocessing_same_day_is_idempotent(self):
+        """同じ日を再処理すると、その日の更新を置き換えるか"""
+        doc, results = self.run_days([10, 12, 8, 10, 60])
+
+        again, scored = score_hours(doc, 'fw', '2025-04-05', {'10:00': 60}, min_samples=3)
+        self.assertEqual(again, doc)
+        self.assertEqual(scored['10:00'], results[4])
+
+        corrected, scored = score_hours(doc, 'fw', '2025-04-05', {'10:00': 10}, min_samples=3)
+        self.assertEqual(corrected['hours']['10']['current']['samples'], 5)
+        self.assertEqual(corrected['hours']['10']['current']['mean'], 10.0)
+
+    def test_older_day_does_not_update(self):
+        """最後に更新した日より前の日は採点だけで、ベースラインを変えないか"""
+        doc, _ = self.run_days([10, 12, 8, 10])
+
+        updated, scored = score_hours(doc, 'fw', '2025-03-20', {'10:00': 50}, min_samples=3)
+
+        self.assertEqual(updated['hours'], doc['hours'])
+        self.assertEqual(scored['10:00']['samples'], 4)
+
+    def test_input_document_is_not_modified(self):
+        """競合時に再度呼ばれても同じ結果になるよう、元の JSON を変えないか"""
+        doc, _ = self.run_days([10, 12])
+        snapshot = repr(doc)
+
+        score_hours(doc, 'fw', '2025-04-03', {'10:00': 30, '11:00': 5})
+
+        self.assertEqual(repr(doc), snapshot)
+
+
+class TestHandlerBaselines(unittest.TestCase):
+    """ジェネレーターの日々のログを順に処理した場合の異常スコアのテスト"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB()
+        self.table = self.dynamodb.Table('stats')
+        self.originals = (lambda_function.s3_client, lambda_function.batch_writer,
+                          lambda_function.BASELINE_PREFIX, lambda_function.metrics)
+        lambda_function.s3_client = self.s3
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+        lambda_function.BASELINE_PREFIX = 'baselines/'
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.batch_writer,
+         lambda_function.BASELINE_PREFIX, lambda_function.metrics) = self.originals
+        self.tmp.cleanup()
+
+    def run_days(self, last_profile, days=DAYS):
+        """
+        days 日分の 13時・14時のログを1日ずつ処理する（最後の日だけ last_profile）
+
+        Returns:
+            list: 日ごとの AnomalousHours
+        """
+        anomalous = []
+        for day in range(days):
+            date = START + timedelta(days=day)
+            output_dir = Path(self.tmp.name) / date.strftime('%Y-%m-%d')
+            profile = last_profile if day == days - 1 else 'flat'
+            generator = JuniperSyslogGenerator(output_dir, date, 'srx-fw01', 300, 0.1,
+                                               seed=SEED, profile=profile)
+            keys = []
+            for hour in (13, 14):
+                generator.create_hourly_log(hour)
+                key = f"raw/{date.strftime('%Y-%m-%d')}/{hour:02d}.zip"
+                self.s3.put_file('in', key, output_dir / f'{hour:02d}.zip')
+                keys.append(key)
+            lambda_function.lambda_handler(
+                {'Records': [{'s3': {'bucket': {'name': 'in'}, 'object': {'key': key}}}
+                             for key in keys]}, None)
+            anomalous.append(lambda_function.metrics.counters['anomalous_hours'])
+        return anomalous
+
+    def item(self, day, hour):
+        date = (START + timedelta(days=day)).strftime('%Y-%m-%d')
+        return self.table.items[(date, hour)]
+
+    def test_burst_hour_is_anomalous(self):
+        """burst の時間だけ異常スコアが高くなり、他の日・時間は閾値未満か"""
+        anomalous = self.run_days('burst:hours=14:minutes=5')
+
+        last = DAYS - 1
+        burst = self.item(last, '14:00')['anomaly']
+        self.assertGreaterEqual(burst['score'], baselines.ALERT_SCORE)
+        self.assertIsInstance(burst['score'], Decimal)
+        self.assertEqual(burst['samples'], DAYS - 1)
+        self.assertLess(abs(self.item(last, '13:00')['anomaly']['score']), baselines.ALERT_SCORE)
+        for day in range(baselines.DEFAULT_MIN_SAMPLES, last):
+            for hour in ('13:00', '14:00'):
+                self.assertLess(abs(self.item(day, hour)['anomaly']['score']), baselines.ALERT_SCORE)
+        # ベースラインの日数が足りない間はスコアを出さない
+        self.assertNotIn('score', self.item(baselines.DEFAULT_MIN_SAMPLES - 1, '14:00')['anomaly'])
+        self.assertEqual(anomalous, [0] * last + [1])
+
+        body = self.s3.objects[(lambda_function.OUTPUT_BUCKET,
+                                f"data/{(START + timedelta(days=last)).strftime('%Y-%m-%d')}.json")]
+        hours = {h['hour']: h for h in rollup.decode_document(body)['hourly_stats']}
+        self.assertEqual(hours['14:00']['anomaly']['score'], float(burst['score']))
+
+    def test_flat_days_are_not_anomalous(self):
+        """burst のない日々では異常と判定しないか"""
+        anomalous = self.run_days('flat')
+
+        self.assertEqual(anomalous, [0] * DAYS)
+        self.assertLess(abs(self.item(DAYS - 1, '14:00')['anomaly']['score']), baselines.ALERT_SCORE)
+
+    def test_deterministic(self):
+        """同じ seed のログなら同じスコアになるか（再処理しても同じ）"""
+        self.run_days('burst:hours=14:minutes=5')
+        first = self.item(DAYS - 1, '14:00')['anomaly']
+
+        key = f"raw/{(START + timedelta(days=DAYS - 1)).strftime('%Y-%m-%d')}/14.zip"
+        lambda_function.lambda_handler(
+            {'Records': [{'s3': {'bucket': {'name': 'in'}, 'object': {'key': key}}}]}, None)
+
+        self.assertEqual(self.item(DAYS - 1, '14:00')['anomaly'], first)
+
+    def test_first_baseline_under_role_policy(self):
+        """実行ロールの ListBucket の範囲で、最初の処理がベースラインを作成するか（403 で失敗しないか）"""
+        self.s3 = lambda_function.s3_client = FakeS3Client(list_prefixes=iam_list_prefixes())
+
+        self.run_days('flat', days=2)
+
+        doc = rollup.decode_document(self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'baselines/srx-fw01.json')])
+        self.assertEqual(doc['hours']['14']['current']['samples'], 2)
+        self.assertEqual(self.item(1, '14:00')['anomaly']['samples'], 1)
+        self.assertEqual(lambda_function.metrics.counters['baseline_failures'], 0)
+
+    def test_failure_is_reported(self):
+        """ベースラインを読めない場合、集計は保存しつつ BaselineFailures と ERROR ログを出すか"""
+        self.s3 = lambda_function.s3_client = FakeS3Client(list_prefixes=['data/'])
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.run_days('flat', days=1)
+
+        self.assertNotIn('anomaly', self.item(0, '14:00'))
+        # 13時・14時の2ファイルとも失敗する
+        self.assertEqual(lambda_function.metrics.counters['baseline_failures'], 2)
+        errors = [json.loads(line) for line in out.getvalue().splitlines()
+                  if line.startswith('{') and '"ERROR"' in line]
+        self.assertEqual([(e['key'], e['error_code']) for e in errors],
+                         [('baselines/srx-fw01.json', 'AccessDenied')] * 2)
+
+    def test_disabled(self):
+        """BASELINE_PREFIX が空なら anomaly を保存しないか"""
+        lambda_function.BASELINE_PREFIX = ''
+
+        self.run_days('flat')
+
+        self.assertNotIn('anomaly', self.item(DAYS - 1, '14:00'))
+        self.assertFalse([key for _, key in self.s3.objects if key.startswith('baselines/')])
+
+
+if __name__ == '__main__':
+    unittest.main()
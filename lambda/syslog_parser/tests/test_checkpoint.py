@@ -0,0 +1,272 @@
+"""
+時間予算つきの読み込み（チェックポイントと再開）のテスト
+
+BudgetReader の打ち切り位置と再開、lambda_handler がチェックポイントを保存して
+続きの呼び出しを起動し、最後の呼び出しで打ち切らずに読んだ場合と同じ集計を保存するかをテスト
+"""
+
+import unittest
+import io
+import sys
+import json
+import zipfile
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import lambda_function
+import rollup
+import zip_stream
+from checkpoint import BudgetReader, record_ends
+from csv_scanner import QUOTED
+from ledger import Ledger, DONE
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB, FakeDynamoDBClient, FakeLambdaClient
+from tests.test_handler import HEADER, make_zip, make_event
+
+
+class Countdown:
+    """読み込みのたびに減っていく残り時間（ミリ秒）"""
+
+    def __init__(self, calls, reserve_ms=1000):
+        self.calls = calls
+        self.reserve_ms = reserve_ms
+
+    def __call__(self):
+        self.calls -= 1
+        return self.reserve_ms * 2 if self.calls >= 0 else 0
+
+
+def without_processed_at(value):
+    """処理日時（呼び出しごとに変わる）を除いた値"""
+    if isinstance(value, dict):
+        return {k: without_processed_at(v) for k, v in value.items() if k != 'processed_at'}
+    if isinstance(value, list):
+        return [without_processed_at(v) for v in value]
+    return value
+
+
+def read_all(reader, size=16):
+    chunks = []
+    while True:
+        data = reader.read(size)
+        if not data:
+            return b''.join(chunks)
+        chunks.append(data)
+
+
+class TestBudgetReader(unittest.TestCase):
+    """BudgetReader の打ち切りと再開のテスト"""
+
+    DATA = (b'\n' + HEADER.encode() +
+            b''.join(b'2025-04-28T10:%02d:00Z,fw,RT_IDP,2,CRITICAL,THREAT,"a\nb, %d"\n' % (i, i)
+                     for i in range(20)))
+
+    def test_record_ends_outside_quotes(self):
+        """クォートの中の改行はレコードの区切りにしないか"""
+        data = b'a,"x\ny"\nb\n'
+        self.assertEqual(list(record_ends(data)), [8, 10])
+        self.assertEqual(list(record_ends(b'y"\nb\n', state=QUOTED)), [3, 5])
+
+    def test_record_ends_with_stray_quote(self):
+        """フィールドの途中の " はクォートの始まりにしないか（csv.reader と同じ区切り）"""
+        data = b'a,disk 5" bay failed\nb,x\nc,"y\nz",w\n'
+        self.assertEqual(list(record_ends(data)), [21, 25, 35])
+        self.assertEqual(list(record_ends(b'a,"x""\ny"\n')), [10])
+
+    def test_no_budget_reads_everything(self):
+        """残り時間の関数がなければ最後まで読むか"""
+        reader = BudgetReader(io.BytesIO(self.DATA))
+
+        self.assertEqual(read_all(reader), self.DATA)
+        self.assertFalse(reader.stopped)
+        self.assertEqual(reader.offset, len(self.DATA))
+        # 先頭の空行はヘッダーに含める
+        self.assertEqual(reader.header_end, 1 + len(HEADER))
+
+    def test_stop_and_resume_concatenate(self):
+        """打ち切った位置から再開すると、ヘッダー + 残りのレコードになるか"""
+        reader = BudgetReader(io.BytesIO(self.DATA), Countdown(4), 1000)
+        first = read_all(reader)
+
+        self.assertTrue(reader.stopped)
+        self.assertLess(reader.offset, len(self.DATA))
+        self.assertEqual(first, self.DATA[:reader.offset])
+        self.assertEqual(list(record_ends(first))[-1], len(first))
+
+        resumed = BudgetReader(io.BytesIO(self.DATA), offset=reader.offset,
+                               header_end=reader.header_end)
+        second = read_all(resumed)
+
+        self.assertEqual(second, self.DATA[:reader.header_end] + self.DATA[reader.offset:])
+        self.assertFalse(resumed.stopped)
+        self.assertEqual(resumed.offset, len(self.DATA))
+
+    def test_resume_requires_header_end(self):
+        """再開位置だけではヘッダーの範囲がわからないため ValueError になるか"""
+        with self.assertRaises(ValueError):
+            BudgetReader(io.BytesIO(self.DATA), offset=10)
+
+
+class TestCheckpointHandler(unittest.TestCase):
+    """lambda_handler のチェックポイントと続きの呼び出しのテスト"""
+
+    KEY = 'raw/2025-04-28/10.zip'
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB()
+        self.table = self.dynamodb.Table('stats')
+        self.lambda_client = FakeLambdaClient()
+        self.originals = (lambda_function.s3_client, lambda_function.table,
+                          lambda_function.batch_writer, lambda_function.lambda_client,
+                          lambda_function.ledger, lambda_function.LEDGER_TABLE,
+                          lambda_function.STREAM_CHUNK_SIZE, lambda_function.MEMBER_WORKERS)
+        lambda_function.s3_client = self.s3
+        lambda_function.table = self.table
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+        lambda_function.lambda_client = self.lambda_client
+        # 小さい読み込み単位で、1回の呼び出しでは読み切れないようにする
+        lambda_function.STREAM_CHUNK_SIZE = 256
+        lambda_function.MEMBER_WORKERS = 1
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.table,
+         lambda_function.batch_writer, lambda_function.lambda_client,
+         lambda_function.ledger, lambda_function.LEDGER_TABLE,
+         lambda_function.STREAM_CHUNK_SIZE, lambda_function.MEMBER_WORKERS) = self.originals
+
+    def context(self, reads):
+        context = Mock()
+        context.get_remaining_time_in_millis.side_effect = Countdown(
+            reads, lambda_function.CHECKPOINT_RESERVE_SECONDS * 1000)
+        return context
+
+    def daily(self):
+        data = self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json')]
+        return without_processed_at(rollup.decode_document(data))
+
+    def run_until_done(self, event, reads=6):
+        """続きの呼び出しがなくなるまで lambda_handler を呼び、最後の結果を返す"""
+        results = []
+        while True:
+            response = lambda_function.lambda_handler(event, self.context(reads))
+            results.append(json.loads(response['body'])['results'][0])
+            if results[-1]['status'] != 'continued':
+                return results
+            event = self.lambda_client.invocations[-1][2]
+
+    def test_resumed_result_matches_single_pass(self):
+        """打ち切りと再開を繰り返しても、1回で読んだ場合と同じ集計を保存するか"""
+        data = make_zip(10, critical=40, warning=25)
+        self.s3.objects[('in', self.KEY)] = data
+        lambda_function.lambda_handler(make_event([self.KEY]), None)
+        expected_items = without_processed_at(self.table.items)
+        expected_daily = self.daily()
+        self.table.items.clear()
+        self.s3.objects.pop((lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json'))
+
+        results = self.run_until_done(make_event([self.KEY]))
+
+        self.assertGreater(len(results), 2)
+        self.assertEqual([r['segment'] for r in results[:-1]], list(range(1, len(results))))
+        self.assertEqual(results[-1]['status'], 'success')
+        self.assertEqual(without_processed_at(self.table.items), expected_items)
+        self.assertEqual(self.daily(), expected_daily)
+        # 続きの呼び出しは非同期で、処理を終えたチェックポイントは消す
+        self.assertTrue(all(call[1] == 'Event' for call in self.lambda_client.invocations))
+        self.assertFalse([key for bucket, key in self.s3.objects
+                          if key.startswith(lambda_function.CHECKPOINT_PREFIX)])
+
+    def test_multiple_members_resume(self):
+        """読み終えたメンバーは読み直さず、打ち切ったメンバーだけ続きを読むか"""
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            for hour in (10, 11):
+                with zipfile.ZipFile(io.BytesIO(make_zip(hour, critical=30, warning=5))) as src:
+                    z.writestr(f'{hour}.csv', src.read(f'{hour:02d}.csv'))
+        self.s3.objects[('in', self.KEY)] = out.getvalue()
+
+        results = self.run_until_done(make_event([self.KEY]), reads=8)
+
+        self.assertEqual(results[-1]['status'], 'success')
+        self.assertEqual(self.table.items[('2025-04-28', '10:00')]['critical_count'], 30)
+        self.assertEqual(self.table.items[('2025-04-28', '11:00')]['critical_count'], 30)
+
+    def test_stop_skips_remaining_members(self):
+        """打ち切ったメンバーより後ろのメンバーは読み捨てず、ボディをそれ以上読まないか"""
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_STORED) as z:
+            with zipfile.ZipFile(io.BytesIO(make_zip(10, critical=40, warning=25))) as src:
+                z.writestr('10.csv', src.read('10.csv'))
+            # 後ろのメンバーは zip_stream の読み込み単位より大きくする
+            lines = [HEADER] + ['2025-04-28T11:00:00Z,srx-fw01,RT_IDP,2,WARNING,THREAT,'
+                                'RT_IDP_ATTACK_LOG: Port scan detected\n'] * 40000
+            z.writestr('11.csv', ''.join(lines))
+            second = z.getinfo('11.csv').header_offset
+        data = out.getvalue()
+        self.s3.objects[('in', self.KEY)] = data
+        received = []
+        get_object = self.s3.get_object
+
+        def counting_get_object(**kwargs):
+            response = get_object(**kwargs)
+            body = response['Body']
+            read = body.read
+
+            def counting_read(*args):
+                chunk = read(*args)
+                received.append(len(chunk))
+                return chunk
+
+            body.read = counting_read
+            return response
+
+        self.s3.get_object = counting_get_object
+        response = lambda_function.lambda_handler(make_event([self.KEY]), self.context(6))
+
+        self.assertEqual(json.loads(response['body'])['results'][0]['status'], 'continued')
+        self.assertLess(sum(received), second + zip_stream.CHUNK_SIZE)
+        self.assertLess(sum(received), len(data) - zip_stream.CHUNK_SIZE)
+
+        self.s3.get_object = get_object
+        results = self.run_until_done(self.lambda_client.invocations[-1][2], reads=1000)
+        self.assertEqual(results[-1]['status'], 'success')
+        self.assertEqual(self.table.items[('2025-04-28', '10:00')]['critical_count'], 40)
+        self.assertEqual(self.table.items[('2025-04-28', '11:00')]['warning_count'], 40000)
+
+    def test_continuation_keeps_ledger_lease(self):
+        """続きの呼び出しが台帳のリースを引き継ぎ、最後に処理済みにするか"""
+        client = FakeDynamoDBClient()
+        lambda_function.ledger = Ledger(client, 'ledger')
+        lambda_function.LEDGER_TABLE = 'ledger'
+        data = make_zip(10, critical=40, warning=25)
+        self.s3.objects[('in', self.KEY)] = data
+
+        results = self.run_until_done(make_event([self.KEY]))
+
+        self.assertEqual(results[-1]['status'], 'success')
+        (item,) = client.tables['ledger'].values()
+        self.assertEqual(item['status']['S'], DONE)
+
+    def test_replaced_object_skips_continuation(self):
+        """チェックポイントの後に置き換えられたオブジェクトの続きは処理しないか"""
+        self.s3.objects[('in', self.KEY)] = make_zip(10, critical=40, warning=25)
+        response = lambda_function.lambda_handler(make_event([self.KEY]), self.context(6))
+        self.assertEqual(json.loads(response['body'])['results'][0]['status'], 'continued')
+        self.s3.objects[('in', self.KEY)] = make_zip(10, critical=1, warning=1)
+
+        response = lambda_function.lambda_handler(self.lambda_client.invocations[-1][2], None)
+
+        result = json.loads(response['body'])['results'][0]
+        self.assertEqual(result['status'], 'skipped')
+        self.assertEqual(self.table.items, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+コールドスタートのテスト
+
+新しいインタープリタで lambda_function を import し、
+  - import 時に AWS クライアントを作らないこと（DYNAMODB_TABLE が未設定でも import できる）
+  - 使わないモジュール（columnar / multiprocessing）を import しないこと
+  - 初回の呼び出しで作るのは S3 と DynamoDB の低レベルクライアントだけであること
+  - warm-up イベント・プロビジョニングされた同時実行で先にクライアントを作ること
+  - import と初回の呼び出しの所要時間が予算内であること
+をテストする。boto3 は呼び出しを記録するフェイクに差し替える。
+
+予算は環境変数 COLD_START_IMPORT_BUDGET_MS / COLD_START_INVOKE_BUDGET_MS で変更できる。
+"""
+
+import unittest
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+LAMBDA_DIR = Path(__file__).resolve().parent.parent
+
+IMPORT_BUDGET_MS = float(os.environ.get('COLD_START_IMPORT_BUDGET_MS', '500'))
+INVOKE_BUDGET_MS = float(os.environ.get('COLD_START_INVOKE_BUDGET_MS', '500'))
+
+# 子プロセスで実行するスクリプト（結果を JSON で最後の行に出力）
+CHILD = r'''
+import io
+import sys
+import json
+import time
+import types
+import zipfile
+import contextlib
+
+sys.path.insert(0, LAMBDA_DIR)
+from tests.fakes import FakeS3Client, FakeDynamoDB
+
+calls = []
+s3 = FakeS3Client()
+dynamodb = FakeDynamoDB(typed=True)
+
+boto3 = types.ModuleType('boto3')
+def client(service, **kwargs):
+    calls.append(['client', service])
+    return {'s3': s3, 'dynamodb': dynamodb}[service]
+def resource(service, **kwargs):
+    calls.append(['resource', service])
+    raise AssertionError('service resource should not be used on the hot path')
+boto3.client = client
+boto3.resource = resource
+sys.modules['boto3'] = boto3
+
+out = io.BytesIO()
+with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+    z.writestr('10.csv', 'Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\n'
+                         '2025-04-28T10:00:00Z,srx-fw01,RT_IDP,2,CRITICAL,THREAT,x\n'
+                         '2025-04-28T10:00:01Z,srx-fw01,RT_IDP,4,WARNING,THREAT,y\n')
+s3.objects[('in', 'raw/2025-04-28/10.zip')] = out.getvalue()
+event = {'Records': [{'s3': {'bucket': {'name': 'in'}, 'object': {'key': 'raw/2025-04-28/10.zip'}}}]}
+
+result = {}
+start = time.perf_counter()
+import lambda_function
+result['import_ms'] = (time.perf_counter() - start) * 1000
+result['calls_after_import'] = list(calls)
+result['modules_after_import'] = [m for m in ('columnar', 'multiprocessing') if m in sys.modules]
+
+lambda_function.DYNAMODB_TABLE = 'stats'
+with contextlib.redirect_stdout(io.StringIO()):
+    if WARM_UP:
+        result['warm_up'] = json.loads(lambda_function.lambda_handler({'warmup': True}, None)['body'])
+        result['calls_after_warm_up'] = list(calls)
+    start = time.perf_counter()
+    lambda_function.lambda_handler(event, None)
+    result['first_invoke_ms'] = (time.perf_counter() - start) * 1000
+    lambda_function.lambda_handler(event, None)
+result['calls'] = calls
+result['items'] = {f"{k[0]} {k[1]}": int(v['critical_count'])
+                   for k, v in dynamodb.Table('stats').items.items()}
+print(json.dumps(result))
+'''
+
+
+def run_child(warm_up=False, env=None):
+    child_env = {k: v for k, v in os.environ.items()
+                 if k not in ('DYNAMODB_TABLE', 'AWS_LAMBDA_INITIALIZATION_TYPE')}
+    child_env.update(env or {})
+    code = f"LAMBDA_DIR = {str(LAMBDA_DIR)!r}\nWARM_UP = {warm_up!r}\n" + CHILD
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=str(LAMBDA_DIR),
+                                     env=child_env, text=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class TestColdStart(unittest.TestCase):
+
+    def test_import_is_lazy(self):
+        result = run_child()
+        self.assertEqual(result['calls_after_import'], [])
+        self.assertEqual(result['modules_after_import'], [])
+        # 初回の呼び出しで S3 と DynamoDB の低レベルクライアントだけを作り、2回目以降は使い回す
+        self.assertEqual(result['calls'], [['client', 's3'], ['client', 'dynamodb']])
+        # 低レベルクライアント経由でも同じアイテムが書き込まれる
+        self.assertEqual(result['items'], {'2025-04-28 10:00': 1})
+
+    def test_budget(self):
+        # 1回目はディスクキャッシュ等の影響を受けるため、良い方で判定する
+        runs = [run_child() for _ in range(2)]
+        import_ms = min(r['import_ms'] for r in runs)
+        invoke_ms = min(r['first_invoke_ms'] for r in runs)
+        self.assertLess(import_ms, IMPORT_BUDGET_MS, f"import took {import_ms:.1f}ms")
+        self.assertLess(invoke_ms, INVOKE_BUDGET_MS, f"first invoke took {invoke_ms:.1f}ms")
+
+    def test_warm_up_event(self):
+        result = run_child(warm_up=True)
+        self.assertEqual(result['warm_up']['message'], 'Warmed up')
+        self.assertEqual(sorted(result['warm_up']['initialized']), ['batch_writer', 's3_client'])
+        self.assertEqual(result['calls_after_warm_up'], [['client', 's3'], ['client', 'dynamodb']])
+        # 本番の呼び出しでは新しいクライアントを作らない
+        self.assertEqual(result['calls'], result['calls_after_warm_up'])
+
+    def test_provisioned_concurrency(self):
+        result = run_child(env={'AWS_LAMBDA_INITIALIZATION_TYPE': 'provisioned-concurrency',
+                                'DYNAMODB_TABLE': 'stats', 'COLUMNAR_PREFIX': 'columnar/'})
+        self.assertEqual(result['calls_after_import'], [['client', 's3'], ['client', 'dynamodb']])
+        self.assertEqual(result['modules_after_import'], ['columnar'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,250 @@
+"""
+列指向エクスポートのテスト
+
+columnar.ColumnarWriter / ColumnarReader の往復（CSV と同じ値になるか）、
+必要な列・行グループだけを読むこと、COLUMNAR_PREFIX による取り込み時の書き出しをテスト
+"""
+
+import unittest
+import csv
+import io
+import random
+import sys
+import tempfile
+import zipfile
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# テストデータ生成に generator を使う
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / 'generator'))
+
+import lambda_function
+import columnar
+import member_pool
+from columnar import ColumnarWriter, ColumnarReader, ColumnarError, COLUMN_NAMES, epoch
+from csv_scanner import CsvScanner
+from generate import JuniperSyslogGenerator
+from tests.fakes import FakeS3Client
+
+
+def generator_csv(rows, hours=(3, 4), seed=7):
+    """generator で hours の各時間 rows 行ずつの CSV を作る"""
+    random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        generator = JuniperSyslogGenerator(tmp, datetime(2025, 4, 28), 'srx-fw01', rows, 0.2)
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(COLUMN_NAMES)
+        for hour in hours:
+            base = datetime(2025, 4, 28, hour)
+            writer.writerows(sorted(generator.generate_log_row(base) for _ in range(rows)))
+    return buf.getvalue().encode('utf-8')
+
+
+def write_columnar(data, row_group_size=columnar.ROW_GROUP_SIZE):
+    scanner = CsvScanner(io.BytesIO(data))
+    out = io.BytesIO()
+    writer = ColumnarWriter(out, scanner.column_indexes(COLUMN_NAMES), row_group_size)
+    writer.extend(scanner.rows(len(scanner.columns) - 1))
+    writer.close()
+    return out.getvalue()
+
+
+def csv_rows(data):
+    return list(csv.DictReader(io.StringIO(data.decode('utf-8'))))
+
+
+def to_epoch(text):
+    return int(datetime.strptime(text, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp())
+
+
+class TestRoundTrip(unittest.TestCase):
+    """書き込み → 読み込みで CSV と同じ値になるか"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = generator_csv(3000)
+        cls.rows = csv_rows(cls.data)
+
+    def test_all_columns(self):
+        reader = ColumnarReader(io.BytesIO(write_columnar(self.data, row_group_size=1000)))
+        self.assertEqual(reader.rows, len(self.rows))
+        self.assertEqual(len(reader.row_groups), 6)
+        decoded = list(reader.scan())
+        for row, values in zip(self.rows, decoded):
+            expected = [row[name] for name in COLUMN_NAMES]
+            expected[0] = to_epoch(expected[0])
+            self.assertEqual(list(values), expected)
+
+    def test_dictionary_encoding(self):
+        reader = ColumnarReader(io.BytesIO(write_columnar(self.data)))
+        self.assertEqual(reader.dictionaries['Hostname'], ['srx-fw01'])
+        self.assertEqual(set(reader.dictionaries['Severity']), {r['Severity'] for r in self.rows})
+        # 辞書列は1バイトの番号で保存される
+        self.assertTrue(all(chunk['type'] == 'B'
+                            for name, chunk in reader.row_groups[0]['chunks'].items()
+                            if name in reader.dictionaries))
+
+    def test_smaller_than_csv(self):
+        encoded = write_columnar(self.data)
+        self.assertLess(len(encoded), len(self.data) / 4)
+
+    def test_quoted_and_invalid_values(self):
+        """クォート付きの値・解析できない Timestamp・空ファイル"""
+        data = ('Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\n'
+                '2025-04-28T10:00:05Z,fw,APP,2,CRITICAL,THREAT,"a, b\nc ""d"""\n'
+                'broken,fw,APP,2,CRITICAL,THREAT,x\n'
+                '2025-04-28T10:00:07.500+09:00,fw,APP,2,CRITICAL,THREAT,日本語\n').encode('utf-8')
+        reader = ColumnarReader(io.BytesIO(write_columnar(data)))
+        rows = list(reader.scan(['Timestamp', 'Message']))
+        self.assertEqual(rows, [
+            (epoch('2025-04-28T10:00:05Z'), 'a, b\nc "d"'),
+            (None, 'x'),
+            (epoch('2025-04-28T01:00:07Z'), '日本語'),
+        ])
+        self.assertEqual(reader.row_groups[0]['invalid'], [1])
+
+        empty = ColumnarReader(io.BytesIO(write_columnar(data.splitlines(keepends=True)[0])))
+        self.assertEqual(empty.rows, 0)
+        self.assertEqual(list(empty.scan()), [])
+
+    def test_not_columnar(self):
+        with self.assertRaises(ColumnarError):
+            ColumnarReader(io.BytesIO(self.data))
+
+
+class TestQuery(unittest.TestCase):
+    """条件付きの読み込みテスト"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = generator_csv(2000, hours=(2, 3, 4))
+        cls.rows = csv_rows(cls.data)
+        cls.encoded = write_columnar(cls.data, row_group_size=500)
+
+    def reader(self):
+        return ColumnarReader(io.BytesIO(self.encoded))
+
+    def test_count_by_with_filters(self):
+        """03:00 台の CRITICAL を AppName 別に数える"""
+        start, end = epoch('2025-04-28T03:00:00Z'), epoch('2025-04-28T04:00:00Z')
+        expected = Counter(r['AppName'] for r in self.rows
+                           if r['Severity'] == 'CRITICAL' and r['Timestamp'][11:13] == '03')
+        reader = self.reader()
+        self.assertEqual(reader.count_by('AppName', where={'Severity': ['CRITICAL']},
+                                         start=start, end=end), expected)
+
+    def test_skips_row_groups_and_columns(self):
+        """時間の範囲外の行グループと、使わない列のチャンクを読まないか"""
+        reader = self.reader()
+        start, end = epoch('2025-04-28T03:00:00Z'), epoch('2025-04-28T04:00:00Z')
+        groups = [g for g in reader.row_groups if g['ts_max'] >= start and g['ts_min'] < end]
+        self.assertLess(len(groups), len(reader.row_groups))
+        reader.count_by('LogType', start=start, end=end)
+        # Timestamp と LogType のチャンクだけ
+        self.assertEqual(reader.chunk_reads, 2 * len(groups))
+
+    def test_scan_filter(self):
+        reader = self.reader()
+        threats = list(reader.scan(['Message'], where={'LogType': ['THREAT'],
+                                                       'Severity': ['CRITICAL', 'WARNING']}))
+        expected = [(r['Message'],) for r in self.rows
+                    if r['LogType'] == 'THREAT' and r['Severity'] in ('CRITICAL', 'WARNING')]
+        self.assertEqual(threats, expected)
+        self.assertEqual(list(reader.scan(where={'Severity': ['NO-SUCH']})), [])
+
+    def test_filter_requires_dictionary_column(self):
+        with self.assertRaises(ValueError):
+            list(self.reader().scan(where={'Message': ['x']}))
+
+
+class DirectoryUploads:
+    """upload_fileobj をディレクトリへの書き込みにするクライアント"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None):
+        path = self.root / Key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(Fileobj.read())
+
+
+class TestColumnarExport(unittest.TestCase):
+    """COLUMNAR_PREFIX を設定した取り込みのテスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.originals = (lambda_function.s3_client, lambda_function.INGEST_MODE,
+                          lambda_function.MEMBER_WORKERS, lambda_function.worker_s3_client,
+                          lambda_function.COLUMNAR_PREFIX, member_pool.START_METHOD)
+        lambda_function.s3_client = self.s3
+        # フェイクを引き継ぐよう、ワーカーはこのプロセスから fork する
+        lambda_function.worker_s3_client = lambda: self.s3
+        member_pool.START_METHOD = 'fork'
+        lambda_function.COLUMNAR_PREFIX = 'columnar/'
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.INGEST_MODE,
+         lambda_function.MEMBER_WORKERS, lambda_function.worker_s3_client,
+         lambda_function.COLUMNAR_PREFIX, member_pool.START_METHOD) = self.originals
+
+    def ingest(self, members, mode, workers):
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            for name, data in members:
+                z.writestr(name, data)
+        self.s3.objects[('in', 'raw/2025-04-28/bundle.zip')] = out.getvalue()
+        lambda_function.INGEST_MODE = mode
+        lambda_function.MEMBER_WORKERS = workers
+        return lambda_function.ingest('in', 'raw/2025-04-28/bundle.zip')
+
+    def exported(self):
+        return {key: data for (bucket, key), data in self.s3.objects.items()
+                if key.startswith('columnar/')}
+
+    def test_export_matches_csv(self):
+        members = [('03.csv', generator_csv(500, hours=(3,))),
+                   ('04.csv', generator_csv(500, hours=(4,)))]
+        for mode, workers in (('stream', 1), ('disk', 1)):
+            self.s3.objects.clear()
+            stats, = self.ingest(members, mode, workers)
+            exported = self.exported()
+            self.assertEqual(sorted(exported), [
+                'columnar/2025-04-28/srx-fw01/bundle/03.slcol',
+                'columnar/2025-04-28/srx-fw01/bundle/04.slcol'])
+            reader = ColumnarReader(io.BytesIO(exported['columnar/2025-04-28/srx-fw01/bundle/04.slcol']))
+            self.assertEqual(reader.count_by('Severity'),
+                             Counter(r['Severity'] for r in csv_rows(members[1][1])))
+            # 集計結果は書き出しの有無で変わらない
+            lambda_function.COLUMNAR_PREFIX = ''
+            self.assertEqual(self.ingest(members, mode, workers), [stats])
+            lambda_function.COLUMNAR_PREFIX = 'columnar/'
+
+    def test_export_from_worker_processes(self):
+        """ワーカープロセスからはプロセスごとのクライアントで書き出すか"""
+        members = [(f'{hour:02d}.csv', generator_csv(200, hours=(hour,))) for hour in (1, 2, 3)]
+        with tempfile.TemporaryDirectory() as tmp:
+            # fork したワーカーの書き込みは親のフェイクに届かないため、ファイルに書く
+            lambda_function.worker_s3_client = lambda: DirectoryUploads(tmp)
+            self.ingest(members, 'disk', 2)
+            uploaded = sorted(p.relative_to(tmp).as_posix() for p in Path(tmp).rglob('*.slcol'))
+        self.assertEqual(uploaded, [f'columnar/2025-04-28/srx-fw01/bundle/{hour:02d}.slcol'
+                                    for hour in (1, 2, 3)])
+
+    def test_missing_columns_are_not_exported(self):
+        data = b'Timestamp,Hostname,Severity\n2025-04-28T10:00:00Z,srx-fw01,CRITICAL\n'
+        stats, = self.ingest([('10.csv', data)], 'stream', 1)
+        self.assertEqual(stats['hourly_stats'], {'10:00': {'CRITICAL': 1, 'WARNING': 0}})
+        self.assertEqual(self.exported(), {})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
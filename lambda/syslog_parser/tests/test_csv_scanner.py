@@ -0,0 +1,155 @@
+"""
+高速 CSV スキャナのテスト
+
+csv_scanner.CsvScanner が csv.reader と同じフィールド値を返すかをテスト
+"""
+
+import unittest
+import csv
+import io
+import sys
+import tempfile
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from csv_scanner import CsvScanner
+from lambda_function import parse_csv
+
+HEADER = ['Timestamp', 'Hostname', 'AppName', 'SeverityLevel', 'Severity', 'LogType', 'Message']
+
+
+def scan(data, max_index):
+    scanner = CsvScanner(io.BufferedReader(io.BytesIO(data)))
+    return scanner, [[f.decode('utf-8') for f in fields[:max_index + 1]]
+                     for fields in scanner.rows(max_index)]
+
+
+def reference(data, max_index):
+    rows = list(csv.reader(io.StringIO(data.decode('utf-8'), newline='')))
+    return [(row + [''] * (max_index + 1))[:max_index + 1] for row in rows[1:] if row]
+
+
+class TestCsvScanner(unittest.TestCase):
+    """CsvScanner と csv.reader の一致テスト"""
+
+    def write_rows(self, rows, lineterminator='\r\n'):
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator=lineterminator)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+        return buf.getvalue().encode('utf-8')
+
+    def assert_same_as_csv(self, data):
+        expected = reference(data, len(HEADER) - 1)
+        for max_index in (1, 4, 5, len(HEADER) - 1):
+            scanner, rows = scan(data, max_index)
+            self.assertEqual(scanner.columns, HEADER)
+            self.assertEqual(rows, reference(data, max_index), f"max_index={max_index}")
+            # 分割しない列も field_getter で全列を分割した場合と同じ値を取り出せる
+            scanner = CsvScanner(io.BufferedReader(io.BytesIO(data)))
+            getters = [scanner.field_getter(max_index, i) for i in range(len(HEADER))]
+            rows = [[get(fields).decode('utf-8') for get in getters]
+                    for fields in scanner.rows(max_index)]
+            self.assertEqual(rows, expected, f"field_getter max_index={max_index}")
+
+    def test_plain_rows(self):
+        """クォートなしの行（高速パス）"""
+        rows = [['2025-04-28T10:00:00Z', 'srx-fw01', 'RT_IDP', '2', 'CRITICAL', 'THREAT',
+                 f'RT_IDP_ATTACK_LOG: Port scan detected 10.0.0.{i}/1234 > 8.8.8.8/53 protocol=udp']
+                for i in range(20)]
+        self.assert_same_as_csv(self.write_rows(rows))
+        self.assert_same_as_csv(self.write_rows(rows, lineterminator='\n'))
+
+    def test_quoted_fields(self):
+        """区切り文字・改行・エスケープされたクォートを含むフィールド（フォールバック）"""
+        rows = [
+            ['2025-04-28T10:00:00Z', 'srx-fw01', 'RT_IDP', '2', 'CRITICAL', 'THREAT', 'a, b, c'],
+            ['2025-04-28T11:00:00Z', 'srx-fw01', 'UI_AUTH', '4', 'WARNING', 'NORMAL', 'line1\nline2\r\nline3'],
+            ['2025-04-28T12:00:00Z', 'srx,fw02', 'SSHD', '6', 'INFO', 'NORMAL', 'say "hello", bye'],
+            ['2025-04-28T13:00:00Z', 'srx-fw01', 'SSHD', '6', 'INFO', 'NORMAL', 'plain'],
+        ]
+        self.assert_same_as_csv(self.write_rows(rows))
+
+    def test_stray_quotes(self):
+        """フィールドの途中の " で後続の行を飲み込まないか（csv.reader はクォートの始まりとみなさない）"""
+        data = ('Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\r\n'
+                '2025-04-28T10:00:00Z,srx-fw01,CHASSISD,2,CRITICAL,NORMAL,disk 5" bay failed\r\n'
+                '2025-04-28T10:01:00Z,srx-fw01,RT_IDP,2,CRITICAL,THREAT,msg\r\n'
+                '2025-04-28T10:02:00Z,srx-fw01,SSHD,6,INFO,NORMAL,"quoted, ""ok"""\r\n'
+                '2025-04-28T10:03:00Z,srx-fw01,CHASSISD,4,WARNING,NORMAL,fan 2" tray removed\r\n'
+                '2025-04-28T10:04:00Z,srx-fw01,SSHD,6,INFO,NORMAL,"a"b,c\r\n').encode('utf-8')
+        self.assertEqual(len(reference(data, 1)), 5)
+        self.assert_same_as_csv(data)
+
+    def test_blank_and_short_rows(self):
+        """空行と列数の足りない行"""
+        data = ('Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\r\n'
+                '\r\n'
+                '2025-04-28T10:00:00Z,srx-fw01\r\n'
+                '2025-04-28T10:00:00Z,srx-fw01,RT_IDP,2,CRITICAL,THREAT\r\n'
+                '2025-04-28T10:00:00Z,srx-fw01,RT_IDP,2,CRITICAL,THREAT,\r\n'
+                '2025-04-28T10:00:00Z,srx-fw01,RT_IDP,2,CRITICAL,THREAT,msg,extra\r\n'
+                '2025-04-28T10:00:00Z,srx-fw01,RT_IDP,2,CRITICAL,THREAT,msg').encode('utf-8')
+        self.assert_same_as_csv(data)
+
+    def test_bom_and_empty(self):
+        """BOM 付きヘッダーと空ファイル"""
+        data = b'\xef\xbb\xbf' + self.write_rows([['t', 'h', 'a', '1', 'INFO', 'NORMAL', 'm']])
+        scanner, _ = scan(data, 1)
+        self.assertEqual(scanner.columns, HEADER)
+        scanner, rows = scan(b'', 1)
+        self.assertEqual((scanner.columns, rows), ([], []))
+
+    def test_missing_column(self):
+        """存在しない列名は KeyError"""
+        scanner, _ = scan(self.write_rows([]), 1)
+        with self.assertRaises(KeyError):
+            scanner.column_indexes(['Component'])
+
+
+class TestParseCsvFallback(unittest.TestCase):
+    """クォートを含む CSV でも parse_csv の結果が変わらないか"""
+
+    def test_parse_csv_quoted_message(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = Path(tmp) / 'test.csv'
+            with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(HEADER)
+                writer.writerow(['2025-04-28T10:00:00Z', 'srx-fw01', 'RT_IDP', '2',
+                                 'CRITICAL', 'THREAT', 'multi\nline, "quoted"'])
+                writer.writerow(['2025-04-28T10:05:00Z', 'srx-fw01', 'RT_IDP', '4',
+                                 'WARNING', 'THREAT', 'x'])
+                writer.writerow(['2025-04-28T11:05:00Z', 'srx-fw01', 'SSHD', '6',
+                                 'INFO', 'NORMAL', 'y'])
+
+            stats = parse_csv(str(csv_path))
+
+        self.assertEqual(stats['log_date'], '2025-04-28')
+        self.assertEqual(stats['hostname'], 'srx-fw01')
+        self.assertEqual(stats['hourly_stats'], {'10:00': {'CRITICAL': 1, 'WARNING': 1}})
+
+    def test_parse_csv_stray_quote(self):
+        """Message の途中の " の後の行も集計されるか"""
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = Path(tmp) / 'test.csv'
+            csv_path.write_bytes(
+                b'Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\n'
+                b'2025-04-28T10:00:00Z,srx-fw01,CHASSISD,2,CRITICAL,NORMAL,disk 5" bay failed\n'
+                b'2025-04-28T10:05:00Z,srx-fw01,RT_IDP,2,CRITICAL,THREAT,x\n'
+                b'2025-04-28T11:05:00Z,srx-fw01,RT_IDP,4,WARNING,THREAT,y\n')
+
+            stats = parse_csv(str(csv_path))
+
+        self.assertEqual(stats['hourly_stats'], {'10:00': {'CRITICAL': 2, 'WARNING': 0},
+                                                 '11:00': {'CRITICAL': 0, 'WARNING': 1}})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
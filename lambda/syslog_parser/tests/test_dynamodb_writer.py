@@ -0,0 +1,131 @@
+"""
+DynamoDB バッチ書き込みのテスト
+
+dynamodb_writer.BatchWriter をスロットリング・部分失敗を注入したフェイクでテスト
+"""
+
+import unittest
+import sys
+from decimal import Decimal
+from pathlib import Path
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from dynamodb_writer import BatchWriter, BatchWriteError, serialize_item, deserialize_item
+from tests.fakes import FakeDynamoDB, FakeClientError
+
+
+def make_items(count):
+    return [{'log_date': '2025-04-28', 'hour': f'{i:04d}', 'critical_count': i}
+            for i in range(count)]
+
+
+class TestBatchWriter(unittest.TestCase):
+    """BatchWriter のテスト"""
+
+    def setUp(self):
+        self.sleeps = []
+
+    def make_writer(self, dynamodb, **kwargs):
+        kwargs.setdefault('sleep', self.sleeps.append)
+        return BatchWriter(dynamodb, 'stats', **kwargs)
+
+    def test_batches_of_25(self):
+        """25件ずつのバッチに分割されるか"""
+        dynamodb = FakeDynamoDB()
+        report = self.make_writer(dynamodb).write(make_items(60))
+
+        self.assertEqual(report['batches'], 3)
+        self.assertEqual(report['requests'], 3)
+        self.assertEqual([b['items'] for b in report['batch_stats']], [25, 25, 10])
+        self.assertEqual(len(dynamodb.Table('stats').items), 60)
+        self.assertEqual(self.sleeps, [])
+
+    def test_unprocessed_items_retried(self):
+        """UnprocessedItems が全て書き込まれるまで再送されるか"""
+        dynamodb = FakeDynamoDB(unprocessed_rate=0.5, seed=1)
+        report = self.make_writer(dynamodb, max_retries=20).write(make_items(100))
+
+        self.assertEqual(len(dynamodb.Table('stats').items), 100)
+        self.assertGreater(report['retries'], 0)
+        self.assertEqual(report['throttles'], report['retries'])
+        self.assertEqual(report['unprocessed'], 0)
+        self.assertEqual(len(self.sleeps), report['retries'])
+
+    def test_throttling_exception_retried(self):
+        """スロットリング例外がバックオフ付きで再送されるか"""
+        dynamodb = FakeDynamoDB(throttle_rate=0.5, seed=3)
+        report = self.make_writer(dynamodb, max_retries=20).write(make_items(50))
+
+        self.assertEqual(len(dynamodb.Table('stats').items), 50)
+        self.assertGreater(report['throttles'], 0)
+
+    def test_gives_up_after_max_retries(self):
+        """リトライ上限を超えると BatchWriteError になるか"""
+        dynamodb = FakeDynamoDB(unprocessed_rate=1.0)
+        with self.assertRaises(BatchWriteError) as cm:
+            self.make_writer(dynamodb, max_retries=3).write(make_items(30))
+
+        self.assertEqual(cm.exception.unprocessed_count, 30)
+        self.assertEqual(dynamodb.calls, 2 * 4)
+
+    def test_non_throttle_error_raised(self):
+        """スロットリング以外のエラーは再送せずに送出されるか"""
+        class BrokenDynamoDB:
+            def batch_write_item(self, RequestItems):
+                raise FakeClientError('ValidationException', 'bad item')
+
+        with self.assertRaises(FakeClientError):
+            self.make_writer(BrokenDynamoDB()).write(make_items(1))
+        self.assertEqual(self.sleeps, [])
+
+    def test_backoff_is_exponential_with_jitter(self):
+        """バックオフがフルジッター付きの指数関数になるか"""
+        writer = self.make_writer(FakeDynamoDB(), base_delay=0.1, max_delay=1.0, rand=lambda: 1.0)
+        self.assertEqual([writer._backoff(n) for n in range(1, 6)], [0.1, 0.2, 0.4, 0.8, 1.0])
+        writer.rand = lambda: 0.5
+        self.assertEqual(writer._backoff(2), 0.1)
+
+    def test_in_flight_cap(self):
+        """同時リクエスト数が max_in_flight を超えないか"""
+        dynamodb = FakeDynamoDB(latency=0.01)
+        self.make_writer(dynamodb, max_in_flight=3).write(make_items(250))
+
+        self.assertEqual(len(dynamodb.Table('stats').items), 250)
+        self.assertLessEqual(dynamodb.max_in_flight, 3)
+        self.assertGreater(dynamodb.max_in_flight, 1)
+
+    def test_invalid_batch_size(self):
+        with self.assertRaises(ValueError):
+            BatchWriter(FakeDynamoDB(), 'stats', batch_size=26)
+
+
+class TestSerializer(unittest.TestCase):
+    """低レベルクライアント用の型付き属性値への変換のテスト"""
+
+    def test_round_trip(self):
+        item = {'log_date': '2025-04-28', 'hour': '10:00', 'critical_count': 15,
+                'ratio': Decimal('0.25'), 'flag': True, 'note': None,
+                'top': {'srx-fw01': 3}, 'tags': ['a', 1]}
+        typed = serialize_item(item)
+        self.assertEqual(typed['log_date'], {'S': '2025-04-28'})
+        self.assertEqual(typed['critical_count'], {'N': '15'})
+        self.assertEqual(typed['flag'], {'BOOL': True})
+        self.assertEqual(typed['top'], {'M': {'srx-fw01': {'N': '3'}}})
+        self.assertEqual(deserialize_item(typed), item)
+
+    def test_float_rejected(self):
+        # リソースの TypeSerializer と同じく float は Decimal で渡す必要がある
+        with self.assertRaises(TypeError):
+            serialize_item({'ratio': 0.25})
+
+    def test_writer_serializes(self):
+        dynamodb = FakeDynamoDB(typed=True)
+        writer = BatchWriter(dynamodb, 'stats', serialize=serialize_item)
+        writer.write([{'log_date': '2025-04-28', 'hour': '10:00', 'critical_count': 2}])
+        self.assertEqual(dynamodb.Table('stats').items[('2025-04-28', '10:00')]['critical_count'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
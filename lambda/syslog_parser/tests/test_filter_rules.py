@@ -0,0 +1,329 @@
+"""
+集計ルール（フィルタールールエンジン）のテスト
+
+filter_rules.RuleSet のコンパイル・ディスパッチテーブルによる評価・合算と、
+lambda_function への組み込み（FILTER_RULES / FILTER_RULES_S3）をテスト
+"""
+
+import unittest
+import io
+import re
+import csv
+import sys
+import json
+import random
+import zipfile
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import lambda_function
+import rollup
+from aggregation import AggregationSpec, Aggregator
+from csv_scanner import CsvScanner
+from filter_rules import RuleSet, RuleCounts
+from partials import PartialAggregate
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB
+
+TS, SEV, APP, TYPE, MSG = 0, 1, 2, 3, 4
+COLUMNS = ['Timestamp', 'Severity', 'AppName', 'LogType', 'Message']
+INDEXES = {'Severity': SEV, 'AppName': APP, 'LogType': TYPE, 'Message': MSG}
+
+RULES = [
+    {'name': 'idp_error', 'severity': 'ERROR', 'app': 'RT_IDP'},
+    {'name': 'brute_force', 'message': 'brute force', 'ignore_case': True},
+    {'name': 'threat_scan', 'log_type': 'THREAT', 'message': r'Port scan|SYN flood'},
+    {'name': 'urgent', 'severity': ['EMERGENCY', 'ALERT']},
+]
+
+MESSAGES = [
+    b'RT_IDP_ATTACK_LOG: SSH brute force attack detected',
+    b'RT_IDP_ATTACK_LOG: Port scan detected',
+    b'RT_SCREEN_TCP: SYN flood attack',
+    b'RT_FLOW_SESSION_CREATE: session created',
+    b'Brute Force login',
+]
+
+
+def make_rows(n, seed=1):
+    rand = random.Random(seed)
+    rows = []
+    for i in range(n):
+        rows.append([
+            b'2025-04-28T%02d:%02d:00Z' % (rand.randrange(24), i % 60),
+            rand.choice([b'ERROR', b'CRITICAL', b'EMERGENCY', b'ALERT', b'INFO']),
+            rand.choice([b'RT_IDP', b'RT_SCREEN', b'RT_FLOW']),
+            rand.choice([b'THREAT', b'TRAFFIC', b'SYSTEM']),
+            rand.choice(MESSAGES),
+        ])
+    return rows
+
+
+def naive_counts(rules, rows):
+    """ルールを1行ずつそのまま評価した時間別件数（比較用）"""
+    columns = (('severity', SEV), ('app', APP), ('log_type', TYPE))
+    result = {}
+    for fields in rows:
+        hour = fields[TS][11:13].decode() + ':00'
+        for rule in rules:
+            ok = True
+            for key, i in columns:
+                values = rule.get(key)
+                if values is not None:
+                    values = [values] if isinstance(values, str) else values
+                    ok = ok and fields[i].decode() in values
+            if 'message' in rule:
+                flags = re.IGNORECASE if rule.get('ignore_case') else 0
+                ok = ok and re.search(rule['message'], fields[MSG].decode(), flags) is not None
+            if ok:
+                counts = result.setdefault(hour, {})
+                counts[rule['name']] = counts.get(rule['name'], 0) + 1
+    return result
+
+
+def to_csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\r\n')
+    writer.writerow(COLUMNS)
+    writer.writerows([field.decode() for field in fields] for fields in rows)
+    return out.getvalue().encode()
+
+
+def scan(rule_set, rows, buffer_size=512):
+    """scan_csv と同じ組み立てで CSV にした rows を数える（小さい読み込み単位で複数のブロックにする）"""
+    aggregator = Aggregator(AggregationSpec())
+    counts = rule_set.new_counts()
+    f = rule_set.prefilter(io.BytesIO(to_csv(rows)), counts, buffer_size=buffer_size)
+    scanner = CsvScanner(f)
+    max_index = max([TS, SEV] + [INDEXES[column] for column in rule_set.key_columns])
+    dispatch = rule_set.dispatcher(TS, INDEXES, counts, scanner.field_getter(max_index, MSG))
+    aggregator.consume(scanner.rows(max_index), TS, SEV, dispatch=dispatch)
+    return aggregator, counts
+
+
+class TestRuleSet(unittest.TestCase):
+    """RuleSet のコンパイルと評価のテスト"""
+
+    def test_matches_naive_evaluation(self):
+        """ディスパッチテーブルとまとめた正規表現の結果が、1行ずつの評価と一致するか"""
+        rule_set = RuleSet.parse(json.dumps(RULES))
+        rows = make_rows(3000)
+
+        aggregator, counts = scan(rule_set, rows)
+
+        self.assertEqual(rule_set.hourly_stats(aggregator, counts), naive_counts(RULES, rows))
+
+    def test_severity_only_rules_use_aggregator(self):
+        """Severity だけのルールは行ごとに評価せず、集計カウンタから求めるか"""
+        rule_set = RuleSet.parse(json.dumps(RULES))
+
+        self.assertEqual(rule_set.severity_rules, [('urgent', ['ALERT', 'EMERGENCY'])])
+        self.assertEqual([rule.name for rule in rule_set.row_rules],
+                         ['idp_error', 'brute_force', 'threat_scan'])
+        self.assertEqual(rule_set.columns(), ['Severity', 'AppName', 'LogType', 'Message'])
+
+        severity_only = RuleSet.parse('[{"name": "urgent", "severity": "ALERT"}]')
+        self.assertEqual(severity_only.row_rules, [])
+        self.assertEqual(severity_only.columns(), [])
+
+    def test_unknown_severity_is_evaluated_per_row(self):
+        """RFC5424 にない Severity は集計カウンタでは区別できないため、行ごとに評価するか"""
+        rule_set = RuleSet.parse('[{"name": "err", "severity": "ERR"}]')
+        rows = [[b'2025-04-28T10:00:00Z', b'ERR', b'', b'', b''],
+                [b'2025-04-28T10:00:00Z', b'BOGUS', b'', b'', b'']]
+
+        aggregator, counts = scan(rule_set, rows)
+
+        self.assertEqual(rule_set.hourly_stats(aggregator, counts), {'10:00': {'err': 1}})
+
+    def test_dispatch_table_skips_regex(self):
+        """条件の列で成り立たない組の行は正規表現を評価しないか"""
+        rule_set = RuleSet.parse(
+            '[{"name": "idp_sqli", "app": "RT_IDP", "message": "SQL injection"}]')
+        calls = []
+        rule = rule_set.row_rules[0]
+        search = rule.search
+        rule.search = lambda message: calls.append(message) or search(message)
+        rows = [[b'2025-04-28T10:00:00Z', b'INFO', b'RT_FLOW', b'', b'SQL injection'],
+                [b'2025-04-28T10:00:00Z', b'INFO', b'RT_IDP', b'', b'SQL injection']]
+
+        aggregator, counts = scan(rule_set, rows)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(counts.hourly_stats(), {'10:00': {'idp_sqli': 1}})
+
+    def test_ignore_case_literals_without_regex(self):
+        """ignore_case の文字列だけのパターンは lower() した Message の検索で、正規表現と同じ件数になるか"""
+        rules = [
+            {'name': 'brute_force', 'message': 'Brute Force', 'ignore_case': True},
+            {'name': 'sqli', 'message': 'SQL injection|xss', 'ignore_case': True},
+            {'name': 'scan', 'message': 'port scan', 'ignore_case': True, 'log_type': 'THREAT'},
+            {'name': 'regex', 'message': r'attack\b', 'ignore_case': True},
+            {'name': 'exact', 'message': 'SYN flood'},
+        ]
+        rule_set = RuleSet.parse(json.dumps(rules))
+        self.assertEqual([rule.literals for rule in rule_set.row_rules],
+                         [(b'brute force',), (b'sql injection', b'xss'), (b'port scan',), None,
+                          (b'SYN flood',)])
+        rows = make_rows(2000, seed=5)
+        for i, message in enumerate([b'XSS in /login', b'sql INJECTION', b'PORT SCAN, sql injection xss']):
+            rows[i][MSG] = message
+
+        aggregator, counts = scan(rule_set, rows)
+
+        self.assertEqual(rule_set.hourly_stats(aggregator, counts), naive_counts(rules, rows))
+
+    def test_message_only_rules_scan_blocks(self):
+        """Message だけのルールは行ごとに評価せず、ブロックごとの文字列の検索で1行ずつの評価と同じ件数になるか"""
+        rules = [
+            {'name': 'brute_force', 'message': 'brute force', 'ignore_case': True},
+            {'name': 'sqli', 'message': 'SQL injection|XSS'},
+            {'name': 'urgent', 'severity': ['EMERGENCY', 'ALERT']},
+        ]
+        rule_set = RuleSet.parse(json.dumps(rules))
+        self.assertEqual([rule_id for rule_id, _ in rule_set.scan_rules], [0, 1])
+        self.assertIsNone(rule_set.dispatcher(TS, INDEXES, rule_set.new_counts()))
+        rows = make_rows(1500, seed=7)
+        # 他の列にだけある文字列・クォートの中の改行と区切り文字・1行に2回ある文字列
+        rows[3][APP] = b'brute force'
+        rows[10][MSG] = b'first line\nSSH Brute Force, "quoted"'
+        rows[11][MSG] = b'XSS and SQL injection, XSS again'
+        rows[-1][MSG] = b'BRUTE FORCE at the end'
+        expected = naive_counts(rules, rows)
+
+        for buffer_size in (64, 512, 1024 * 1024):
+            with self.subTest(buffer_size=buffer_size):
+                aggregator, counts = scan(rule_set, rows, buffer_size)
+                self.assertEqual(rule_set.hourly_stats(aggregator, counts), expected)
+
+        # 最後の行が改行で終わらない CSV
+        counts = rule_set.new_counts()
+        f = rule_set.prefilter(io.BytesIO(to_csv(rows).rstrip(b'\r\n')), counts)
+        while f.read(4096):
+            pass
+        self.assertEqual(counts.hourly_stats(), scan(rule_set, rows)[1].hourly_stats())
+
+        # ルールに必要な列がない CSV では数えない
+        counts = rule_set.new_counts()
+        f = rule_set.prefilter(io.BytesIO(b'Timestamp,Severity\r\n2025-04-28T10:00:00Z,XSS\r\n'), counts)
+        self.assertEqual(f.read(), b'Timestamp,Severity\r\n2025-04-28T10:00:00Z,XSS\r\n')
+        self.assertEqual(counts.hourly_stats(), {})
+
+    def test_invalid_rules(self):
+        """不正なルールは ValueError になるか"""
+        for text in ('{"name": "x"}',
+                     '[{"severity": "ERROR"}]',
+                     '[{"name": "x"}]',
+                     '[{"name": "x", "app": "RT_IDP", "color": "red"}]',
+                     '[{"name": "x", "message": "("}]',
+                     '[{"name": "x", "message": "a"}, {"name": "x", "message": "b"}]',
+                     '[{"name": "x", "message": "(?i)a"}]'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                RuleSet.parse(text)
+        self.assertFalse(RuleSet.parse(''))
+        self.assertTrue(RuleSet.parse('{"rules": [{"name": "x", "severity": "ERROR"}]}'))
+
+    def test_counts_merge_and_round_trip(self):
+        """件数を合算・シリアライズしても結果が変わらないか"""
+        rule_set = RuleSet.parse(json.dumps(RULES))
+        rows = make_rows(1000)
+        _, whole = scan(rule_set, rows)
+        _, first = scan(rule_set, rows[:400])
+        _, second = scan(rule_set, rows[400:])
+
+        merged = RuleCounts.from_dict(json.loads(json.dumps(first.to_dict()))).merge(second)
+
+        self.assertEqual(merged.hourly_stats(), whole.hourly_stats())
+        with self.assertRaises(ValueError):
+            merged.merge(RuleCounts(['other']))
+
+    def test_partial_round_trip(self):
+        """途中集計に件数を持ち回れるか（プロセス間の受け渡し・チェックポイント）"""
+        rule_set = RuleSet.parse(json.dumps(RULES))
+        aggregator, counts = scan(rule_set, make_rows(200))
+        partial = PartialAggregate(aggregator, '2025-04-28', 'fw', rule_counts=counts)
+
+        restored = PartialAggregate.from_dict(json.loads(json.dumps(partial.to_dict())))
+
+        self.assertEqual(restored.rule_counts.hourly_stats(), counts.hourly_stats())
+
+
+class TestHandlerRules(unittest.TestCase):
+    """FILTER_RULES を指定した場合の保存内容テスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB()
+        self.table = self.dynamodb.Table('stats')
+        self.originals = (lambda_function.s3_client, lambda_function.batch_writer,
+                          lambda_function.filter_rules, lambda_function.FILTER_RULES,
+                          lambda_function.FILTER_RULES_S3)
+        lambda_function.s3_client = self.s3
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+        lambda_function.filter_rules = None
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.batch_writer,
+         lambda_function.filter_rules, lambda_function.FILTER_RULES,
+         lambda_function.FILTER_RULES_S3) = self.originals
+
+    def run_handler(self):
+        lines = ['Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\n']
+        for fields in make_rows(500, seed=7):
+            ts, sev, app, log_type, msg = (f.decode() for f in fields)
+            lines.append(f'{ts},srx-fw01,{app},2,{sev},{log_type},{msg}\n')
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr('10.csv', ''.join(lines))
+        self.s3.objects[('in', 'raw/10.zip')] = out.getvalue()
+
+        event = {'Records': [{'s3': {'bucket': {'name': 'in'}, 'object': {'key': 'raw/10.zip'}}}]}
+        lambda_function.lambda_handler(event, None)
+        return naive_counts(RULES, make_rows(500, seed=7))
+
+    def test_items_and_json(self):
+        """ルール別の時間別件数が DynamoDB と日次JSON・月次ロールアップに保存されるか"""
+        lambda_function.FILTER_RULES = json.dumps(RULES)
+
+        expected = self.run_handler()
+
+        for hour, counts in expected.items():
+            self.assertEqual(self.table.items[('2025-04-28', hour)]['rule_counts'], counts)
+        body = self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json')]
+        hours = {h['hour']: h for h in rollup.decode_document(body)['hourly_stats']}
+        self.assertEqual({hour: h['rules'] for hour, h in hours.items()}, expected)
+
+        body = self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'data/monthly/2025-04.json')]
+        (day,) = rollup.decode_document(body)['daily_stats']
+        self.assertEqual(day['rules']['brute_force'],
+                         sum(c.get('brute_force', 0) for c in expected.values()))
+
+    def test_rules_from_s3(self):
+        """FILTER_RULES_S3 のルールを読み込むか（FILTER_RULES より優先）"""
+        self.s3.objects[('config', 'rules.json')] = json.dumps(RULES).encode()
+        lambda_function.FILTER_RULES = '[{"name": "ignored", "severity": "INFO"}]'
+        lambda_function.FILTER_RULES_S3 = 's3://config/rules.json'
+
+        expected = self.run_handler()
+
+        self.assertEqual(lambda_function.get_filter_rules().names(), [r['name'] for r in RULES])
+        self.assertEqual(self.table.items[('2025-04-28', '10:00')]['rule_counts'], expected['10:00'])
+
+    def test_no_rules_no_attribute(self):
+        """ルールがなければ従来どおり rule_counts を保存しないか"""
+        lambda_function.FILTER_RULES = ''
+        lambda_function.FILTER_RULES_S3 = ''
+
+        self.run_handler()
+
+        self.assertNotIn('rule_counts', self.table.items[('2025-04-28', '10:00')])
+
+
+if __name__ == '__main__':
+    unittest.main()
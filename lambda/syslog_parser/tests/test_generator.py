@@ -0,0 +1,441 @@
+"""
+テストデータ生成（generator/generate.py・generator/batch.py）のテスト
+
+バッチ生成の行が generate_log_row と同じ列・形式・分布になるか、
+random.seed() で結果を固定できるか、Lambda の集計でそのまま読めるか、
+ホスト × 日付 × 時間の並列生成がプロセス数によらず同じ ZIP になるか、
+負荷の形（generator/profiles.py）が指定どおりの偏りになるかをテスト
+"""
+
+import unittest
+import io
+import csv
+import re
+import random
+import sys
+import tempfile
+import zipfile
+import hashlib
+import ipaddress
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# テスト対象の generator
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / 'generator'))
+
+import lambda_function
+import zip_stream
+import batch
+import generate
+import profiles
+from generate import JuniperSyslogGenerator, THREAT_MESSAGES, NORMAL_MESSAGES, SEVERITIES
+
+BASE_TIME = datetime(2025, 4, 28, 10)
+HEADER = ['Timestamp', 'Hostname', 'AppName', 'SeverityLevel', 'Severity', 'LogType', 'Message']
+MESSAGE = re.compile(
+    r'(?P<text>.+) (?P<src>[\d.]+)/(?P<sport>\d+) > (?P<dst>[\d.]+)/(?P<dport>\d+) '
+    r'protocol=(?P<protocol>tcp|udp|icmp) SeverityLevel=(?P<level>\d) Severity=(?P<severity>[A-Z]+)$')
+
+ENGINES = ['python'] + (['numpy'] if batch.numpy is not None else [])
+
+
+def make_generator(tmp, rows, threat_ratio=0.1, engine='python', hostname='srx-fw01'):
+    with patch('builtins.print'):
+        return JuniperSyslogGenerator(tmp, datetime(2025, 4, 28), hostname, rows, threat_ratio,
+                                      engine=engine)
+
+
+def batch_rows(generator, rows):
+    return list(csv.reader(io.StringIO(''.join(generator.batch.lines(BASE_TIME, rows)))))
+
+
+class TestBatchRows(unittest.TestCase):
+    """バッチ生成した行の形式と分布のテスト"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_row_format(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                random.seed(3)
+                rows = batch_rows(make_generator(self.tmp.name, 0, 0.5, engine), 2000)
+                self.assertEqual(len(rows), 2000)
+                for timestamp, hostname, appname, level, severity, log_type, message in rows:
+                    self.assertEqual(hostname, 'srx-fw01')
+                    self.assertTrue(timestamp.startswith('2025-04-28T10:'))
+                    self.assertEqual(int(level), SEVERITIES[severity])
+                    match = MESSAGE.match(message)
+                    self.assertIsNotNone(match, message)
+                    self.assertEqual((match['level'], match['severity']), (level, severity))
+                    messages = THREAT_MESSAGES if log_type == 'THREAT' else NORMAL_MESSAGES
+                    self.assertIn(match['text'], messages[appname])
+                    self.assertTrue(ipaddress.ip_address(match['src']).is_private)
+                    self.assertTrue(1024 <= int(match['sport']) <= 65535)
+                    self.assertIn(int(match['dport']), batch.DST_PORTS)
+                    self.assertNotEqual(match['dst'].split('.')[-1], '0')
+
+    def test_distribution_matches_per_row(self):
+        """Severity・AppName・宛先IPの種類の比率が generate_log_row と同じか"""
+        rows = 40000
+        random.seed(5)
+        generator = make_generator(self.tmp.name, 0, 0.2, 'row')
+        expected = self.ratios([generator.generate_log_row(BASE_TIME) for _ in range(rows)])
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                observed = self.ratios(batch_rows(make_generator(self.tmp.name, 0, 0.2, engine), rows))
+                self.assertEqual(set(observed), set(expected))
+                for key, ratio in expected.items():
+                    self.assertAlmostEqual(observed[key], ratio, delta=0.015, msg=key)
+
+    def ratios(self, rows):
+        counts = Counter()
+        for row in rows:
+            match = MESSAGE.match(row[6])
+            dst = ipaddress.ip_address(match['dst'])
+            counts.update([('severity', row[4]), ('app', row[2]), ('type', row[5]),
+                           ('dst_private', dst.is_private), ('protocol', match['protocol'])])
+            self.assertFalse(dst.is_loopback)
+        return {key: count / len(rows) for key, count in counts.items()}
+
+    def test_extreme_threat_ratios(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                types = {row[5] for row in batch_rows(make_generator(self.tmp.name, 0, 0.0, engine), 500)}
+                self.assertEqual(types, {'NORMAL'})
+                types = {row[5] for row in batch_rows(make_generator(self.tmp.name, 0, 1.0, engine), 500)}
+                self.assertEqual(types, {'THREAT'})
+
+    def test_seed_is_reproducible(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                generator = make_generator(self.tmp.name, 0, 0.1, engine)
+                random.seed(42)
+                first = generator.batch.lines(BASE_TIME, 300)
+                random.seed(42)
+                self.assertEqual(generator.batch.lines(BASE_TIME, 300), first)
+                self.assertNotEqual(generator.batch.lines(BASE_TIME, 300), first)
+
+    def test_hostname_is_quoted_like_csv_writer(self):
+        random.seed(1)
+        rows = batch_rows(make_generator(self.tmp.name, 0, 0.1, hostname='fw,"lab"'), 10)
+        self.assertEqual({row[1] for row in rows}, {'fw,"lab"'})
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            make_generator(self.tmp.name, 0, engine='fast')
+
+    def test_fallback_without_numpy(self):
+        with patch.object(batch, 'numpy', None):
+            self.assertEqual(make_generator(self.tmp.name, 0, engine='auto').engine, 'python')
+            with self.assertRaises(ImportError):
+                make_generator(self.tmp.name, 0, engine='numpy')
+
+
+class TestHourlyLog(unittest.TestCase):
+    """create_hourly_log の ZIP をどの方式でも Lambda で集計できるか"""
+
+    def test_zip_is_parsed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for engine in ENGINES + ['row']:
+                with self.subTest(engine=engine):
+                    random.seed(9)
+                    generator = make_generator(tmp, 3000, 0.3, engine)
+                    # バッチの区切りをまたいでも行数が変わらない
+                    with patch.object(batch, 'DEFAULT_BATCH_SIZE', 700):
+                        generator.create_hourly_log(7)
+                    with zipfile.ZipFile(Path(tmp) / '07.zip') as z:
+                        text = z.read('07.csv').decode('utf-8')
+                    rows = list(csv.reader(io.StringIO(text)))
+                    self.assertEqual(rows[0], HEADER)
+                    self.assertEqual(len(rows), 3001)
+                    self.assertTrue(text.endswith('\r\n'))
+
+                    expected = Counter(row[4] for row in rows[1:] if row[4] in ('CRITICAL', 'WARNING'))
+                    csv_path = Path(tmp) / '07.csv'
+                    csv_path.write_text(text, encoding='utf-8', newline='')
+                    stats = lambda_function.parse_csv(str(csv_path))
+                    self.assertEqual(stats['hourly_stats'], {'07:00': {'CRITICAL': expected['CRITICAL'],
+                                                                       'WARNING': expected['WARNING']}})
+
+
+class TestStreamingZip(unittest.TestCase):
+    """ZIP のメンバーへの直接書き込みと圧縮レベルのテスト"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def create(self, rows, engine='python', **kwargs):
+        generator = make_generator(self.tmp.name, rows, 0.1, engine)
+        for name, value in kwargs.items():
+            setattr(generator, name, value)
+        generator.seed = 3
+        self.assertTrue(generator.create_hourly_log(4))
+        return Path(self.tmp.name) / '04.zip'
+
+    def test_no_intermediate_file(self):
+        self.create(100)
+        self.assertEqual(sorted(p.name for p in Path(self.tmp.name).iterdir()), ['04.zip'])
+
+    def test_constant_memory(self):
+        """ピークのメモリ使用量が行数によらない"""
+        peaks = {}
+        for engine in ENGINES + ['row']:
+            # 表（batch.py のキャッシュ）を作っておく
+            self.create(10, engine)
+            for rows in (2000, 20000):
+                with patch.object(batch, 'DEFAULT_BATCH_SIZE', 500):
+                    tracemalloc.start()
+                    self.create(rows, engine)
+                    peaks[engine, rows] = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+            with self.subTest(engine=engine):
+                self.assertLess(peaks[engine, 20000], peaks[engine, 2000] * 1.5 + 256 * 1024)
+
+    def test_compress_levels(self):
+        texts = {}
+        sizes = {}
+        for level in (0, 1, 9):
+            path = self.create(3000, compress_level=level)
+            sizes[level] = path.stat().st_size
+            with zipfile.ZipFile(path) as z:
+                info = z.getinfo('04.csv')
+                self.assertEqual(info.compress_type,
+                                 zipfile.ZIP_STORED if level == 0 else zipfile.ZIP_DEFLATED)
+            # Lambda のストリーム取り込みでも読める
+            with open(path, 'rb') as f:
+                (name, member), = [(n, m.read()) for n, m in zip_stream.iter_members(f)]
+            texts[level] = member
+        self.assertEqual(texts[0], texts[1])
+        self.assertEqual(texts[0], texts[9])
+        self.assertGreater(sizes[0], sizes[1])
+        self.assertGreater(sizes[1], sizes[9])
+        with self.assertRaises(ValueError):
+            JuniperSyslogGenerator(self.tmp.name, BASE_TIME, 'fw', 1, 0.1, compress_level=10)
+
+    def test_zip64_when_member_may_exceed_4gib(self):
+        with patch.object(generate, 'MAX_ROW_BYTES', 2 ** 32):
+            path = self.create(200)
+        with open(path, 'rb') as f:
+            (name, member), = [(n, m.read()) for n, m in zip_stream.iter_members(f)]
+        with zipfile.ZipFile(path) as z:
+            self.assertEqual(z.read('04.csv'), member)
+        # ローカルヘッダーに ZIP64 の拡張フィールド（ID 0x0001）がある
+        header = path.read_bytes()[:64]
+        self.assertEqual(header[30 + len('04.csv'):][:2], b'\x01\x00')
+        self.assertEqual(len(member.splitlines()), 201)
+
+
+def tree_digest(root):
+    """root 以下のファイルの相対パス → SHA-256"""
+    return {path.relative_to(root).as_posix(): hashlib.sha256(path.read_bytes()).hexdigest()
+            for path in sorted(Path(root).rglob('*')) if path.is_file()}
+
+
+class TestCorpus(unittest.TestCase):
+    """generate_corpus（--workers / --seed / --hosts / --days）のテスト"""
+
+    DATES = [datetime(2025, 4, 28) + timedelta(days=i) for i in range(2)]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def corpus(self, name, seed=7, workers=1, engine='python', hostnames=('fw01', 'fw02'), dates=None):
+        root = Path(self.tmp.name) / name
+        with patch('builtins.print'):
+            failed = generate.generate_corpus(root, dates or self.DATES, list(hostnames), 40, 0.3,
+                                              seed, engine=engine, workers=workers, hours=3)
+        self.assertEqual(failed, [])
+        return tree_digest(root)
+
+    def test_identical_for_any_worker_count(self):
+        for engine in ENGINES + ['row']:
+            with self.subTest(engine=engine):
+                serial = self.corpus(f'{engine}-1', engine=engine)
+                self.assertEqual(len(serial), 2 * 2 * 3)
+                self.assertIn('2025-04-29/fw02/02.zip', serial)
+                self.assertEqual(self.corpus(f'{engine}-3', engine=engine, workers=3), serial)
+
+    def test_units_are_independent(self):
+        """ホストや日付を増やしても、既存の (ホスト, 日付, 時) の内容は変わらない"""
+        full = self.corpus('full')
+        other = self.corpus('other', hostnames=('fw02', 'fw09'), dates=self.DATES[::-1])
+        for key in ('2025-04-28/fw02/00.zip', '2025-04-29/fw02/02.zip'):
+            self.assertEqual(other[key], full[key])
+        self.assertNotEqual(full['2025-04-28/fw01/00.zip'], full['2025-04-28/fw02/00.zip'])
+        self.assertNotEqual(self.corpus('other-seed', seed=8), full)
+
+    def test_single_host_and_day_is_flat(self):
+        digest = self.corpus('flat', hostnames=('srx-fw01',), dates=self.DATES[:1])
+        self.assertEqual(sorted(digest), ['00.zip', '01.zip', '02.zip'])
+        with zipfile.ZipFile(Path(self.tmp.name) / 'flat' / '01.zip') as z:
+            info = z.getinfo('01.csv')
+            rows = list(csv.reader(io.StringIO(z.read(info).decode('utf-8'))))
+        # 更新日時は ZIP の既定値に固定（生成した日時によらず同じバイト列になる）
+        self.assertEqual(info.date_time, (1980, 1, 1, 0, 0, 0))
+        self.assertEqual(len(rows), 41)
+        self.assertEqual({row[1] for row in rows[1:]}, {'srx-fw01'})
+        self.assertTrue(all(row[0].startswith('2025-04-28T01:') for row in rows[1:]))
+
+    def test_unit_seed(self):
+        seed = generate.unit_seed(1, 'fw01', datetime(2025, 4, 28), 5)
+        self.assertEqual(seed, generate.unit_seed(1, 'fw01', datetime(2025, 4, 28), 5))
+        others = {generate.unit_seed(2, 'fw01', datetime(2025, 4, 28), 5),
+                  generate.unit_seed(1, 'fw02', datetime(2025, 4, 28), 5),
+                  generate.unit_seed(1, 'fw01', datetime(2025, 4, 29), 5),
+                  generate.unit_seed(1, 'fw01', datetime(2025, 4, 28), 6)}
+        self.assertNotIn(seed, others)
+        self.assertEqual(len(others), 4)
+
+    def test_fleet_hostnames(self):
+        self.assertEqual(generate.fleet_hostnames('srx-fw01', '1'), ['srx-fw01'])
+        self.assertEqual(generate.fleet_hostnames('srx-fw01', '3'), ['srx-fw01', 'srx-fw02', 'srx-fw03'])
+        self.assertEqual(generate.fleet_hostnames('srx-fw01', '300')[-1], 'srx-fw300')
+        self.assertEqual(generate.fleet_hostnames('srx-fw01', '300')[0], 'srx-fw001')
+        self.assertEqual(generate.fleet_hostnames('edge', '2'), ['edge01', 'edge02'])
+        self.assertEqual(generate.fleet_hostnames('srx-fw01', 'a, b'), ['a', 'b'])
+
+
+def read_rows(zip_path):
+    """ZIP の CSV の行（ヘッダーを除く）"""
+    with zipfile.ZipFile(zip_path) as z:
+        return list(csv.reader(io.StringIO(z.read(z.namelist()[0]).decode('utf-8'))))[1:]
+
+
+class TestProfiles(unittest.TestCase):
+    """負荷の形（--profile）のテスト"""
+
+    DATE = datetime(2025, 4, 28)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def hourly(self, profile, hour, rows=2000, engine='python', threat_ratio=0.1, seed=3):
+        with patch('builtins.print'):
+            generator = JuniperSyslogGenerator(self.tmp.name, self.DATE, 'srx-fw01', rows,
+                                               threat_ratio, engine=engine, seed=seed,
+                                               profile=profile)
+        self.assertTrue(generator.create_hourly_log(hour))
+        return read_rows(Path(self.tmp.name) / f"{hour:02d}.zip")
+
+    def planned(self, profile, rows=1000, seed=3, hostname='srx-fw01'):
+        return [generate.planned_rows(hostname, self.DATE, hour, rows, 0.1, seed, profile)
+                for hour in range(24)]
+
+    def test_flat(self):
+        self.assertEqual(profiles.make_profiles(None, 1), [])
+        self.assertEqual(profiles.make_profiles('flat', 1), [])
+        self.assertEqual(self.planned('flat'), [1000] * 24)
+        rows = self.hourly('flat', 2)
+        self.assertEqual(len(rows), 2000)
+
+    def test_diurnal(self):
+        planned = self.planned('diurnal:peak=14:amplitude=0.6')
+        self.assertEqual(max(planned), planned[14])
+        self.assertEqual(min(planned), planned[2])
+        self.assertEqual(planned[14], 1600)
+        self.assertEqual(planned[2], 400)
+        # 1日の平均は元の行数のまま
+        self.assertAlmostEqual(sum(planned) / 24, 1000, delta=1)
+        self.assertEqual(len(self.hourly('diurnal:peak=14:amplitude=0.6', 14)), 3200)
+
+    def test_burst(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                rows = self.hourly('burst:hours=4:minutes=5:factor=2:sources=3', 4,
+                                   engine=engine)
+                self.assertEqual(len(rows), 2000 * 3)
+                critical = [row for row in rows if row[4] == 'CRITICAL']
+                self.assertGreater(len(critical), 4000 * 0.85)
+                # CRITICAL の大半は 5 分間・3 つの攻撃元（グローバルIP）→ 1 つの宛先に集中する
+                in_burst = [MESSAGE.match(row[6]) for row in critical
+                            if not ipaddress.ip_address(MESSAGE.match(row[6])['src']).is_private]
+                self.assertGreater(len(in_burst), len(critical) * 0.9)
+                self.assertEqual(len({m['src'] for m in in_burst}), 3)
+                self.assertEqual(len({(m['dst'], m['dport'], m['protocol']) for m in in_burst}), 1)
+                seconds = [int(row[0][14:16]) * 60 + int(row[0][17:19]) for row in critical
+                           if not ipaddress.ip_address(MESSAGE.match(row[6])['src']).is_private]
+                self.assertLess(max(seconds) - min(seconds), 300)
+                # バーストのない時間は変わらない
+                self.assertEqual(len(self.hourly('burst:hours=4', 5, engine=engine)), 2000)
+
+    def test_burst_hours_follow_seed(self):
+        planned = self.planned('burst:count=2')
+        self.assertEqual(sum(rows > 1000 for rows in planned), 2)
+        self.assertEqual(self.planned('burst:count=2'), planned)
+        others = [self.planned('burst:count=2', seed=seed) for seed in range(4, 8)]
+        self.assertTrue(any(other != planned for other in others))
+
+    def test_zipf(self):
+        rows = self.hourly('zipf:s=1.2:sources=100', 1, rows=5000)
+        sources = Counter(MESSAGE.match(row[6])['src'] for row in rows)
+        self.assertLessEqual(len(sources), 100)
+        self.assertTrue(all(ipaddress.ip_address(ip).is_private for ip in sources))
+        # 上位 10 個の送信元で半分以上
+        self.assertGreater(sum(count for _, count in sources.most_common(10)), 2500)
+        # 送信元の一覧は seed だけで決まる（時間が違っても同じヘビーヒッター）
+        other = Counter(MESSAGE.match(row[6])['src']
+                        for row in self.hourly('zipf:s=1.2:sources=100', 2, rows=5000))
+        self.assertEqual(other.most_common(1)[0][0], sources.most_common(1)[0][0])
+
+    def test_replay(self):
+        rates = Path(self.tmp.name) / 'rates.csv'
+        rates.write_text('hour,rows,threat_ratio,date\n'
+                         '0,10,,\n'
+                         '1,20,1.0,\n'
+                         '1,30,0.0,2025-04-28\n'
+                         '1,40,0.0,2025-04-29\n', encoding='utf-8')
+        spec = f"replay:path={rates}"
+        planned = self.planned(spec)
+        self.assertEqual(planned[:3], [10, 30, 1000])
+        self.assertEqual({row[5] for row in self.hourly(spec, 1)}, {'NORMAL'})
+        self.assertEqual(len(self.hourly(spec, 0)), 10)
+
+    def test_corpus_is_reproducible(self):
+        spec = 'diurnal:amplitude=0.5,burst:count=1:minutes=2,zipf:sources=50'
+        digests = []
+        for workers in (1, 2):
+            root = Path(self.tmp.name) / f"w{workers}"
+            with patch('builtins.print'):
+                failed = generate.generate_corpus(root, [self.DATE], ['fw01', 'fw02'], 100, 0.1, 5,
+                                                  workers=workers, hours=24, profile=spec)
+            self.assertEqual(failed, [])
+            digests.append(tree_digest(root))
+        self.assertEqual(digests[0], digests[1])
+        for hour in (0, 14):
+            path = Path(self.tmp.name) / 'w1' / '2025-04-28' / 'fw02' / f"{hour:02d}.zip"
+            self.assertEqual(len(read_rows(path)),
+                             generate.planned_rows('fw02', self.DATE, hour, 100, 0.1, 5, spec))
+
+    def test_invalid(self):
+        for spec in ('wave', 'diurnal:amplitude', 'diurnal:height=2', 'diurnal:amplitude=2',
+                     'burst:minutes=0'):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                profiles.make_profiles(spec, 1)
+        with self.assertRaises(ValueError):
+            JuniperSyslogGenerator(self.tmp.name, self.DATE, 'srx-fw01', 10, 0.1, engine='row',
+                                   profile='zipf')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,309 @@
+"""
+lambda_handler のテスト
+
+複数レコードを含む S3 イベントの並行処理をフェイク S3 / DynamoDB でテスト
+"""
+
+import unittest
+import io
+import json
+import os
+import sys
+import zipfile
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import lambda_function
+import rollup
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB, iam_list_prefixes
+
+HEADER = 'Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\n'
+
+
+def make_zip(hour, critical, warning, date='2025-04-28', hostname='srx-fw01'):
+    """指定件数の CRITICAL/WARNING を含む1時間分のZIPを生成"""
+    lines = [HEADER]
+    for severity, count in (('CRITICAL', critical), ('WARNING', warning), ('INFO', 3)):
+        for i in range(count):
+            lines.append(f'{date}T{hour:02d}:{i % 60:02d}:00Z,{hostname},RT_IDP,2,'
+                         f'{severity},THREAT,RT_IDP_ATTACK_LOG: Port scan detected\n')
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr(f'{hour:02d}.csv', ''.join(lines))
+    return out.getvalue()
+
+
+def make_event(keys, bucket='in'):
+    return {'Records': [
+        {'s3': {'bucket': {'name': bucket}, 'object': {'key': key}}} for key in keys
+    ]}
+
+
+class TestLambdaHandler(unittest.TestCase):
+    """lambda_handler の複数レコード処理テスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB()
+        self.table = self.dynamodb.Table('stats')
+        self.originals = (lambda_function.s3_client, lambda_function.table,
+                          lambda_function.batch_writer, lambda_function.INGEST_MODE)
+        lambda_function.s3_client = self.s3
+        lambda_function.table = self.table
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.table,
+         lambda_function.batch_writer, lambda_function.INGEST_MODE) = self.originals
+
+    def test_extract_s3_records(self):
+        """全レコードのバケット名とキーを抽出できるか"""
+        event = make_event(['raw/a.zip', 'raw/b.zip', 'raw/c.zip'])
+        self.assertEqual(lambda_function.extract_s3_records(event),
+                         [('in', 'raw/a.zip'), ('in', 'raw/b.zip'), ('in', 'raw/c.zip')])
+
+    def test_all_records_processed(self):
+        """イベント内の全レコードが処理されるか"""
+        keys = [f'raw/2025-04-28/{hour:02d}.zip' for hour in range(6)]
+        for hour, key in enumerate(keys):
+            self.s3.objects[('in', key)] = make_zip(hour, critical=hour + 1, warning=2)
+
+        response = lambda_function.lambda_handler(make_event(keys), None)
+
+        body = json.loads(response['body'])
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual([r['key'] for r in body['results']], keys)
+        self.assertTrue(all(r['status'] == 'success' for r in body['results']))
+        for hour in range(6):
+            item = self.table.items[('2025-04-28', f'{hour:02d}:00')]
+            self.assertEqual(item['critical_count'], hour + 1)
+
+    def test_disk_mode_concurrent(self):
+        """disk 取り込みでも並行処理で結果が混ざらないか"""
+        lambda_function.INGEST_MODE = 'disk'
+        keys = [f'raw/2025-04-28/{hour:02d}.zip' for hour in range(8)]
+        for hour, key in enumerate(keys):
+            self.s3.objects[('in', key)] = make_zip(hour, critical=hour * 10, warning=hour)
+
+        lambda_function.lambda_handler(make_event(keys), None)
+
+        for hour in range(1, 8):
+            item = self.table.items[('2025-04-28', f'{hour:02d}:00')]
+            self.assertEqual(item['critical_count'], hour * 10)
+            self.assertEqual(item['warning_count'], hour)
+
+    def test_partial_failure(self):
+        """失敗したレコードがあっても他のレコードは処理され、結果が個別に返るか"""
+        self.s3.objects[('in', 'raw/ok.zip')] = make_zip(1, critical=1, warning=1)
+        event = make_event(['raw/ok.zip', 'raw/missing.zip'])
+
+        with self.assertRaises(lambda_function.RecordProcessingError) as cm:
+            lambda_function.lambda_handler(event, None)
+
+        results = cm.exception.results
+        self.assertEqual(results[0]['status'], 'success')
+        self.assertEqual(results[1]['status'], 'error')
+        self.assertEqual(results[1]['key'], 'raw/missing.zip')
+        self.assertIn(('2025-04-28', '01:00'), self.table.items)
+
+
+class TestPublishedJson(unittest.TestCase):
+    """日次JSON・週/月のロールアップ・マニフェストの出力のテスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB()
+        self.originals = (lambda_function.s3_client, lambda_function.table,
+                          lambda_function.batch_writer, lambda_function.JSON_COMPRESSION,
+                          lambda_function.ROLLUP_PERIODS)
+        lambda_function.s3_client = self.s3
+        lambda_function.table = self.dynamodb.Table('stats')
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.table,
+         lambda_function.batch_writer, lambda_function.JSON_COMPRESSION,
+         lambda_function.ROLLUP_PERIODS) = self.originals
+
+    def run_days(self):
+        """2025-04-27（日・W17）と 2025-04-28（月・W18）の2時間ずつを1回の呼び出しで処理"""
+        keys = []
+        for date in ('2025-04-27', '2025-04-28'):
+            for hour in (9, 10):
+                key = f'raw/{date}/{hour:02d}.zip'
+                self.s3.objects[('in', key)] = make_zip(hour, critical=hour, warning=1, date=date)
+                keys.append(key)
+        lambda_function.lambda_handler(make_event(keys), None)
+
+    def exported(self, key):
+        return rollup.decode_document(self.s3.objects[(lambda_function.OUTPUT_BUCKET, key)])
+
+    def test_rollups_and_manifest(self):
+        self.run_days()
+        bucket = lambda_function.OUTPUT_BUCKET
+        daily = {date: self.exported(f'data/{date}.json') for date in ('2025-04-27', '2025-04-28')}
+
+        monthly = self.exported('data/monthly/2025-04.json')
+        self.assertEqual([d['log_date'] for d in monthly['daily_stats']], sorted(daily))
+        self.assertEqual(monthly['critical'], 2 * (9 + 10))
+        self.assertEqual(monthly['daily_stats'][1]['hourly_critical'][9:11], [9, 10])
+        self.assertEqual(monthly['daily_stats'][1]['revision'], daily['2025-04-28']['revision'])
+        self.assertEqual([d['log_date'] for d in self.exported('data/weekly/2025-W17.json')['daily_stats']],
+                         ['2025-04-27'])
+        self.assertEqual([d['log_date'] for d in self.exported('data/weekly/2025-W18.json')['daily_stats']],
+                         ['2025-04-28'])
+
+        # マニフェストのハッシュは公開中の内容と一致する
+        manifest = self.exported(lambda_function.MANIFEST_KEY)
+        self.assertEqual(sorted(manifest['daily']), sorted(daily))
+        self.assertEqual(sorted(manifest['weekly']), ['2025-W17', '2025-W18'])
+        for date, doc in daily.items():
+            self.assertEqual(manifest['daily'][date]['hash'], rollup.content_hash(doc))
+        self.assertEqual(manifest['monthly']['2025-04']['hash'], rollup.content_hash(monthly))
+
+        # 空白なし・gzip 圧縮で、マニフェストだけ毎回再検証させる
+        metadata = self.s3.metadata[(bucket, 'data/2025-04-28.json')]
+        self.assertEqual(metadata['ContentEncoding'], 'gzip')
+        self.assertEqual(metadata['CacheControl'], lambda_function.JSON_CACHE_CONTROL)
+        self.assertEqual(self.s3.metadata[(bucket, lambda_function.MANIFEST_KEY)]['CacheControl'],
+                         lambda_function.MANIFEST_CACHE_CONTROL)
+        body = self.s3.objects[(bucket, 'data/2025-04-28.json')]
+        self.assertLess(len(body), len(json.dumps(daily['2025-04-28'], indent=2)) / 2)
+
+    def test_first_export_under_role_policy(self):
+        """実行ロールの ListBucket の範囲で、その日の最初の出力が日次JSONを作成するか（403 で失敗しないか）"""
+        self.s3 = lambda_function.s3_client = FakeS3Client(list_prefixes=iam_list_prefixes())
+        self.s3.objects[('in', 'raw/2025-04-28/10.zip')] = make_zip(10, critical=3, warning=1)
+
+        lambda_function.lambda_handler(make_event(['raw/2025-04-28/10.zip']), None)
+
+        daily = self.exported('data/2025-04-28.json')
+        self.assertEqual([h['critical'] for h in daily['hourly_stats']], [3])
+        self.assertEqual(daily['revision'], 1)
+
+    def test_first_rollups_and_manifest_under_role_policy(self):
+        """実行ロールの ListBucket の範囲で、週・月のロールアップとマニフェストが初回の更新で作成されるか"""
+        self.s3 = lambda_function.s3_client = FakeS3Client(list_prefixes=iam_list_prefixes())
+
+        self.run_days()
+
+        manifest = self.exported(lambda_function.MANIFEST_KEY)
+        self.assertEqual(sorted(manifest['daily']), ['2025-04-27', '2025-04-28'])
+        self.assertEqual(sorted(manifest['weekly']), ['2025-W17', '2025-W18'])
+        self.assertEqual(sorted(manifest['monthly']), ['2025-04'])
+        self.assertEqual([d['log_date'] for d in self.exported('data/monthly/2025-04.json')['daily_stats']],
+                         ['2025-04-27', '2025-04-28'])
+        for week in ('2025-W17', '2025-W18'):
+            self.assertEqual(manifest['weekly'][week]['hash'],
+                             rollup.content_hash(self.exported(f'data/weekly/{week}.json')))
+
+    def test_uncompressed_without_rollups(self):
+        lambda_function.JSON_COMPRESSION = 'none'
+        lambda_function.ROLLUP_PERIODS = []
+        self.run_days()
+
+        body = self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json')]
+        self.assertEqual(json.loads(body), self.exported('data/2025-04-28.json'))
+        self.assertNotIn(b'\n', body)
+        self.assertNotIn('ContentEncoding',
+                         self.s3.metadata[(lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json')])
+        self.assertFalse([key for _, key in self.s3.objects if key.startswith(('data/weekly/',
+                                                                                'data/monthly/'))])
+        self.assertEqual(self.exported(lambda_function.MANIFEST_KEY)['weekly'], {})
+
+
+class TestMultiHostSchema(unittest.TestCase):
+    """TABLE_SCHEMA=multi_host のテスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB(key_names=('pk', 'sk'), page_size=5)
+        self.table = self.dynamodb.Table('stats')
+        self.originals = (lambda_function.s3_client, lambda_function.table,
+                          lambda_function.batch_writer, lambda_function.TABLE_SCHEMA,
+                          lambda_function.EXPORT_MODE, lambda_function.MAX_WORKERS,
+                          lambda_function.MESSAGE_TEMPLATES)
+        lambda_function.s3_client = self.s3
+        lambda_function.table = self.table
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+        lambda_function.TABLE_SCHEMA = 'multi_host'
+        # フリート全体の JSON でテンプレート別件数も合算されるか確かめる
+        lambda_function.MESSAGE_TEMPLATES = 64
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.table,
+         lambda_function.batch_writer, lambda_function.TABLE_SCHEMA,
+         lambda_function.EXPORT_MODE, lambda_function.MAX_WORKERS,
+         lambda_function.MESSAGE_TEMPLATES) = self.originals
+
+    def exported(self, key):
+        return rollup.decode_document(self.s3.objects[(lambda_function.OUTPUT_BUCKET, key)])
+
+    def test_hosts_do_not_clobber_each_other(self):
+        """同じ時間帯を複数ホストが書いても上書きされず、フリート合計が出るか"""
+        self.run_fleet_scenario()
+
+    def test_hosts_do_not_clobber_each_other_query_mode(self):
+        """EXPORT_MODE=query でも同じフリート合計になるか"""
+        lambda_function.EXPORT_MODE = 'query'
+        # 日次JSONの再生成は読み出し→全体書き換えのため、完成形を検証するには逐次処理にする
+        lambda_function.MAX_WORKERS = 1
+        self.run_fleet_scenario()
+
+    def run_fleet_scenario(self):
+        hosts = [f'srx-fw{i:02d}' for i in range(1, 6)]
+        keys = []
+        for n, host in enumerate(hosts, start=1):
+            for hour in (10, 11):
+                key = f'raw/2025-04-28/{host}-{hour}.zip'
+                self.s3.objects[('in', key)] = make_zip(hour, critical=n, warning=hour, hostname=host)
+                keys.append(key)
+
+        lambda_function.lambda_handler(make_event(keys), None)
+
+        item = self.table.items[('HOST#srx-fw03#2025-04-28', '10:00')]
+        self.assertEqual(item['critical_count'], 3)
+
+        host_json = self.exported('data/hosts/srx-fw02/2025-04-28.json')
+        self.assertEqual([h['critical'] for h in host_json['hourly_stats']], [2, 2])
+
+        fleet_json = self.exported('data/2025-04-28.json')
+        self.assertEqual(fleet_json['hostname'], 'fleet')
+        self.assertEqual(fleet_json['hosts'], hosts)
+        self.assertEqual(fleet_json['hourly_stats'][0]['severities'], {'CRITICAL': 15, 'WARNING': 50, 'INFO': 15})
+        self.assertEqual(sum(fleet_json['hourly_stats'][0]['templates'].values()), 80)
+        for hour in fleet_json['hourly_stats']:
+            hour.pop('by_host', None)
+            hour.pop('severities', None)
+            hour.pop('templates', None)
+        self.assertEqual(fleet_json['hourly_stats'], [
+            {'hour': '10:00', 'critical': 15, 'warning': 50, 'total': 65, 'hosts': 5},
+            {'hour': '11:00', 'critical': 15, 'warning': 55, 'total': 70, 'hosts': 5},
+        ])
+
+        # 月のロールアップはフリート全体の日次JSONの要約
+        monthly = self.exported('data/monthly/2025-04.json')
+        self.assertEqual((monthly['critical'], monthly['warning'], monthly['total']), (30, 105, 135))
+        self.assertEqual(monthly['daily_stats'][0]['hosts'], 5)
+
+    def test_reprocessing_is_idempotent(self):
+        """同じファイルを再処理してもフリート合計が増えないか"""
+        self.s3.objects[('in', 'raw/a.zip')] = make_zip(10, critical=4, warning=1, hostname='srx-a')
+        self.s3.objects[('in', 'raw/b.zip')] = make_zip(10, critical=6, warning=1, hostname='srx-b')
+
+        lambda_function.lambda_handler(make_event(['raw/a.zip', 'raw/b.zip']), None)
+        lambda_function.lambda_handler(make_event(['raw/a.zip']), None)
+
+        fleet_json = self.exported('data/2025-04-28.json')
+        self.assertEqual(fleet_json['hourly_stats'][0]['critical'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,316 @@
+"""
+ヘビーヒッター追跡のテスト
+
+heavy_hitters.FrequentItems の誤差保証・合算と、HeavyHitters による
+THREAT 行の送信元IP・宛先IP・宛先ポートの追跡をテスト
+"""
+
+import unittest
+import io
+import json
+import random
+import sys
+import tempfile
+import zipfile
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# テストデータ生成に generator を使う
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / 'generator'))
+
+import lambda_function
+import rollup
+from generate import JuniperSyslogGenerator
+from heavy_hitters import FrequentItems, HeavyHitters, merge_views, top_view
+from threats import threat_observer
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB
+
+HEADER = 'Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\n'
+FLOOD_SRC = '10.66.66.66'
+
+
+def zipf_stream(n, distinct, seed=1):
+    """Zipf 分布に近い値の列（少数の値に件数が偏る）"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    return [f'v{i}'.encode() for i in rng.choices(range(distinct), weights, k=n)]
+
+
+def assert_bounds(test, summary, exact):
+    """件数は真の値の下限で、誤差は error 以下"""
+    for item, true in exact.items():
+        estimate = summary.counts.get(item, 0)
+        test.assertLessEqual(estimate, true)
+        test.assertLessEqual(true - estimate, summary.error)
+
+
+def generator_rows(rows_per_hour, flood_rows, hour=10, seed=7):
+    """generator の行に、1つの送信元からの SYN flood を混ぜる"""
+    random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        generator = JuniperSyslogGenerator(tmp, datetime(2025, 4, 28), 'srx-fw01',
+                                           rows_per_hour, threat_ratio=0.1)
+    base_time = datetime(2025, 4, 28, hour)
+    rows = [generator.generate_log_row(base_time) for _ in range(rows_per_hour)]
+    for i in range(flood_rows):
+        rows.append([f'2025-04-28T{hour:02d}:00:{i % 60:02d}Z', 'srx-fw01', 'RT_SCREEN', 2,
+                     'CRITICAL', 'THREAT',
+                     f'RT_SCREEN_TCP: SYN flood attack detected {FLOOD_SRC}/{40000 + i} > '
+                     f'192.168.0.1/443 protocol=tcp SeverityLevel=2 Severity=CRITICAL'])
+    random.Random(seed).shuffle(rows)
+    return rows
+
+
+def to_csv(rows):
+    return HEADER + ''.join(','.join(str(v) for v in row) + '\n' for row in rows)
+
+
+def exact_threats(rows):
+    """THREAT 行の送信元IP・宛先IP・宛先ポートを正確に数える"""
+    counters = {'src_ip': Counter(), 'dst_ip': Counter(), 'dst_port': Counter()}
+    for row in rows:
+        if row[5] != 'THREAT':
+            continue
+        src, _, dst = row[6].split(' protocol=')[0].rsplit(' ', 3)[1:]
+        counters['src_ip'][src.split('/')[0]] += 1
+        counters['dst_ip'][dst.split('/')[0]] += 1
+        counters['dst_port'][dst.split('/')[1]] += 1
+    return counters
+
+
+class TestFrequentItems(unittest.TestCase):
+    """Misra-Gries 要約の誤差保証テスト"""
+
+    def test_exact_within_capacity(self):
+        summary = FrequentItems(capacity=8)
+        for item in zipf_stream(1000, distinct=16):
+            summary.update(item)
+        self.assertEqual(summary.error, 0)
+        self.assertEqual(summary.counts, Counter(zipf_stream(1000, distinct=16)))
+
+    def test_error_bound(self):
+        stream = zipf_stream(20000, distinct=5000)
+        exact = Counter(stream)
+        summary = FrequentItems(capacity=32)
+        for item in stream:
+            summary.update(item)
+
+        self.assertLessEqual(len(summary.counts), 64)
+        self.assertLessEqual(summary.error, len(stream) / 33)
+        assert_bounds(self, summary, exact)
+        # 最頻値は上位に残る
+        self.assertEqual(summary.top(1)[0][0], exact.most_common(1)[0][0])
+
+    def test_merge(self):
+        streams = [zipf_stream(5000, distinct=2000, seed=seed) for seed in (1, 2, 3)]
+        merged = FrequentItems(capacity=32)
+        for stream in streams:
+            part = FrequentItems(capacity=32)
+            for item in stream:
+                part.update(item)
+            merged.merge(part)
+
+        exact = Counter(item for stream in streams for item in stream)
+        self.assertEqual(merged.total, 15000)
+        self.assertLessEqual(merged.error, merged.total / 33 * 3)
+        assert_bounds(self, merged, exact)
+
+    def test_update_counts_keeps_bounds(self):
+        """まとめて数えた件数を足しても誤差保証を保つか"""
+        stream = zipf_stream(20000, distinct=5000)
+        summary = FrequentItems(capacity=32)
+        for start in range(0, len(stream), 1000):
+            summary.update_counts(Counter(stream[start:start + 1000]))
+
+        exact = Counter(stream)
+        self.assertEqual(summary.total, len(stream))
+        self.assertLessEqual(len(summary.counts), 64)
+        self.assertLessEqual(summary.error, len(stream) / 33)
+        assert_bounds(self, summary, exact)
+        self.assertEqual(summary.top(1)[0][0], exact.most_common(1)[0][0])
+
+    def test_truncated_keeps_bounds(self):
+        stream = zipf_stream(5000, distinct=500)
+        summary = FrequentItems(capacity=64)
+        for item in stream:
+            summary.update(item)
+        top = summary.truncated(5)
+        self.assertEqual(len(top.counts), 5)
+        self.assertEqual(top.counts, dict(summary.top(5)))
+        assert_bounds(self, top, Counter(stream))
+
+    def test_round_trip(self):
+        summary = FrequentItems(capacity=4)
+        for item in zipf_stream(500, distinct=50):
+            summary.update(item)
+        data = json.loads(json.dumps(summary.to_dict()))
+        restored = FrequentItems.from_dict(data, capacity=4)
+        self.assertEqual(restored.counts, summary.counts)
+        self.assertEqual((restored.total, restored.error), (summary.total, summary.error))
+
+
+class TestHeavyHitters(unittest.TestCase):
+    """HeavyHitters の THREAT 行追跡テスト"""
+
+    def observe(self, rows, capacity):
+        tracker = HeavyHitters(capacity)
+        fields = [[str(v).encode() for v in row] for row in rows]
+        tracker.consume(fields, 0, 5, 6)
+        return tracker
+
+    def test_flood_source_on_top(self):
+        rows = generator_rows(rows_per_hour=3000, flood_rows=400)
+        stats = self.observe(rows, capacity=16).hourly_stats()
+        exact = exact_threats(rows)
+
+        entry = stats['10:00']
+        self.assertEqual(entry['src_ip']['total'], sum(exact['src_ip'].values()))
+        self.assertEqual(entry['src_ip']['items'][0][0], FLOOD_SRC)
+        flood = entry['src_ip']['items'][0][1]
+        self.assertLessEqual(flood, exact['src_ip'][FLOOD_SRC])
+        self.assertLessEqual(exact['src_ip'][FLOOD_SRC] - flood, entry['src_ip']['error'])
+        # 宛先ポートは6種類なので正確
+        self.assertEqual(dict(entry['dst_port']['items']), dict(exact['dst_port']))
+        self.assertEqual(entry['dst_port']['error'], 0)
+
+    def test_batches_match_rows(self):
+        """時間をまたいで少しずつまとめて渡しても、1行ずつ数えた場合と同じになるか"""
+        rows = generator_rows(300, 20, hour=9) + generator_rows(300, 20, hour=10, seed=8)
+        rows.insert(100, ['2025-04-28T99:00:00Z', 'srx-fw01', 'RT_SCREEN', 2, 'CRITICAL', 'THREAT',
+                          'RT_SCREEN_TCP: SYN flood attack detected 10.0.0.1/1 > 192.168.0.1/443'])
+        fields = [[str(v).encode() for v in row] for row in rows]
+
+        batched = HeavyHitters(1000)
+        observe, flush = threat_observer(0, 6, [batched], batch_rows=7)
+        for row in fields:
+            if row[5] == b'THREAT':
+                observe(row)
+        flush()
+
+        expected = HeavyHitters(1000)
+        for row in fields:
+            if row[5] == b'THREAT' and row[0][11:13] != b'99':
+                src, _, dst = row[6].split(b' protocol=')[0].rsplit(b' ', 3)[1:]
+                expected.add(row[0][11:13], src.split(b'/')[0], *dst.split(b'/'))
+        self.assertEqual(batched.hourly_stats(), expected.hourly_stats())
+        self.assertEqual(sorted(batched.hourly_stats()), ['09:00', '10:00'])
+
+    def test_ignores_normal_rows(self):
+        rows = [row for row in generator_rows(500, 0) if row[5] == 'NORMAL']
+        self.assertEqual(self.observe(rows, capacity=4).hourly_stats(), {})
+
+    def test_merge_files(self):
+        """ファイルごとの要約の合算が上位・誤差保証を保つか"""
+        first = generator_rows(2000, 150, seed=1)
+        second = generator_rows(2000, 150, seed=2)
+        merged = self.observe(first, 16).merge(self.observe(second, 16))
+        restored = HeavyHitters.from_dict(json.loads(json.dumps(merged.to_dict())))
+
+        summary = restored.by_hour[b'10'][0]
+        exact = exact_threats(first + second)['src_ip']
+        self.assertEqual(summary.top(1)[0][0], FLOOD_SRC.encode())
+        assert_bounds(self, summary, {ip.encode(): n for ip, n in exact.items()})
+
+    def test_views(self):
+        rows = generator_rows(2000, 200)
+        entry = self.observe(rows, 16).hourly_stats()['10:00']
+        view = top_view(entry, 3)
+        self.assertEqual(len(view['dst_port']['items']), 3)
+        self.assertLessEqual(len(view['src_ip']['items']), 3)
+        self.assertEqual(view['src_ip']['items'][0][0], FLOOD_SRC)
+
+        fleet = merge_views([view, view], 3)
+        self.assertEqual(fleet['src_ip']['items'][0],
+                         [FLOOD_SRC, view['src_ip']['items'][0][1] * 2])
+        self.assertEqual(fleet['src_ip']['total'], view['src_ip']['total'] * 2)
+
+
+class TestHandlerHeavyHitters(unittest.TestCase):
+    """ヘビーヒッターの保存・日次JSON出力テスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB(key_names=('pk', 'sk'))
+        self.table = self.dynamodb.Table('stats')
+        self.originals = (lambda_function.s3_client, lambda_function.batch_writer,
+                          lambda_function.TABLE_SCHEMA, lambda_function.HEAVY_HITTER_CAPACITY)
+        lambda_function.s3_client = self.s3
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+        lambda_function.TABLE_SCHEMA = 'multi_host'
+        lambda_function.HEAVY_HITTER_CAPACITY = 64
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.batch_writer,
+         lambda_function.TABLE_SCHEMA, lambda_function.HEAVY_HITTER_CAPACITY) = self.originals
+
+    def run_handler(self):
+        keys = []
+        for n, host in enumerate(('srx-a', 'srx-b')):
+            rows = generator_rows(1000, 100, seed=n)
+            for row in rows:
+                row[1] = host
+            out = io.BytesIO()
+            with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+                z.writestr('10.csv', to_csv(rows))
+            key = f'raw/{host}.zip'
+            self.s3.objects[('in', key)] = out.getvalue()
+            keys.append(key)
+
+        event = {'Records': [{'s3': {'bucket': {'name': 'in'}, 'object': {'key': key}}}
+                             for key in keys]}
+        lambda_function.lambda_handler(event, None)
+
+    def test_persisted_and_merged_across_hosts(self):
+        self.run_handler()
+
+        item = self.table.items[('HOST#srx-a#2025-04-28', '10:00')]
+        self.assertEqual(item['heavy_hitters']['src_ip']['items'][0][0], FLOOD_SRC)
+
+        fleet = rollup.decode_document(self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json')])
+        top = fleet['hourly_stats'][0]['heavy_hitters']['src_ip']
+        self.assertLessEqual(len(top['items']), lambda_function.HEAVY_HITTER_TOP_N)
+        self.assertEqual(top['items'][0][0], FLOOD_SRC)
+        self.assertGreaterEqual(top['items'][0][1], 200 - top['error'])
+        self.assertEqual(top['total'], sum(
+            h['heavy_hitters']['src_ip']['total']
+            for h in fleet['hourly_stats'][0]['by_host'].values()))
+
+    def test_message_not_last_column(self):
+        """Message の後ろに列があっても、Message の中の送信元・宛先だけを数えるか"""
+        rows = generator_rows(1000, 100)
+        exact = exact_threats(rows)
+        # 送信元・宛先のない THREAT 行（後ろの列の値を数えてはいけない）
+        rows += [['2025-04-28T10:00:00Z', 'srx-fw01', 'RT_IDP', 2, 'CRITICAL', 'THREAT',
+                  'RT_IDP_ATTACK_LOG: signature update failed']] * 5
+        header = HEADER.rstrip('\n') + ',Note\n'
+        data = header + ''.join(
+            ','.join(str(v) for v in row + ['x 10.9.9.9/1 > 10.9.9.9/2']) + '\n' for row in rows)
+
+        stats = lambda_function.build_stats(lambda_function.scan_csv(io.BytesIO(data.encode())))
+
+        entry = stats['heavy_hitters']['10:00']
+        self.assertEqual(entry['src_ip']['items'][0][0], FLOOD_SRC)
+        self.assertEqual(entry['src_ip']['total'], sum(exact['src_ip'].values()))
+        self.assertEqual(dict(entry['dst_port']['items']), dict(exact['dst_port']))
+
+    def test_disabled(self):
+        """HEAVY_HITTER_CAPACITY=0 なら heavy_hitters を保存しないか"""
+        lambda_function.HEAVY_HITTER_CAPACITY = 0
+
+        self.run_handler()
+
+        self.assertNotIn('heavy_hitters', self.table.items[('HOST#srx-a#2025-04-28', '10:00')])
+        fleet = rollup.decode_document(self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json')])
+        self.assertNotIn('heavy_hitters', fleet['hourly_stats'][0])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
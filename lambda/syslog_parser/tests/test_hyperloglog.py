@@ -0,0 +1,266 @@
+"""
+HyperLogLog のテスト
+
+hyperloglog.HyperLogLog の精度とメモリの関係（generator の IP で既知のユニーク数）、
+スケッチの合算（精度の違うスケッチの畳み込みを含む）、時間別スケッチから日全体のユニーク数を求める流れをテスト
+"""
+
+import unittest
+import io
+import json
+import random
+import sys
+import tempfile
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+# テストデータ生成に generator を使う
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / 'generator'))
+
+import lambda_function
+import rollup
+from generate import JuniperSyslogGenerator
+from hyperloglog import HyperLogLog, HourlyDistinct, merge_sketches
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB
+
+HEADER = 'Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\n'
+
+
+def make_generator(seed):
+    random.seed(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        return JuniperSyslogGenerator(tmp, datetime(2025, 4, 28), 'srx-fw01', 0, 1.0)
+
+
+def distinct_ips(count, seed=1):
+    """generator の IP 生成で、ユニーク数がちょうど count の IP のリスト"""
+    generator = make_generator(seed)
+    ips = set()
+    while len(ips) < count:
+        ips.add(generator.random_private_ip() if random.random() < 0.5
+                else generator.random_global_ip())
+    return sorted(ips)
+
+
+def sketch_of(ips, precision):
+    sketch = HyperLogLog(precision)
+    for ip in ips:
+        sketch.add(ip.encode())
+    return sketch
+
+
+class TestHyperLogLog(unittest.TestCase):
+    """HyperLogLog の精度・合算テスト"""
+
+    CARDINALITIES = (50, 1000, 5000, 30000)
+    PRECISIONS = (8, 10, 12, 14)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ips = distinct_ips(max(cls.CARDINALITIES))
+
+    def test_accuracy_versus_memory(self):
+        """誤差が標準誤差の4倍以内で、レジスタを増やすほど誤差が小さくなるか"""
+        mean_errors = []
+        for precision in self.PRECISIONS:
+            standard_error = 1.04 / (2 ** precision) ** 0.5
+            errors = []
+            for cardinality in self.CARDINALITIES:
+                # 重複を含めて追加しても推定値は変わらない
+                ips = self.ips[:cardinality] * 2
+                sketch = sketch_of(ips, precision)
+                self.assertEqual(sketch.memory_bytes(), 2 ** precision)
+                error = abs(sketch.estimate() - cardinality) / cardinality
+                self.assertLess(error, 4 * standard_error,
+                                f"precision={precision} cardinality={cardinality}")
+                errors.append(error)
+            mean_errors.append(sum(errors) / len(errors))
+        self.assertLess(mean_errors[-1], mean_errors[0])
+
+    def test_empty(self):
+        self.assertEqual(HyperLogLog().estimate(), 0)
+
+    def test_merge_equals_union(self):
+        """合算したスケッチは和集合のスケッチと同じレジスタになるか"""
+        first, second = self.ips[:3000], self.ips[2000:6000]
+        merged = sketch_of(first, 12).merge(sketch_of(second, 12))
+        union = sketch_of(set(first) | set(second), 12)
+        self.assertEqual(merged.registers, union.registers)
+        self.assertLess(abs(merged.estimate() - 6000) / 6000, 0.07)
+
+    def test_merge_folds_to_lower_precision(self):
+        """精度の違うスケッチは低い方に畳んで合算し、低い精度の和集合のスケッチと同じになるか"""
+        first, second = self.ips[:3000], self.ips[2000:6000]
+        union = sketch_of(set(first) | set(second), 10)
+
+        for high, low in ((sketch_of(first, 12), sketch_of(second, 10)),
+                          (sketch_of(second, 10), sketch_of(first, 12))):
+            merged = high.merge(low)
+            self.assertEqual(merged.precision, 10)
+            self.assertEqual(merged.registers, union.registers)
+
+        self.assertEqual(sketch_of(first, 14).folded(8).registers, sketch_of(first, 8).registers)
+        with self.assertRaises(ValueError):
+            HyperLogLog(10).folded(12)
+
+    def test_update_equals_add(self):
+        """まとめて追加しても1件ずつ追加した場合と同じレジスタになるか"""
+        sketch = HyperLogLog(12)
+        sketch.update(ip.encode() for ip in self.ips[:2000])
+        self.assertEqual(sketch.registers, sketch_of(self.ips[:2000], 12).registers)
+
+    def test_round_trip(self):
+        sketch = sketch_of(self.ips[:500], 10)
+        data = json.loads(json.dumps(sketch.to_dict()))
+        self.assertEqual(data['estimate'], sketch.estimate())
+        self.assertEqual(HyperLogLog.from_dict(data).registers, sketch.registers)
+        # 少ないユニーク数では圧縮でレジスタより小さくなる
+        self.assertLess(len(data['registers']), sketch.memory_bytes())
+
+    def test_invalid_precision(self):
+        with self.assertRaises(ValueError):
+            HyperLogLog(20)
+
+
+class TestHourlyDistinct(unittest.TestCase):
+    """時間別スケッチから日全体のユニーク数を求めるテスト"""
+
+    def test_daily_from_hours(self):
+        ips = distinct_ips(4000, seed=2)
+        rng = random.Random(3)
+        tracker = HourlyDistinct(12)
+        exact_hours = {}
+        seen = set()
+        # 同じ IP が複数の時間に現れる
+        for hour in range(24):
+            chosen = rng.sample(ips, 500)
+            exact_hours[f'{hour:02d}:00'] = len(set(chosen))
+            seen.update(chosen)
+            for ip in chosen:
+                tracker.add(f'{hour:02d}'.encode(), ip.encode(), b'192.168.0.1', b'443')
+
+        stats = tracker.hourly_stats()
+        for hour, sketch in stats.items():
+            self.assertLess(abs(sketch['estimate'] - exact_hours[hour]) / exact_hours[hour], 0.07)
+
+        daily = merge_sketches(stats.values())
+        exact_daily = len(seen)
+        # 時間別の合計（12000）ではなく日のユニーク数（4000 弱）になる
+        self.assertLess(abs(daily['estimate'] - exact_daily) / exact_daily, 0.07)
+
+    def test_merge_files(self):
+        ips = distinct_ips(2000, seed=4)
+        first, second = HourlyDistinct(10), HourlyDistinct(10)
+        for ip in ips[:1200]:
+            first.add(b'10', ip.encode(), b'', b'')
+        for ip in ips[800:]:
+            second.add(b'10', ip.encode(), b'', b'')
+        merged = HourlyDistinct.from_dict(json.loads(json.dumps(first.merge(second).to_dict())))
+        estimate = merged.hourly_stats()['10:00']['estimate']
+        self.assertLess(abs(estimate - 2000) / 2000, 0.13)
+
+    def test_merge_different_precisions(self):
+        """精度を変える前後の時間別スケッチ・保存済みスケッチを、低い方の精度で合算できるか"""
+        ips = distinct_ips(2000, seed=5)
+        before, after = HourlyDistinct(12), HourlyDistinct(10)
+        before.add_batch(b'09', [ip.encode() for ip in ips[:1500]], (), ())
+        before.add_batch(b'10', [ip.encode() for ip in ips[:1200]], (), ())
+        after.add_batch(b'10', [ip.encode() for ip in ips[800:]], (), ())
+
+        merged = before.merge(after)
+
+        self.assertEqual(merged.precision, 10)
+        stats = merged.hourly_stats()
+        self.assertEqual({sketch['precision'] for sketch in stats.values()}, {10})
+        self.assertEqual(stats['10:00']['registers'],
+                         sketch_of(ips, 10).to_dict()['registers'])
+        self.assertEqual(stats['09:00']['registers'],
+                         sketch_of(ips[:1500], 10).to_dict()['registers'])
+        daily = merge_sketches([sketch_of(ips[:1500], 12).to_dict(), sketch_of(ips[800:], 10).to_dict()])
+        self.assertEqual(daily['precision'], 10)
+        self.assertLess(abs(daily['estimate'] - 2000) / 2000, 0.13)
+
+
+class TestHandlerDistinct(unittest.TestCase):
+    """スケッチの保存と日次JSONでの合算テスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB()
+        self.table = self.dynamodb.Table('stats')
+        self.originals = (lambda_function.s3_client, lambda_function.table,
+                          lambda_function.batch_writer, lambda_function.EXPORT_MODE,
+                          lambda_function.HLL_PRECISION)
+        lambda_function.s3_client = self.s3
+        lambda_function.table = self.table
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+        lambda_function.HLL_PRECISION = 12
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.table,
+         lambda_function.batch_writer, lambda_function.EXPORT_MODE,
+         lambda_function.HLL_PRECISION) = self.originals
+
+    def run_hours(self):
+        """3時間分の THREAT 行（送信元は 300 種類から選ぶ）を処理"""
+        ips = distinct_ips(300, seed=5)
+        rng = random.Random(6)
+        keys = []
+        seen = set()
+        for hour in (9, 10, 11):
+            lines = [HEADER]
+            for i in range(400):
+                src = rng.choice(ips)
+                seen.add(src)
+                lines.append(f'2025-04-28T{hour:02d}:{i % 60:02d}:00Z,srx-fw01,RT_SCREEN,2,CRITICAL,'
+                             f'THREAT,RT_SCREEN_TCP: SYN flood attack detected {src}/5000 > '
+                             f'192.168.0.1/443 protocol=tcp SeverityLevel=2 Severity=CRITICAL\n')
+            out = io.BytesIO()
+            with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+                z.writestr(f'{hour:02d}.csv', ''.join(lines))
+            key = f'raw/{hour:02d}.zip'
+            self.s3.objects[('in', key)] = out.getvalue()
+            keys.append(key)
+
+        event = {'Records': [{'s3': {'bucket': {'name': 'in'}, 'object': {'key': key}}}
+                             for key in keys]}
+        lambda_function.lambda_handler(event, None)
+        return rollup.decode_document(self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json')]), len(seen)
+
+    def check(self, doc, exact):
+        item = self.table.items[('2025-04-28', '10:00')]
+        self.assertEqual(item['src_ip_sketch']['precision'], lambda_function.HLL_PRECISION)
+        hours = doc['hourly_stats']
+        self.assertTrue(all(h['distinct_src_ips'] < exact for h in hours))
+        # 時間別の合計は日のユニーク数にならない（同じ IP が複数の時間に現れる）
+        self.assertGreater(sum(h['distinct_src_ips'] for h in hours), exact * 1.5)
+        self.assertLess(abs(doc['distinct_src_ips'] - exact) / exact, 0.05)
+
+    def test_rollup(self):
+        self.check(*self.run_hours())
+
+    def test_query(self):
+        lambda_function.EXPORT_MODE = 'query'
+        self.check(*self.run_hours())
+
+    def test_disabled(self):
+        """HLL_PRECISION=0 ならスケッチとユニーク数を保存しないか"""
+        lambda_function.HLL_PRECISION = 0
+
+        doc, _ = self.run_hours()
+
+        self.assertNotIn('src_ip_sketch', self.table.items[('2025-04-28', '10:00')])
+        self.assertNotIn('distinct_src_ips', doc)
+        self.assertFalse([h for h in doc['hourly_stats'] if 'distinct_src_ips' in h])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
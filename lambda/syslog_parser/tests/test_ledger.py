@@ -0,0 +1,246 @@
+"""
+処理済みオブジェクトの台帳のテスト
+
+フェイクの DynamoDB 低レベルクライアント（条件付き書き込み対応）で
+claim / complete / release とリースの引き継ぎ、lambda_handler の重複配信のスキップをテスト
+"""
+
+import unittest
+import sys
+import json
+import threading
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import lambda_function
+from ledger import Ledger, CLAIMED, DONE
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB, FakeDynamoDBClient, FakeClientError
+from tests.test_handler import make_zip, make_event
+
+
+class Clock:
+    """テスト用の時計（UNIX 秒）"""
+
+    def __init__(self, now=1745830800.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestLedger(unittest.TestCase):
+    """Ledger の状態遷移のテスト"""
+
+    def setUp(self):
+        self.client = FakeDynamoDBClient()
+        self.clock = Clock()
+        self.ledger = Ledger(self.client, 'ledger', clock=self.clock)
+
+    def test_claim_complete_then_duplicate(self):
+        """処理済みにした後の claim は done になり、記録した結果を返すか"""
+        claim = self.ledger.claim('in', 'raw/2025-04-28/10.zip', '"abc"', 60)
+        self.assertEqual(claim.status, CLAIMED)
+        self.assertTrue(self.ledger.complete(claim, {'log_date': '2025-04-28', 'total_hours': 1}))
+
+        duplicate = self.ledger.claim('in', 'raw/2025-04-28/10.zip', 'abc', 60)
+
+        self.assertEqual(duplicate.status, DONE)
+        self.assertEqual(duplicate.item['log_date'], '2025-04-28')
+        self.assertEqual(duplicate.item['total_hours'], 1)
+        self.assertNotIn('owner', duplicate.item)
+        # 重複の確認は GetItem 1回だけ
+        self.assertEqual(self.client.calls['put_item'], 2)
+
+    def test_new_etag_is_processed(self):
+        """同じキーでも内容（ETag）が変われば処理できるか"""
+        claim = self.ledger.claim('in', 'raw/a.zip', 'v1', 60)
+        self.ledger.complete(claim, {})
+
+        self.assertEqual(self.ledger.claim('in', 'raw/a.zip', 'v2', 60).status, CLAIMED)
+
+    def test_concurrent_claims_single_winner(self):
+        """同時に届いた重複のうち1つだけが claim できるか"""
+        barrier = threading.Barrier(8)
+        statuses = []
+
+        def claim():
+            barrier.wait()
+            statuses.append(self.ledger.claim('in', 'raw/a.zip', 'abc', 60).status)
+
+        threads = [threading.Thread(target=claim) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses.count(CLAIMED), 1)
+        self.assertEqual(statuses.count('busy'), 7)
+
+    def test_expired_lease_taken_over(self):
+        """落ちた呼び出しのリースは期限後に引き継がれ、元の owner は完了できないか"""
+        crashed = self.ledger.claim('in', 'raw/a.zip', 'abc', 10)
+
+        self.clock.now += 5
+        self.assertEqual(self.ledger.claim('in', 'raw/a.zip', 'abc', 10).status, 'busy')
+
+        self.clock.now += 6
+        takeover = self.ledger.claim('in', 'raw/a.zip', 'abc', 10)
+        self.assertEqual(takeover.status, CLAIMED)
+        self.assertEqual(takeover.item['attempts'], 2)
+
+        self.assertFalse(self.ledger.complete(crashed, {}))
+        self.assertFalse(self.ledger.release(crashed))
+        self.assertTrue(self.ledger.complete(takeover, {}))
+        self.assertEqual(self.ledger.claim('in', 'raw/a.zip', 'abc', 10).status, DONE)
+
+    def test_release_allows_retry(self):
+        """release した後はリースの期限を待たずに claim できるか"""
+        claim = self.ledger.claim('in', 'raw/a.zip', 'abc', 600)
+        self.assertTrue(self.ledger.release(claim))
+
+        self.assertEqual(self.ledger.claim('in', 'raw/a.zip', 'abc', 600).status, CLAIMED)
+
+    def test_retention(self):
+        """項目に TTL 用の expires_at が付くか"""
+        claim = self.ledger.claim('in', 'raw/a.zip', 'abc', 60)
+        self.ledger.complete(claim, {})
+
+        item = self.ledger.lookup(claim.object_id)
+        self.assertEqual(item['expires_at'], int(self.clock.now) + 30 * 86400)
+
+
+class TestLedgerHandler(unittest.TestCase):
+    """lambda_handler の重複配信・再アップロードのテスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB()
+        self.table = self.dynamodb.Table('stats')
+        self.client = FakeDynamoDBClient()
+        self.originals = (lambda_function.s3_client, lambda_function.table,
+                          lambda_function.batch_writer, lambda_function.ledger,
+                          lambda_function.LEDGER_TABLE)
+        lambda_function.s3_client = self.s3
+        lambda_function.table = self.table
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+        lambda_function.ledger = Ledger(self.client, 'ledger')
+        lambda_function.LEDGER_TABLE = 'ledger'
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.table,
+         lambda_function.batch_writer, lambda_function.ledger,
+         lambda_function.LEDGER_TABLE) = self.originals
+
+    def put(self, key, data):
+        self.s3.objects[('in', key)] = data
+        return self.s3.etag(data).strip('"')
+
+    def event(self, key, etag):
+        event = make_event([key])
+        event['Records'][0]['s3']['object']['eTag'] = etag
+        return event
+
+    def test_duplicate_delivery_skipped(self):
+        """同じイベントの再配信は ZIP を読まずに skipped になるか"""
+        etag = self.put('raw/2025-04-28/10.zip', make_zip(10, critical=3, warning=1))
+        event = self.event('raw/2025-04-28/10.zip', etag)
+
+        lambda_function.lambda_handler(event, None)
+        gets, batches = self.s3.get_requests, self.dynamodb.calls
+        response = lambda_function.lambda_handler(event, None)
+
+        result = json.loads(response['body'])['results'][0]
+        self.assertEqual(result['status'], 'skipped')
+        self.assertEqual(result['log_date'], '2025-04-28')
+        self.assertEqual(result['total_hours'], 1)
+        self.assertEqual(self.s3.get_requests, gets)
+        self.assertEqual(self.dynamodb.calls, batches)
+
+    def test_reupload_with_new_content(self):
+        """内容の変わった再アップロードは処理し直すか"""
+        key = 'raw/2025-04-28/10.zip'
+        lambda_function.lambda_handler(
+            self.event(key, self.put(key, make_zip(10, critical=3, warning=1))), None)
+        response = lambda_function.lambda_handler(
+            self.event(key, self.put(key, make_zip(10, critical=7, warning=1))), None)
+
+        result = json.loads(response['body'])['results'][0]
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(self.table.items[('2025-04-28', '10:00')]['critical_count'], 7)
+
+    def test_missing_etag_uses_head_object(self):
+        """イベントに eTag がない場合は head_object の ETag で重複を判定するか"""
+        etag = self.put('raw/2025-04-28/10.zip', make_zip(10, critical=3, warning=1))
+        lambda_function.lambda_handler(self.event('raw/2025-04-28/10.zip', etag), None)
+
+        response = lambda_function.lambda_handler(make_event(['raw/2025-04-28/10.zip']), None)
+
+        result = json.loads(response['body'])['results'][0]
+        self.assertEqual(result['status'], 'skipped')
+
+    def test_busy_record_fails_for_retry(self):
+        """他の呼び出しが処理中のレコードは busy として失敗し、S3 の再試行に任せるか"""
+        etag = self.put('raw/2025-04-28/10.zip', make_zip(10, critical=3, warning=1))
+        lambda_function.ledger.claim('in', 'raw/2025-04-28/10.zip', etag, 600)
+
+        with self.assertRaises(lambda_function.RecordProcessingError) as cm:
+            lambda_function.lambda_handler(self.event('raw/2025-04-28/10.zip', etag), None)
+
+        self.assertEqual(cm.exception.results[0]['status'], 'busy')
+        self.assertEqual(self.s3.get_requests, 0)
+
+    def test_failure_releases_lease(self):
+        """処理に失敗したレコードはリースを手放し、次の配信で処理できるか"""
+        with self.assertRaises(lambda_function.RecordProcessingError):
+            lambda_function.lambda_handler(self.event('raw/2025-04-28/10.zip', 'abc'), None)
+        self.assertEqual(self.client.tables['ledger'], {})
+
+        etag = self.put('raw/2025-04-28/10.zip', make_zip(10, critical=3, warning=1))
+        response = lambda_function.lambda_handler(self.event('raw/2025-04-28/10.zip', etag), None)
+        self.assertEqual(response['statusCode'], 200)
+
+    def test_export_failure_is_retried(self):
+        """JSON の出力に失敗したら処理済みにせず、次の配信で JSON を出力し直すか"""
+        key = 'raw/2025-04-28/10.zip'
+        event = self.event(key, self.put(key, make_zip(10, critical=3, warning=1)))
+        put_object = self.s3.put_object
+
+        def failing_put_object(**kwargs):
+            if kwargs['Bucket'] == lambda_function.OUTPUT_BUCKET:
+                raise FakeClientError('InternalError', 'We encountered an internal error.')
+            return put_object(**kwargs)
+
+        self.s3.put_object = failing_put_object
+        with self.assertRaises(lambda_function.RecordProcessingError) as cm:
+            lambda_function.lambda_handler(event, None)
+        self.assertEqual(cm.exception.results[0]['status'], 'error')
+        self.assertEqual(lambda_function.metrics.counters['export_failures'], 1)
+        self.assertEqual(self.client.tables['ledger'], {})
+
+        self.s3.put_object = put_object
+        response = lambda_function.lambda_handler(event, None)
+
+        self.assertEqual(json.loads(response['body'])['results'][0]['status'], 'success')
+        self.assertIn((lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json'), self.s3.objects)
+        self.assertEqual(lambda_function.lambda_handler(event, None)['statusCode'], 200)
+
+    def test_lease_from_remaining_time(self):
+        """リースの長さは呼び出しの残り時間 + 余裕になるか"""
+        context = Mock()
+        context.get_remaining_time_in_millis.return_value = 60000
+
+        self.assertEqual(lambda_function.ledger_lease_seconds(context),
+                         60 + lambda_function.LEDGER_LEASE_GRACE_SECONDS)
+        self.assertEqual(lambda_function.ledger_lease_seconds(None),
+                         lambda_function.LEDGER_LEASE_SECONDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
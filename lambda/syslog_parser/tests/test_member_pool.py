@@ -0,0 +1,327 @@
+"""
+ZIP メンバー並列処理のテスト
+
+member_pool.process_members、s3_range.S3RangeReader、partials.merge_partials と、
+複数の CSV メンバーを持つ ZIP の取り込み（逐次処理と同じ結果になるか）をテスト
+"""
+
+import unittest
+import io
+import os
+import sys
+import zipfile
+import functools
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import lambda_function
+import member_pool
+from member_pool import MemberProcessingError
+from partials import PartialAggregate, merge_partials
+from s3_range import S3RangeReader, open_s3_object
+from tests.fakes import FakeS3Client, FakeClientError
+
+HEADER = 'Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\n'
+SEVERITIES = ['CRITICAL', 'WARNING', 'INFO', 'NOTICE']
+
+
+def make_csv(hour, rows, hostname='srx-fw01', date='2025-04-28'):
+    """1時間分の CSV（THREAT 行は送信元IPが行ごとに変わる）"""
+    lines = [HEADER]
+    for i in range(rows):
+        severity = SEVERITIES[i % 4]
+        lines.append(
+            f'{date}T{hour:02d}:{i % 60:02d}:00Z,{hostname},RT_SCREEN,2,{severity},THREAT,'
+            f'RT_SCREEN_TCP: SYN flood attack detected 10.{hour}.{i % 7}.{i % 50}/5000 > '
+            f'192.168.0.{i % 3}/443 protocol=tcp\n')
+    return ''.join(lines).encode('utf-8')
+
+
+def make_zip(members):
+    """members: [(name, bytes)] から ZIP バイト列を生成"""
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        for name, data in members:
+            z.writestr(name, data)
+    return out.getvalue()
+
+
+class FakeArchive:
+    """メンバー名 → バイト列の ZIP 代わり（process_members 単体のテスト用）"""
+
+    def __init__(self, members):
+        self.members = members
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def open(self, name):
+        return io.BytesIO(self.members[name])
+
+
+class LengthResult:
+    def __init__(self, value):
+        self.value = value
+
+    def to_dict(self):
+        return {'value': self.value}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['value'])
+
+
+# ワーカーで initializer が設定する倍率
+scale = 1
+
+
+def set_scale(value):
+    global scale
+    scale = value
+
+
+def scan_length(member, name):
+    data = member.read()
+    if data == b'boom':
+        raise ValueError('bad member')
+    if data == b'crash':
+        os._exit(1)
+    return LengthResult(len(data) * scale)
+
+
+class TestProcessMembers(unittest.TestCase):
+    """process_members のテスト"""
+
+    MEMBERS = {f'{i:02d}.csv': b'x' * (i * 10 + 1) for i in range(7)}
+
+    def run_pool(self, members, workers, **kwargs):
+        # ワーカーは forkserver から起動する（既定の START_METHOD）ため、渡す関数は pickle できる形にする
+        names = sorted(members)
+        results = member_pool.process_members(
+            functools.partial(FakeArchive, members), names, scan_length, LengthResult.from_dict, workers,
+            preload_modules=(__name__,), **kwargs)
+        return [r.value for r in results]
+
+    def test_results_in_member_order(self):
+        """ワーカー数によらず names の順で結果が返るか"""
+        expected = [len(self.MEMBERS[name]) for name in sorted(self.MEMBERS)]
+        for workers in (1, 2, 3, 10):
+            self.assertEqual(self.run_pool(self.MEMBERS, workers), expected, workers)
+
+    def test_member_error(self):
+        """失敗したメンバーが MemberProcessingError にまとめられるか"""
+        members = dict(self.MEMBERS, **{'03.csv': b'boom'})
+        for workers in (1, 3):
+            with self.assertRaises((MemberProcessingError, ValueError)) as cm:
+                self.run_pool(members, workers)
+            if workers > 1:
+                self.assertIn('03.csv', cm.exception.errors)
+                self.assertIn('bad member', str(cm.exception))
+
+    def test_worker_crash(self):
+        """ワーカーが異常終了しても待ち続けずにエラーになるか"""
+        members = dict(self.MEMBERS, **{'05.csv': b'crash'})
+        with self.assertRaises(MemberProcessingError) as cm:
+            self.run_pool(members, 2)
+        self.assertEqual(cm.exception.errors['05.csv'], 'Worker exited unexpectedly')
+
+    def test_initializer(self):
+        """各ワーカーで initializer が scan より先に呼ばれるか"""
+        members = {name: b'x' for name in self.MEMBERS}
+        results = self.run_pool(members, 3, initializer=set_scale, initargs=(5,))
+        self.assertEqual(results, [5] * len(members))
+
+    def test_default_workers(self):
+        self.assertGreaterEqual(member_pool.default_workers(), 1)
+
+
+class TestS3RangeReader(unittest.TestCase):
+    """S3RangeReader のテスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.data = bytes(range(256)) * 100
+        self.s3.objects[('in', 'raw/a.bin')] = self.data
+
+    def test_seek_and_read(self):
+        reader = S3RangeReader(self.s3, 'in', 'raw/a.bin')
+        self.assertEqual(reader.size, len(self.data))
+        reader.seek(1000)
+        self.assertEqual(reader.read(10), self.data[1000:1010])
+        reader.seek(-5, io.SEEK_END)
+        self.assertEqual(reader.read(), self.data[-5:])
+        self.assertEqual(reader.read(10), b'')
+
+    def test_buffered_requests(self):
+        """バッファ単位でレンジ GET されるか"""
+        f = open_s3_object(self.s3, 'in', 'raw/a.bin', buffer_size=4096)
+        chunks = iter(lambda: f.read(1000), b'')
+        self.assertEqual(b''.join(chunks), self.data)
+        self.assertEqual(f.raw.requests, -(-len(self.data) // 4096))
+
+    def test_replaced_object(self):
+        """読み込み中にオブジェクトが置き換えられたら失敗するか"""
+        reader = S3RangeReader(self.s3, 'in', 'raw/a.bin')
+        self.s3.objects[('in', 'raw/a.bin')] = b'replaced'
+        with self.assertRaises(FakeClientError):
+            reader.read(10)
+
+    def test_zipfile_over_ranges(self):
+        """zipfile.ZipFile で任意のメンバーを読めるか"""
+        members = [(f'{hour:02d}.csv', make_csv(hour, 300)) for hour in range(3)]
+        self.s3.objects[('in', 'raw/a.zip')] = make_zip(members)
+        with zipfile.ZipFile(open_s3_object(self.s3, 'in', 'raw/a.zip', buffer_size=1024)) as z:
+            self.assertEqual(z.read('02.csv'), members[2][1])
+
+
+class TestPartials(unittest.TestCase):
+    """PartialAggregate の合算・受け渡しのテスト"""
+
+    def scan(self, data):
+        return lambda_function.scan_member(io.BytesIO(data))
+
+    def test_round_trip(self):
+        partial = self.scan(make_csv(10, 200))
+        loaded = PartialAggregate.from_dict(partial.to_dict())
+        self.assertEqual(lambda_function.build_stats(loaded),
+                         lambda_function.build_stats(self.scan(make_csv(10, 200))))
+
+    def test_group_by_host_and_date(self):
+        partials = [
+            self.scan(make_csv(10, 100)),
+            self.scan(make_csv(10, 50, hostname='srx-fw02')),
+            self.scan(HEADER.encode()),
+            self.scan(make_csv(11, 100)),
+            self.scan(make_csv(11, 100, date='2025-04-29')),
+        ]
+        groups = merge_partials(partials)
+        self.assertEqual([p.group_key() for p in groups], [
+            ('2025-04-28', 'srx-fw01'), ('2025-04-28', 'srx-fw02'), ('2025-04-29', 'srx-fw01')])
+        self.assertEqual(len(lambda_function.build_stats(groups[0])['hourly_stats']), 2)
+
+    def test_only_empty(self):
+        groups = merge_partials([self.scan(HEADER.encode()), self.scan(HEADER.encode())])
+        self.assertEqual(len(groups), 1)
+        self.assertIsNone(groups[0].log_date)
+
+
+class TestIngestMembers(unittest.TestCase):
+    """複数メンバーの ZIP の取り込みテスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.originals = (lambda_function.s3_client, lambda_function.INGEST_MODE,
+                          lambda_function.MEMBER_WORKERS, lambda_function.worker_s3_client,
+                          member_pool.START_METHOD, lambda_function.HEAVY_HITTER_CAPACITY)
+        lambda_function.s3_client = self.s3
+        # 上位追跡の要約もワーカーをまたいで合算されるか確かめる
+        lambda_function.HEAVY_HITTER_CAPACITY = 64
+        # フェイクを引き継ぐよう、ワーカーはこのプロセスから fork する
+        lambda_function.worker_s3_client = lambda: self.s3
+        member_pool.START_METHOD = 'fork'
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.INGEST_MODE,
+         lambda_function.MEMBER_WORKERS, lambda_function.worker_s3_client,
+         member_pool.START_METHOD, lambda_function.HEAVY_HITTER_CAPACITY) = self.originals
+
+    def ingest(self, members, mode, workers):
+        self.s3.objects[('in', 'raw/bundle.zip')] = make_zip(members)
+        lambda_function.INGEST_MODE = mode
+        lambda_function.MEMBER_WORKERS = workers
+        return lambda_function.ingest('in', 'raw/bundle.zip')
+
+    def test_same_as_sequential(self):
+        """ワーカー数・取り込み方式によらず逐次処理と同じ結果になるか"""
+        members = [(f'{hour:02d}.csv', make_csv(hour, 200 + hour)) for hour in range(6)]
+        members.append(('readme.txt', b'not a csv'))
+        expected = self.ingest(members, 'stream', 1)
+        self.assertEqual(len(expected), 1)
+        self.assertEqual(len(expected[0]['hourly_stats']), 6)
+        self.assertIn('heavy_hitters', expected[0])
+        for mode in ('stream', 'disk'):
+            for workers in (1, 2, 6):
+                self.assertEqual(self.ingest(members, mode, workers), expected, (mode, workers))
+
+    def test_merged_members_equal_single_file(self):
+        """1時間を複数メンバーに分けても1ファイルと同じ集計になるか"""
+        whole = make_csv(10, 400).splitlines(keepends=True)
+        body = whole[1:]
+        halves = [('a.csv', whole[0] + b''.join(body[:150])),
+                  ('b.csv', whole[0] + b''.join(body[150:]))]
+        expected, = self.ingest([('all.csv', b''.join(whole))], 'stream', 1)
+        merged, = self.ingest(halves, 'stream', 2)
+        # 上位追跡は近似（合算の順で誤差の出方が変わる）なので、正確な集計だけを比べる
+        hitters = merged.pop('heavy_hitters')
+        expected.pop('heavy_hitters')
+        self.assertEqual(merged, expected)
+        self.assertEqual(hitters['10:00']['dst_ip']['total'], 400)
+
+    def test_sequential_by_default(self):
+        """MEMBER_WORKERS を指定しなければ逐次処理（CPU 数によらず、レンジ GET で調べない）"""
+        if 'MEMBER_WORKERS' in os.environ:
+            self.skipTest('MEMBER_WORKERS is set')
+        self.assertEqual(self.originals[2], 1)
+
+    def test_single_member_streams(self):
+        """CSV メンバーが1つなら、MEMBER_WORKERS が 2 以上でもワーカーを使わず1回の GET で展開するか"""
+        members = [('10.csv', make_csv(10, 3000)), ('readme.txt', b'not a csv')]
+        expected = self.ingest(members, 'stream', 1)
+        # 無圧縮にして、レンジ GET の大きさより十分大きい ZIP にする
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_STORED) as z:
+            for name, data in members:
+                z.writestr(name, data)
+        data = out.getvalue()
+        self.assertGreater(len(data), 4 * lambda_function.CENTRAL_DIRECTORY_READ_SIZE)
+        self.s3.objects[('in', 'raw/bundle.zip')] = data
+        received = []
+        get_object = self.s3.get_object
+
+        def counted_get_object(**kwargs):
+            response = get_object(**kwargs)
+            received.append(response['ContentLength'])
+            return response
+
+        self.s3.get_object = counted_get_object
+        lambda_function.INGEST_MODE = 'stream'
+        lambda_function.MEMBER_WORKERS = 4
+        original = lambda_function.scan_members
+        lambda_function.scan_members = Mock(side_effect=AssertionError('member pool used'))
+        try:
+            stats = lambda_function.ingest('in', 'raw/bundle.zip')
+        finally:
+            lambda_function.scan_members = original
+
+        self.assertEqual(stats, expected)
+        # 本体の GET 1回と、セントラルディレクトリを読む末尾の小さなレンジ GET だけ
+        self.assertIn(len(data), received)
+        self.assertLess(sum(received), len(data) + lambda_function.CENTRAL_DIRECTORY_READ_SIZE)
+
+    def test_hosts_in_one_zip(self):
+        """ホスト別のメンバーがホストごとの結果になるか"""
+        members = [('srx-fw01/10.csv', make_csv(10, 100)),
+                   ('srx-fw02/10.csv', make_csv(10, 30, hostname='srx-fw02'))]
+        stats = self.ingest(members, 'stream', 2)
+        self.assertEqual([(s['hostname'], s['severity_stats']['10:00']['CRITICAL']) for s in stats],
+                         [('srx-fw01', 25), ('srx-fw02', 8)])
+
+    def test_member_failure(self):
+        """壊れたメンバーがあれば処理全体が失敗するか"""
+        members = [(f'{hour:02d}.csv', make_csv(hour, 100)) for hour in range(3)]
+        members[1] = ('01.csv', b'Timestamp,Hostname\n2025-04-28T01:00:00Z,srx-fw01\n')
+        with self.assertRaises(MemberProcessingError):
+            self.ingest(members, 'disk', 2)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
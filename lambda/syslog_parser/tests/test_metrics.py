@@ -0,0 +1,231 @@
+"""
+呼び出し単位のメトリクス（EMF）のテスト
+
+metrics.Metrics の段階別の計測（入れ子の差し引き）、EMF のドキュメントの形式、
+lambda_handler が呼び出しごとに EMF の JSON を1行だけ出力することをテスト
+"""
+
+import unittest
+import io
+import json
+import sys
+import zipfile
+import contextlib
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import lambda_function
+import member_pool
+from metrics import Metrics, STAGES
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB
+from tests.test_handler import make_zip, make_event
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SlowStream(io.RawIOBase):
+    """read のたびに clock を進めるストリーム"""
+
+    def __init__(self, data, clock, step):
+        self.data = io.BytesIO(data)
+        self.clock = clock
+        self.step = step
+
+    def read(self, size=-1):
+        self.clock.now += self.step
+        return self.data.read(size)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_nested_spans_are_exclusive(self):
+        clock = FakeClock()
+        metrics = Metrics(clock)
+        with metrics.span('parse'):
+            clock.now += 1
+            with metrics.span('extract'):
+                clock.now += 2
+                with metrics.span('download'):
+                    clock.now += 4
+            clock.now += 8
+        with metrics.span('save'):
+            clock.now += 16
+            with metrics.span('export'):
+                clock.now += 32
+        self.assertEqual(metrics.seconds, {'download': 4, 'extract': 2, 'parse': 9,
+                                           'save': 16, 'export': 32})
+
+    def test_reader(self):
+        clock = FakeClock()
+        metrics = Metrics(clock)
+        reader = metrics.reader(SlowStream(b'x' * 1000, clock, 0.5), 'extract', 'csv_bytes')
+        self.assertEqual(sum(len(chunk) for chunk in iter(lambda: reader.read(300), b'')), 1000)
+        self.assertEqual(metrics.counters['csv_bytes'], 1000)
+        # 300 バイトずつ 4 回 + EOF の確認 1 回
+        self.assertEqual(metrics.seconds['extract'], 2.5)
+
+    def test_merge_and_round_trip(self):
+        first, second = Metrics(), Metrics()
+        first.add('rows_scanned', 10)
+        second.add('rows_scanned', 5)
+        second.seconds['parse'] = 1.5
+        merged = Metrics.from_dict(json.loads(json.dumps(first.merge(second).to_dict())))
+        self.assertEqual(merged.counters['rows_scanned'], 15)
+        self.assertEqual(merged.seconds['parse'], 1.5)
+
+    def test_emf_document(self):
+        clock = FakeClock()
+        metrics = Metrics(clock)
+        metrics.add('rows_scanned', 3000)
+        metrics.seconds['download'] = 0.25
+        clock.now = 2.0
+        doc = metrics.to_emf('Syslog', {'FunctionName': 'parser'}, timestamp=1700000000.5,
+                             properties={'RequestId': 'r-1'})
+
+        directive = doc['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(doc['_aws']['Timestamp'], 1700000000500)
+        self.assertEqual(directive['Namespace'], 'Syslog')
+        self.assertEqual(directive['Dimensions'], [['FunctionName']])
+        self.assertEqual((doc['FunctionName'], doc['RequestId']), ('parser', 'r-1'))
+        # 宣言したメトリクスは全て値を持つ（RequestId はメトリクスにしない）
+        names = [m['Name'] for m in directive['Metrics']]
+        self.assertTrue(all(isinstance(doc[name], (int, float)) for name in names))
+        self.assertNotIn('RequestId', names)
+        self.assertEqual(doc['DownloadTime'], 250)
+        self.assertEqual(doc['Duration'], 2000)
+        self.assertEqual(doc['RowsPerSecond'], 1500)
+        units = {m['Name']: m['Unit'] for m in directive['Metrics']}
+        self.assertEqual((units['ParseTime'], units['BytesIn'], units['RowsPerSecond']),
+                         ('Milliseconds', 'Bytes', 'Count/Second'))
+
+
+class TestHandlerMetrics(unittest.TestCase):
+    """lambda_handler の EMF 出力のテスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB()
+        self.originals = (lambda_function.s3_client, lambda_function.table,
+                          lambda_function.batch_writer, lambda_function.INGEST_MODE,
+                          lambda_function.MEMBER_WORKERS, lambda_function.worker_s3_client,
+                          lambda_function.METRICS_NAMESPACE, member_pool.START_METHOD)
+        lambda_function.s3_client = self.s3
+        # フェイクを引き継ぐよう、ワーカーはこのプロセスから fork する
+        lambda_function.worker_s3_client = lambda: self.s3
+        member_pool.START_METHOD = 'fork'
+        lambda_function.table = self.dynamodb.Table('stats')
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+        lambda_function.METRICS_NAMESPACE = 'SyslogAnalytics'
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.table,
+         lambda_function.batch_writer, lambda_function.INGEST_MODE,
+         lambda_function.MEMBER_WORKERS, lambda_function.worker_s3_client,
+         lambda_function.METRICS_NAMESPACE, member_pool.START_METHOD) = self.originals
+
+    def invoke(self, keys, context=None):
+        """lambda_handler を実行し、(EMF の行, 例外) を返す"""
+        out = io.StringIO()
+        error = None
+        with contextlib.redirect_stdout(out):
+            try:
+                lambda_function.lambda_handler(make_event(keys), context)
+            except lambda_function.RecordProcessingError as e:
+                error = e
+        lines = [json.loads(line) for line in out.getvalue().splitlines() if line.startswith('{"_aws"')]
+        return lines, error
+
+    def put(self, key, data):
+        self.s3.objects[('in', key)] = data
+        return len(data)
+
+    def test_one_line_per_invocation(self):
+        for mode in ('stream', 'disk'):
+            with self.subTest(mode=mode):
+                lambda_function.INGEST_MODE = mode
+                keys = [f'raw/2025-04-28/{hour:02d}.zip' for hour in range(3)]
+                size = sum(self.put(key, make_zip(hour, critical=5, warning=7))
+                           for hour, key in enumerate(keys))
+                context = Mock(aws_request_id='req-1')
+
+                lines, error = self.invoke(keys, context)
+                self.assertIsNone(error)
+                self.assertEqual(len(lines), 1)
+                doc = lines[0]
+                self.assertEqual((doc['FunctionName'], doc['RequestId']), ('syslog-parser', 'req-1'))
+                self.assertEqual((doc['Records'], doc['FailedRecords']), (3, 0))
+                self.assertEqual(doc['BytesIn'], size)
+                self.assertEqual(doc['RowsScanned'], 3 * 15)
+                self.assertEqual(doc['RowsKept'], 3 * 12)
+                self.assertEqual(doc['DynamoDBItems'], 3)
+                self.assertEqual(doc['DynamoDBRequests'], 3)
+                self.assertEqual(doc['DynamoDBRetries'], 0)
+                self.assertGreater(doc['CsvBytes'], doc['BytesIn'] / 2)
+                self.assertGreater(doc['RowsPerSecond'], 0)
+                stage_total = sum(doc[f"{stage.capitalize()}Time"] for stage in STAGES)
+                self.assertTrue(all(doc[f"{stage.capitalize()}Time"] >= 0 for stage in STAGES))
+                self.assertGreater(doc['ParseTime'], 0)
+                self.assertGreater(doc['SaveTime'], 0)
+                self.assertGreater(doc['ExportTime'], 0)
+                # 並行処理したスレッドの時間を合算するため Duration を超えることはあるが、桁は変わらない
+                self.assertLess(stage_total, doc['Duration'] * lambda_function.MAX_WORKERS + 1)
+
+    def test_failed_invocation_still_emits(self):
+        self.put('raw/ok.zip', make_zip(1, critical=1, warning=1))
+        self.put('raw/bad.zip', b'not a zip')
+        lines, error = self.invoke(['raw/ok.zip', 'raw/bad.zip'])
+        self.assertIsNotNone(error)
+        self.assertEqual(len(lines), 1)
+        self.assertEqual((lines[0]['Records'], lines[0]['FailedRecords']), (2, 1))
+        self.assertNotIn('RequestId', lines[0])
+
+    def test_counters_reset_per_invocation(self):
+        self.put('raw/a.zip', make_zip(1, critical=2, warning=0))
+        first, _ = self.invoke(['raw/a.zip'])
+        second, _ = self.invoke(['raw/a.zip'])
+        self.assertEqual(first[0]['RowsScanned'], second[0]['RowsScanned'])
+        self.assertEqual(second[0]['Records'], 1)
+
+    def test_worker_processes_report_back(self):
+        """ワーカープロセスで計測した解凍・解析の値も合算されるか"""
+        out = io.BytesIO()
+        members = {f'{hour:02d}.csv': make_zip(hour, 3, 4) for hour in range(3)}
+        csv_size = 0
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            for name, data in members.items():
+                with zipfile.ZipFile(io.BytesIO(data)) as inner:
+                    text = inner.read(name)
+                csv_size += len(text)
+                z.writestr(name, text)
+        size = self.put('raw/2025-04-28/bundle.zip', out.getvalue())
+        lambda_function.INGEST_MODE = 'stream'
+        lambda_function.MEMBER_WORKERS = 2
+        lines, error = self.invoke(['raw/2025-04-28/bundle.zip'])
+        self.assertIsNone(error)
+        self.assertEqual(lines[0]['CsvBytes'], csv_size)
+        self.assertEqual(lines[0]['BytesIn'], size)
+        self.assertEqual(lines[0]['RowsScanned'], 3 * 10)
+        self.assertGreater(lines[0]['ExtractTime'] + lines[0]['ParseTime'], 0)
+
+    def test_disabled(self):
+        lambda_function.METRICS_NAMESPACE = ''
+        self.put('raw/a.zip', make_zip(1, critical=1, warning=0))
+        lines, _ = self.invoke(['raw/a.zip'])
+        self.assertEqual(lines, [])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
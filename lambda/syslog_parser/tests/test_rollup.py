@@ -0,0 +1,236 @@
+"""
+日次JSONインクリメンタル更新のテスト
+
+rollup.update_json_document の条件付き PUT と、マージ処理をテスト
+"""
+
+import unittest
+import json
+import sys
+import threading
+from pathlib import Path
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import rollup
+from rollup import RollupConflictError
+from tests.fakes import FakeS3Client, FakeClientError, iam_list_prefixes
+
+
+def entries(**hours):
+    """entries(h10=(critical, warning)) → hourly_entries 形式"""
+    return rollup.hourly_entries({'hourly_stats': {
+        f'{name[1:]}:00': {'CRITICAL': c, 'WARNING': w} for name, (c, w) in hours.items()
+    }})
+
+
+class TestMergeDaily(unittest.TestCase):
+    """merge_daily のテスト"""
+
+    def test_new_document(self):
+        doc = rollup.merge_daily(None, '2025-04-28', 'srx-fw01', 't1', entries(h11=(1, 2), h10=(3, 4)))
+        self.assertEqual([h['hour'] for h in doc['hourly_stats']], ['10:00', '11:00'])
+        self.assertEqual(doc['hourly_stats'][0], {'hour': '10:00', 'critical': 3, 'warning': 4, 'total': 7})
+        self.assertEqual(doc['total_hours'], 2)
+
+    def test_merge_replaces_only_new_hours(self):
+        """既存の時間は残り、今回の時間だけが置き換わるか（再処理で二重計上しない）"""
+        doc = rollup.merge_daily(None, '2025-04-28', 'srx-fw01', 't1', entries(h10=(3, 4), h11=(1, 1)))
+        doc = rollup.merge_daily(doc, '2025-04-28', 'srx-fw01', 't2', entries(h11=(5, 5), h12=(1, 0)))
+        doc = rollup.merge_daily(doc, '2025-04-28', 'srx-fw01', 't3', entries(h11=(5, 5)))
+
+        self.assertEqual([(h['hour'], h['critical']) for h in doc['hourly_stats']],
+                         [('10:00', 3), ('11:00', 5), ('12:00', 1)])
+        self.assertEqual(doc['processed_at'], 't3')
+
+
+class TestMergeFleet(unittest.TestCase):
+    """merge_fleet のテスト"""
+
+    def test_totals_from_hosts(self):
+        doc = None
+        doc = rollup.merge_fleet(doc, '2025-04-28', 'fleet', 'fw-b', 't', entries(h10=(2, 1)))
+        doc = rollup.merge_fleet(doc, '2025-04-28', 'fleet', 'fw-a', 't', entries(h10=(3, 0), h11=(1, 1)))
+        doc = rollup.merge_fleet(doc, '2025-04-28', 'fleet', 'fw-b', 't', entries(h10=(4, 1)))
+
+        self.assertEqual(doc['hosts'], ['fw-a', 'fw-b'])
+        ten = doc['hourly_stats'][0]
+        self.assertEqual((ten['critical'], ten['warning'], ten['total'], ten['hosts']), (7, 1, 8, 2))
+        self.assertEqual(doc['hourly_stats'][1]['hosts'], 1)
+
+
+class TestUpdateJsonDocument(unittest.TestCase):
+    """update_json_document の条件付き PUT のテスト"""
+
+    def test_create_and_update(self):
+        s3 = FakeS3Client()
+        append = lambda doc: {'values': (doc or {'values': []})['values'] + [1]}
+
+        rollup.update_json_document(s3, 'out', 'data/x.json', append)
+        doc, conflicts = rollup.update_json_document(s3, 'out', 'data/x.json', append)
+
+        self.assertEqual(doc, {'values': [1, 1]})
+        self.assertEqual(conflicts, 0)
+        self.assertEqual(json.loads(s3.objects[('out', 'data/x.json')]), doc)
+
+    def test_concurrent_writers_do_not_lose_updates(self):
+        """同時に更新しても、競合をリトライして全ての更新が反映されるか"""
+        s3 = FakeS3Client(get_latency=0.002)
+        workers = 8
+
+        def add_hour(hour):
+            def merge(doc):
+                doc = dict(doc or {})
+                doc[hour] = 1
+                return doc
+            rollup.update_json_document(s3, 'out', 'data/day.json', merge,
+                                        max_retries=50, base_delay=0.001)
+
+        threads = [threading.Thread(target=add_hour, args=(f'{h:02d}:00',)) for h in range(workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        doc = json.loads(s3.objects[('out', 'data/day.json')])
+        self.assertEqual(len(doc), workers)
+        self.assertGreater(s3.conflicts, 0)
+
+    def test_gives_up_after_max_retries(self):
+        """競合が続くと RollupConflictError になるか"""
+        class AlwaysConflict(FakeS3Client):
+            def put_object(self, **kwargs):
+                raise FakeClientError('PreconditionFailed')
+
+        with self.assertRaises(RollupConflictError):
+            rollup.update_json_document(AlwaysConflict(), 'out', 'k', lambda d: {},
+                                        max_retries=2, sleep=lambda s: None)
+
+    def test_first_manifest(self):
+        """マニフェストがまだない場合、ListBucket の範囲内なら新規作成されるか（範囲外は AccessDenied）"""
+        s3 = FakeS3Client(list_prefixes=iam_list_prefixes())
+        merge = lambda doc: rollup.merge_manifest(doc, 't1', {('daily', '2025-04-28'): {'hash': 'a', 'revision': 1}})
+
+        doc, conflicts = rollup.update_json_document(s3, 'out', 'data/manifest.json', merge)
+
+        self.assertEqual((doc['revision'], conflicts), (1, 0))
+        self.assertEqual(json.loads(s3.objects[('out', 'data/manifest.json')]), doc)
+        with self.assertRaises(FakeClientError):
+            rollup.update_json_document(s3, 'out', 'manifest.json', merge)
+
+    def test_other_errors_raised(self):
+        class AccessDenied(FakeS3Client):
+            def get_object(self, **kwargs):
+                raise FakeClientError('AccessDenied')
+
+        with self.assertRaises(FakeClientError):
+            rollup.update_json_document(AccessDenied(), 'out', 'k', lambda d: {})
+
+
+class TestEncoding(unittest.TestCase):
+    """encode_document / decode_document / content_hash のテスト"""
+
+    DOC = {'log_date': '2025-04-28', 'hostname': 'srx-fw01', 'hourly_stats': [
+        {'hour': f'{h:02d}:00', 'critical': h, 'warning': 1, 'total': h + 1} for h in range(24)]}
+
+    def test_minified_and_gzipped(self):
+        plain = rollup.encode_document(self.DOC)
+        self.assertNotIn(b' ', plain)
+        compressed = rollup.encode_document(self.DOC, compress=True)
+        self.assertLess(len(compressed), len(plain))
+        # 同じ内容なら同じバイト列（gzip ヘッダーの時刻を固定）
+        self.assertEqual(compressed, rollup.encode_document(dict(self.DOC), compress=True))
+        for data in (plain, compressed, json.dumps(self.DOC, indent=2).encode('utf-8')):
+            self.assertEqual(rollup.decode_document(data), self.DOC)
+
+    def test_json_object(self):
+        args = rollup.json_object(self.DOC, compress=True)
+        self.assertEqual(args['ContentEncoding'], 'gzip')
+        self.assertEqual(args['ContentType'], 'application/json')
+        self.assertNotIn('ContentEncoding', rollup.json_object(self.DOC))
+
+    def test_update_reads_compressed_document(self):
+        s3 = FakeS3Client()
+        add = lambda doc: {'n': (doc or {'n': 0})['n'] + 1}
+        rollup.update_json_document(s3, 'out', 'k', add, compress=True, put_args={'CacheControl': 'x'})
+        doc, _ = rollup.update_json_document(s3, 'out', 'k', add, compress=True)
+        self.assertEqual(doc, {'n': 2})
+        self.assertEqual(s3.metadata[('out', 'k')]['ContentEncoding'], 'gzip')
+
+    def test_content_hash(self):
+        self.assertEqual(rollup.content_hash(self.DOC), rollup.content_hash(dict(self.DOC)))
+        self.assertEqual(len(rollup.content_hash(self.DOC)), rollup.HASH_LENGTH)
+        self.assertNotEqual(rollup.content_hash(self.DOC), rollup.content_hash({**self.DOC, 'x': 1}))
+
+
+class TestPeriods(unittest.TestCase):
+    """週・月のロールアップとマニフェストのテスト"""
+
+    def daily(self, log_date, revision, **hours):
+        doc = rollup.merge_daily(None, log_date, 'srx-fw01', 't', entries(**hours))
+        doc['revision'] = revision
+        return doc
+
+    def test_period_name(self):
+        self.assertEqual(rollup.period_name('weekly', '2025-04-27'), '2025-W17')
+        self.assertEqual(rollup.period_name('weekly', '2025-04-28'), '2025-W18')
+        # ISO 週は年をまたぐ
+        self.assertEqual(rollup.period_name('weekly', '2024-12-30'), '2025-W01')
+        self.assertEqual(rollup.period_name('monthly', '2025-04-30'), '2025-04')
+
+    def test_parse_periods(self):
+        self.assertEqual(rollup.parse_periods('monthly, weekly'), ['weekly', 'monthly'])
+        self.assertEqual(rollup.parse_periods(''), [])
+        with self.assertRaises(ValueError):
+            rollup.parse_periods('daily,yearly')
+
+    def test_day_summary(self):
+        summary = rollup.day_summary(self.daily('2025-04-28', 2, h10=(3, 4), h23=(1, 0)))
+        self.assertEqual(summary['hourly_critical'][10], 3)
+        self.assertEqual(summary['hourly_critical'][23], 1)
+        self.assertEqual((summary['critical'], summary['warning'], summary['total']), (4, 4, 8))
+        self.assertEqual((summary['hours'], summary['revision']), (2, 2))
+
+    def test_merge_period(self):
+        merge = lambda doc, daily: rollup.merge_period(doc, 'monthly', '2025-04', 'srx-fw01', 't',
+                                                       rollup.day_summary(daily))
+        doc = merge(None, self.daily('2025-04-28', 1, h10=(3, 4)))
+        doc = merge(doc, self.daily('2025-04-01', 1, h00=(1, 1)))
+        doc = merge(doc, self.daily('2025-04-28', 2, h10=(3, 4), h11=(2, 0)))
+        self.assertEqual([d['log_date'] for d in doc['daily_stats']], ['2025-04-01', '2025-04-28'])
+        self.assertEqual((doc['critical'], doc['warning'], doc['total']), (6, 5, 11))
+        self.assertEqual(doc['revision'], 3)
+
+        # 並行して処理した古い日次JSONの要約が後から届いても戻らない
+        stale = merge(doc, self.daily('2025-04-28', 1, h10=(3, 4)))
+        self.assertEqual(stale['critical'], 6)
+
+    def test_merge_period_distinct_sources(self):
+        from hyperloglog import HyperLogLog
+        sketches = []
+        for start in (0, 500):
+            sketch = HyperLogLog(10)
+            for i in range(start, start + 1000):
+                sketch.add(f'10.0.{i // 256}.{i % 256}'.encode())
+            sketches.append(sketch.to_dict())
+        summary = rollup.day_summary(self.daily('2025-04-28', 1, h10=(1, 0)))
+        doc = rollup.merge_period(None, 'weekly', '2025-W18', 'h', 't', summary, sketches[0])
+        doc = rollup.merge_period(doc, 'weekly', '2025-W18', 'h', 't', summary, sketches[1])
+        self.assertAlmostEqual(doc['distinct_src_ips'], 1500, delta=150)
+
+    def test_merge_manifest(self):
+        entry = lambda h, r: {'hash': h, 'revision': r}
+        doc = rollup.merge_manifest(None, 't1', {('daily', '2025-04-28'): entry('a', 2),
+                                                 ('monthly', '2025-04'): entry('m', 5)})
+        doc = rollup.merge_manifest(doc, 't2', {('daily', '2025-04-27'): entry('b', 1),
+                                                ('daily', '2025-04-28'): entry('old', 1)})
+        self.assertEqual(list(doc['daily']), ['2025-04-27', '2025-04-28'])
+        self.assertEqual(doc['daily']['2025-04-28']['hash'], 'a')
+        self.assertEqual(doc['monthly'], {'2025-04': entry('m', 5)})
+        self.assertEqual(doc['weekly'], {})
+        self.assertEqual((doc['processed_at'], doc['revision']), ('t2', 2))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
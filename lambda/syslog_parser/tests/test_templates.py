@@ -0,0 +1,248 @@
+"""
+Message のテンプレート別集計のテスト
+
+templates.TemplateCounts の接頭辞の切り出し・テンプレート名・上限・合算と、
+lambda_function への組み込み（MESSAGE_TEMPLATES）をテスト
+"""
+
+import unittest
+import io
+import sys
+import json
+import random
+import zipfile
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import lambda_function
+import rollup
+import templates
+from templates import TemplateCounts, OTHER_TEMPLATE, message_prefix, template_name
+from partials import PartialAggregate
+from aggregation import AggregationSpec, Aggregator
+from dynamodb_writer import BatchWriter
+from tests.fakes import FakeS3Client, FakeDynamoDB
+
+TS = 0
+
+EVENTS = [
+    'RT_SCREEN_TCP: SYN flood attack detected',
+    'RT_IDP_ATTACK_LOG: Port scan detected',
+    'RT_IDP_ATTACK_LOG: SQL injection attack detected',
+    'RT_FLOW_SESSION_CREATE: session created',
+]
+
+
+def junos_message(event, rand):
+    """generator/generate.py と同じ形の Message"""
+    return (f'{event} 10.0.{rand.randrange(256)}.{rand.randrange(256)}/{rand.randrange(1024, 65536)} > '
+            f'203.0.113.{rand.randrange(256)}/{rand.choice([22, 80, 443])} '
+            f'protocol={rand.choice(["tcp", "udp"])} SeverityLevel=2 Severity=CRITICAL').encode()
+
+
+def make_rows(n, seed=1):
+    rand = random.Random(seed)
+    rows = []
+    expected = {}
+    for _ in range(n):
+        hour = rand.randrange(24)
+        event = rand.choice(EVENTS)
+        rows.append([b'2025-04-28T%02d:00:00Z' % hour, junos_message(event, rand)])
+        counts = expected.setdefault(f'{hour:02d}:00', {})
+        counts[event] = counts.get(event, 0) + 1
+    return rows, expected
+
+
+def count(rows, max_templates=64, spec=None):
+    """行 [Timestamp, Message] を集計のループ（Aggregator.consume）の中で数える"""
+    counts = TemplateCounts(max_templates)
+    aggregator = Aggregator(spec or AggregationSpec())
+    aggregator.consume(([ts, b'INFO', message] for ts, message in rows), TS, 1, 1,
+                       templates=counts.counter(2))
+    return counts
+
+
+class TestTemplates(unittest.TestCase):
+    """TemplateCounts のテスト"""
+
+    def test_prefix_and_name(self):
+        """送信元・宛先やパラメータを除いた接頭辞と、数字を含む単語を伏せた名前になるか"""
+        rand = random.Random(0)
+        message = junos_message('RT_SCREEN_TCP: SYN flood attack detected', rand)
+        self.assertEqual(message_prefix(message), b'RT_SCREEN_TCP: SYN flood attack detected')
+        self.assertEqual(message_prefix(b'UI_LOGIN_EVENT: User admin logged in via ssh user=admin port=22'),
+                         b'UI_LOGIN_EVENT: User admin logged in via ssh')
+        self.assertEqual(message_prefix(b'UI_COMMIT: Commit complete'), b'UI_COMMIT: Commit complete')
+        self.assertEqual(template_name(b'SNMP_TRAP: link 3 down on ge-0/0/1'),
+                         'SNMP_TRAP: link <*> down on <*>')
+        self.assertEqual(template_name(b''), '<*>')
+
+    def test_counts_per_template_and_hour(self):
+        """同じイベントの行が送信元・宛先によらず同じテンプレートに数えられるか"""
+        rows, expected = make_rows(2000)
+
+        counts = count(rows)
+
+        self.assertEqual(counts.hourly_stats(), expected)
+        self.assertEqual(sorted(counts.names), sorted(EVENTS))
+        # キャッシュはテンプレートごとに1件（送信元・宛先の組み合わせでは増えない）
+        self.assertEqual(len(counts.prefixes), len(EVENTS))
+
+    def test_max_templates(self):
+        """上限を超えたテンプレートを OTHER_TEMPLATE にまとめ、名前を覚え続けないか"""
+        rows = [[b'2025-04-28T10:00:00Z', b'EVENT_%s: something' % chr(65 + i).encode()]
+                for i in range(10)]
+
+        counts = count(rows, max_templates=4)
+
+        stats = counts.hourly_stats()['10:00']
+        self.assertEqual(stats[OTHER_TEMPLATE], 7)
+        self.assertEqual(len(counts.names), 4)
+        self.assertEqual(len(counts.ids), 4)
+
+    def test_prefix_cache_is_bounded(self):
+        """可変の部分が接頭辞に残っても、キャッシュが CACHE_SIZE を超えないか"""
+        original = templates.CACHE_SIZE
+        templates.CACHE_SIZE = 8
+        try:
+            rows = [[b'2025-04-28T10:00:00Z', b'RPD_BGP: peer %d down' % i] for i in range(50)]
+            counts = count(rows)
+        finally:
+            templates.CACHE_SIZE = original
+
+        self.assertLessEqual(len(counts.prefixes), 8)
+        self.assertEqual(counts.hourly_stats(), {'10:00': {'RPD_BGP: peer <*> down': 50}})
+
+    def test_minute_and_app_dimensions(self):
+        """分の粒度・AppName 別の集計と一緒でも、時ごとのテンプレート別件数が変わらないか"""
+        rows, expected = make_rows(1000, seed=5)
+
+        counts = count(rows, spec=AggregationSpec(minute=True, app=True))
+
+        self.assertEqual(counts.hourly_stats(), expected)
+
+    def test_shared_key_uses_first_template(self):
+        """先頭の KEY_BYTES バイトが同じ Message は、最初に見たテンプレートに数えられるか"""
+        created = b'RT_FLOW_SESSION_CREATE: session created'
+        closed = b'RT_FLOW_SESSION_CREATE: session closed'
+        self.assertEqual(created[:templates.KEY_BYTES], closed[:templates.KEY_BYTES])
+
+        counts = count([[b'2025-04-28T10:00:00Z', created], [b'2025-04-28T10:00:00Z', closed]])
+
+        self.assertEqual(counts.hourly_stats(), {'10:00': {'RT_FLOW_SESSION_CREATE: session created': 2}})
+
+    def test_merge_and_round_trip(self):
+        """番号の違う件数を名前で対応付けて合算でき、シリアライズしても変わらないか"""
+        rows, expected = make_rows(1000, seed=3)
+        first = count(list(reversed(rows[:300])))
+        second = count(rows[300:])
+
+        merged = TemplateCounts.from_dict(json.loads(json.dumps(first.to_dict()))).merge(second)
+
+        self.assertEqual(merged.hourly_stats(), expected)
+        with self.assertRaises(ValueError):
+            merged.merge(TemplateCounts(8))
+
+    def test_merge_keeps_bound(self):
+        """合算しても上限を超えず、はみ出したテンプレートは OTHER_TEMPLATE になるか"""
+        first = count([[b'2025-04-28T10:00:00Z', b'A: x'], [b'2025-04-28T10:00:00Z', b'B: x']],
+                      max_templates=3)
+        second = count([[b'2025-04-28T10:00:00Z', b'C: x'], [b'2025-04-28T10:00:00Z', b'D: x']],
+                       max_templates=3)
+
+        first.merge(second)
+
+        self.assertEqual(len(first.names), 3)
+        self.assertEqual(first.hourly_stats()['10:00'], {OTHER_TEMPLATE: 2, 'A: x': 1, 'B: x': 1})
+
+    def test_partial_round_trip(self):
+        """途中集計に件数を持ち回れるか（プロセス間の受け渡し・チェックポイント）"""
+        rows, expected = make_rows(200)
+        partial = PartialAggregate(Aggregator(AggregationSpec()), '2025-04-28', 'fw',
+                                   template_counts=count(rows))
+
+        restored = PartialAggregate.from_dict(json.loads(json.dumps(partial.to_dict())))
+
+        self.assertEqual(restored.template_counts.hourly_stats(), expected)
+
+
+class TestHandlerTemplates(unittest.TestCase):
+    """MESSAGE_TEMPLATES を指定した場合の保存内容テスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.dynamodb = FakeDynamoDB()
+        self.table = self.dynamodb.Table('stats')
+        self.originals = (lambda_function.s3_client, lambda_function.batch_writer,
+                          lambda_function.MESSAGE_TEMPLATES)
+        lambda_function.s3_client = self.s3
+        lambda_function.batch_writer = BatchWriter(self.dynamodb, 'stats')
+
+    def tearDown(self):
+        (lambda_function.s3_client, lambda_function.batch_writer,
+         lambda_function.MESSAGE_TEMPLATES) = self.originals
+
+    def run_handler(self, extra_lines=()):
+        rows, expected = make_rows(500, seed=7)
+        lines = ['Timestamp,Hostname,AppName,SeverityLevel,Severity,LogType,Message\n']
+        for ts, message in rows:
+            lines.append(f'{ts.decode()},srx-fw01,RT_IDP,2,CRITICAL,THREAT,{message.decode()}\n')
+        lines.extend(extra_lines)
+        out = io.BytesIO()
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr('10.csv', ''.join(lines))
+        self.s3.objects[('in', 'raw/10.zip')] = out.getvalue()
+
+        event = {'Records': [{'s3': {'bucket': {'name': 'in'}, 'object': {'key': 'raw/10.zip'}}}]}
+        lambda_function.lambda_handler(event, None)
+        return expected
+
+    def test_items_and_json(self):
+        """テンプレート別の時間別件数が DynamoDB と日次JSON・月次ロールアップに保存されるか"""
+        lambda_function.MESSAGE_TEMPLATES = 64
+
+        expected = self.run_handler()
+
+        for hour, counts in expected.items():
+            self.assertEqual(self.table.items[('2025-04-28', hour)]['template_counts'], counts)
+        body = self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'data/2025-04-28.json')]
+        hours = {h['hour']: h for h in rollup.decode_document(body)['hourly_stats']}
+        self.assertEqual({hour: h['templates'] for hour, h in hours.items()}, expected)
+
+        body = self.s3.objects[(lambda_function.OUTPUT_BUCKET, 'data/monthly/2025-04.json')]
+        (day,) = rollup.decode_document(body)['daily_stats']
+        self.assertEqual(day['templates'], rollup.sum_counts(expected.values()))
+
+    def test_quoted_and_short_rows(self):
+        """クォートされた Message（カンマを含む）と Message のない行も、Message 全体で数えるか"""
+        lambda_function.MESSAGE_TEMPLATES = 64
+
+        expected = self.run_handler([
+            '2025-04-28T10:00:00Z,srx-fw01,RT_IDP,2,CRITICAL,THREAT,'
+            '"UI_COMMIT: Commit complete, by admin"\n',
+            '2025-04-28T10:05:00Z,srx-fw01,RT_IDP,2,CRITICAL\n',
+        ])
+
+        counts = self.table.items[('2025-04-28', '10:00')]['template_counts']
+        self.assertEqual(counts['UI_COMMIT: Commit complete, by admin'], 1)
+        self.assertEqual(counts[template_name(b'')], 1)
+        for template, count in expected.get('10:00', {}).items():
+            self.assertEqual(counts[template], count)
+
+    def test_disabled(self):
+        """MESSAGE_TEMPLATES=0 なら template_counts を保存しないか"""
+        lambda_function.MESSAGE_TEMPLATES = 0
+
+        self.run_handler()
+
+        self.assertNotIn('template_counts', self.table.items[('2025-04-28', '10:00')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+ZIP ストリーム展開のテスト
+
+zip_stream.iter_members と lambda_function のストリーム取り込み経路をテスト
+"""
+
+import unittest
+import csv
+import io
+import os
+import sys
+import zipfile
+from pathlib import Path
+from unittest.mock import Mock
+
+# boto3 をモック化（Lambda 環境で利用可能だが、ローカルテストではインストール不要）
+sys.modules['boto3'] = Mock()
+
+# 同じディレクトリから import
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import lambda_function
+import zip_stream
+from zip_stream import ZipStreamError
+from tests.fakes import FakeS3Client
+
+HEADER = ['Timestamp', 'Hostname', 'AppName', 'SeverityLevel', 'Severity', 'LogType', 'Message']
+
+
+class NonSeekableBuffer(io.RawIOBase):
+    """シーク不可の書き込み先（zipfile にデータディスクリプタを使わせる）"""
+
+    def __init__(self):
+        super().__init__()
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data.extend(b)
+        return len(b)
+
+
+def make_csv(rows):
+    """テスト用 CSV バイト列を生成"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(HEADER)
+    for i in range(rows):
+        severity = ['CRITICAL', 'WARNING', 'INFO', 'NOTICE'][i % 4]
+        writer.writerow([
+            f'2025-04-28T{i % 24:02d}:{i % 60:02d}:00Z', 'srx-fw01', 'RT_IDP',
+            '2', severity, 'THREAT', f'RT_IDP_ATTACK_LOG: Port scan detected {i}'
+        ])
+    return buf.getvalue().encode('utf-8')
+
+
+def make_zip(members, compression=zipfile.ZIP_DEFLATED, seekable=True, force_zip64=False):
+    """members: [(name, bytes)] から ZIP バイト列を生成"""
+    out = io.BytesIO() if seekable else NonSeekableBuffer()
+    with zipfile.ZipFile(out, 'w', compression=compression) as z:
+        for name, data in members:
+            with z.open(name, 'w', force_zip64=force_zip64) as w:
+                w.write(data)
+    return out.getvalue() if seekable else bytes(out.data)
+
+
+def read_members(archive, chunk_size=zip_stream.CHUNK_SIZE):
+    return [(name, member.read())
+            for name, member in zip_stream.iter_members(io.BytesIO(archive), chunk_size)]
+
+
+class TestIterMembers(unittest.TestCase):
+    """iter_members のテスト"""
+
+    def test_deflated_members(self):
+        """Deflate 圧縮の複数メンバーを順に展開できるか"""
+        members = [('00.csv', make_csv(500)), ('01.csv', make_csv(300))]
+        self.assertEqual(read_members(make_zip(members)), members)
+
+    def test_stored_member(self):
+        """無圧縮メンバーを展開できるか"""
+        members = [('00.csv', make_csv(100))]
+        self.assertEqual(read_members(make_zip(members, zipfile.ZIP_STORED)), members)
+
+    def test_data_descriptor(self):
+        """シーク不可で書かれた ZIP（データディスクリプタ付き）を展開できるか"""
+        members = [('a.csv', make_csv(200)), ('b.csv', make_csv(10))]
+        archive = make_zip(members, seekable=False)
+        self.assertEqual(read_members(archive), members)
+
+    def test_zip64(self):
+        """ZIP64 拡張フィールド付きのメンバーを展開できるか"""
+        members = [('00.csv', make_csv(200))]
+        self.assertEqual(read_members(make_zip(members, force_zip64=True)), members)
+        archive = make_zip(members, seekable=False, force_zip64=True)
+        self.assertEqual(read_members(archive), members)
+
+    def test_small_chunks(self):
+        """読み込み単位が小さくても同じ結果になるか"""
+        members = [('00.csv', make_csv(300)), ('01.csv', make_csv(5))]
+        self.assertEqual(read_members(make_zip(members), chunk_size=7), members)
+
+    def test_skip_unread_member(self):
+        """読まなかったメンバーを読み飛ばして次に進めるか"""
+        members = [('skip.txt', b'x' * 10000), ('00.csv', make_csv(50))]
+        names = []
+        for name, member in zip_stream.iter_members(io.BytesIO(make_zip(members))):
+            names.append(name)
+            if name.endswith('.csv'):
+                self.assertEqual(member.read(), members[1][1])
+        self.assertEqual(names, ['skip.txt', '00.csv'])
+
+    def test_unsupported_method(self):
+        """未対応の圧縮方式は ZipStreamError になるか"""
+        archive = make_zip([('00.csv', make_csv(10))], zipfile.ZIP_BZIP2)
+        with self.assertRaises(ZipStreamError):
+            read_members(archive)
+
+    def test_corrupted_crc(self):
+        """CRC 不一致を検出できるか"""
+        archive = bytearray(make_zip([('00.csv', make_csv(10))], zipfile.ZIP_STORED))
+        # ローカルヘッダ (30 + 名前6バイト) 直後のデータを改ざん
+        archive[36] ^= 0xFF
+        with self.assertRaises(ZipStreamError):
+            read_members(bytes(archive))
+
+
+class TestStreamIngest(unittest.TestCase):
+    """ストリーム取り込みと /tmp 経由取り込みの一致テスト"""
+
+    def setUp(self):
+        self.s3 = FakeS3Client()
+        self.original_client = lambda_function.s3_client
+        self.original_mode = lambda_function.INGEST_MODE
+        lambda_function.s3_client = self.s3
+
+    def tearDown(self):
+        lambda_function.s3_client = self.original_client
+        lambda_function.INGEST_MODE = self.original_mode
+
+    def test_stream_matches_disk(self):
+        """ストリーム取り込みと /tmp 経由の集計結果が一致するか"""
+        self.s3.objects[('in', 'raw/2025-04-28/10.zip')] = make_zip([('10.csv', make_csv(2000))])
+
+        lambda_function.INGEST_MODE = 'stream'
+        streamed = lambda_function.ingest('in', 'raw/2025-04-28/10.zip')
+        lambda_function.INGEST_MODE = 'disk'
+        on_disk = lambda_function.ingest('in', 'raw/2025-04-28/10.zip')
+
+        self.assertEqual(streamed, on_disk)
+        self.assertEqual(len(streamed), 1)
+        self.assertEqual(streamed[0]['log_date'], '2025-04-28')
+        self.assertEqual(streamed[0]['hourly_stats']['00:00']['CRITICAL'], 84)
+
+    def test_stream_falls_back_to_disk(self):
+        """ストリーム展開できない ZIP は /tmp 経由で処理されるか"""
+        self.s3.objects[('in', 'raw/bz2.zip')] = make_zip(
+            [('10.csv', make_csv(100))], zipfile.ZIP_BZIP2)
+
+        lambda_function.INGEST_MODE = 'stream'
+        stats, = lambda_function.ingest('in', 'raw/bz2.zip')
+
+        self.assertEqual(stats['hostname'], 'srx-fw01')
+        self.assertEqual(sum(c['CRITICAL'] for c in stats['hourly_stats'].values()), 25)
+
+    def test_stream_no_csv(self):
+        """CSV が含まれない ZIP はエラーになるか"""
+        self.s3.objects[('in', 'raw/empty.zip')] = make_zip([('readme.txt', b'hello')])
+        with self.assertRaises(Exception):
+            lambda_function.stream_zip('in', 'raw/empty.zip')
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
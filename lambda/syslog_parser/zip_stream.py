@@ -0,0 +1,255 @@
+"""
+ZIP ストリーム展開
+
+S3 の StreamingBody のような「先頭から順に読むだけ」のストリームから、
+ZIP のローカルファイルヘッダを順に辿り、各メンバーをその場で解凍する。
+
+zipfile モジュールは末尾のセントラルディレクトリを読むためにシークが必要だが、
+ここではローカルファイルヘッダだけを使うため、/tmp への書き出しも
+アーカイブ全体のメモリ展開も不要になる。メモリ使用量はチャンクサイズで決まる。
+
+対応範囲:
+    - 圧縮方式: Deflate (8), Stored (0)
+    - データディスクリプタ (汎用フラグ bit 3) 付きの Deflate
+    - ZIP64 拡張フィールド
+    上記以外 (暗号化、bzip2/lzma、サイズ不明の Stored) は ZipStreamError を送出し、
+    呼び出し側で /tmp 経由の展開にフォールバックさせる。
+"""
+
+import io
+import struct
+import zlib
+
+# 圧縮データを読み込む単位（デフォルト 1MB）
+CHUNK_SIZE = 1024 * 1024
+
+LOCAL_HEADER_SIG = b'PK\x03\x04'
+DATA_DESCRIPTOR_SIG = b'PK\x07\x08'
+# ローカルファイルヘッダ以外のシグネチャ（セントラルディレクトリ等）が出たら終端
+END_SIGNATURES = (b'PK\x01\x02', b'PK\x05\x06', b'PK\x06\x06', b'PK\x06\x07')
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+FLAG_ENCRYPTED = 0x0001
+FLAG_DATA_DESCRIPTOR = 0x0008
+FLAG_UTF8 = 0x0800
+
+ZIP64_EXTRA_ID = 0x0001
+
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+
+
+class ZipStreamError(Exception):
+    """ストリームのままでは展開できない ZIP"""
+
+
+class _Source:
+    """
+    読み戻し（unread）可能なシーケンシャル入力
+
+    Deflate ストリームの終端を越えて読んだ余りを次のヘッダ解析に戻すために使う。
+    """
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.pending = b''
+
+    def read(self, size=None):
+        """最大 size バイト返す（空bytesは EOF）"""
+        if size is None:
+            size = self.chunk_size
+        if self.pending:
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+        return self.stream.read(size)
+
+    def read_exact(self, size):
+        """ちょうど size バイト返す（足りなければ ZipStreamError）"""
+        parts = []
+        remaining = size
+        while remaining > 0:
+            data = self.read(remaining)
+            if not data:
+                raise ZipStreamError("Unexpected end of ZIP stream")
+            parts.append(data)
+            remaining -= len(data)
+        return b''.join(parts)
+
+    def unread(self, data):
+        if data:
+            self.pending = data + self.pending
+
+
+class MemberReader(io.RawIOBase):
+    """
+    ZIP メンバー1件分の解凍済みバイトストリーム
+
+    io.BufferedReader / io.TextIOWrapper で包んで使う想定。
+    読み終えた時点で CRC32 とサイズを検証する。
+    """
+
+    def __init__(self, source, method, flags, crc, compressed_size, file_size, zip64):
+        super().__init__()
+        self._source = source
+        self._flags = flags
+        self._expected_crc = crc
+        self._expected_size = file_size
+        self._zip64 = zip64
+        self._crc = 0
+        self._size = 0
+        self._buffer = b''
+        self._finished = False
+
+        if method == METHOD_DEFLATED:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        else:
+            self._decompressor = None
+            self._stored_remaining = compressed_size
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        view = memoryview(b)
+        while not self._buffer and not self._finished:
+            self._fill(len(view))
+        if not self._buffer:
+            return 0
+        n = min(len(view), len(self._buffer))
+        view[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def drain(self):
+        """未読部分を読み捨てる（次のメンバーに進むため）"""
+        while not self._finished:
+            self._buffer = b''
+            self._fill(self._source.chunk_size)
+        self._buffer = b''
+
+    def _fill(self, max_length):
+        max_length = max(max_length, 1)
+        if self._decompressor is None:
+            self._fill_stored(max_length)
+        else:
+            self._fill_deflated(max_length)
+
+    def _fill_stored(self, max_length):
+        if self._stored_remaining == 0:
+            self._finish()
+            return
+        data = self._source.read(min(max_length, self._stored_remaining))
+        if not data:
+            raise ZipStreamError("Unexpected end of ZIP stream")
+        self._stored_remaining -= len(data)
+        self._emit(data)
+
+    def _fill_deflated(self, max_length):
+        d = self._decompressor
+        # 前回 max_length で打ち切った未処理分を優先（出力サイズを一定に保つ）
+        if d.unconsumed_tail:
+            data = d.decompress(d.unconsumed_tail, max_length)
+        else:
+            compressed = self._source.read()
+            if not compressed:
+                raise ZipStreamError("Unexpected end of ZIP stream")
+            data = d.decompress(compressed, max_length)
+        if data:
+            self._emit(data)
+        if d.eof:
+            self._source.unread(d.unused_data)
+            self._finish()
+
+    def _emit(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer = data
+
+    def _finish(self):
+        self._finished = True
+        if self._flags & FLAG_DATA_DESCRIPTOR:
+            self._read_data_descriptor()
+        if self._crc != self._expected_crc:
+            raise ZipStreamError("CRC mismatch in ZIP member")
+        if self._expected_size is not None and self._size != self._expected_size:
+            raise ZipStreamError("Size mismatch in ZIP member")
+
+    def _read_data_descriptor(self):
+        head = self._source.read_exact(4)
+        if head == DATA_DESCRIPTOR_SIG:
+            head = self._source.read_exact(4)
+        self._expected_crc = struct.unpack('<I', head)[0]
+        if self._zip64:
+            _, file_size = struct.unpack('<QQ', self._source.read_exact(16))
+        else:
+            _, file_size = struct.unpack('<II', self._source.read_exact(8))
+        self._expected_size = file_size
+
+
+def _parse_zip64_extra(extra, file_size, compressed_size):
+    """ZIP64 拡張フィールドから 64bit サイズを取り出す"""
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, data_size = struct.unpack('<HH', extra[pos:pos + 4])
+        data = extra[pos + 4:pos + 4 + data_size]
+        if header_id == ZIP64_EXTRA_ID:
+            values = list(struct.unpack(f'<{len(data) // 8}Q', data[:len(data) // 8 * 8]))
+            if file_size == 0xFFFFFFFF and values:
+                file_size = values.pop(0)
+            if compressed_size == 0xFFFFFFFF and values:
+                compressed_size = values.pop(0)
+            return file_size, compressed_size, True
+        pos += 4 + data_size
+    return file_size, compressed_size, False
+
+
+def iter_members(stream, chunk_size=CHUNK_SIZE):
+    """
+    ZIP ストリームのメンバーを先頭から順に返す
+
+    Args:
+        stream: read(n) を持つバイナリストリーム（S3 StreamingBody 等）
+        chunk_size (int): 圧縮データの読み込み単位
+
+    Yields:
+        tuple: (member_name, MemberReader)
+            次のメンバーに進むと前の MemberReader の未読分は読み捨てられる
+
+    Raises:
+        ZipStreamError: ストリーム展開に対応していない ZIP の場合
+    """
+    source = _Source(stream, chunk_size)
+
+    while True:
+        signature = source.read_exact(4)
+        if signature in END_SIGNATURES:
+            return
+        if signature != LOCAL_HEADER_SIG:
+            raise ZipStreamError("Invalid ZIP local file header")
+
+        (_, _, flags, method, _, _, crc, compressed_size, file_size,
+         name_len, extra_len) = _LOCAL_HEADER.unpack(
+            signature + source.read_exact(_LOCAL_HEADER.size - 4))
+        raw_name = source.read_exact(name_len)
+        extra = source.read_exact(extra_len)
+
+        name = raw_name.decode('utf-8' if flags & FLAG_UTF8 else 'cp437')
+
+        if flags & FLAG_ENCRYPTED:
+            raise ZipStreamError(f"Encrypted ZIP member is not supported: {name}")
+        if method not in (METHOD_STORED, METHOD_DEFLATED):
+            raise ZipStreamError(f"Unsupported compression method {method}: {name}")
+        if method == METHOD_STORED and flags & FLAG_DATA_DESCRIPTOR:
+            raise ZipStreamError(f"Stored member without size is not supported: {name}")
+
+        file_size, compressed_size, zip64 = _parse_zip64_extra(
+            extra, file_size, compressed_size)
+        if flags & FLAG_DATA_DESCRIPTOR:
+            # サイズと CRC はデータディスクリプタで確定する
+            file_size = None
+
+        member = MemberReader(source, method, flags, crc, compressed_size, file_size, zip64)
+        yield name, member
+        member.drain()
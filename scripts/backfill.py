@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+ローカルの ZIP をまとめて再集計するバックフィル
+
+S3 に再アップロードして Lambda を1オブジェクトずつ起動する代わりに、
+lambda_function の集計・保存処理をローカルのプロセスプールで並列に実行する。
+
+入力は generator/generate.py の出力（{dir}/HH.zip）や、日付ディレクトリで
+まとめたもの（{root}/YYYY-MM-DD/HH.zip、S3 の raw/YYYY-MM-DD/ と同じ）。
+パスに YYYY-MM-DD を含むファイルは --start / --end で日付を絞り込める。
+
+結果の書き出し先（--sink）:
+    table   DynamoDB テーブル + S3 の日次JSON（Lambda と同じ save_to_dynamodb）
+    json    ローカルディレクトリに日次JSON・週/月のロールアップ・マニフェスト（{output}/data/...、S3 と同じ構成）
+    memory  日次JSONをメモリ上に作るだけで書き出さない（件数の確認や計測用）
+
+完了したファイルは状態ファイル（JSON Lines）に1行ずつ記録し、
+--resume を付けると記録済みのファイル（サイズ・更新時刻が同じもの）を読み飛ばして再開する。
+
+使用方法:
+    python scripts/backfill.py source_logs --sink json --output backfill_out
+    python scripts/backfill.py archive/ --start 2025-04-01 --end 2025-04-30 --workers 8 --resume
+    DYNAMODB_TABLE=syslog-hourly-stats OUTPUT_BUCKET=... python scripts/backfill.py archive/ --sink table
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import contextlib
+from datetime import datetime, timezone
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from unittest.mock import Mock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / 'lambda' / 'syslog_parser'))
+
+SINKS = ('table', 'json', 'memory')
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+DEFAULT_STATE_FILE = 'backfill-state.jsonl'
+
+
+def load_lambda(sink):
+    """
+    lambda_function を import する
+
+    table 以外の書き出し先では DynamoDB / S3 を使わないため、
+    テーブル名が未設定でも、boto3 がなくても動くようにする（benchmarks/_common.py と同じ）。
+    """
+    if sink != 'table':
+        os.environ.setdefault('DYNAMODB_TABLE', 'syslog-hourly-stats-backfill')
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
+        try:
+            import boto3  # noqa: F401
+        except ImportError:
+            sys.modules['boto3'] = Mock()
+    import lambda_function
+    return lambda_function
+
+
+# ============================================================
+# 書き出し先
+# ============================================================
+
+class RollupSink:
+    """日次JSONを Lambda の EXPORT_MODE=rollup と同じ形でマージする書き出し先の基底クラス"""
+
+    def __init__(self, lambda_function):
+        self.lambda_function = lambda_function
+
+    def save(self, stats, file_name):
+        processed_at = datetime.utcnow().isoformat() + 'Z'
+        self.lambda_function.export_rollup(stats, processed_at, update=self.update)
+
+    def update(self, json_key, merge):
+        """json_key の JSON を merge(current) で更新し、更新後の JSON を返す"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemorySink(RollupSink):
+    """
+    メモリ上に保持する書き出し先
+
+    Attributes:
+        results (list): (file_name, stats)
+        documents (dict): json_key → 日次JSON（S3 に出力される内容と同じ）
+    """
+
+    def __init__(self, lambda_function):
+        super().__init__(lambda_function)
+        self.results = []
+        self.documents = {}
+
+    def save(self, stats, file_name):
+        self.results.append((file_name, stats))
+        super().save(stats, file_name)
+
+    def update(self, json_key, merge):
+        doc = self.documents[json_key] = merge(self.documents.get(json_key))
+        return doc
+
+
+class JsonDirSink(RollupSink):
+    """ローカルディレクトリに日次JSONを書き出す（既存のJSONにマージする）"""
+
+    def __init__(self, lambda_function, output_dir):
+        super().__init__(lambda_function)
+        self.output_dir = Path(output_dir)
+
+    def update(self, json_key, merge):
+        path = self.output_dir / json_key
+        current = json.loads(path.read_text(encoding='utf-8')) if path.exists() else None
+        doc = merge(current)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps(doc, ensure_ascii=False, indent=2), encoding='utf-8')
+        os.replace(tmp, path)
+        return doc
+
+
+class TableSink:
+    """DynamoDB テーブルと S3 の日次JSONに書き出す（Lambda と同じ）"""
+
+    def __init__(self, lambda_function):
+        self.lambda_function = lambda_function
+
+    def save(self, stats, file_name):
+        self.lambda_function.save_to_dynamodb(stats, file_name)
+
+    def close(self):
+        pass
+
+
+def make_sink(name, lambda_function, output_dir=None):
+    if name == 'table':
+        return TableSink(lambda_function)
+    if name == 'json':
+        if not output_dir:
+            raise ValueError("--output is required for the json sink")
+        return JsonDirSink(lambda_function, output_dir)
+    if name == 'memory':
+        return MemorySink(lambda_function)
+    raise ValueError(f"Unknown sink: {name}")
+
+
+# ============================================================
+# 入力ファイルと状態ファイル
+# ============================================================
+
+def file_date(path):
+    """パスに含まれる最後の YYYY-MM-DD（なければ None）"""
+    dates = DATE_PATTERN.findall(str(path))
+    return dates[-1] if dates else None
+
+
+def find_zips(paths, start=None, end=None):
+    """
+    処理する ZIP の一覧
+
+    Args:
+        paths (list): ディレクトリ（再帰的に探す）または ZIP ファイル
+        start, end (str): YYYY-MM-DD（両端を含む）。指定した場合、パスに日付のないファイルは除外
+
+    Returns:
+        list: (path, file_name) のソート済みリスト
+            file_name は入力ディレクトリからの相対パス（DynamoDB の file_name / 状態ファイルのキー）
+    """
+    found = {}
+    for root in map(Path, paths):
+        if root.is_file():
+            candidates = [(root, root.name)]
+        else:
+            candidates = [(p, p.relative_to(root).as_posix()) for p in root.rglob('*.zip') if p.is_file()]
+        for path, name in candidates:
+            if start or end:
+                date = file_date(name) or file_date(path.resolve())
+                if date is None or (start and date < start) or (end and date > end):
+                    continue
+            found[str(path.resolve())] = (path, name)
+    return sorted(found.values(), key=lambda entry: entry[1])
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def load_completed(state_file):
+    """状態ファイルから完了済みのファイルを読む（途中で切れた最終行は無視）"""
+    completed = {}
+    if not os.path.exists(state_file):
+        return completed
+    with open(state_file, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            completed[record['path']] = record
+    return completed
+
+
+# ============================================================
+# ワーカー
+# ============================================================
+
+def init_worker(sink, verbose):
+    """ワーカープロセスの初期化（ZIP 内のメンバーはワーカー内で逐次処理する）"""
+    lambda_function = load_lambda(sink)
+    lambda_function.MEMBER_WORKERS = 1
+    if not verbose:
+        # build_stats などの print を捨てる
+        sys.stdout = open(os.devnull, 'w')
+
+
+def process_file(path, file_name):
+    """
+    ZIP 1ファイルを集計する（ワーカープロセスで実行）
+
+    Returns:
+        dict: {'stats': [parse_csv() と同じ構造, ...], 'rows': 総行数, 'seconds': 所要時間}
+    """
+    import lambda_function
+    from partials import merge_partials
+
+    start = time.perf_counter()
+    partials = lambda_function.zip_partials(str(path), 'backfill', file_name)
+    # merge_partials は先頭の途中集計に合算していくため、行数は合算前に数える
+    rows = sum(partial.aggregator.total_rows() for partial in partials)
+    return {
+        'stats': [lambda_function.build_stats(group) for group in merge_partials(partials)],
+        'rows': rows,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+# ============================================================
+# 進捗表示
+# ============================================================
+
+class Progress:
+    """処理済みファイル数・行数・rows/sec・残り時間の表示"""
+
+    def __init__(self, total, interval=2.0, out=sys.stdout, clock=time.monotonic):
+        self.total = total
+        self.interval = interval
+        self.out = out
+        self.clock = clock
+        self.started = clock()
+        self.last_report = None
+        self.files = 0
+        self.rows = 0
+        self.failed = 0
+
+    def update(self, rows, failed=False):
+        self.files += 1
+        self.rows += rows
+        self.failed += failed
+        now = self.clock()
+        if self.last_report is None or now - self.last_report >= self.interval or self.files == self.total:
+            self.report(now)
+
+    def rows_per_second(self, now=None):
+        elapsed = (now or self.clock()) - self.started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def report(self, now=None):
+        now = now or self.clock()
+        self.last_report = now
+        elapsed = now - self.started
+        percent = self.files / self.total * 100 if self.total else 100.0
+        eta = elapsed / self.files * (self.total - self.files) if self.files else 0
+        failed = f"  failed {self.failed}" if self.failed else ''
+        print(f"[{self.files:>{len(str(self.total))}}/{self.total} {percent:5.1f}%] "
+              f"rows {self.rows:,}  {self.rows_per_second(now):,.0f} rows/s  "
+              f"elapsed {format_seconds(elapsed)}  eta {format_seconds(eta)}{failed}",
+              file=self.out, flush=True)
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+# ============================================================
+# 実行
+# ============================================================
+
+def backfill(files, sink, state_file, workers, resume=False, verbose=False, progress_interval=2.0,
+             sink_name='memory'):
+    """
+    ZIP を並列に集計して sink に書き出す
+
+    書き出しは親プロセスで完了順に行い、書き出しが成功したファイルだけを状態ファイルに記録する。
+    同時に処理中のファイルは workers の2倍までに抑える（結果を溜め込まない）。
+
+    Args:
+        files (list): find_zips() の返り値
+        sink: save(stats, file_name) / close() を持つ書き出し先
+        state_file (str): 状態ファイルのパス
+        workers (int): プロセス数
+        resume (bool): 状態ファイルに記録済みのファイルを読み飛ばす（False なら状態ファイルを作り直す）
+        sink_name (str): 書き出し先の種類（ワーカーでの lambda_function の import 方法を合わせる）
+
+    Returns:
+        dict: {'files', 'skipped', 'failed', 'rows', 'seconds', 'rows_per_second'}
+    """
+    completed = load_completed(state_file) if resume else {}
+    pending = []
+    for path, name in files:
+        record = completed.get(name)
+        if record is not None and record.get('signature') == file_signature(path):
+            continue
+        pending.append((path, name))
+    skipped = len(files) - len(pending)
+    print(f"Files: {len(files)} (to process: {len(pending)}, already completed: {skipped}), "
+          f"workers: {workers}", flush=True)
+
+    progress = Progress(len(pending), interval=progress_interval)
+    failures = []
+    mode = 'a' if resume else 'w'
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with open(state_file, mode, encoding='utf-8') as state, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                initargs=(sink_name, verbose)) as executor:
+        queue = iter(pending)
+        in_flight = {}
+
+        def submit():
+            for path, name in queue:
+                in_flight[executor.submit(process_file, path, name)] = (path, name)
+                if len(in_flight) >= workers * 2:
+                    break
+
+        submit()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, name = in_flight.pop(future)
+                try:
+                    result = future.result()
+                    with quiet:
+                        for stats in result['stats']:
+                            sink.save(stats, name)
+                except Exception as e:
+                    failures.append({'path': name, 'error': str(e)})
+                    print(f"ERROR: {name}: {e}", flush=True)
+                    progress.update(0, failed=True)
+                    continue
+                state.write(json.dumps({
+                    'path': name,
+                    'signature': file_signature(path),
+                    'rows': result['rows'],
+                    'groups': [[s['log_date'], s['hostname']] for s in result['stats']],
+                    'completed_at': datetime.now(timezone.utc).isoformat(),
+                }) + '\n')
+                state.flush()
+                progress.update(result['rows'])
+            submit()
+    sink.close()
+
+    elapsed = time.monotonic() - progress.started
+    summary = {
+        'files': len(pending) - len(failures),
+        'skipped': skipped,
+        'failed': len(failures),
+        'failures': failures,
+        'rows': progress.rows,
+        'seconds': elapsed,
+        'rows_per_second': progress.rows_per_second(),
+    }
+    print(f"Done: {summary['files']} files, {summary['rows']:,} rows in {format_seconds(elapsed)} "
+          f"({summary['rows_per_second']:,.0f} rows/s), skipped {skipped}, failed {len(failures)}",
+          flush=True)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backfill hourly stats from local syslog ZIPs')
+    parser.add_argument('paths', nargs='+', help='Directories (searched recursively) or ZIP files')
+    parser.add_argument('--start', help='First log date to process (YYYY-MM-DD, from the path)')
+    parser.add_argument('--end', help='Last log date to process (YYYY-MM-DD, inclusive)')
+    parser.add_argument('--sink', choices=SINKS, default='json', help='Where to write results (default: json)')
+    parser.add_argument('--output', help='Output directory for the json sink')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--state', default=DEFAULT_STATE_FILE,
+                        help=f'State file recording completed files (default: {DEFAULT_STATE_FILE})')
+    parser.add_argument('--resume', action='store_true', help='Skip files already recorded in the state file')
+    parser.add_argument('--progress-interval', type=float, default=2.0, help='Seconds between progress lines')
+    parser.add_argument('--verbose', action='store_true', help='Show the parser output of every file')
+    args = parser.parse_args(argv)
+
+    for value in (args.start, args.end):
+        if value is not None and not DATE_PATTERN.fullmatch(value):
+            parser.error(f"Invalid date: {value} (use YYYY-MM-DD)")
+
+    lambda_function = load_lambda(args.sink)
+    try:
+        sink = make_sink(args.sink, lambda_function, args.output)
+    except ValueError as e:
+        parser.error(str(e))
+
+    files = find_zips(args.paths, args.start, args.end)
+    if not files:
+        print("No ZIP files found")
+        return 1
+    summary = backfill(files, sink, args.state, max(1, args.workers), resume=args.resume,
+                       verbose=args.verbose, progress_interval=args.progress_interval,
+                       sink_name=args.sink)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
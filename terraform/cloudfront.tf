@@ -46,7 +46,30 @@ resource "aws_cloudfront_distribution" "output" {
     compress    = true  # Gzip圧縮有効
   }
 
+  # data/manifest.json のキャッシュ動作（公開中の JSON のハッシュ一覧。毎回オリジンで再検証）
+  ordered_cache_behavior {
+    path_pattern           = "data/manifest.json"
+    allowed_methods        = ["GET", "HEAD", "OPTIONS"]
+    cached_methods         = ["GET", "HEAD"]
+    target_origin_id       = "S3-${aws_s3_bucket.output.id}"
+    viewer_protocol_policy = "redirect-to-https"
+
+    forwarded_values {
+      query_string = false
+      cookies {
+        forward = "none"
+      }
+    }
+
+    min_ttl     = 0
+    default_ttl = 0
+    max_ttl     = 60
+    compress    = true
+  }
+
   # data/*.json のキャッシュ動作（短時間キャッシュ）
+  # ダッシュボードは ?v={内容のハッシュ} を付けて取得するため、v をキャッシュキーに含める
+  # （Lambda は gzip 圧縮済みの JSON を Content-Encoding: gzip で保存する）
   ordered_cache_behavior {
     path_pattern           = "data/*.json"
     allowed_methods        = ["GET", "HEAD", "OPTIONS"]
@@ -55,7 +78,8 @@ resource "aws_cloudfront_distribution" "output" {
     viewer_protocol_policy = "redirect-to-https"
 
     forwarded_values {
-      query_string = false
+      query_string            = true
+      query_string_cache_keys = ["v"]
       cookies {
         forward = "none"
       }
@@ -1,17 +1,24 @@
 # DynamoDB テーブル
+# table_schema = "single"     : PK log_date / SK hour（従来、1台構成）
+# table_schema = "multi_host" : PK pk / SK sk（ホスト×日付パーティション、lambda/syslog_parser/key_schema.py 参照）
+locals {
+  dynamodb_hash_key  = var.table_schema == "multi_host" ? "pk" : "log_date"
+  dynamodb_range_key = var.table_schema == "multi_host" ? "sk" : "hour"
+}
+
 resource "aws_dynamodb_table" "stats" {
   name         = var.dynamodb_table_name
   billing_mode = "PAY_PER_REQUEST"
-  hash_key     = "log_date"
-  range_key    = "hour"
+  hash_key     = local.dynamodb_hash_key
+  range_key    = local.dynamodb_range_key
 
   attribute {
-    name = "log_date"
+    name = local.dynamodb_hash_key
     type = "S"
   }
 
   attribute {
-    name = "hour"
+    name = local.dynamodb_range_key
     type = "S"
   }
 
@@ -20,7 +27,31 @@ resource "aws_dynamodb_table" "stats" {
   }
 }
 
+# 処理済みオブジェクトの台帳（lambda/syslog_parser/ledger.py）
+# S3 イベントの重複配信・同じ内容の再アップロードを解析せずにスキップする
+resource "aws_dynamodb_table" "ledger" {
+  name         = "${var.dynamodb_table_name}-ledger"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "object_id"
+
+  attribute {
+    name = "object_id"
+    type = "S"
+  }
+
+  # LEDGER_RETENTION_DAYS を過ぎた項目を削除
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name = "${var.dynamodb_table_name}-ledger"
+  }
+}
+
 # 注記:
 # - Point-in-time Recovery: デフォルト無効（コスト削減）
 # - Encryption: デフォルト有効（AWS Managed Key）
 # - TTL: 必要に応じて後から追加（future enhancement）
+# - table_schema の変更はキーの変更のためテーブルの再作成になる
@@ -40,19 +40,84 @@ resource "aws_iam_role_policy" "lambda_policy" {
         Effect = "Allow"
         Action = [
           "dynamodb:PutItem",
+          "dynamodb:BatchWriteItem",
           "dynamodb:Query"
         ]
         Resource = aws_dynamodb_table.stats.arn
       },
 
-      # S3 書き込み（出力バケットの data/ 配下のみ）
+      # 処理済みオブジェクトの台帳（条件付き書き込みによる claim / complete / release）
+      {
+        Sid    = "DynamoDBLedger"
+        Effect = "Allow"
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem",
+          "dynamodb:DeleteItem"
+        ]
+        Resource = aws_dynamodb_table.ledger.arn
+      },
+
+      # S3 読み書き（出力バケットの data/ 配下のみ、日次JSONのインクリメンタル更新）
+      # 列指向エクスポートを有効にした場合はその接頭辞の配下も
       {
         Sid    = "S3PutObject"
         Effect = "Allow"
         Action = [
+          "s3:GetObject",
           "s3:PutObject"
         ]
-        Resource = "${aws_s3_bucket.output.arn}/data/*"
+        Resource = compact([
+          "${aws_s3_bucket.output.arn}/data/*",
+          var.columnar_prefix != "" ? "${aws_s3_bucket.output.arn}/${var.columnar_prefix}*" : ""
+        ])
+      },
+
+      # 出力バケットの一覧（接頭辞を限定）
+      # ListBucket がないと存在しないキーの GetObject は 404 NoSuchKey ではなく 403 AccessDenied になり、
+      # 日次JSON・ロールアップ・マニフェスト・ベースラインを初めて作る更新（rollup.read_json_document）が失敗する
+      {
+        Sid      = "S3ListOutput"
+        Effect   = "Allow"
+        Action   = ["s3:ListBucket"]
+        Resource = aws_s3_bucket.output.arn
+        Condition = {
+          StringLike = {
+            "s3:prefix" = ["data/*", "baselines/*"]
+          }
+        }
+      },
+
+      # ホスト・時刻ごとの CRITICAL 件数のベースライン（lambda_function.score_anomalies）
+      {
+        Sid    = "S3Baselines"
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject"
+        ]
+        Resource = "${aws_s3_bucket.output.arn}/baselines/*"
+      },
+
+      # 途中集計（チェックポイント）の保存・読み込み・削除（lambda_function.continue_record）
+      {
+        Sid    = "S3Checkpoints"
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject"
+        ]
+        Resource = "${aws_s3_bucket.output.arn}/checkpoints/*"
+      },
+
+      # 続きの呼び出し（自分自身の非同期 Invoke）
+      # 関数はこのポリシーに依存するため、ARN は名前から組み立てる
+      {
+        Sid      = "LambdaInvokeSelf"
+        Effect   = "Allow"
+        Action   = ["lambda:InvokeFunction"]
+        Resource = "arn:aws:lambda:*:*:function:${var.project_name}-parser-function"
       },
 
       # CloudWatch Logs（標準）
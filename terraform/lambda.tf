@@ -1,8 +1,9 @@
 # データソース: Lambda 関数のソースコード
 data "archive_file" "lambda" {
   type        = "zip"
-  source_file = "${path.module}/../lambda/syslog_parser/lambda_function.py"
+  source_dir  = "${path.module}/../lambda/syslog_parser"
   output_path = "${path.module}/lambda_function.zip"
+  excludes    = ["tests", "tests/**", "__pycache__", "__pycache__/**", "requirements.txt"]
 }
 
 # Lambda 関数
@@ -18,8 +19,13 @@ resource "aws_lambda_function" "parser" {
 
   environment {
     variables = {
-      DYNAMODB_TABLE = aws_dynamodb_table.stats.name
-      OUTPUT_BUCKET  = aws_s3_bucket.output.id
+      DYNAMODB_TABLE  = aws_dynamodb_table.stats.name
+      OUTPUT_BUCKET   = aws_s3_bucket.output.id
+      TABLE_SCHEMA    = var.table_schema
+      FLEET_SHARDS    = var.fleet_shards
+      COLUMNAR_PREFIX = var.columnar_prefix
+      LEDGER_TABLE    = aws_dynamodb_table.ledger.name
+      FILTER_RULES    = var.filter_rules
     }
   }
 
@@ -35,6 +35,35 @@ variable "dynamodb_table_name" {
   default     = "syslog-hourly-stats"
 }
 
+variable "table_schema" {
+  description = "DynamoDB キー設計 (single: 1台構成, multi_host: 複数ホスト)"
+  type        = string
+  default     = "single"
+
+  validation {
+    condition     = contains(["single", "multi_host"], var.table_schema)
+    error_message = "table_schema must be single or multi_host."
+  }
+}
+
+variable "fleet_shards" {
+  description = "multi_host のフリート集計用パーティションのシャード数"
+  type        = number
+  default     = 8
+}
+
+variable "filter_rules" {
+  description = "追加で数える集計ルールの JSON（lambda/syslog_parser/filter_rules.py。空ならルールなし）"
+  type        = string
+  default     = ""
+}
+
+variable "columnar_prefix" {
+  description = "パース済みの行を列指向ファイルで出力バケットに書き出すキーの接頭辞（空なら書き出さない。例: columnar/）"
+  type        = string
+  default     = ""
+}
+
 # Lambda 設定
 variable "lambda_memory" {
   description = "Lambda メモリ (MB)"